@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#
+# @file    run-startup-benchmark.py
+# @brief   Measure the start-up time of the MOCCASIN CLI and parser
+# @author  Michael Hucka
+#
+# <!---------------------------------------------------------------------------
+# This software is part of MOCCASIN, the Model ODE Converter for Creating
+# Automated SBML INteroperability. Visit https://github.com/sbmlteam/moccasin/.
+#
+# Copyright (C) 2014-2016 jointly by the following organizations:
+#  1. California Institute of Technology, Pasadena, CA, USA
+#  2. Icahn School of Medicine at Mount Sinai, New York, NY, USA
+#  3. Boston University, Boston, MA, USA
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation.  A copy of the license agreement is provided in the
+# file named "COPYING.txt" included with this software distribution and also
+# available online at https://github.com/sbmlteam/moccasin/.
+# ------------------------------------------------------------------------- -->
+
+# Each case is run in a fresh Python process, the given number of times, and
+# the fastest and median wall-clock times are reported.  The times include
+# starting the Python interpreter itself, which is shown as the first case
+# for reference.
+
+from __future__ import print_function
+import getopt
+import os
+import subprocess
+import sys
+import time
+
+top = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+cli = os.path.join(top, 'moccasin', 'interfaces', 'moccasin_CLI.py')
+
+first_parse = '''
+from matlab_parser import MatlabGrammar
+MatlabGrammar(backend={!r}).parse_string('x = [1 2 3];\\ny = x(2) + 1;\\n')
+'''
+
+cases = [
+    ('python (no-op)',             ['-c', 'pass']),
+    ('moccasin --help',            [cli, '--help']),
+    ('import matlab_parser',       ['-c', 'import matlab_parser']),
+    ('first parse (pyparsing)',    ['-c', first_parse.format('pyparsing')]),
+    ('first parse (rd)',           ['-c', first_parse.format('rd')]),
+]
+
+
+def run(args, env):
+    start = time.time()
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call([sys.executable] + args, env=env,
+                              stdout=devnull, stderr=devnull)
+    return time.time() - start
+
+
+def main(argv):
+    '''Usage: run-startup-benchmark.py [-n count]
+    Arguments:
+      -n  (Optional) Number of times to run each case.  Default: 10.
+    '''
+
+    try:
+        options, path = getopt.getopt(argv[1:], "n:")
+    except:
+        raise SystemExit(main.__doc__)
+
+    count = 10
+    for opt, value in options:
+        if opt == '-n':
+            count = int(value)
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.join(top, 'moccasin')]
+        + [p for p in [os.environ.get('PYTHONPATH')] if p])
+
+    print('{:<26} {:>10} {:>10}'.format('', 'fastest', 'median'))
+    for label, args in cases:
+        times = sorted(run(args, env) for i in range(count))
+        print('{:<26} {:>9.3f}s {:>9.3f}s'.format(label, times[0],
+                                                  times[len(times)//2]))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -98,9 +98,13 @@ try:
     from .cleaner import *
     from .errors import *
     from .evaluate_formula import *
+    from .evaluator import *
     from .expr_tester import *
+    from .eliminator import *
     from .finder import *
+    from .folder import *
     from .name_generator import *
+    from .reactions import *
     from .recognizer import *
     from .rewriter import *
     from .xpp import *
@@ -108,9 +112,13 @@ except:
     from cleaner import *
     from errors import *
     from evaluate_formula import *
+    from evaluator import *
     from expr_tester import *
+    from eliminator import *
     from finder import *
+    from folder import *
     from name_generator import *
+    from reactions import *
     from recognizer import *
     from rewriter import *
     from xpp import *
@@ -224,8 +232,8 @@ def clean_matlab(context, protected_context):
                 for elem in subscripts:
                     if isinstance(elem, Identifier):
                         assigned_vars.append(elem)
-        used_vars = [x for x in assigned_vars if MatlabFinder(context).find_use(x)]
-        unused_vars = list(set(assigned_vars) - set(used_vars))
+        finder = MatlabFinder(context)
+        unused_vars = set(x for x in assigned_vars if not finder.find_use(x))
         for var in list(context.assignments.keys()):
             if var in unused_vars:
                 context.assignments.pop(var)
@@ -277,12 +285,7 @@ def all_function_calls(context):
     definitions too.  The dictionary keys are the names of the functions
     being called.
     """
-    calls = {}
-    for fname, arglist in context.calls.items():
-        calls[fname] = arglist
-    for fname, fcontext in context.functions.items():
-        calls.update(all_function_calls(fcontext))
-    return calls
+    return context.call_graph.all_calls(context)
 
 
 def matlab_ode_call(context):
@@ -314,16 +317,7 @@ def assignment(thing, context, recursive=False):
     Identifier and 'recursive' is non-False, looks up the Identifier's value
     recursively, until it gets something that's not an Identifier.
     '''
-    if thing in context.assignments:
-        value = context.assignments[thing]
-        if isinstance(value, Identifier) and recursive:
-            return assignment(value, context, recursive)
-        else:
-            return value
-    elif hasattr(context, 'parent') and context.parent:
-        return assignment(thing, context.parent)
-    else:
-        return None
+    return context.symbols.assignment(thing, context, recursive)
 
 
 def all_assignments(context):
@@ -386,12 +380,13 @@ def ref_name(name, context):
     return False
 
 
-def func_from_handle(thing, context, underscores):
+def func_from_handle(thing, context, underscores, names):
     '''Retrieves the function called by a function handle.  Returns a tuple,
        (ignorable_variable, function_name)
     where "ignorable_variable" is an intermediate variable that may have
     held a function handle.  If it is None, then there was no intermediate
-    variable.'''
+    variable.  New functions created along the way are named using the
+    NameGenerator "names".'''
     # Cases:
     #  @foo => foo is the function name
     #  @(args)body => several cases possible:
@@ -439,17 +434,17 @@ def func_from_handle(thing, context, underscores):
             # means it's the equivalent of a function body.  Approach: create
             # a new fake function, store it, and return its name.
             return (ignorable_variable,
-                    create_array_function(thing, context, underscores))
+                    create_array_function(thing, context, underscores, names))
     else:
         return (None, None)
 
 
-def create_array_function(thing, context, underscores):
+def create_array_function(thing, context, underscores, names):
     if not isinstance(thing, AnonFun):
         # Shouldn't be here in the first place.
         return None
     args = thing.args
-    func_name = NameGenerator().name(prefix='anon')
+    func_name = names.name(prefix='anon')
     func_id = Identifier(name=func_name)
     output_var_name = func_name + '_'*underscores + 'out'
     output_var = Identifier(name=output_var_name)
@@ -898,7 +893,28 @@ def infer_real_names(context, ode_var, underscores):
 # -----------------------------------------------------------------------------
 
 def create_raterule_model(parse_results, use_species=True, output_format="sbml",
-                          name_vars_after_param=False, add_comments=True):
+                          name_vars_after_param=False, add_comments=True,
+                          names=None, fold_constants=False,
+                          inline_constants=False, common_subexpressions=False,
+                          min_subexpression_cost=2):
+
+    # Names made up during the conversion come from 'names', a NameGenerator.
+    # Each conversion gets a new one unless the caller (normally a
+    # ConversionSession) provides one.
+    if names is None:
+        names = NameGenerator()
+
+    # If 'fold_constants' is True, constant expressions are replaced by their
+    # values where these are exact (see MatlabConstantFolder), so that fewer
+    # of them end up as initial assignments.  If 'inline_constants' is True,
+    # constants used only once, in a rate rule, are also replaced there by
+    # their values; this implies 'fold_constants'.
+    fold_constants = fold_constants or inline_constants
+
+    # If 'common_subexpressions' is True, subexpressions that occur more than
+    # once in the rows of the ODE function's output, and have at least
+    # 'min_subexpression_cost' operations, are computed once by assignment
+    # rules (or XPP fixed variables) that the rate rules then use.
 
     # First, gather some initial information.
     working_context = first_function_context(parse_results)
@@ -912,7 +928,8 @@ def create_raterule_model(parse_results, use_species=True, output_format="sbml",
     #      dy = [row1; row2; ...]     --> "dy" = output_var
     #  end                            -->
 
-    func_var, ode_func = func_from_handle(args[0], working_context, underscores)
+    func_var, ode_func = func_from_handle(args[0], working_context, underscores,
+                                          names)
     if not ode_func:
         fail(ConversionError,
              'could not extract ODE function from {} call'.format(matlab_func))
@@ -947,6 +964,21 @@ def create_raterule_model(parse_results, use_species=True, output_format="sbml",
     # variable names, and we have to infer the name translations.
     translations = infer_real_names(working_context, ode_var, underscores)
 
+    # Variables that are not turned into parameters (see below).
+    output_var = function_context.returns[0]
+    skip_vars = [init_cond_var, output_var, assigned_var, ode_var, func_var]
+    if isinstance(time_span, Identifier):
+        # If the time span is a named variable and not an array, skip it too.
+        skip_vars.append(time_span)
+
+    # The values of the other variables may be propagated when folding,
+    # except inside the ODE function for variables named like its parameters.
+    folder = None
+    if fold_constants:
+        assignments = remaining_vars(working_context, function_context,
+                                     skip_vars + function_context.parameters)
+        folder = MatlabConstantFolder(assignments)
+
     # If we get this far, we are ready to start generating SBML or XPP output.
     document = blank_document(output_format)
 
@@ -960,7 +992,8 @@ def create_raterule_model(parse_results, use_species=True, output_format="sbml",
     mloop(init_cond,
           lambda idx, item: make_indexed(ode_var, idx, item, translations,
                                          use_species, False, document,
-                                         underscores, function_context))
+                                         underscores, function_context,
+                                         folder))
 
     # Look inside the function definition and find the assignment to the
     # function's output variable. (It corresponds to assigned_var, but inside
@@ -981,7 +1014,6 @@ def create_raterule_model(parse_results, use_species=True, output_format="sbml",
     # To match up the 'y' variables, we rewrite individual y(n) assignments
     # using reconstruct_separate_assignments() to put it all into a common form
     #
-    output_var = function_context.returns[0]
     reconstruct_separate_assignments(function_context, output_var)
     var_def = function_context.assignments[output_var]
     if not isinstance(var_def, Array):
@@ -992,10 +1024,21 @@ def create_raterule_model(parse_results, use_species=True, output_format="sbml",
     if vector_length(init_cond) != vector_length(var_def):
         fail(ConversionError,
              'initial conditions array and output array have different sizes')
-    mloop(var_def,
-          lambda idx, item: make_rate_rule(ode_var, dependent_var, translations,
-                                           idx, item, document, underscores,
-                                           function_context))
+    rows = []
+    mloop(var_def, lambda idx, item: rows.append(item))
+    if inline_constants:
+        folder.choose_inlined(rows, [init_cond])
+    if folder:
+        rows = [folder.fold(row) for row in rows]
+    if common_subexpressions:
+        eliminator = SubexpressionEliminator(min_subexpression_cost, names)
+        (rows, shared) = eliminator.eliminate(rows)
+        for name, expr in shared:
+            make_shared_rule(ode_var, dependent_var, translations, name, expr,
+                             document, underscores, function_context)
+    for idx, row in enumerate(rows):
+        make_rate_rule(ode_var, dependent_var, translations, idx, row,
+                       document, underscores, function_context)
 
     # Create remaining parameters.  Break up matrix assignments by looking up
     # the value assigned to the variable; if it's a matrix value, then the
@@ -1005,12 +1048,8 @@ def create_raterule_model(parse_results, use_species=True, output_format="sbml",
     # variables inside the function shadow ones outside.  FIXME: check if
     # something more complicated is going on in the Matlab code.
     #
-    skip_vars = [init_cond_var, output_var, assigned_var, ode_var, func_var]
-    if isinstance(time_span, Identifier):
-        # If the time span is a named variable and not an array, skip it too.
-        skip_vars.append(time_span)
     make_remaining_vars(working_context, function_context, skip_vars,
-                        translations, document, underscores)
+                        translations, document, underscores, folder)
 
     # Deal with final quirks.
     if ref_name('time', working_context) or ref_name('time', function_context):
@@ -1030,6 +1069,26 @@ def create_raterule_model(parse_results, use_species=True, output_format="sbml",
     return [output, post_add, post_convert]
 
 
+def create_reaction_model(parse_results, use_species=True,
+                          name_vars_after_param=False, add_comments=True,
+                          names=None, fold_constants=False,
+                          inline_constants=False, numeric_parameters=False):
+    # Makes the equation-based SBML model and infers reactions from its rate
+    # rules locally (see ReactionInferrer), instead of sending an XPP model
+    # to BIOCHAM.  If 'numeric_parameters' is True, the values of constant
+    # parameters are put into the stoichiometries, as BIOCHAM does.  Only
+    # species get reactions, so if 'use_species' is False, the result is the
+    # equation-based model.
+    (sbml, _, _) = create_raterule_model(parse_results, use_species, 'sbml',
+                                         name_vars_after_param, add_comments,
+                                         names=names,
+                                         fold_constants=fold_constants,
+                                         inline_constants=inline_constants)
+    document = SBMLReader().readSBMLFromString(sbml)
+    ReactionInferrer(numeric_parameters).infer(document)
+    return generate_output(document, add_comments)
+
+
 def is_vector(matrix):
     '''Returns True if "matrix" is a single row vector.'''
     return (len(matrix.rows) == 1 and len(matrix.rows[0]) >= 1)
@@ -1056,7 +1115,7 @@ def mloop(matrix, func):
 
 
 def make_indexed(var, index, content, translations, use_species, use_rules,
-                 document, underscores, context):
+                 document, underscores, context, folder=None):
     # Helper function:
     def make_declaration(the_name, the_value, const=(not use_rules)):
         if use_species:
@@ -1066,9 +1125,15 @@ def make_indexed(var, index, content, translations, use_species, use_rules,
 
     name = rename(var.name, str(index + 1), underscores)
     real_name = translations[name] if name in translations else name
+    value = folder.value(content) if folder else None
+    if folder:
+        content = folder.fold(content)
     if isinstance(content, Number):
         # The value is a number => it can be the SBML 'value' attribute.
         make_declaration(real_name, content.value)
+    elif value is not None:
+        # Same, for a constant expression whose value we computed.
+        make_declaration(real_name, decimal_text(value))
     elif constant_expression(content, context):
         # If the RHS is an expression but it's all constant values, we turn it
         # into an initial assignment.
@@ -1091,11 +1156,35 @@ def make_rate_rule(assigned_var, dep_var, translations, index, content,
                   document, underscores, context):
     # Currently, this assumes there's only one math expression per row or
     # column, meaning, one subscript value per row or column.
+    formula = rate_formula(assigned_var, dep_var, translations, content,
+                           underscores, context)
+    if not formula:
+        fail(ConversionError,
+             'Failed to convert formula for row {}'.format(index + 1))
+
+    # Finally, write the rate rule.
+    rule_var = rename(assigned_var.name, str(index + 1), underscores)
+    if rule_var in translations:
+        rule_var = translations[rule_var]
+    create_rate_rule(document, rule_var, formula)
+
+
+def make_shared_rule(assigned_var, dep_var, translations, name, content,
+                     document, underscores, context):
+    # Defines variable 'name', used in the rate rules in place of 'content'.
+    formula = rate_formula(assigned_var, dep_var, translations, content,
+                           underscores, context)
+    if not formula:
+        fail(ConversionError, 'Failed to convert formula for {}'.format(name))
+    create_assigned_parameter(document, name, formula, True)
+
+
+def rate_formula(assigned_var, dep_var, translations, content, underscores,
+                 context):
     translator = lambda node: munge_reference(node, context, underscores)
     string_formula = MatlabGrammar.make_formula(content, atrans=translator)
     if not string_formula:
-        fail(ConversionError,
-             'Failed to convert formula for row {}'.format(index + 1))
+        return None
 
     # We need to rewrite matrix references "x(n)" to the form "x_n", and
     # rename the variable to the name used for the results assignment
@@ -1103,13 +1192,7 @@ def make_rate_rule(assigned_var, dep_var, translations, index, content,
     xnameregexp = dep_var.name + '_'*underscores + r'(\d+)'
     newnametransform = assigned_var.name + '_'*underscores + r'\1'
     formula = re.sub(xnameregexp, newnametransform, string_formula)
-
-    # Finally, write the rate rule.
-    rule_var = rename(assigned_var.name, str(index + 1), underscores)
-    if rule_var in translations:
-        rule_var = translations[rule_var]
-    formula = translate_names(formula, translations)
-    create_rate_rule(document, rule_var, formula)
+    return translate_names(formula, translations)
 
 
 # FIXME only handles 1-D matrices.
@@ -1125,7 +1208,6 @@ def munge_reference(array, context, underscores):
     # adds one in front of each number.
     name = array.name.name
     constructed = name + '_'*(underscores - 1)
-    assignments = all_assignments(context)
     for i in range(0, len(array.args)):
         element = array.args[i]
         i += 1
@@ -1134,23 +1216,27 @@ def munge_reference(array, context, underscores):
         elif isinstance(element, Identifier):
             # The subscript is not a number.  If it's a simple variable and
             # we've seen its value, we can handle it by looking up its value.
-            var_name = element.name
-            if var_name not in assignments:
-                fail(UnsupportedInputError, 'Unable to handle "' + name + '"')
-            assigned_value = assignments[var_name]
+            assigned_value = assignment(element, context, recursive=True)
             if isinstance(assigned_value, Number):
-                constructed += '_' + assigned_value
+                constructed += '_' + assigned_value.value
             else:
                 fail(UnsupportedInputError, 'Unable to handle "' + name + '"')
     return constructed
 
 
-def make_remaining_vars(working_context, function_context, skip_vars,
-                          name_translations, document, underscores):
-
+def remaining_vars(working_context, function_context, skip_vars):
+    # Returns a dictionary of the assignments in both contexts, less those
+    # to the variables in 'skip_vars'.  Variables assigned inside the
+    # function shadow those assigned outside.
     all_vars = dict(itertools.chain(working_context.assignments.items(),
                                     function_context.assignments.items()))
-    all_vars = {lhs:rhs for lhs, rhs in all_vars.items() if lhs not in skip_vars}
+    return {lhs:rhs for lhs, rhs in all_vars.items() if lhs not in skip_vars}
+
+
+def make_remaining_vars(working_context, function_context, skip_vars,
+                        name_translations, document, underscores, folder=None):
+
+    all_vars = remaining_vars(working_context, function_context, skip_vars)
 
     # We do it slightly differently if the variable is assigned inside the
     # ODE function versus outside.  Inside, we make them assignment rules
@@ -1158,7 +1244,10 @@ def make_remaining_vars(working_context, function_context, skip_vars,
     # is called.  Outside, we make them one-time initial assignments.
     for var, rhs in natsorted(all_vars.items(), alg=ns.IGNORECASE):
         in_function = True if var in function_context.assignments else False
-        if isinstance(rhs, Number):
+        if folder and isinstance(var, Identifier) and var.name in folder.inlined:
+            # Its value has been put into the rate rule that uses it.
+            continue
+        elif isinstance(rhs, Number):
             create_parameter(document, var.name, rhs.value, True)
         elif isinstance(var, Array) or isinstance(var, ArrayRef):
             if isinstance(rhs, FunCall) and rhs.name.name.startswith('ode'):
@@ -1172,7 +1261,8 @@ def make_remaining_vars(working_context, function_context, skip_vars,
             mloop(rhs,
                   lambda idx, item: make_indexed(var, idx, item, name_translations,
                                                  False, in_function, document,
-                                                 underscores, function_context))
+                                                 underscores, function_context,
+                                                 folder))
         elif isinstance(rhs, Handle):
             # Skip function handles. If any was used in the ode* call, it will
             # have been dealt with earlier.
@@ -1182,7 +1272,13 @@ def make_remaining_vars(working_context, function_context, skip_vars,
             # when the value is another variable, i.e., "x = y".  First we
             # see if the RHS is a constant expression, because then it can be
             # made an initial assignment instead of an assignment rule.
-            if constant_expression(rhs, context):
+            # When folding, we also see if its value can be written directly.
+            value = folder.value(rhs) if folder else None
+            if folder:
+                rhs = folder.fold(rhs)
+            if value is not None:
+                create_parameter(document, var.name, decimal_text(value), True)
+            elif constant_expression(rhs, function_context):
                 create_parameter(document, var.name, 0, True)
                 formula = MatlabGrammar.make_formula(rhs)
                 create_initial_assignment(document, var.name, formula)
@@ -1243,6 +1339,69 @@ def rename(base, tail='', num_underscores=1):
 
 
 
+# -----------------------------------------------------------------------------
+# Conversion sessions.
+# -----------------------------------------------------------------------------
+#
+# Everything that changes during a conversion is kept either in the parse
+# results or in the state held by a ConversionSession: the parser (with its
+# contexts) and the generator of names for made-up functions.  Different
+# sessions share nothing, so conversions can run in several threads at
+# once, one session per thread.  (Parses using the PyParsing backend are
+# still run one at a time, because PyParsing keeps its state globally; see
+# MatlabGrammar._parse_with_packrat_cache().)
+
+class ConversionSession(object):
+    """Holds the state of one conversion from MATLAB.  Typical use:
+
+        session = ConversionSession()
+        results = session.parse_string(matlab_text)
+        [sbml, _, _] = session.create_raterule_model(results)
+
+    A session must not be used by more than one thread at a time.
+    """
+
+    def __init__(self, backend='pyparsing', cache=None):
+        """Creates a session.  The arguments are passed to MatlabGrammar()."""
+        self.parser = MatlabGrammar(cache=cache, backend=backend)
+        self.names  = NameGenerator()
+
+
+    def parse_string(self, input, fail_soft=False):
+        return self.parser.parse_string(input, fail_soft=fail_soft)
+
+
+    def parse_file(self, path, fail_soft=False):
+        return self.parser.parse_file(path, fail_soft=fail_soft)
+
+
+    def create_raterule_model(self, parse_results, use_species=True,
+                              output_format="sbml", name_vars_after_param=False,
+                              add_comments=True, fold_constants=False,
+                              inline_constants=False, common_subexpressions=False,
+                              min_subexpression_cost=2):
+        return create_raterule_model(parse_results, use_species, output_format,
+                                     name_vars_after_param, add_comments,
+                                     names=self.names,
+                                     fold_constants=fold_constants,
+                                     inline_constants=inline_constants,
+                                     common_subexpressions=common_subexpressions,
+                                     min_subexpression_cost=min_subexpression_cost)
+
+
+    def create_reaction_model(self, parse_results, use_species=True,
+                              name_vars_after_param=False, add_comments=True,
+                              fold_constants=False, inline_constants=False,
+                              numeric_parameters=False):
+        return create_reaction_model(parse_results, use_species,
+                                     name_vars_after_param, add_comments,
+                                     names=self.names,
+                                     fold_constants=fold_constants,
+                                     inline_constants=inline_constants,
+                                     numeric_parameters=numeric_parameters)
+
+
+
 # -----------------------------------------------------------------------------
 # Post-processing output from BIOCHAM web service.
 # -----------------------------------------------------------------------------
@@ -1347,10 +1506,10 @@ def fail(ex, arg):
 def parse_args(argv):
     help_msg = 'MOCCASIN version ' + __version__ + '\n' + main.__doc__
     try:
-        options, path = getopt.getopt(argv[1:], "cdpqxoOrvl")
+        options, path = getopt.getopt(argv[1:], "cdfipqsxoOrvlR")
     except:
         raise SystemExit(help_msg)
-    if len(path) != 1 or len(options) > 8:
+    if len(path) != 1 or len(options) > 12:
         raise SystemExit(help_msg)
     add_comments     = not any(['-c' in y for y in options])
     debug            = any(['-d' in y for y in options])
@@ -1361,14 +1520,24 @@ def parse_args(argv):
     name_after_param = any(['-l' in y for y in options])
     create_xpp       = any(['-o' in y for y in options])
     create_biocham   = any(['-O' in y for y in options])
-    if not create_xpp and not create_biocham:
+    create_reactions = any(['-R' in y for y in options])
+    fold_constants   = any(['-f' in y for y in options])
+    inline_constants = any(['-i' in y for y in options])
+    common_subexprs  = any(['-s' in y for y in options])
+    if create_reactions and common_subexprs:
+        # Reactions are made from the ODEs as they are.
+        raise SystemExit('Option -s applies only to equation-based SBML or XPP output.')
+    if create_reactions:
+        output_format = "reactions"
+    elif not create_xpp and not create_biocham:
         output_format = "sbml"
     elif create_xpp:
         output_format = "xpp"
     else:
         output_format = "biocham"
     return path[0], debug, quiet, print_parse, print_raw, use_species, \
-        name_after_param, output_format, add_comments
+        name_after_param, output_format, add_comments, fold_constants, \
+        inline_constants, common_subexprs
 
 
 def main(argv):
@@ -1378,17 +1547,22 @@ Converts an ODE MATLAB model in FILENAME.m into an ODE-oriented SBML or XPP
 model.  Available options:
  -c   Omit comments in the SBML file about program version and other info
  -d   Drop into pdb before starting to parse the MATLAB input
+ -f   Write constant expressions as values where they can be computed exactly
  -h   Print this help message and quit
+ -i   Like -f, and also put constants used only once into the rate rule
  -l   Name variables per ODE function's parameters (default: use output variable)
  -o   Convert to XPP .ode file format (default: produce SBML)
  -O   Convert to XPP .ode file format suitable for use with BIOCHAM
  -p   Turn variables into SBML parameters (default: make them SBML species)
  -q   Be quiet; just produce the final output, nothing else
+ -R   Convert to reaction-based SBML, inferring the reactions locally
  -r   Print the raw MatlabNode output for the output printed with option -x
+ -s   Compute subexpressions shared by several ODEs once (not with -R)
  -x   Print extra debugging info about the interpreted MATLAB
 """
     (path, debug, quiet, print_parse, print_raw, use_species, name_after_param,
-     output_format, add_comments) = parse_args(argv)
+     output_format, add_comments, fold_constants, inline_constants,
+     common_subexprs) = parse_args(argv)
 
     # Try to read the file contents.
     path = expanded_path(path)
@@ -1407,6 +1581,8 @@ model.  Available options:
             output_type = "XPP for BIOCHAM"
         elif output_format == "xpp":
             output_type = "XPP"
+        elif output_format == "reactions":
+            output_type = "reaction-based SBML"
         else:
             output_type = "SBML"
         print('----- {} file '.format(output_type) + path + ' ' + '-'*30)
@@ -1419,9 +1595,18 @@ model.  Available options:
     sanity_check_matlab(parse_results)
 
     # Now do the actual conversion.
-    NameGenerator().reset()
-    [out, _, _] = create_raterule_model(parse_results, use_species, output_format,
-                                        name_after_param, add_comments)
+    if output_format == "reactions":
+        out = create_reaction_model(parse_results, use_species,
+                                    name_after_param, add_comments,
+                                    fold_constants=fold_constants,
+                                    inline_constants=inline_constants)
+    else:
+        [out, _, _] = create_raterule_model(parse_results, use_species,
+                                            output_format, name_after_param,
+                                            add_comments,
+                                            fold_constants=fold_constants,
+                                            inline_constants=inline_constants,
+                                            common_subexpressions=common_subexprs)
 
     # Print the conversion results and other things.
     if print_parse and not quiet:
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+#
+# @file    eliminator.py
+# @brief   Find subexpressions shared by several MatlabNode expressions
+# @author  Michael Hucka
+#
+# <!---------------------------------------------------------------------------
+# This software is part of MOCCASIN, the Model ODE Converter for Creating
+# Automated SBML INteroperability. Visit https://github.com/sbmlteam/moccasin/.
+#
+# Copyright (C) 2014-2016 jointly by the following organizations:
+#  1. California Institute of Technology, Pasadena, CA, USA
+#  2. Icahn School of Medicine at Mount Sinai, New York, NY, USA
+#  3. Boston University, Boston, MA, USA
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation.  A copy of the license agreement is provided in the
+# file named "COPYING.txt" included with this software distribution and also
+# available online at https://github.com/sbmlteam/moccasin/.
+# ------------------------------------------------------------------------- -->
+
+import sys
+sys.path.append('..')
+from matlab_parser import *
+
+try:
+    from .name_generator import *
+except:
+    from name_generator import *
+
+# SubexpressionEliminator
+#
+# The rows of an ODE function's output often have terms in common, such as
+# "k1*x(1)/(K + x(1))", and each rate rule made from them makes the
+# simulator compute the term again.  SubexpressionEliminator finds the
+# subexpressions that occur more than once in a list of expressions, gives
+# each a name, and replaces its occurrences by the name.  The converter then
+# defines the names with assignment rules (in SBML) or fixed variables (in
+# XPP).
+#
+# Each distinct subexpression is given a number, in one walk of the
+# expressions: two subexpressions get the same number if they are of the
+# same kind with the same operator and their operands have the same
+# numbers.  Operands are numbered before the expressions they are part of.
+# The cost of a subexpression is the number of operators and function calls
+# in it; references to variables (including array elements such as x(1))
+# and numbers cost nothing, and are never shared on their own.  Only
+# subexpressions with at least 'min_cost' operations are shared.
+#
+# Subexpressions are considered from the most costly down.  Sharing one
+# that occurs N times leaves one copy of its parts (in its definition), so
+# the counts of its parts are reduced by N-1 for every time they occur in
+# it; a part is then shared only if it still occurs more than once.
+# Operands are not reordered, so "a*b" and "b*a" are different, as are the
+# two halves of "a + b + c" and "a + (b + c)".
+
+class SubexpressionEliminator(object):
+    """Replaces subexpressions that occur more than once in a list of
+    MatlabNode expressions by new variables."""
+
+    def __init__(self, min_cost=2, names=None):
+        self.min_cost = max(1, min_cost)
+        self._names = names or NameGenerator()
+
+
+    def eliminate(self, expressions, prefix='cse'):
+        """Returns a tuple (expressions, shared), where 'expressions' are
+        the given expressions with the shared subexpressions replaced by
+        Identifier objects, and 'shared' is a list of tuples (name,
+        expression) defining the variables.  A definition may use the
+        variables defined before it in the list.  The given expressions
+        are not changed."""
+        self._keys  = {}                # Key of subexpression => its number.
+        self._nodes = []                # Number => a node.
+        self._parts = []                # Number => numbers of its operands.
+        self._costs = []                # Number => its cost.
+        self._count = []                # Number => times it occurs.
+        tops = [self._number(expr) for expr in expressions]
+
+        chosen = []
+        for num in sorted(range(len(self._nodes)), key=lambda n: -self._costs[n]):
+            count = self._count[num]
+            if count < 2 or self._costs[num] < self.min_cost:
+                continue
+            chosen.append(num)
+            stack = list(self._parts[num])
+            while stack:
+                part = stack.pop()
+                self._count[part] -= count - 1
+                stack.extend(self._parts[part])
+
+        # Name them in the order they will be defined, which is the order
+        # they were numbered in, and rebuild the expressions from the
+        # operands up, using the names.
+        chosen = dict((num, Identifier(name=self._names.name(prefix=prefix)))
+                      for num in sorted(chosen))
+        rebuilt = []
+        for num, node in enumerate(self._nodes):
+            parts = [chosen.get(part, rebuilt[part]) for part in self._parts[num]]
+            if any(part is not self._nodes[n]
+                   for part, n in zip(parts, self._parts[num])):
+                node = _with_operands(node, parts)
+            rebuilt.append(node)
+        expressions = [chosen.get(num, rebuilt[num]) for num in tops]
+        shared = [(chosen[num].name, rebuilt[num]) for num in sorted(chosen)]
+        return (expressions, shared)
+
+
+    def _number(self, expr):
+        # Numbers 'expr' and all of its subexpressions.  This uses our own
+        # stack (see "Deeply nested operator expressions" in matlab.py).
+        stack = [(expr, False)]
+        numbers = []
+        while stack:
+            (node, ready) = stack.pop()
+            operands = _operands(node)
+            if operands and not ready:
+                stack.append((node, True))
+                stack.extend((operand, False) for operand in reversed(operands))
+                continue
+            parts = tuple(numbers[len(numbers) - len(operands):]) if operands else ()
+            if operands:
+                del numbers[len(numbers) - len(operands):]
+            key = (type(node).__name__, _label(node)) + parts
+            num = self._keys.get(key)
+            if num is None:
+                num = len(self._nodes)
+                self._keys[key] = num
+                self._nodes.append(node)
+                self._parts.append(parts)
+                cost = sum(self._costs[part] for part in parts)
+                self._costs.append(cost + 1 if operands is not None else 0)
+                self._count.append(0)
+            self._count[num] += 1
+            numbers.append(num)
+        return numbers[0]
+
+
+def _operands(node):
+    # The operands of an operation, or None if 'node' is not one.
+    if isinstance(node, BinaryOp):
+        return [node.left, node.right]
+    elif isinstance(node, (UnaryOp, Transpose)):
+        return [node.operand]
+    elif isinstance(node, FunCall) and isinstance(node.name, Identifier):
+        return list(node.args or [])
+    return None
+
+
+def _label(node):
+    # What distinguishes 'node' from other nodes of its kind with the same
+    # operands.  Other things are compared whole.
+    if isinstance(node, (BinaryOp, UnaryOp, Transpose)):
+        return node.op
+    elif isinstance(node, FunCall) and isinstance(node.name, Identifier):
+        return node.name.name
+    elif isinstance(node, Number):
+        return node.value
+    elif isinstance(node, Identifier):
+        return node.name
+    return repr(node)
+
+
+def _with_operands(node, operands):
+    if isinstance(node, BinaryOp):
+        return BinaryOp(op=node.op, left=operands[0], right=operands[1])
+    elif isinstance(node, FunCall):
+        return FunCall(name=node.name, args=operands)
+    return type(node)(op=node.op, operand=operands[0])
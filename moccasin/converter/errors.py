@@ -60,3 +60,29 @@ class UnsupportedInputError(MoccasinException):
 class ConversionError(MoccasinException):
     """Class of errors for general failures of MOCCASIN's conversion approach."""
     pass
+
+
+class EvaluationError(MoccasinException):
+    """Class of errors for expressions that cannot be evaluated."""
+    pass
+
+
+class UnknownIdentifierError(EvaluationError):
+    """Class of errors for expressions that use variables without values.
+    The attribute 'names' holds the names of the variables."""
+
+    def __init__(self, names):
+        self.names = sorted(names)
+        super(UnknownIdentifierError, self).__init__(
+            'unknown identifier(s): ' + ', '.join(self.names))
+
+
+class BiochamError(MoccasinException):
+    """Class of errors for failures of the BIOCHAM web service."""
+    pass
+
+
+class BiochamUnavailableError(BiochamError):
+    """Class of errors for calls to BIOCHAM that are not made, because the
+    last ones failed (see BiochamClient)."""
+    pass
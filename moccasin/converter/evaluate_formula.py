@@ -36,6 +36,9 @@ __source__ = '''http://pyparsing.wikispaces.com/file/view/fourFn.py'''
 class NumericStringParser(object):
     """
     Most of this code comes from the fourFn.py pyparsing example
+
+    This evaluates formulas given as text.  To evaluate MatlabNode
+    expressions, use MatlabEvaluator (in evaluator.py) instead.
     """
     def push_first(self, toks):
         self.exprStack.append(toks[0])
@@ -0,0 +1,480 @@
+#!/usr/bin/env python
+#
+# @file    evaluator.py
+# @brief   Compile and evaluate MatlabNode expressions
+# @author  Michael Hucka
+#
+# <!---------------------------------------------------------------------------
+# This software is part of MOCCASIN, the Model ODE Converter for Creating
+# Automated SBML INteroperability. Visit https://github.com/sbmlteam/moccasin/.
+#
+# Copyright (C) 2014-2016 jointly by the following organizations:
+#  1. California Institute of Technology, Pasadena, CA, USA
+#  2. Icahn School of Medicine at Mount Sinai, New York, NY, USA
+#  3. Boston University, Boston, MA, USA
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation.  A copy of the license agreement is provided in the
+# file named "COPYING.txt" included with this software distribution and also
+# available online at https://github.com/sbmlteam/moccasin/.
+# ------------------------------------------------------------------------- -->
+
+from __future__ import division
+import decimal
+from decimal import Decimal
+import math
+import operator
+import six
+import sys
+sys.path.append('..')
+from matlab_parser import *
+
+try:
+    from .errors import *
+except:
+    from errors import *
+
+# MatlabEvaluator
+#
+# NumericStringParser (in evaluate_formula.py) evaluates formulas given as
+# text, which means turning MatlabNode expressions back into text and
+# parsing them again with a grammar of its own.  MatlabEvaluator instead
+# works on the MatlabNode expressions themselves.  It compiles each
+# expression once into a Python function of an environment (a dictionary
+# from variable names to values), which can then be called any number of
+# times.  It has two modes:
+#
+#  - float mode (the default), in which numbers are Python floats;
+#  - exact mode, in which numbers are Decimal objects.  Sums, differences,
+#    products, quotients, integer powers, sqrt, exp and logarithms are done
+#    in Decimal arithmetic, with the precision of the decimal context given
+#    to the evaluator.  Other functions (trigonometric functions, etc.) are
+#    computed with floats and converted back to Decimal.
+#
+# Scalar expressions are supported: numbers, variables, arithmetic,
+# relational and logical operators, calls to common elementary functions,
+# and references such as x(2) to elements of lists in the environment.
+# Anything else raises EvaluationError when it is compiled.  A variable
+# that is neither in the environment nor one of the constants pi, Inf and
+# NaN raises UnknownIdentifierError, naming all the missing variables.
+#
+# Chains of left operands are compiled into a single function with a loop
+# rather than one nested function per operator (see "Deeply nested operator
+# expressions" in matlab.py).
+
+
+# Helpers for the two modes.
+# .............................................................................
+
+def _matlab_round(x):
+    # MATLAB rounds halves away from zero.
+    return math.floor(x + 0.5) if x >= 0 else math.ceil(x - 0.5)
+
+
+def _fix(x):
+    return math.floor(x) if x >= 0 else math.ceil(x)
+
+
+def _sign(x):
+    return (x > 0) - (x < 0)
+
+
+def _mod(x, y):
+    return x if y == 0 else x - math.floor(x / y) * y
+
+
+def _rem(x, y):
+    return x if y == 0 else x - _fix(x / y) * y
+
+
+def _power(x, y):
+    # Python gives complex results for negative numbers raised to
+    # fractional powers; we don't handle them.
+    result = x ** y
+    if isinstance(result, complex):
+        raise ValueError('complex result')
+    return result
+
+
+def _dec_to_integral(rounding):
+    return lambda x: x.to_integral_value(rounding=rounding)
+
+
+def _dec_mod(x, y):
+    if y == 0:
+        return x
+    r = x % y
+    if r and (r < 0) != (y < 0):
+        r += y
+    return r
+
+
+def _dec_rem(x, y):
+    return x if y == 0 else x % y
+
+
+def _dec_sign(x):
+    return Decimal((x > 0) - (x < 0))
+
+
+def _via_float(fn):
+    # Computes a function that Decimal doesn't have using floats.
+    return lambda *args: Decimal(repr(fn(*[float(x) for x in args])))
+
+
+_SHARED_FUNCTIONS = {
+    'plus':     operator.add,
+    'minus':    operator.sub,
+    'times':    operator.mul,
+    'mtimes':   operator.mul,
+    'rdivide':  operator.truediv,
+    'mrdivide': operator.truediv,
+    'ldivide':  lambda x, y: y / x,
+    'mldivide': lambda x, y: y / x,
+    'power':    _power,
+    'mpower':   _power,
+    'uminus':   operator.neg,
+    'uplus':    operator.pos,
+    'abs':      abs,
+    'max':      max,
+    'min':      min,
+}
+
+_FLOAT_FUNCTIONS = dict(_SHARED_FUNCTIONS, **{
+    'sqrt':  math.sqrt,
+    'exp':   math.exp,
+    'log':   math.log,
+    'log10': math.log10,
+    'log2':  lambda x: math.log(x, 2),
+    'sin':   math.sin,
+    'cos':   math.cos,
+    'tan':   math.tan,
+    'asin':  math.asin,
+    'acos':  math.acos,
+    'atan':  math.atan,
+    'atan2': math.atan2,
+    'sinh':  math.sinh,
+    'cosh':  math.cosh,
+    'tanh':  math.tanh,
+    'asinh': math.asinh,
+    'acosh': math.acosh,
+    'atanh': math.atanh,
+    'hypot': math.hypot,
+    'floor': lambda x: float(math.floor(x)),
+    'ceil':  lambda x: float(math.ceil(x)),
+    'fix':   lambda x: float(_fix(x)),
+    'round': lambda x: float(_matlab_round(x)),
+    'sign':  lambda x: float(_sign(x)),
+    'mod':   _mod,
+    'rem':   _rem,
+})
+
+_DECIMAL_FUNCTIONS = dict(_SHARED_FUNCTIONS, **{
+    'sqrt':  lambda x: x.sqrt(),
+    'exp':   lambda x: x.exp(),
+    'log':   lambda x: x.ln(),
+    'log10': lambda x: x.log10(),
+    'log2':  lambda x: x.ln() / Decimal(2).ln(),
+    'sin':   _via_float(math.sin),
+    'cos':   _via_float(math.cos),
+    'tan':   _via_float(math.tan),
+    'asin':  _via_float(math.asin),
+    'acos':  _via_float(math.acos),
+    'atan':  _via_float(math.atan),
+    'atan2': _via_float(math.atan2),
+    'sinh':  _via_float(math.sinh),
+    'cosh':  _via_float(math.cosh),
+    'tanh':  _via_float(math.tanh),
+    'asinh': _via_float(math.asinh),
+    'acosh': _via_float(math.acosh),
+    'atanh': _via_float(math.atanh),
+    'hypot': _via_float(math.hypot),
+    'floor': _dec_to_integral(decimal.ROUND_FLOOR),
+    'ceil':  _dec_to_integral(decimal.ROUND_CEILING),
+    'fix':   _dec_to_integral(decimal.ROUND_DOWN),
+    'round': _dec_to_integral(decimal.ROUND_HALF_UP),
+    'sign':  _dec_sign,
+    'mod':   _dec_mod,
+    'rem':   _dec_rem,
+})
+
+_ARITHMETIC_OPS = {
+    '+':   operator.add,
+    '-':   operator.sub,
+    '*':   operator.mul,
+    '.*':  operator.mul,
+    '/':   operator.truediv,
+    './':  operator.truediv,
+    '\\':  lambda x, y: y / x,
+    '.\\': lambda x, y: y / x,
+    '^':   _power,
+    '.^':  _power,
+}
+
+_RELATIONAL_OPS = {
+    '==': operator.eq,
+    '~=': operator.ne,
+    '!=': operator.ne,
+    '<':  operator.lt,
+    '<=': operator.le,
+    '>':  operator.gt,
+    '>=': operator.ge,
+    '&&': lambda x, y: bool(x) and bool(y),
+    '&':  lambda x, y: bool(x) and bool(y),
+    '||': lambda x, y: bool(x) or bool(y),
+    '|':  lambda x, y: bool(x) or bool(y),
+}
+
+_CONSTANTS = {'pi': math.pi, 'Inf': float('inf'), 'inf': float('inf'),
+              'NaN': float('nan'), 'nan': float('nan')}
+
+
+# The evaluator.
+# .............................................................................
+
+class CompiledExpression(object):
+    """An expression compiled by MatlabEvaluator.  Call it with an
+    environment (a dictionary from variable names to values) to evaluate
+    it.  The attribute 'names' is the set of the names of the variables it
+    needs from the environment."""
+
+    __slots__ = ('node', 'names', '_evaluator', '_function')
+
+    def __init__(self, node, names, evaluator, function):
+        self.node       = node
+        self.names      = names
+        self._evaluator = evaluator
+        self._function  = function
+
+
+    def __call__(self, env=None):
+        return self._evaluator._run(self, self._evaluator.environment(env))
+
+
+class MatlabEvaluator(object):
+    """Compiles MatlabNode expressions into functions and evaluates them.
+    If 'exact' is True, numbers are Decimal objects and arithmetic is done
+    in the decimal context 'context' (the current one if it is None);
+    otherwise, numbers are floats.  Compiled expressions are kept, so that
+    compiling an expression equal to one compiled before costs a lookup.
+    """
+
+    def __init__(self, exact=False, context=None):
+        self.exact = exact
+        self._decimal_context = context
+        self._compiled = {}
+        if exact:
+            self._number = self._decimal
+            self._functions = _DECIMAL_FUNCTIONS
+            self._true, self._false = Decimal(1), Decimal(0)
+        else:
+            self._number = self._float
+            self._functions = _FLOAT_FUNCTIONS
+            self._true, self._false = 1.0, 0.0
+        self._constants = dict((name, self._number(value))
+                               for name, value in _CONSTANTS.items())
+
+
+    def compile(self, node):
+        """Returns a CompiledExpression for the expression 'node'."""
+        compiled = self._compiled.get(node)
+        if compiled is None:
+            names = set()
+            function = self._compile(node, names)
+            compiled = CompiledExpression(node, names, self, function)
+            self._compiled[node] = compiled
+        return compiled
+
+
+    def evaluate(self, node, env=None):
+        """Evaluates the expression 'node' using the variable values in
+        'env', a dictionary from names to values."""
+        return self._run(self.compile(node), self.environment(env))
+
+
+    def evaluate_all(self, nodes, env=None):
+        """Evaluates each of the expressions in 'nodes' using the variable
+        values in 'env', and returns a list of the values.  Variables
+        missing from 'env' are reported for all of the expressions at
+        once."""
+        env = self.environment(env)
+        compiled = [self.compile(node) for node in nodes]
+        missing = set()
+        for expr in compiled:
+            missing.update(name for name in expr.names if name not in env)
+        if missing:
+            raise UnknownIdentifierError(missing)
+        return [self._run(expr, env) for expr in compiled]
+
+
+    def environment(self, env):
+        """Returns a copy of 'env' with its values converted to the numbers
+        used by this evaluator.  Values may be numbers, strings holding
+        numbers, or lists of them."""
+        converted = {}
+        for name, value in (env or {}).items():
+            if isinstance(value, (list, tuple)):
+                converted[name] = [self._number(x) for x in value]
+            else:
+                converted[name] = self._number(value)
+        return converted
+
+
+    def _run(self, compiled, env):
+        missing = [name for name in compiled.names if name not in env]
+        if missing:
+            raise UnknownIdentifierError(missing)
+        try:
+            if self.exact:
+                with decimal.localcontext(self._decimal_context):
+                    return compiled._function(env)
+            return compiled._function(env)
+        except (ArithmeticError, ValueError, TypeError, IndexError) as err:
+            text = MatlabGrammar.make_formula(compiled.node)
+            if isinstance(err, decimal.DecimalException):
+                # These have unhelpful messages.
+                err = type(err).__name__
+            raise EvaluationError('cannot evaluate {}: {}'.format(text, err))
+
+
+    def _float(self, value):
+        if isinstance(value, six.string_types):
+            return float(self._number_text(value))
+        return float(value)
+
+
+    def _decimal(self, value):
+        if isinstance(value, Decimal):
+            return value
+        elif isinstance(value, six.string_types):
+            return Decimal(self._number_text(value))
+        elif isinstance(value, float):
+            return Decimal(repr(value))
+        return Decimal(int(value))
+
+
+    def _number_text(self, text):
+        # MATLAB numbers may use 'd' for the exponent; imaginary ones can't
+        # be handled.
+        if text and text[-1] in 'ijIJ':
+            raise EvaluationError('complex numbers are not supported: ' + text)
+        return text.replace('d', 'e').replace('D', 'e')
+
+
+    # Compiling.  Each _compile* method returns a function of the
+    # environment, and adds the names of the variables it needs to 'names'.
+
+    def _compile(self, node, names):
+        # Left operands of nested binary operators are followed with a loop
+        # and evaluated in order, which is the order the tree gives.
+        chain = []
+        while isinstance(node, BinaryOp):
+            chain.append(node)
+            node = node.left
+        first = self._compile_operand(node, names)
+        if not chain:
+            return first
+        steps = [(self._binary_op(n.op), self._compile(n.right, names))
+                 for n in reversed(chain)]
+        if len(steps) == 1:
+            (op, right) = steps[0]
+            return lambda env: op(first(env), right(env))
+        def evaluate_chain(env):
+            value = first(env)
+            for op, right in steps:
+                value = op(value, right(env))
+            return value
+        return evaluate_chain
+
+
+    def _compile_operand(self, node, names):
+        if isinstance(node, Number):
+            value = self._number(node.value)
+            return lambda env: value
+        elif isinstance(node, Identifier):
+            return self._compile_variable(node.name, names)
+        elif isinstance(node, UnaryOp):
+            operand = self._compile(node.operand, names)
+            if node.op == '-':
+                return lambda env: -operand(env)
+            elif node.op == '+':
+                return operand
+            elif node.op in ['~', '!']:
+                (true, false) = (self._true, self._false)
+                return lambda env: false if operand(env) else true
+        elif isinstance(node, Transpose):
+            # The transpose of a scalar is the scalar.
+            return self._compile(node.operand, names)
+        elif isinstance(node, Array):
+            if (node.rows and len(node.rows) == 1 and len(node.rows[0]) == 1
+                    and not node.is_cell):
+                return self._compile(node.rows[0][0], names)
+        elif isinstance(node, (FunCall, ArrayRef, Ambiguous)):
+            if isinstance(node.name, Identifier):
+                return self._compile_call(node, names)
+        raise EvaluationError('cannot evaluate {}'.format(
+            MatlabGrammar.make_formula(node)))
+
+
+    def _compile_variable(self, name, names):
+        if name in self._constants:
+            value = self._constants[name]
+            return lambda env: env[name] if name in env else value
+        names.add(name)
+        return lambda env: env[name]
+
+
+    def _compile_call(self, node, names):
+        # Ambiguous nodes and array references name an element of a list in
+        # the environment, or a function if there is no such variable.
+        name = node.name.name
+        if not node.args and name in self._constants:
+            # MATLAB's pi, Inf and NaN are functions.
+            return self._compile_variable(name, names)
+        args = [self._compile(arg, names) for arg in (node.args or [])]
+        function = self._functions.get(name)
+        if function is None:
+            if isinstance(node, FunCall):
+                raise EvaluationError('unknown function ' + name)
+            names.add(name)
+            function = _no_such_function(name)
+        elif isinstance(node, FunCall):
+            return self._call(function, args)
+        call = self._call(function, args)
+        if not args:
+            return lambda env: env[name] if name in env else call(env)
+        def reference(env):
+            if name not in env:
+                return call(env)
+            value = env[name]
+            for arg in args:
+                value = value[int(arg(env)) - 1]
+            return value
+        return reference
+
+
+    def _call(self, function, args):
+        if len(args) == 1:
+            arg = args[0]
+            return lambda env: function(arg(env))
+        elif len(args) == 2:
+            (arg1, arg2) = args
+            return lambda env: function(arg1(env), arg2(env))
+        return lambda env: function(*[arg(env) for arg in args])
+
+
+    def _binary_op(self, op):
+        if op in _ARITHMETIC_OPS:
+            return _ARITHMETIC_OPS[op]
+        elif op in _RELATIONAL_OPS:
+            test = _RELATIONAL_OPS[op]
+            (true, false) = (self._true, self._false)
+            return lambda x, y: true if test(x, y) else false
+        raise EvaluationError('unsupported operator ' + op)
+
+
+def _no_such_function(name):
+    def fail(*args):
+        raise UnknownIdentifierError([name])
+    return fail
@@ -31,14 +31,46 @@ from collections import defaultdict
 # will need to be handled specially in the MOCCASIN conversion procedure.  This
 # code is a general system that hopefully can be extended in the future for
 # other constructs if we ever need to do that.
+#
+# By default, any reference to a variable or function makes an expression
+# non-constant.  Two optional arguments relax this: 'known' is a function
+# that returns True for the names of variables whose values are known (and
+# which therefore count as constants), and 'functions' is a collection of
+# names of functions whose calls count as constant if their arguments are.
 
 class MatlabExprTester(MatlabNodeVisitor):
-    def __init__(self, context):
+    def __init__(self, context, known=None, functions=None):
         super(MatlabExprTester, self).__init__()
         self._context = context
+        self._known = known
+        self._functions = functions or ()
         self._is_constant = True
 
 
+    def visit_Identifier(self, node):
+        if not (self._known and self._known(node.name)):
+            self._is_constant = False
+        return node
+
+
+    def visit_FunCall(self, node):
+        if self._is_function(node):
+            self.visit(node.args)
+        else:
+            self._is_constant = False
+        return node
+
+
+    def visit_Ambiguous(self, node):
+        if not node.args and isinstance(node.name, Identifier):
+            self.visit_Identifier(node.name)
+        elif self._is_function(node) and not self._is_known(node.name):
+            self.visit(node.args)
+        else:
+            self._is_constant = False
+        return node
+
+
     def visit_Reference(self, node):
         self._is_constant = False
         return node
@@ -51,3 +83,12 @@ class MatlabExprTester(MatlabNodeVisitor):
 
     def is_constant(self):
         return self._is_constant
+
+
+    def _is_function(self, node):
+        return (isinstance(node.name, Identifier)
+                and node.name.name in self._functions)
+
+
+    def _is_known(self, name):
+        return bool(self._known) and self._known(name.name)
@@ -23,25 +23,56 @@
 import sys
 sys.path.append('..')
 from matlab_parser import *
+from collections import defaultdict
 
 
+# MatlabFinder
+#
+# MatlabFinder answers the question "is this variable used in this context?"
+# for the variables of a context.  A variable counts as used if it is an
+# argument of a function call or array reference, the right-hand side of an
+# assignment, an operand, an element of an array, the name of an array
+# reference or structure, the body of an anonymous function, or a condition
+# or expression in a flow-control statement.  Inner functions are searched;
+# local functions are not.
+#
+# Rather than searching the nodes of the context for every variable, the
+# first question walks the nodes once and makes an index of every variable
+# used in them, which answers the rest.  The nodes must not be changed
+# while the same MatlabFinder is being asked about them.
+
 class MatlabFinder(MatlabNodeVisitor):
     def __init__(self, context):
         super(MatlabFinder, self).__init__()
-        self._found = []
         self._context = context
+        self._uses = None
 
 
-    def _foundit(self):
-        self._found.append(self._sought)
+    def find_use(self, var):
+        """Returns True if 'var' is used in the context."""
+        return bool(self.uses(var))
 
 
-    def visit_FunCall(self, node):
-        if node.args and self._sought in node.args:
-            self._foundit()
-            return
+    def uses(self, var):
+        """Returns a list of the nodes that use 'var', one entry per use."""
+        if self._uses is None:
+            self._uses = defaultdict(list)
+            self.visit(self._context.nodes)
+        return self._uses.get(var, [])
+
+
+    def _check(self, node, thing):
+        # Records 'thing' as used by 'node' if it is a variable, and looks
+        # inside it otherwise.
+        if isinstance(thing, Identifier):
+            self._uses[thing].append(node)
         else:
-            self.visit(node.args)
+            self.visit(thing)
+
+
+    def visit_FunCall(self, node):
+        for arg in (node.args or []):
+            self._check(node, arg)
 
 
     def visit_FunDef(self, node):
@@ -56,168 +87,73 @@ class MatlabFinder(MatlabNodeVisitor):
 
 
     def visit_Assignment(self, node):
-        if node.rhs == self._sought:
-            self._foundit()
-            return
-        else:
-            self.visit(node.rhs)
+        self._check(node, node.rhs)
 
 
     def visit_Operator(self, node):
-        if hasattr(node, 'operand'):
-            if node.operand == self._sought:
-                self._foundit()
-                return
-            else:
-                self.visit(node.operand)
-        if hasattr(node, 'left'):
-            if node.left == self._sought:
-                self._foundit()
-                return
-            else:
-                self.visit(node.left)
-        if hasattr(node, 'right'):
-            if node.right == self._sought:
-                self._foundit()
-                return
-            else:
-                self.visit(node.right)
-        if hasattr(node, 'middle'):
-            if node.middle == self._sought:
-                self._foundit()
-                return
-            else:
-                self.visit(node.middle)
+        # Operands that are themselves operators are handled using our own
+        # stack rather than by calling visit() on them (see "Deeply nested
+        # operator expressions" in matlab.py).
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for operand in self._operands(node):
+                if isinstance(operand, Operator):
+                    stack.append(operand)
+                else:
+                    self._check(node, operand)
+
+
+    def _operands(self, node):
+        names = ['operand', 'left', 'right', 'middle']
+        return [getattr(node, a) for a in names if hasattr(node, a)]
 
 
     def visit_If(self, node):
-        if node.cond == self._sought:
-            self._foundit()
-            return
-        else:
-            self.visit(node.cond)
-        if node.body == self._sought:
-            self._foundit()
-            return
-        else:
-            self.visit(node.body)
-        if node.else_body == self._sought:
-            self._foundit()
-            return
-        else:
-            self.visit(node.else_body)
+        self._check(node, node.cond)
+        self._check(node, node.body)
+        self._check(node, node.else_body)
         for else_cond, else_body in (node.elseif_tuples or []):
-            if else_cond == self._sought:
-                self._foundit()
-                return
-            else:
-                self.visit(else_cond)
-            if else_body == self._sought:
-                self._foundit()
-                return
-            else:
-                self.visit(else_body)
+            self._check(node, else_cond)
+            self._check(node, else_body)
 
 
     def visit_Switch(self, node):
-        if node.cond == self._sought:
-            self._foundit()
-            return
-        else:
-            self.visit(node.cond)
-        if node.otherwise == self._sought:
-            self._foundit()
-            return
-        else:
-            self.visit(node.otherwise)
+        self._check(node, node.cond)
+        self._check(node, node.otherwise)
         for case_cond, case_body in (node.case_tuples or []):
-            if case_cond == self._sought:
-                self._foundit()
-                return
-            else:
-                self.visit(case_cond)
-            if case_body == self._sought:
-                self._foundit()
-                return
-            else:
-                self.visit(case_body)
+            self._check(node, case_cond)
+            self._check(node, case_body)
 
 
     def visit_FlowControl(self, node):
         # This handles the remaining flow control constructs like while & for.
-        if hasattr(node, 'cond'):
-            if node.cond == self._sought:
-                self._foundit()
-                return
-            else:
-                self.visit(node.cond)
-        if hasattr(node, 'expr'):
-            if node.expr == self._sought:
-                self._foundit()
-                return
-            else:
-                self.visit(node.expr)
-        if hasattr(node, 'body'):
-            if node.body == self._sought:
-                self._foundit()
-                return
-            else:
-                self.visit(node.body)
+        for attr in ['cond', 'expr', 'body']:
+            if hasattr(node, attr):
+                self._check(node, getattr(node, attr))
 
 
     def visit_Array(self, node):
         for row in (node.rows or []):
             for item in (row or []):
-                if item == self._sought:
-                    self._foundit()
-                    return
-                else:
-                    self.visit(item)
+                self._check(node, item)
 
 
     def visit_ArrayRef(self, node):
-        if node.name == self._sought:
-            self._foundit()
-            return
-        elif not isinstance(node.name, Identifier):
-            self.visit(node.name)
-        if node.args and self._sought in node.args:
-            self._foundit()
-            return
-        else:
-            self.visit(node.args)
+        self._check(node, node.name)
+        for arg in (node.args or []):
+            self._check(node, arg)
 
 
     def visit_Ambiguous(self, node):
-        if node.name == self._sought:
-            self._foundit()
-            return
-        elif not isinstance(node.name, Identifier):
-            self.visit(node.name)
-        if node.args and self._sought in node.args:
-            self._foundit()
-            return
-        else:
-            self.visit(node.args)
+        self._check(node, node.name)
+        for arg in (node.args or []):
+            self._check(node, arg)
 
 
     def visit_StructRef(self, node):
-        if node.name == self._sought:
-            self._foundit()
-            return
-        elif not isinstance(node.name, Identifier):
-            self.visit(node.name)
+        self._check(node, node.name)
 
 
     def visit_AnonFun(self, node):
-        if node.body == self._sought:
-            self._foundit()
-            return
-        else:
-            self.visit(node.body)
-
-
-    def find_use(self, var):
-        self._sought = var
-        self.visit(self._context.nodes)
-        return var in self._found
+        self._check(node, node.body)
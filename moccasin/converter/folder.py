@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+#
+# @file    folder.py
+# @brief   Fold constant expressions in a MatlabNode tree
+# @author  Michael Hucka
+#
+# <!---------------------------------------------------------------------------
+# This software is part of MOCCASIN, the Model ODE Converter for Creating
+# Automated SBML INteroperability. Visit https://github.com/sbmlteam/moccasin/.
+#
+# Copyright (C) 2014-2016 jointly by the following organizations:
+#  1. California Institute of Technology, Pasadena, CA, USA
+#  2. Icahn School of Medicine at Mount Sinai, New York, NY, USA
+#  3. Boston University, Boston, MA, USA
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation.  A copy of the license agreement is provided in the
+# file named "COPYING.txt" included with this software distribution and also
+# available online at https://github.com/sbmlteam/moccasin/.
+# ------------------------------------------------------------------------- -->
+
+from collections import Counter
+import decimal
+import sys
+sys.path.append('..')
+from matlab_parser import *
+
+try:
+    from .errors import *
+    from .evaluator import *
+    from .expr_tester import *
+except:
+    from errors import *
+    from evaluator import *
+    from expr_tester import *
+
+# MatlabConstantFolder
+#
+# Without folding, every constant expression outside the ODE function (such
+# as "a = 0.01 * 60") becomes a parameter with value 0 plus an initial
+# assignment, which simulators have to evaluate when they load the model.
+# MatlabConstantFolder works out the values of such expressions so that the
+# converter can write them as literal values instead.  It is given the
+# assignments of the variables whose values may be propagated; a variable
+# has a known value if the right-hand side of its assignment does.
+#
+# An expression is folded only if its value is exact: MatlabExprTester
+# (told which variables are known and which functions may be called)
+# decides whether an expression is constant, and MatlabEvaluator computes
+# its value in exact mode, in a decimal context that signals inexact
+# results.  So "0.01 * 60" becomes 0.6, but "1/3" and "exp(1)" are left
+# alone.  Results with more significant digits than a double can hold are
+# not folded either.
+#
+# Folding an expression that is not constant replaces its constant parts:
+# "0.01 * 60 * x" becomes "0.6 * x".  Operations are folded in the order the
+# tree gives, so "x * 0.01 * 60" is left as it is.  Variables with known
+# values are left as references (the parameters are still in the model, and
+# are what the expression depends on), except for the variables in
+# 'inlined', which are replaced by their values; see choose_inlined().  So
+# only parts whose variables are all in 'inlined' are folded.
+
+# Functions whose values MatlabEvaluator computes in Decimal arithmetic in
+# exact mode.  (It computes the others, such as sin, using floats.)
+EXACT_FUNCTIONS = frozenset([
+    'plus', 'minus', 'times', 'mtimes', 'rdivide', 'mrdivide', 'ldivide',
+    'mldivide', 'power', 'mpower', 'uminus', 'uplus', 'abs', 'max', 'min',
+    'sqrt', 'exp', 'log', 'log10', 'log2', 'floor', 'ceil', 'fix', 'round',
+    'sign', 'mod', 'rem',
+])
+
+_EXACT_CONTEXT = decimal.Context(prec=17, traps=[decimal.Inexact,
+                                                 decimal.InvalidOperation,
+                                                 decimal.DivisionByZero,
+                                                 decimal.Overflow])
+
+
+class MatlabConstantFolder(object):
+    """Folds constant expressions and propagates the values of variables.
+    'assignments' is a dictionary of the variables whose values may be
+    propagated, from the left-hand sides of their assignments (Identifier
+    objects) to the right-hand sides.  Other entries are ignored."""
+
+    def __init__(self, assignments):
+        self._assignments = dict((lhs.name, rhs)
+                                 for lhs, rhs in assignments.items()
+                                 if isinstance(lhs, Identifier))
+        self._values = {}
+        self._pending = set()
+        self._evaluator = MatlabEvaluator(exact=True, context=_EXACT_CONTEXT)
+        self.inlined = set()
+
+
+    def variable_value(self, name):
+        """Returns the value of the variable named 'name' as a Decimal, or
+        None if it is not known exactly."""
+        if name in self._values:
+            return self._values[name]
+        rhs = self._assignments.get(name)
+        if rhs is None or name in self._pending:
+            return None
+        self._pending.add(name)
+        try:
+            value = self.value(rhs)
+        finally:
+            self._pending.discard(name)
+        self._values[name] = value
+        return value
+
+
+    def value(self, node):
+        """Returns the value of expression 'node' as a Decimal, or None if
+        it is not constant or its value can't be computed exactly."""
+        return self._value(node, self._known)
+
+
+    def fold(self, node):
+        """Returns 'node' with its constant parts replaced by their values,
+        and the variables in 'inlined' replaced by theirs.  'node' itself
+        is not changed."""
+        return self._fold(node)[0]
+
+
+    def choose_inlined(self, rows, others):
+        """Sets 'inlined' to the names of the variables with known values
+        that are used once in the expressions 'rows' and 'others' (after
+        folding), where that use is in 'rows'.  The right-hand sides of the
+        assignments given to the folder count as 'others', except for those
+        whose values are known, since those will be written as values."""
+        self.inlined = set()
+        others = list(others) + [rhs for name, rhs in self._assignments.items()
+                                 if self.variable_value(name) is None]
+        in_rows = _count_uses([self.fold(node) for node in rows])
+        in_all = in_rows + _count_uses([self.fold(node) for node in others])
+        self.inlined = set(name for name, count in in_rows.items()
+                           if count == 1 and in_all[name] == 1
+                           and self.variable_value(name) is not None)
+        return self.inlined
+
+
+    def _known(self, name):
+        return self.variable_value(name) is not None
+
+
+    def _known_inlined(self, name):
+        return name in self.inlined and self._known(name)
+
+
+    def _value(self, node, known):
+        tester = MatlabExprTester(None, known=known, functions=EXACT_FUNCTIONS)
+        tester.visit(node)
+        if not tester.is_constant():
+            return None
+        return self._evaluate(node)
+
+
+    def _evaluate(self, node):
+        try:
+            compiled = self._evaluator.compile(node)
+            values = [(name, self.variable_value(name))
+                      for name in compiled.names]
+            return compiled(dict((name, value) for name, value in values
+                                 if value is not None))
+        except EvaluationError:
+            return None
+
+
+    def _fold(self, node):
+        # Returns the folded node and its value, or None for the value if it
+        # is not known exactly or the node is to be left as it is (as are
+        # variables not in 'inlined').
+        if isinstance(node, Number):
+            return (node, self._evaluate(node))
+        elif isinstance(node, Identifier):
+            value = self.variable_value(node.name)
+            if value is not None and node.name in self.inlined:
+                return (literal(value), value)
+            return (node, None)
+        elif isinstance(node, Ambiguous) and not node.args:
+            (name, value) = self._fold(node.name)
+            return (node if name is node.name else name, value)
+        elif not isinstance(node, (Operator, FunCall, ArrayRef, Ambiguous)):
+            return (node, None)
+
+        # Try the whole expression at once before taking it apart.
+        value = self._value(node, self._known_inlined)
+        if value is not None:
+            return (literal(value), value)
+
+        if isinstance(node, BinaryOp):
+            return self._fold_binary(node)
+        elif isinstance(node, (UnaryOp, Transpose)):
+            (operand, value) = self._fold(node.operand)
+            return self._combine(_copy(node, operand=operand), [value], True)
+        elif (isinstance(node, (FunCall, ArrayRef, Ambiguous))
+              and isinstance(node.name, Identifier) and node.args):
+            (args, values) = self._fold_all(node.args)
+            function = (node.name.name in EXACT_FUNCTIONS
+                        and not isinstance(node, ArrayRef)
+                        and self.variable_value(node.name.name) is None)
+            return self._combine(_copy(node, args=args), values, function)
+        return (node, None)
+
+
+    def _fold_binary(self, node):
+        # Chains of left operands are followed with a loop (see "Deeply
+        # nested operator expressions" in matlab.py).
+        chain = []
+        while isinstance(node, BinaryOp):
+            chain.append(node)
+            node = node.left
+        (left, value) = self._fold(node)
+        for op_node in reversed(chain):
+            (right, right_value) = self._fold(op_node.right)
+            folded = _copy(op_node, left=left, right=right)
+            (left, value) = self._combine(folded, [value, right_value], True)
+        return (left, value)
+
+
+    def _fold_all(self, nodes):
+        folded = [self._fold(node) for node in nodes]
+        return ([node for node, _ in folded], [value for _, value in folded])
+
+
+    def _combine(self, node, values, foldable):
+        # 'node' has had its operands folded and 'values' are their values.
+        # If they are all known, 'node' may be replaced by its value.  Its
+        # operands are now numbers or variables, so this is quick.
+        if foldable and all(value is not None for value in values):
+            value = self._evaluate(node)
+            if value is not None:
+                return (literal(value), value)
+        return (node, None)
+
+
+def literal(value):
+    """Returns a MatlabNode for the number 'value' (a Decimal)."""
+    if value < 0:
+        return UnaryOp(op='-', operand=Number(value=decimal_text(-value)))
+    return Number(value=decimal_text(value))
+
+
+def decimal_text(value):
+    """Returns the text form of the Decimal 'value', without an exponent
+    unless the number is very large or very small."""
+    value = value.normalize()
+    if value and not -20 <= value.adjusted() <= 20:
+        return str(value)
+    return '{:f}'.format(value)
+
+
+class _UseCounter(MatlabNodeVisitor):
+    def __init__(self):
+        super(_UseCounter, self).__init__()
+        self.counts = Counter()
+
+
+    def visit_Identifier(self, node):
+        self.counts[node.name] += 1
+        return node
+
+
+def _count_uses(nodes):
+    counter = _UseCounter()
+    counter.visit(nodes)
+    return counter.counts
+
+
+def _copy(node, **changes):
+    return type(node)(*[changes[attr] if attr in changes else getattr(node, attr)
+                        for attr in node._attr_names])
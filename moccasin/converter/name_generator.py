@@ -20,16 +20,7 @@
 # available online at https://github.com/sbmlteam/moccasin/.
 # ------------------------------------------------------------------------- -->
 
-import sys
-import six
-sys.path.append('..')
-try:
-    from .singleton import Singleton
-except:
-    from singleton import Singleton
 
-
-@six.add_metaclass(Singleton)
 class NameGenerator(object):
     """Generates a name consisting of a prefix string followed by an integer.
 
@@ -38,9 +29,9 @@ class NameGenerator(object):
     set to something else by using the keyword argument prefix="string" when
     calling the method name().
 
-    This class is implemented as a singleton.  All instances of this class in a
-    running copy of a Python program using this class will share the same
-    counter.
+    Each instance of this class has its own counter.  (This class used to be
+    a singleton, but that made it impossible to run more than one conversion
+    at a time.)  A ConversionSession holds the one used for a conversion.
     """
 
     def __init__(self):
@@ -0,0 +1,408 @@
+#!/usr/bin/env python
+#
+# @file    reactions.py
+# @brief   Infer a reaction network from the rate rules of an SBML model
+# @author  Michael Hucka
+#
+# <!---------------------------------------------------------------------------
+# This software is part of MOCCASIN, the Model ODE Converter for Creating
+# Automated SBML INteroperability. Visit https://github.com/sbmlteam/moccasin/.
+#
+# Copyright (C) 2014-2016 jointly by the following organizations:
+#  1. California Institute of Technology, Pasadena, CA, USA
+#  2. Icahn School of Medicine at Mount Sinai, New York, NY, USA
+#  3. Boston University, Boston, MA, USA
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation.  A copy of the license agreement is provided in the
+# file named "COPYING.txt" included with this software distribution and also
+# available online at https://github.com/sbmlteam/moccasin/.
+# ------------------------------------------------------------------------- -->
+
+import math
+from libsbml import *
+
+try:
+    from .errors import *
+except:
+    from errors import *
+
+# ReactionInferrer
+#
+# MOCCASIN used to get reaction-based SBML by sending an XPP version of the
+# model to the BIOCHAM web service, which infers a reaction network from the
+# ODEs using the method of Fages, Gay and Soliman ("Inferring reaction
+# systems from ordinary differential equations", Theoretical Computer
+# Science 599, 2015).  ReactionInferrer does the same thing locally, working
+# directly on the rate rules of the SBML model made by
+# create_raterule_model().
+#
+# The rate of each species is expanded into a sum of monomials, each a
+# number times a product of factors.  A factor is a symbol (a species or
+# parameter id) or an expression that is not taken apart further, such as
+# "K + x" in "k*x/(K + x)" or a function call, raised to a power.  Factors
+# are numbered as they are first seen, and a monomial is indexed by its
+# factors and their powers, so that the terms of all the rate rules can be
+# grouped in one pass.  Each distinct monomial becomes one reaction whose
+# rate is the monomial without its number: the species in whose rate the
+# monomial has a negative number are its reactants, those with a positive
+# number its products, and the numbers are the stoichiometries.  So
+#
+#     dx1/dt = a - b*x1          dx2/dt = c*x1 - d*x2
+#
+# gives "_ => a x1" at rate 1 (if a is a number), "b x1 => c x2" at rate x1,
+# and "d x2 => _" at rate x2.  A species on which the rate depends but which
+# is not a reactant (directly, or through assignment rules) is made a
+# catalyst: it is added to the reactants and the products once each, as
+# BIOCHAM does.  The compartment is assumed to have size 1, as it does in
+# the models made by the converter.
+#
+# Parameters are kept as symbols, so that "k*x1" is a monomial with
+# stoichiometry 1, unless 'numeric_parameters' is True: the constant
+# parameters are then replaced by their values, so that they end up in the
+# stoichiometries as in the output of the BIOCHAM service.  Expanding a
+# product of sums can make very many terms; a product that would have more
+# than 'max_terms' of them is kept as a single factor instead.
+
+class ReactionInferrer(object):
+    """Replaces the rate rules of the species in an SBML model by a network
+    of reactions with the same rates of change."""
+
+    def __init__(self, numeric_parameters=False, max_terms=1000):
+        self.numeric_parameters = numeric_parameters
+        self.max_terms = max_terms
+
+
+    def infer(self, document):
+        """Changes the SBMLDocument 'document' in place, and returns the
+        list of the reactions added to it."""
+        model = document.getModel()
+        if model is None:
+            raise ConversionError('there is no model in the SBML document')
+
+        species = [s.getId() for s in model.getListOfSpecies()]
+        rules = [rule for rule in model.getListOfRules()
+                 if rule.isRate() and rule.getVariable() in species]
+        self._start(model, set(species))
+
+        # Group the terms of all the rates by their monomials: monomial =>
+        # list of (species, number), in the order they are first seen.
+        terms = {}
+        for rule in rules:
+            var = rule.getVariable()
+            for key, number in self._expand(rule.getMath()).items():
+                if number != 0:
+                    terms.setdefault(key, []).append((var, number))
+
+        for var in [rule.getVariable() for rule in rules]:
+            model.removeRule(var)
+        reactions = []
+        for key, entries in terms.items():
+            reactants = [(s, -n) for s, n in entries if n < 0]
+            products  = [(s, n) for s, n in entries if n > 0]
+            consumed  = set(s for s, _ in reactants)
+            for s in species:
+                if s in self._key_species(key) and s not in consumed:
+                    reactants.append((s, 1))
+                    products = _add_to(products, s, 1)
+            reactions.append(self._create_reaction(model, key, reactants,
+                                                   products))
+        return reactions
+
+
+    def _start(self, model, species):
+        self._factors = []              # Number => formula of the factor.
+        self._numbers = {}              # Formula => number of the factor.
+        self._species = []              # Number => species it depends on.
+
+        # The species that each variable of an assignment rule depends on.
+        rules = dict((rule.getVariable(), rule.getMath())
+                     for rule in model.getListOfRules() if rule.isAssignment())
+        self._depends = dict((s, frozenset([s])) for s in species)
+        pending = set()
+        def depends(name):
+            if name in self._depends or name in pending or name not in rules:
+                return self._depends.get(name, frozenset())
+            pending.add(name)
+            found = frozenset().union(*[depends(n)
+                                        for n in _names(rules[name])])
+            pending.discard(name)
+            self._depends[name] = found
+            return found
+        for name in rules:
+            depends(name)
+
+        # The values of the constant parameters, if they are to be used.
+        self._values = {}
+        if self.numeric_parameters:
+            copy = model.getSBMLDocument().clone()
+            copy.expandInitialAssignments()
+            for p in copy.getModel().getListOfParameters():
+                if p.getConstant() and p.isSetValue() and p.getId() not in rules:
+                    self._values[p.getId()] = p.getValue()
+
+
+    def _expand(self, ast):
+        # Returns the polynomial for 'ast', as a dictionary from monomial
+        # keys to numbers.  A key is a tuple of pairs (factor, power) sorted
+        # by factor.  This uses our own stack (see "Deeply nested operator
+        # expressions" in matlab.py).
+        stack = [(ast, False)]
+        results = []
+        while stack:
+            (node, ready) = stack.pop()
+            count = node.getNumChildren()
+            if count and not ready and _expandable(node):
+                stack.append((node, True))
+                stack.extend((node.getChild(i), False)
+                             for i in reversed(range(count)))
+                continue
+            if count and ready:
+                args = results[len(results) - count:]
+                del results[len(results) - count:]
+                results.append(self._combine(node, args))
+            else:
+                results.append(self._leaf(node))
+        return results[0]
+
+
+    def _leaf(self, node):
+        if node.isNumber():
+            return _constant(node.getValue())
+        elif node.getType() == AST_NAME and node.getName() in self._values:
+            return _constant(self._values[node.getName()])
+        elif self.numeric_parameters and node.getType() == AST_CONSTANT_PI:
+            return _constant(math.pi)
+        elif self.numeric_parameters and node.getType() == AST_CONSTANT_E:
+            return _constant(math.e)
+        return self._factor(node)
+
+
+    def _combine(self, node, args):
+        # 'args' are the polynomials of the children of 'node'.
+        kind = node.getType()
+        if kind == AST_PLUS:
+            return _sum(args)
+        elif kind == AST_MINUS and len(args) == 1:
+            return _scaled(args[0], -1)
+        elif kind == AST_MINUS:
+            return _sum([args[0], _scaled(args[1], -1)])
+        elif kind == AST_TIMES:
+            product = args[0]
+            for arg in args[1:]:
+                product = self._product(product, arg)
+                if product is None:
+                    return self._factor(node)
+            return product
+        elif kind == AST_DIVIDE:
+            if len(args[1]) == 1:
+                inverse = _power(args[1], -1)
+                if inverse is not None:
+                    return self._product(args[0], inverse) or self._factor(node)
+            inverse = _power(self._factor(node.getChild(1)), -1)
+            return self._product(args[0], inverse) or self._factor(node)
+        else:                           # A power.
+            exponent = _constant_value(args[1])
+            if exponent is None or math.isinf(exponent) or math.isnan(exponent):
+                return self._factor(node)
+            if len(args[0]) == 1:
+                result = _power(args[0], exponent)
+                if result is not None:
+                    return result
+            elif exponent == int(exponent) and 0 <= exponent <= self.max_terms:
+                result = _constant(1)
+                for _ in range(int(exponent)):
+                    result = self._product(result, args[0])
+                    if result is None:
+                        break
+                else:
+                    return result
+            return self._factor(node)
+
+
+    def _product(self, p, q):
+        # The product of polynomials 'p' and 'q', or None if it would have
+        # too many terms.
+        if len(p) * len(q) > self.max_terms:
+            return None
+        result = {}
+        for key1, number1 in p.items():
+            for key2, number2 in q.items():
+                key = _merge(key1, key2)
+                result[key] = result.get(key, 0) + number1 * number2
+        return result
+
+
+    def _factor(self, node):
+        # The polynomial made of just the factor 'node'.
+        formula = formulaToL3String(node)
+        num = self._numbers.get(formula)
+        if num is None:
+            num = len(self._factors)
+            self._numbers[formula] = num
+            self._factors.append(formula)
+            self._species.append(frozenset().union(
+                *[self._depends.get(name, frozenset()) for name in _names(node)]))
+        return {((num, 1),): 1}
+
+
+    def _key_species(self, key):
+        return frozenset().union(*[self._species[num] for num, _ in key])
+
+
+    def _create_reaction(self, model, key, reactants, products):
+        reaction = model.createReaction()
+        _check(reaction, 'create reaction')
+        _check(reaction.setId(_unused_id(model)), 'set reaction id')
+        _check(reaction.setReversible(False), 'set reaction "reversible"')
+        _check(reaction.setFast(False), 'set reaction "fast"')
+        for species, stoichiometry in reactants:
+            _add_reference(reaction.createReactant(), species, stoichiometry)
+        for species, stoichiometry in products:
+            _add_reference(reaction.createProduct(), species, stoichiometry)
+        law = reaction.createKineticLaw()
+        _check(law, 'create kinetic law')
+        ast = parseL3Formula(self._formula(key))
+        _check(ast, 'parse kinetic law formula')
+        _check(law.setMath(ast), 'set kinetic law formula')
+        return reaction
+
+
+    def _formula(self, key):
+        # The formula of the monomial 'key' (with number 1).  Factors that
+        # depend on species are written last, so that "k*x" is not "x*k".
+        above = []
+        below = []
+        for num, power in sorted(key, key=lambda f: (bool(self._species[f[0]]),
+                                                     f[0])):
+            text = self._factors[num]
+            if not _is_name(text):
+                text = '(' + text + ')'
+            magnitude = abs(power)
+            if magnitude != 1:
+                text = '{}^{}'.format(text, _number_text(magnitude))
+            (above if power > 0 else below).append(text)
+        formula = ' * '.join(above) or '1'
+        if below:
+            formula += ' / ' + (below[0] if len(below) == 1
+                                else '(' + ' * '.join(below) + ')')
+        return formula
+
+
+def _check(value, message):
+    # Like check() in converter.py, but raises ConversionError instead of
+    # exiting.
+    if value is None or (type(value) is int
+                         and value != LIBSBML_OPERATION_SUCCESS):
+        raise ConversionError('failed to ' + message)
+
+
+def _expandable(node):
+    kind = node.getType()
+    if kind in (AST_PLUS, AST_MINUS, AST_TIMES):
+        return True
+    return (kind in (AST_DIVIDE, AST_POWER, AST_FUNCTION_POWER)
+            and node.getNumChildren() == 2)
+
+
+def _constant(number):
+    return {(): float(number)} if number else {}
+
+
+def _constant_value(poly):
+    # The value of 'poly' if it is a number, else None.
+    if not poly:
+        return 0
+    if list(poly.keys()) == [()]:
+        return poly[()]
+    return None
+
+
+def _sum(polys):
+    # Adds into the largest of 'polys', which is not used again.
+    polys = sorted(polys, key=len, reverse=True)
+    result = polys[0]
+    for poly in polys[1:]:
+        for key, number in poly.items():
+            result[key] = result.get(key, 0) + number
+    return result
+
+
+def _scaled(poly, factor):
+    for key in poly:
+        poly[key] *= factor
+    return poly
+
+
+def _power(poly, exponent):
+    # 'poly' (a single monomial) raised to 'exponent', or None if that is
+    # not a monomial.
+    ((key, number),) = poly.items()
+    whole = exponent == int(exponent)
+    if number == 0 or (number < 0 and not whole):
+        return None
+    try:
+        value = number ** exponent
+    except (OverflowError, ZeroDivisionError):
+        return None
+    powers = tuple((num, _simplest(power * exponent)) for num, power in key)
+    return {powers: value}
+
+
+def _merge(key1, key2):
+    if not key1:
+        return key2
+    if not key2:
+        return key1
+    powers = dict(key1)
+    for num, power in key2:
+        powers[num] = powers.get(num, 0) + power
+    return tuple(sorted((num, _simplest(power))
+                        for num, power in powers.items() if power != 0))
+
+
+def _simplest(number):
+    return int(number) if number == int(number) else number
+
+
+def _number_text(number):
+    return str(_simplest(number))
+
+
+def _add_to(pairs, name, amount):
+    for i, (other, number) in enumerate(pairs):
+        if other == name:
+            return pairs[:i] + [(name, number + amount)] + pairs[i+1:]
+    return pairs + [(name, amount)]
+
+
+def _add_reference(ref, species, stoichiometry):
+    _check(ref, 'create species reference')
+    _check(ref.setSpecies(species), 'set species reference species')
+    _check(ref.setStoichiometry(float(stoichiometry)),
+               'set species reference stoichiometry')
+    _check(ref.setConstant(True), 'set species reference "constant"')
+
+
+def _unused_id(model):
+    n = model.getNumReactions()
+    while model.getElementBySId('R_{}'.format(n)) is not None:
+        n += 1
+    return 'R_{}'.format(n)
+
+
+def _names(ast):
+    # The names used in 'ast'.
+    names = set()
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if node.getType() == AST_NAME:
+            names.add(node.getName())
+        stack.extend(node.getChild(i) for i in range(node.getNumChildren()))
+    return names
+
+
+def _is_name(text):
+    return text.replace('_', 'a').isalnum() and not text[0].isdigit()
@@ -64,6 +64,18 @@ class MatlabRewriter(MatlabNodeVisitor):
         return node
 
 
+    def visit_Assignment(self, node):
+        # The converter reads values from the context's assignments, so if
+        # the RHS is replaced (e.g., by visit_Number), the context must be
+        # told about the new one as well.
+        rhs = node.rhs
+        node = self.default_visit(node)
+        if (node.rhs is not rhs
+            and self._context.assignments.get(node.lhs) is rhs):
+            self._context.assignments[node.lhs] = node.rhs
+        return node
+
+
     def visit_FunCall(self, node):
         node.args = self.visit(node.args)
         if isinstance(node.name, Identifier):
@@ -76,6 +88,8 @@ class MatlabRewriter(MatlabNodeVisitor):
         # Biocham seems unable to parse numbers in scientific notation in
         # some cases, and I haven't figured out what XPP is doing with
         # precision for numbers like 1.25e-7, which it displays as 0.000000.
+        # The parsers share Number nodes between occurrences of the same
+        # value, so we return a new node rather than change this one.
         if self.unscientific_numbers:
             # Convert to a non-scientific number representation.
             value = node.value
@@ -84,14 +98,16 @@ class MatlabRewriter(MatlabNodeVisitor):
                 exponent = tmp.as_tuple().exponent
                 if exponent < 0:
                     size = abs(exponent)
-                    node.value = '{0:.{1}f}'.format(tmp, size)
+                    value = '{0:.{1}f}'.format(tmp, size)
                 else:
-                    node.value = '{:f}'.format(tmp)
+                    value = '{:f}'.format(tmp)
             # If I hand Biocham a number like "10.", it stops parsing the input.
-            if node.value.endswith('.'):
-                node.value = node.value[:-1]
-            if node.value.startswith('.'):
-                node.value = '0' + node.value
+            if value.endswith('.'):
+                value = value[:-1]
+            if value.startswith('.'):
+                value = '0' + value
+            if value != node.value:
+                return Number(value=value)
         return node
 
 
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+#
+# @file    biocham_client.py
+# @brief   HTTP client for the BIOCHAM web service
+# @author  Harold Gomez
+#
+# <!---------------------------------------------------------------------------
+# This software is part of MOCCASIN, the Model ODE Converter for Creating
+# Automated SBML INteroperability. Visit https://github.com/sbmlteam/moccasin/.
+#
+# Copyright (C) 2014-2016 jointly by the following organizations:
+#  1. California Institute of Technology, Pasadena, CA, USA
+#  2. Icahn School of Medicine at Mount Sinai, New York, NY, USA
+#  3. Boston University, Boston, MA, USA
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation.  A copy of the license agreement is provided in the
+# file named "COPYING.txt" included with this software distribution and also
+# available online at https://github.com/sbmlteam/moccasin/.
+# ------------------------------------------------------------------------- -->
+
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from converter import *
+
+# -----------------------------------------------------------------------------
+# Global configuration constants
+# -----------------------------------------------------------------------------
+
+_BIOCHAM_URL = 'http://lifeware.inria.fr/biocham/online/rest/export'
+
+# Responses with these status codes are worth trying again.
+_RETRY_STATUS = frozenset([500, 502, 503, 504])
+
+_now = getattr(time, 'monotonic', time.time)
+
+# -----------------------------------------------------------------------------
+# BiochamClient class definition
+# -----------------------------------------------------------------------------
+
+# BiochamClient
+#
+# Reaction-based SBML is made by uploading an XPP version of the model to the
+# BIOCHAM web service.  A BiochamClient makes these calls through one
+# requests.Session, so that the connections to the service are pooled and
+# kept alive between calls, and the XPP text is sent from memory.
+#
+# Each attempt is limited by 'timeout' (seconds, or a tuple of seconds to
+# connect and to wait for the response).  Attempts that fail to connect,
+# time out or get a 5xx response are tried again up to 'retries' times,
+# waiting 'backoff' seconds before the first retry and twice as long before
+# each next one.  If 'failure_threshold' calls in a row fail this way, the
+# client stops calling the service for 'reset_after' seconds (a circuit
+# breaker): export_sbml() raises BiochamUnavailableError at once, and
+# is_reachable() returns False.  After that, one call is let through as a
+# trial, while calls from other threads still raise the error; the circuit
+# closes again if the trial succeeds, and stays open for another
+# 'reset_after' seconds if it fails.
+#
+# is_reachable() asks the service itself, and remembers the answer for
+# 'reachability_ttl' seconds; the outcome of each export_sbml() call
+# updates it too.  A client may be used by several threads at once, up to
+# 'pool_size' of them without opening extra connections.
+#
+# If 'cache_dir' is given, each successful response is also saved in that
+# directory, in a file named by the SHA-256 hash of the XPP text, and later
+# calls with the same text return it without calling the service.  If
+# 'offline' is True, the client never calls the service: responses come
+# from the cache, and a call that is not in it raises BiochamError.
+
+class BiochamClient():
+    '''Makes calls to the BIOCHAM web service.'''
+
+
+    def __init__(self, url=_BIOCHAM_URL, timeout=(5, 120), retries=2,
+                 backoff=0.5, failure_threshold=3, reset_after=60,
+                 reachability_ttl=300, pool_size=10, cache_dir=None,
+                 offline=False):
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.reachability_ttl = reachability_ttl
+        self.cache_dir = cache_dir
+        self.offline = offline
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self._failures = 0              # Calls in a row that have failed.
+        self._opened_at = None          # When the circuit was opened.
+        self._trying = False            # Whether a trial call is running.
+        self._reachable = None          # Last answer, and when it was found.
+        self._checked_at = None
+
+
+    def close(self):
+        '''Closes the pooled connections.'''
+        self.session.close()
+
+
+    def is_reachable(self):
+        '''Returns True if the BIOCHAM service appears to be up.  It does
+        not, as far as an offline client is concerned.'''
+        if self.offline:
+            return False
+        with self._lock:
+            if self._circuit_open():
+                return False
+            if (self._checked_at is not None
+                    and _now() - self._checked_at < self.reachability_ttl):
+                return self._reachable
+        try:
+            # Any HTTP response will do; the service only accepts uploads.
+            self.session.head(self.url, timeout=self._connect_timeout(),
+                              allow_redirects=False)
+            reachable = True
+        except requests.RequestException:
+            reachable = False
+        self._remember(reachable)
+        return reachable
+
+
+    def export_sbml(self, xpp):
+        '''Sends the XPP model text 'xpp' to BIOCHAM, and returns the
+        SBML it produces (as bytes).'''
+        if not isinstance(xpp, bytes):
+            xpp = xpp.encode('UTF-8')
+        cached = self.cached_response(xpp)
+        if cached is not None:
+            return cached
+        if self.offline:
+            raise BiochamError('no saved BIOCHAM response for this model')
+        with self._lock:
+            if self._circuit_open():
+                raise BiochamUnavailableError(
+                    'not calling BIOCHAM after {} failed calls'.format(self._failures))
+            # If the circuit is still open, this call is the trial.
+            trial = self._opened_at is not None
+            if trial:
+                self._trying = True
+        try:
+            return self._post(xpp)
+        finally:
+            if trial:
+                with self._lock:
+                    self._trying = False
+
+
+    def cached_response(self, xpp):
+        '''Returns the saved response for the XPP text 'xpp', or None.'''
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._cache_path(xpp), 'rb') as file:
+                return file.read()
+        except IOError:
+            return None
+
+
+    def _post(self, xpp):
+        files = {'file': ('model.ode', xpp)}
+        data = {'exportTo': 'sbml', 'curate': 'true'}
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(delay)
+                delay *= 2
+            try:
+                response = self.session.post(self.url, files=files, data=data,
+                                             timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as err:
+                problem = err
+                continue
+            if response.status_code in _RETRY_STATUS:
+                problem = 'HTTP status {}'.format(response.status_code)
+                continue
+            self._succeeded()
+            if response.status_code >= 400:
+                raise BiochamError('BIOCHAM returned HTTP status {}'.format(
+                    response.status_code))
+            self._save_response(xpp, response.content)
+            return response.content
+
+        self._failed()
+        raise BiochamError('call to BIOCHAM failed: {}'.format(problem))
+
+
+    def _save_response(self, xpp, content):
+        # The response is good whether or not it can be saved, so a failure
+        # to save it (full disk, no permission, ...) only loses the entry.
+        if not self.cache_dir:
+            return
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+        except OSError:
+            if not os.path.isdir(self.cache_dir):
+                return
+        # Write it under another name first, so that other threads and
+        # processes never see part of a file.
+        temp = None
+        try:
+            (fd, temp) = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as file:
+                file.write(content)
+            getattr(os, 'replace', os.rename)(temp, self._cache_path(xpp))
+        except (IOError, OSError):
+            if temp:
+                try:
+                    os.remove(temp)
+                except OSError:
+                    pass
+
+
+    def _cache_path(self, xpp):
+        if not isinstance(xpp, bytes):
+            xpp = xpp.encode('UTF-8')
+        name = hashlib.sha256(xpp).hexdigest() + '.xml'
+        return os.path.join(self.cache_dir, name)
+
+
+    def _connect_timeout(self):
+        if isinstance(self.timeout, tuple):
+            return self.timeout[0]
+        return self.timeout
+
+
+    def _circuit_open(self):
+        # Whether no call may be made now: the circuit was opened less than
+        # 'reset_after' seconds ago, or a trial call is running.  Must be
+        # called holding the lock.
+        if self._opened_at is None:
+            return False
+        return self._trying or _now() - self._opened_at < self.reset_after
+
+
+    def _remember(self, reachable):
+        with self._lock:
+            self._reachable = reachable
+            self._checked_at = _now()
+
+
+    def _succeeded(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+        self._remember(True)
+
+
+    def _failed(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = _now()
+        self._remember(False)
@@ -22,21 +22,19 @@
 
 from __future__ import print_function
 from pyparsing import ParseException, ParseResults
-from tempfile import NamedTemporaryFile
+from multiprocessing.pool import ThreadPool
 import os
 import sys
-import requests
 import pdb
 
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 from matlab_parser import *
 from converter import *
 
-# -----------------------------------------------------------------------------
-# Global configuration constants
-# -----------------------------------------------------------------------------
-
-_BIOCHAM_URL = 'http://lifeware.inria.fr/biocham/online/rest/export'
+try:
+    from .biocham_client import *
+except:
+    from biocham_client import *
 
 # -----------------------------------------------------------------------------
 # Controller class definition
@@ -46,10 +44,12 @@ class Controller():
     '''This class serves to interface between Moccasins' modules to the CLI and GUI.'''
 
 
-    def __init__( self ):
+    def __init__( self, biocham=None ):
         self.parser = MatlabGrammar()
         self.file_contents = None
         self.parse_results = None
+        # All calls to BIOCHAM go through one client, which pools them.
+        self.biocham = biocham or BiochamClient()
 
 
     def parse_File(self , file_contents):
@@ -63,55 +63,83 @@ class Controller():
         return (self.parser.print_parse_results(self.parse_results))
 
 
-    def build_model(self, use_species, output_format, name_after_param, add_comments):
+    def build_model(self, use_species, output_format, name_after_param, add_comments,
+                    fold_constants=False, inline_constants=False,
+                    common_subexpressions=False, min_subexpression_cost=2):
         '''Converts a parsed file into XPP or equation-based SBML.'''
         (output, _, _) = create_raterule_model(self.parse_results, use_species,
                                                output_format, name_after_param,
-                                               add_comments)
+                                               add_comments,
+                                               fold_constants=fold_constants,
+                                               inline_constants=inline_constants,
+                                               common_subexpressions=common_subexpressions,
+                                               min_subexpression_cost=min_subexpression_cost)
         return output
 
 
-    def build_reaction_model(self, use_species, name_after_param, add_comments):
-        '''Converts a parsed file into reaction-based SBML.'''
+    def build_reaction_model(self, use_species, name_after_param, add_comments,
+                             fold_constants=False, inline_constants=False,
+                             local=False):
+        '''Converts a parsed file into reaction-based SBML.  If 'local' is
+        True, the reactions are inferred here instead of by BIOCHAM.'''
+        if local:
+            return create_reaction_model(self.parse_results, use_species,
+                                         name_after_param, add_comments,
+                                         fold_constants=fold_constants,
+                                         inline_constants=inline_constants)
         try:
-            # Create temp file storing XPP model version
-            with NamedTemporaryFile(suffix=".ode", delete=False) as xpp_file:
-                (output, add, convert) = create_raterule_model(self.parse_results,
-                                                               use_species,
-                                                               "biocham",
-                                                               name_after_param,
-                                                               add_comments)
-
-                # python 3 changed the way temporary files read/wrote data
-                # and used bytes that need to encoded/decoded
-                try:
-                    xpp_file.write(output)
-                except:
-                    xpp_file.write(output.encode('UTF-8'))
-                xpp_file.flush()
-                xpp_file.close()
-                files = {'file': open(xpp_file.name)}
-            # Access Biocham to curate and convert equations to reactions
-            data = {'exportTo':'sbml', 'curate':'true'}
-            response = requests.post(_BIOCHAM_URL, files=files, data=data)
-            del files
-
-            # We need to post-process the output to deal with
-            # limitations in BIOCHAM's translation service.
-            sbml = process_biocham_output(response.content, self.parse_results,
-                                          post_add=add, post_convert=convert,
-                                          add_comments=add_comments)
-            return(sbml)
-        except IOError as err:
+            return self._biocham_model(self.parse_results, use_species,
+                                       name_after_param, add_comments,
+                                       fold_constants, inline_constants)
+        except (IOError, BiochamError) as err:
             print("error: {0}".format(err))
+
+
+    def build_reaction_models(self, inputs, use_species, name_after_param,
+                              add_comments, fold_constants=False,
+                              inline_constants=False, max_workers=4):
+        '''Converts the MATLAB file contents in the list 'inputs' into
+        reaction-based SBML, with up to 'max_workers' of them converted and
+        sent to BIOCHAM at once.  Returns a list of the results in the same
+        order; the exception raised for an input is put in its place.'''
+        def convert(file_contents):
+            session = ConversionSession()
+            try:
+                parse_results = session.parse_string(file_contents)
+                return self._biocham_model(parse_results, use_species,
+                                           name_after_param, add_comments,
+                                           fold_constants, inline_constants,
+                                           session)
+            except Exception as err:
+                return err
+        pool = ThreadPool(max_workers)
+        try:
+            return pool.map(convert, inputs, chunksize=1)
         finally:
-            os.unlink(xpp_file.name)
+            pool.close()
+            pool.join()
+
+
+    def _biocham_model(self, parse_results, use_species, name_after_param,
+                       add_comments, fold_constants, inline_constants,
+                       session=None):
+        create = session.create_raterule_model if session else create_raterule_model
+        (output, add, convert) = create(parse_results, use_species, "biocham",
+                                        name_after_param, add_comments,
+                                        fold_constants=fold_constants,
+                                        inline_constants=inline_constants)
+
+        # Access Biocham to curate and convert equations to reactions
+        response = self.biocham.export_sbml(output)
+
+        # We need to post-process the output to deal with
+        # limitations in BIOCHAM's translation service.
+        return process_biocham_output(response, parse_results,
+                                      post_add=add, post_convert=convert,
+                                      add_comments=add_comments)
 
 
     def check_network_connection(self):
-        '''Connects somewhere to test if a network is available.'''
-        try:
-            _ = requests.get('http://www.google.com', timeout=5)
-            return True
-        except requests.ConnectionError:
-            return False
+        '''Returns True if the BIOCHAM service can be reached.  The answer
+        is remembered for a while; see BiochamClient.'''
+        return self.biocham.is_reachable()
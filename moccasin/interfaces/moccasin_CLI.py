@@ -25,17 +25,15 @@ import plac
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
-from controller import Controller
-
-# This prevents exceeding recursion depth in some cases.
-sys.setrecursionlimit(1500)
 
 # -----------------------------------------------------------------------------
 # Main function - driver
 # -----------------------------------------------------------------------------
 
 def main(path, omit_comments=False, debug=False, use_equations=False,
-         output_XPP=False, use_params=False, quiet=False, print_parse=False):
+         output_XPP=False, use_params=False, quiet=False, print_parse=False,
+         fold_constants=False, inline_constants=False,
+         common_subexpressions=False, local_reactions=False, min_cost=None):
     '''A minimal interface for converting simple MATLAB models to SBML.'''
     #Flag-Option-Required-Default(FORD) convention was followed for function args declaration.
     #Flag arguments are first, then option arguments and required arguments, and finally default arguments.
@@ -44,6 +42,18 @@ def main(path, omit_comments=False, debug=False, use_equations=False,
         print('File "{}" does not appear to be a MATLAB file.'.format(path))
         sys.exit(1)
 
+    # Reactions are made from the ODEs as they are, so shared terms can only
+    # be computed once in equation-based SBML or XPP output.
+    if (common_subexpressions or min_cost is not None) and not (use_equations or output_XPP):
+        print('Options -s and -m apply only to equation-based SBML (-e) or XPP (-o) output.')
+        sys.exit(1)
+    if min_cost is None:
+        min_cost = 2
+
+    # Importing the back-end brings in libSBML, the MATLAB parser and more,
+    # so it is only done once we know there is work to do (not for --help).
+    from controller import Controller
+
     add_comments = not omit_comments
     try:
         #Interface with the back-end
@@ -69,24 +79,36 @@ def main(path, omit_comments=False, debug=False, use_equations=False,
                 output = controller.build_model(use_species=(not use_params),
                                                 output_format="xpp",
                                                 name_after_param=False,
-                                                add_comments=add_comments)
+                                                add_comments=add_comments,
+                                                fold_constants=fold_constants,
+                                                inline_constants=inline_constants,
+                                                common_subexpressions=common_subexpressions,
+                                                min_subexpression_cost=min_cost)
                 print(output)
             elif use_equations:
                 print_header('Equation-based SBML output', quiet)
                 output = controller.build_model(use_species=(not use_params),
                                                 output_format="sbml",
                                                 name_after_param=False,
-                                                add_comments=add_comments)
+                                                add_comments=add_comments,
+                                                fold_constants=fold_constants,
+                                                inline_constants=inline_constants,
+                                                common_subexpressions=common_subexpressions,
+                                                min_subexpression_cost=min_cost)
                 print(output)
             else:
                 print_header('Reaction-based SBML output', quiet)
-                if not controller.check_network_connection() and not quiet:
-                    print('Error: a network connection is needed for this feature.')
+                if (not local_reactions and not controller.check_network_connection()
+                    and not quiet):
+                    print('Error: the BIOCHAM web service, needed for this feature, cannot be reached.')
                     sys.exit(1)
 
                 sbml = controller.build_reaction_model(use_species=(not use_params),
                                                        name_after_param=False,
-                                                       add_comments=add_comments)
+                                                       add_comments=add_comments,
+                                                       fold_constants=fold_constants,
+                                                       inline_constants=inline_constants,
+                                                       local=local_reactions)
                 print(sbml)
 
     except Exception as err:
@@ -117,6 +139,11 @@ main.__annotations__ = dict(
     use_params    = ('encode variables as SBML parameters instead of SBML species',  'flag', 'p'),
     quiet         = ('be quiet: produce SBML and nothing else',                      'flag', 'q'),
     print_parse   = ('print extra debugging info about the interpreted MATLAB code', 'flag', 'x'),
+    fold_constants   = ('write constant expressions as values where exact',      'flag', 'f'),
+    inline_constants = ('like -f, and put constants used once into their rule', 'flag', 'i'),
+    common_subexpressions = ('compute terms shared by several ODEs only once (with -e or -o)', 'flag', 's'),
+    local_reactions  = ('infer reactions here instead of using BIOCHAM online', 'flag', 'l'),
+    min_cost         = ('fewest operations in a shared term (default: 2)',       'option', 'm', int, None, 'N'),
 )
 
 # -----------------------------------------------------------------------------
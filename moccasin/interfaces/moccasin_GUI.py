@@ -489,7 +489,7 @@ class MainFrame ( wx.Frame ):
                         #output reaction-based SBML
                         else:
                                 if not self.controller.check_network_connection():
-                                        msg = "A network connection is needed for this feature, but the network appears to be unavailable."
+                                        msg = "The BIOCHAM web service is needed for this feature, but it appears to be unreachable."
                                         dlg = wx.MessageDialog(self, msg, "Warning", wx.OK | wx.ICON_WARNING)
                                         dlg.ShowModal()
                                         dlg.Destroy()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+#
+# @file    mock_biocham.py
+# @brief   Local stand-in for the BIOCHAM web service
+# @author  Harold Gomez
+#
+# <!---------------------------------------------------------------------------
+# This software is part of MOCCASIN, the Model ODE Converter for Creating
+# Automated SBML INteroperability. Visit https://github.com/sbmlteam/moccasin/.
+#
+# Copyright (C) 2014-2016 jointly by the following organizations:
+#  1. California Institute of Technology, Pasadena, CA, USA
+#  2. Icahn School of Medicine at Mount Sinai, New York, NY, USA
+#  3. Boston University, Boston, MA, USA
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation.  A copy of the license agreement is provided in the
+# file named "COPYING.txt" included with this software distribution and also
+# available online at https://github.com/sbmlteam/moccasin/.
+# ------------------------------------------------------------------------- -->
+
+from __future__ import print_function
+import email
+import getopt
+import random
+import socket
+import sys
+import threading
+import time
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+# -----------------------------------------------------------------------------
+# Global configuration constants
+# -----------------------------------------------------------------------------
+
+# What BIOCHAM returns for a model without ODEs, more or less.
+_EMPTY_MODEL = b'''<?xml version="1.0" encoding="UTF-8"?>
+<sbml xmlns="http://www.sbml.org/sbml/level2/version2" level="2" version="2">
+  <model id="Model_generated_by_BIOCHAM">
+    <listOfCompartments>
+      <compartment id="compartmentOne" size="1"/>
+    </listOfCompartments>
+  </model>
+</sbml>
+'''
+
+_message_from_bytes = getattr(email, 'message_from_bytes', email.message_from_string)
+
+# -----------------------------------------------------------------------------
+# MockBiocham class definition
+# -----------------------------------------------------------------------------
+
+# MockBiocham
+#
+# The BIOCHAM web service converts an XPP model to SBML when it is sent a
+# multipart form with the fields "exportTo" (set to "sbml") and "file" (the
+# model), which is what BiochamClient.export_sbml() does.  MockBiocham is a
+# local HTTP server that accepts the same uploads, so that the reaction-based
+# path can be tested and measured without the real service.  Uploads without
+# those fields get status 400, and HEAD requests get 405, as from BIOCHAM.
+#
+# Its answer is 'response': either the SBML to return, as bytes, or a
+# function that is given the uploaded XPP text (as bytes) and returns it.
+# Each answer is delayed by 'latency' seconds, or a random time between the
+# two numbers if 'latency' is a tuple, and a fraction 'error_rate' of the
+# uploads get 'error_status' instead.  Answers put in the list 'script', as
+# tuples (status, body, delay), are given first, one per upload.  The
+# server records the requests it gets in 'requests', as tuples (method,
+# fields), and counts how many uploads it was answering at once.
+
+class MockBiocham(ThreadingMixIn, HTTPServer):
+    '''Local HTTP server that behaves like BIOCHAM's export service.'''
+
+    daemon_threads = True
+
+    def __init__(self, port=0, host='127.0.0.1', response=_EMPTY_MODEL,
+                 latency=0, error_rate=0, error_status=503, seed=None):
+        HTTPServer.__init__(self, (host, port), _Handler)
+        self.response = response
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.script = []
+        self.requests = []
+        self.connections = set()        # Client ports seen.
+        self.active = 0                 # Uploads being answered,
+        self.most_active = 0            # and the most at any one time.
+        self.lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._thread = None
+        self.url = 'http://{}:{}/biocham/online/rest/export'.format(
+            host, self.server_port)
+
+
+    def start(self):
+        '''Serves requests in a background thread.  Returns the server.'''
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+
+    def stop(self):
+        '''Stops serving, and closes the server's socket.'''
+        if self._thread:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+
+
+    def uploads(self):
+        '''Returns the XPP texts uploaded so far.'''
+        return [fields.get('file') for method, fields in self.requests
+                if method == 'POST']
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+    def _answer(self, xpp):
+        # Returns (status, body, delay) for an upload of 'xpp'.
+        with self.lock:
+            if self.script:
+                return self.script.pop(0)
+            failed = self._random.random() < self.error_rate
+            if isinstance(self.latency, tuple):
+                delay = self._random.uniform(*self.latency)
+            else:
+                delay = self.latency
+        if failed:
+            return (self.error_status, b'', delay)
+        body = self.response(xpp) if callable(self.response) else self.response
+        return (200, body, delay)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'       # Keep connections alive.
+
+    def do_HEAD(self):
+        self.server.requests.append(('HEAD', {}))
+        self._send(405, b'', head=True)
+
+
+    def do_GET(self):
+        self.server.requests.append(('GET', {}))
+        self._send(405, b'')
+
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        fields = _form_fields(self.headers.get('Content-Type', ''),
+                              self.rfile.read(length))
+        server.requests.append(('POST', fields))
+        server.connections.add(self.client_address[1])
+        if fields.get('exportTo') != b'sbml' or 'file' not in fields:
+            self._send(400, b'expected the fields exportTo=sbml and file')
+            return
+
+        with server.lock:
+            server.active += 1
+            server.most_active = max(server.active, server.most_active)
+        try:
+            (status, body, delay) = server._answer(fields['file'])
+            time.sleep(delay)
+        finally:
+            with server.lock:
+                server.active -= 1
+        self._send(status, body)
+
+
+    def log_message(self, *args):
+        pass
+
+
+    def _send(self, status, body, head=False):
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/xml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if not head:
+                self.wfile.write(body)
+        except socket.error:
+            pass                        # The client gave up waiting.
+
+
+def _form_fields(content_type, body):
+    # The fields of a multipart form, as a dictionary from names to bytes.
+    header = 'Content-Type: {}\r\n\r\n'.format(content_type).encode('latin-1')
+    message = _message_from_bytes(header + body)
+    if not message.is_multipart():
+        return {}
+    fields = {}
+    for part in message.get_payload():
+        name = part.get_param('name', header='content-disposition')
+        if name:
+            fields[name] = part.get_payload(decode=True)
+    return fields
+
+
+# -----------------------------------------------------------------------------
+# Command line interface
+# -----------------------------------------------------------------------------
+
+def main(argv):
+    '''Usage: mock_biocham.py [options]
+    Runs a local stand-in for the BIOCHAM web service until interrupted.
+    Options:
+      -p PORT     Port to listen on (default: 8765)
+      -r FILE     SBML file to return (default: an empty model)
+      -l SECONDS  Delay of each answer, or LOW,HIGH for a random delay
+      -e RATE     Fraction of uploads that fail (default: 0)
+      -s STATUS   HTTP status of the failures (default: 503)
+    '''
+    try:
+        options, _ = getopt.getopt(argv[1:], "p:r:l:e:s:")
+    except getopt.GetoptError:
+        raise SystemExit(main.__doc__)
+    settings = {'port': 8765}
+    for opt, value in options:
+        if opt == '-p':
+            settings['port'] = int(value)
+        elif opt == '-r':
+            with open(value, 'rb') as file:
+                settings['response'] = file.read()
+        elif opt == '-l':
+            low_high = [float(v) for v in value.split(',')]
+            settings['latency'] = tuple(low_high) if len(low_high) > 1 else low_high[0]
+        elif opt == '-e':
+            settings['error_rate'] = float(value)
+        elif opt == '-s':
+            settings['error_status'] = int(value)
+    server = MockBiocham(**settings)
+    print('Mock BIOCHAM service at ' + server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -22,5 +22,10 @@
 
 from .grammar import MatlabGrammar
 from .context import MatlabContext
+from .symbols import SymbolTable
+from .callgraph import CallGraph
+from .cache import ParseCache
+from .serialize import dump_context, load_context
+from .columnar import ColumnarTrees
 from .matlab import *
 from .functions import *
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+#
+# @file    cache.py
+# @brief   Persistent, content-addressed cache of MatlabGrammar parse results
+# @author  Michael Hucka
+#
+# <!---------------------------------------------------------------------------
+# This software is part of MOCCASIN, the Model ODE Converter for Creating
+# Automated SBML INteroperability. Visit https://github.com/sbmlteam/moccasin/.
+#
+# Copyright (C) 2014-2016 jointly by the following organizations:
+#  1. California Institute of Technology, Pasadena, CA, USA
+#  2. Icahn School of Medicine at Mount Sinai, New York, NY, USA
+#  3. Boston University, Boston, MA, USA
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation.  A copy of the license agreement is provided in the
+# file named "COPYING.txt" included with this software distribution and also
+# available online at https://github.com/sbmlteam/moccasin/.
+# ------------------------------------------------------------------------- -->
+
+# Basic principles of the parse cache
+# -----------------------------------
+#
+# Parsing is by far the most expensive step in MOCCASIN: the PyParsing
+# grammar, followed by the three passes that turn ParseResults into
+# MatlabNode/MatlabContext objects, can take seconds for a modest model.
+# When the same files are converted over and over, nearly all of that work
+# is redundant.  ParseCache stores the finished MatlabContext tree on disk,
+# so that a later parse of the same input can skip PyParsing and the
+# transformer passes entirely.
+#
+# Entries are content-addressed: the key is a SHA-1 digest of the
+# *preprocessed* input text (i.e., after continuation and line-ending
+# normalization), the grammar version, the MOCCASIN version and the name of
+# the parser backend.  Changing either version number therefore invalidates
+# every old entry automatically, and two differently-named files with the
+# same contents share an entry.  The backends get separate entries, because
+# their trees may differ in ways that matter (e.g., in which nodes are
+# shared).
+#
+# Each entry is one pickle file in the cache directory.  Files are written
+# to a temporary name in the same directory and then renamed into place, so
+# that a reader never sees a partially-written entry; this makes the cache
+# safe to share between concurrent processes.  A corrupt or unreadable entry
+# is simply treated as a miss.
+#
+# The cache is bounded by a maximum number of entries and a maximum total
+# size in bytes.  Recency of use is tracked through file modification times
+# (a hit "touches" the entry), and when the cache grows past either limit,
+# the least-recently used entries are deleted first.
+
+from __future__ import print_function
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import six
+from six.moves import cPickle as pickle
+try:
+    from version import __version__
+except:
+    from ..version import __version__
+
+
+# Bump this whenever a change to the grammar or to the post-processing in
+# grammar.py would make previously-cached MatlabContext trees different from
+# what a fresh parse would produce.  The bumps so far were for:
+#
+#   2: assignments and types resolved through the symbol table.
+#   3: Ambiguous nodes resolved through longer chains of type inferences
+#      (a change made before 2, which should have been bumped for then).
+
+GRAMMAR_VERSION = '3'
+
+# Defaults for the cache limits.
+
+_DEFAULT_MAX_ENTRIES = 5000
+_DEFAULT_MAX_BYTES   = 512*1024*1024
+
+_ENTRY_SUFFIX = '.pickle'
+
+
+class ParseCache(object):
+    """On-disk cache of MatlabContext objects produced by MatlabGrammar.
+
+    Pass an instance as the `cache` argument to MatlabGrammar() to have
+    MatlabGrammar.parse_string() and MatlabGrammar.parse_file() consult it.
+
+    :param directory: the directory in which cache entries are stored.  It
+    is created if it does not exist.
+    :param max_entries: maximum number of entries kept in the cache.
+    :param max_bytes: maximum total size in bytes of the cache entries.
+
+    The attributes `hits`, `misses`, `stores` and `evictions` count the
+    corresponding events over the lifetime of this object; stats() returns
+    them as a dictionary.  They are updated under a lock, so that they are
+    exact when the cache is shared by parsers in several threads.
+
+    Entries are kept apart for each parser backend, so that a tree made by
+    one backend is never returned to the other.
+    """
+
+    def __init__(self, directory, max_entries=_DEFAULT_MAX_ENTRIES,
+                 max_bytes=_DEFAULT_MAX_BYTES):
+        if max_entries is not None and max_entries < 1:
+            raise ValueError('max_entries must be at least 1')
+        if max_bytes is not None and max_bytes < 1:
+            raise ValueError('max_bytes must be at least 1')
+        self.directory   = os.path.abspath(os.path.expanduser(directory))
+        self.max_entries = max_entries
+        self.max_bytes   = max_bytes
+        self.hits        = 0
+        self.misses      = 0
+        self.stores      = 0
+        self.evictions   = 0
+        self._lock       = threading.Lock()
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                # Another process may have created it in the meantime.
+                if not os.path.isdir(self.directory):
+                    raise
+
+
+    def __repr__(self):
+        return '<ParseCache {}: {} hits, {} misses>'.format(
+            self.directory, self.hits, self.misses)
+
+
+    def key(self, preprocessed, backend='pyparsing'):
+        """Returns the cache key for the given preprocessed input text, as
+        parsed by the named parser backend."""
+        digest = hashlib.sha1()
+        for part in [GRAMMAR_VERSION, __version__, backend, preprocessed]:
+            if isinstance(part, six.text_type):
+                part = part.encode('utf-8')
+            digest.update(part)
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+
+    def get(self, preprocessed, backend='pyparsing'):
+        """Returns the cached MatlabContext for the preprocessed input text,
+        or None if there is no (usable) entry for it."""
+        path = self._path(self.key(preprocessed, backend))
+        try:
+            with open(path, 'rb') as f:
+                context = pickle.load(f)
+        except Exception:
+            # Missing, unreadable, truncated or otherwise unusable.
+            self._count('misses')
+            return None
+        self._count('hits')
+        self._touch(path)
+        return context
+
+
+    def put(self, preprocessed, context, backend='pyparsing'):
+        """Stores the MatlabContext `context` as the parse result for the
+        preprocessed input text, as parsed by the named parser backend,
+        then evicts old entries if necessary."""
+        path = self._path(self.key(preprocessed, backend))
+        # PyParsing results are not needed by anyone downstream and are
+        # large and slow to pickle, so we make sure they don't get stored.
+        saved_pr = context.parse_results
+        context.parse_results = None
+        try:
+            data = pickle.dumps(context, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # Some inputs produce trees that can't be pickled (e.g., too
+            # deeply nested).  Caching is an optimization, so just skip it.
+            return False
+        finally:
+            context.parse_results = saved_pr
+        (fd, tmp_path) = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            _replace(tmp_path, path)
+        except Exception:
+            _remove(tmp_path)
+            return False
+        self._count('stores')
+        self._evict()
+        return True
+
+
+    def clear(self):
+        """Removes every entry from the cache."""
+        for (path, _, _) in self._entries():
+            _remove(path)
+
+
+    def stats(self):
+        """Returns a dictionary of counters and the current cache size."""
+        entries = self._entries()
+        with self._lock:
+            counts = {'hits': self.hits, 'misses': self.misses,
+                      'stores': self.stores, 'evictions': self.evictions}
+        counts.update(entries=len(entries),
+                      bytes=sum(size for (_, _, size) in entries))
+        return counts
+
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _ENTRY_SUFFIX)
+
+
+    def _touch(self, path):
+        try:
+            os.utime(path, None)
+        except OSError:
+            # Evicted by another process after we read it.  No matter.
+            pass
+
+
+    def _entries(self):
+        # Returns a list of (path, mtime, size) for the current entries.
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(_ENTRY_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, st.st_mtime, st.st_size))
+        return entries
+
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for (_, _, size) in entries)
+        while entries and ((self.max_entries and len(entries) > self.max_entries)
+                           or (self.max_bytes and total > self.max_bytes)):
+            (path, _, size) = entries.pop(0)
+            if _remove(path):
+                self._count('evictions')
+            total -= size
+
+
+# Helpers.
+# .............................................................................
+
+def _replace(src, dst):
+    # os.rename() is atomic on POSIX but fails on Windows if the destination
+    # exists; os.replace() does the right thing, but is only in Python 3.3+.
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        if sys.platform.startswith('win') and os.path.exists(dst):
+            _remove(dst)
+        os.rename(src, dst)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
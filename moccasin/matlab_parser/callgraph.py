@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+#
+# @file    callgraph.py
+# @brief   Index of the function calls in a tree of MatlabContext objects
+# @author  Michael Hucka
+#
+# <!---------------------------------------------------------------------------
+# This software is part of MOCCASIN, the Model ODE Converter for Creating
+# Automated SBML INteroperability. Visit https://github.com/sbmlteam/moccasin/.
+#
+# Copyright (C) 2014-2016 jointly by the following organizations:
+#  1. California Institute of Technology, Pasadena, CA, USA
+#  2. Icahn School of Medicine at Mount Sinai, New York, NY, USA
+#  3. Boston University, Boston, MA, USA
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation.  A copy of the license agreement is provided in the
+# file named "COPYING.txt" included with this software distribution and also
+# available online at https://github.com/sbmlteam/moccasin/.
+# ------------------------------------------------------------------------- -->
+
+# The 'calls' dictionary of a MatlabContext holds the calls made in that
+# context, by the name of the function called.  Questions such as "where is
+# function f called?" or "where is a handle to f passed to a function?"
+# would need a search of every context and every argument list.  A
+# CallGraph answers them from two indexes, both keyed by function name:
+#
+#   direct:   for each function, the contexts that call it, and for each
+#             context, its list of argument lists for the calls (the same
+#             list as in the context's 'calls' dictionary);
+#
+#   handles:  for each function, the calls that are given a handle to it
+#             as an argument, as (context, name of the function called,
+#             argument list).
+#
+# MatlabGrammar adds each call to the graph as it records it in a context.
+# Calls are sometimes removed from a 'calls' dictionary afterwards (when
+# what looked like a call turns out to be an array reference); the graph
+# skips those when it is queried, so it doesn't need to be told.
+#
+# There is one graph per tree of contexts, kept by the topmost context (see
+# MatlabContext.call_graph).  A graph made for contexts that already have
+# calls, such as contexts read back from a cache, starts out with them.
+
+from collections import defaultdict
+
+try:
+    from matlab import FuncHandle
+except:
+    from .matlab import FuncHandle
+
+
+class CallGraph(object):
+    """Index of the function calls made in a tree of MatlabContext objects.
+    Get the graph of a context using its 'call_graph' property."""
+
+    def __init__(self, context=None):
+        self._direct  = defaultdict(dict)
+        self._handles = defaultdict(list)
+        if context is not None:
+            stack = [context]
+            while stack:
+                context = stack.pop()
+                for name, arglists in context.calls.items():
+                    for args in arglists:
+                        self._add_handles(context, name, args)
+                    self._direct[name][context] = arglists
+                stack.extend(reversed(list(context.functions.values())))
+
+
+    def add(self, context, name, args):
+        """Records a call to 'name' with argument list 'args' that has just
+        been added to the 'calls' dictionary of 'context'."""
+        self._direct[name][context] = context.calls[name]
+        self._add_handles(context, name, args)
+
+
+    def calls_to(self, name, context):
+        """Returns the argument lists of the calls to 'name' made in
+        'context' and in the functions defined directly in it (except
+        'name' itself), leaving out calls without arguments."""
+        own = []
+        nested = []
+        for caller, arglists in self._callers(name):
+            if caller is context:
+                own += [args for args in arglists if args]
+            elif caller.parent is context and caller.name != name:
+                nested += [args for args in arglists if args]
+        return own + nested
+
+
+    def handle_calls(self, name, context):
+        """Returns a dictionary of the calls made in 'context' and in the
+        functions defined directly in it that are given a handle to 'name'
+        as an argument.  The keys are the names of the functions called and
+        the values are lists of argument lists."""
+        calls = defaultdict(list)
+        for caller, callee, args in self._handles.get(name, []):
+            if ((caller is context or caller.parent is context)
+                    and self._current(caller, callee, args)):
+                calls[callee].append(args)
+        return calls
+
+
+    def all_calls(self, context):
+        """Returns a dictionary of the calls made in 'context' and in the
+        functions defined within it, at any depth.  The keys are the names
+        of the functions called and the values are lists of argument
+        lists."""
+        calls = {}
+        for name in list(self._direct):
+            for caller, arglists in self._callers(name):
+                if _within(caller, context):
+                    calls.setdefault(name, []).extend(arglists)
+        return calls
+
+
+    def _callers(self, name):
+        # The callers of 'name' and their argument lists, for the calls
+        # that are still in the contexts' 'calls' dictionaries.
+        callers = self._direct.get(name)
+        if not callers:
+            return []
+        return [(caller, arglists) for caller, arglists in callers.items()
+                if caller.calls.get(name) is arglists]
+
+
+    def _add_handles(self, context, name, args):
+        for arg in (args or []):
+            if isinstance(arg, FuncHandle):
+                self._handles[arg.name].append((context, name, args))
+
+
+    def _current(self, context, name, args):
+        arglists = context.calls.get(name)
+        return (arglists is not None
+                and self._direct.get(name, {}).get(context) is arglists
+                and any(x is args for x in arglists))
+
+
+def _within(context, ancestor):
+    while context is not None:
+        if context is ancestor:
+            return True
+        context = context.parent
+    return False
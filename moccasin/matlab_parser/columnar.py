@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+#
+# @file    columnar.py
+# @brief   Column-oriented storage of MatlabNode trees for bulk analysis
+# @author  Michael Hucka
+#
+# <!---------------------------------------------------------------------------
+# This software is part of MOCCASIN, the Model ODE Converter for Creating
+# Automated SBML INteroperability. Visit https://github.com/sbmlteam/moccasin/.
+#
+# Copyright (C) 2014-2016 jointly by the following organizations:
+#  1. California Institute of Technology, Pasadena, CA, USA
+#  2. Icahn School of Medicine at Mount Sinai, New York, NY, USA
+#  3. Boston University, Boston, MA, USA
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation.  A copy of the license agreement is provided in the
+# file named "COPYING.txt" included with this software distribution and also
+# available online at https://github.com/sbmlteam/moccasin/.
+# ------------------------------------------------------------------------- -->
+
+# ColumnarTrees holds the node lists of any number of parsed files in a few
+# flat arrays instead of as MatlabNode objects, for analyzing large numbers
+# of models at once.  Each node, list, tuple and attribute value is a row,
+# and each column is an array from the standard module 'array':
+#
+#   kind:    what the row is: one of the _KIND_ constants below, or
+#            _KIND_NODE plus the position of the node's class in
+#            _NODE_CLASSES;
+#   parent:  the row of the parent, or -1 for the row of a whole tree;
+#   first:   the row of the first child;
+#   count:   the number of children;
+#   value:   the index in the string table of the row's string, or -1.
+#
+# The children of a node are the values of its attributes, in the order of
+# its _attr_names; the children of a list or tuple are its items.  Rows are
+# laid out breadth first, so the children of a row are always consecutive
+# rows, and the rows of each tree come after those of the trees added
+# before it.  Identifier, Number, String and Special nodes have no children:
+# their name or value is in the 'value' column of their own row.
+#
+# Queries such as find() work on whole columns at once.  If NumPy is
+# installed, they are done with NumPy arrays that share the memory of the
+# columns; otherwise they are done with plain Python loops.
+#
+# Only nodes are stored.  The `context` attribute of FunDef nodes is not,
+# and is None in the nodes returned by nodes().
+
+from __future__ import print_function
+from array import array
+from bisect import bisect_right
+from fnmatch import fnmatchcase
+import six
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from matlab import *
+except:
+    from .matlab import *
+
+
+_KIND_NONE   = 0
+_KIND_TRUE   = 1
+_KIND_FALSE  = 2
+_KIND_STRING = 3
+_KIND_LIST   = 4
+_KIND_TUPLE  = 5
+_KIND_NODE   = 8
+
+_NODE_CLASSES = [Number, String, Special, Array, FuncHandle, AnonFun,
+                 Identifier, FunCall, ArrayRef, StructRef, Ambiguous,
+                 UnaryOp, BinaryOp, ColonOp, Transpose, ScopeDecl,
+                 Assignment, FunDef, Try, Switch, If, While, For, Branch,
+                 ShellCommand, Comment]
+
+_NODE_KINDS = dict((cls, _KIND_NODE + i) for i, cls in enumerate(_NODE_CLASSES))
+
+# Classes whose single attribute is kept in the 'value' column.
+
+_LEAF_CLASSES = set([Identifier, Number, String, Special])
+
+
+class ColumnarTrees(object):
+    """Column-oriented store of lists of MatlabNode objects.
+
+    Use add() to store the `nodes` of a MatlabContext (or any list of
+    nodes), find() to look for nodes, and node() and nodes() to get
+    MatlabNode objects back.  Rows are numbered from 0, as are the trees
+    in the order they were added.
+    """
+
+    def __init__(self):
+        self.kind    = array('B')
+        self.parent  = array('i')
+        self.first   = array('i')
+        self.count   = array('i')
+        self.value   = array('i')
+        self.strings = []                  # The string table.
+        self.labels  = []                  # One per tree, as given to add().
+        self._roots  = []                  # The row of each tree.
+        self._string_ids = {}
+
+
+    def __len__(self):
+        """Returns the number of rows."""
+        return len(self.kind)
+
+
+    def add(self, nodes, label=None):
+        """Stores the list of MatlabNode objects `nodes` as a new tree, and
+        returns the number of the tree.  `label` can be anything that
+        identifies it, such as the path of the file it came from."""
+        tree = len(self._roots)
+        self._roots.append(len(self.kind))
+        self.labels.append(label)
+        self._new_rows(1, -1)
+        queue = [(self._roots[-1], nodes)]
+        # The queue only grows while we go through it, so this visits the
+        # rows in the order they are created.
+        i = 0
+        while i < len(queue):
+            row, thing = queue[i]
+            i += 1
+            children = self._set_row(row, thing)
+            if children:
+                first = len(self.kind)
+                self._new_rows(len(children), row)
+                self.first[row] = first
+                self.count[row] = len(children)
+                queue.extend(zip(range(first, first + len(children)), children))
+        return tree
+
+
+    def tree(self, row):
+        """Returns the number of the tree that `row` belongs to."""
+        return bisect_right(self._roots, row) - 1
+
+
+    def root(self, tree):
+        """Returns the row of tree number `tree`."""
+        return self._roots[tree]
+
+
+    def find(self, cls, name=None):
+        """Returns a list of the rows of nodes of class `cls` (a subclass of
+        MatlabNode; its subclasses are not included), in order.  If `name`
+        is given, only nodes whose `name` is an Identifier matching the
+        shell-style pattern `name` are included, e.g., find(FunCall,
+        'ode*').  For Identifier nodes, the pattern is matched against the
+        identifiers themselves."""
+        kind = _NODE_KINDS[cls]
+        if name is None:
+            return self._rows_of_kind(kind)
+        if cls is Identifier:
+            offset = None
+        elif 'name' in (cls._attr_names or []):
+            offset = cls._attr_names.index('name')
+        else:
+            raise ValueError('{} nodes have no name'.format(cls.__name__))
+        matching = [fnmatchcase(text, name) for text in self.strings]
+        if numpy is not None:
+            return self._find_numpy(kind, offset, matching)
+        ident = _NODE_KINDS[Identifier]
+        kinds, values, first = self.kind, self.value, self.first
+        found = []
+        for row in self._rows_of_kind(kind):
+            if offset is not None:
+                row_name = first[row] + offset
+                if kinds[row_name] != ident:
+                    continue
+            else:
+                row_name = row
+            if matching[values[row_name]]:
+                found.append(row)
+        return found
+
+
+    def children(self, row):
+        """Returns the rows of the children of `row`."""
+        first = self.first[row]
+        return list(range(first, first + self.count[row]))
+
+
+    def node(self, row):
+        """Returns the MatlabNode (or list, tuple or value) stored in `row`,
+        recreating it and everything below it."""
+        # Written using our own stack, since expressions can be nested very
+        # deeply.  Entries are [kind, rows of the children still to convert,
+        # values of the children converted so far]; the object is made when
+        # all of its children have been converted.
+        def start(row):
+            kind = self.kind[row]
+            if kind == _KIND_STRING:
+                return None, self.strings[self.value[row]]
+            elif kind == _KIND_NONE:
+                return None, None
+            elif kind == _KIND_TRUE or kind == _KIND_FALSE:
+                return None, kind == _KIND_TRUE
+            elif kind >= _KIND_NODE:
+                cls = _NODE_CLASSES[kind - _KIND_NODE]
+                if cls in _LEAF_CLASSES:
+                    return None, cls(self.strings[self.value[row]])
+            first = self.first[row]
+            return [kind, list(range(first + self.count[row] - 1, first - 1, -1)), []], None
+
+        entry, value = start(row)
+        if entry is None:
+            return value
+        stack = [entry]
+        while True:
+            entry = stack[-1]
+            if entry[1]:
+                child, value = start(entry[1].pop())
+                if child is not None:
+                    stack.append(child)
+                    continue
+                entry[2].append(value)
+                continue
+            stack.pop()
+            kind, _, values = entry
+            if kind == _KIND_LIST:
+                value = values
+            elif kind == _KIND_TUPLE:
+                value = tuple(values)
+            else:
+                value = _NODE_CLASSES[kind - _KIND_NODE](*values)
+            if not stack:
+                return value
+            stack[-1][2].append(value)
+
+
+    def nodes(self, tree):
+        """Returns the list of MatlabNode objects stored as tree `tree`."""
+        return self.node(self._roots[tree])
+
+
+    def nbytes(self):
+        """Returns the number of bytes taken by the columns."""
+        return sum(len(column) * column.itemsize for column in
+                   [self.kind, self.parent, self.first, self.count, self.value])
+
+
+    def _new_rows(self, n, parent):
+        self.kind.extend([0] * n)
+        self.parent.extend([parent] * n)
+        self.first.extend([0] * n)
+        self.count.extend([0] * n)
+        self.value.extend([-1] * n)
+
+
+    def _set_row(self, row, thing):
+        # Fills in the kind and value of 'row' for 'thing', and returns the
+        # things that are its children.
+        if thing is None:
+            self.kind[row] = _KIND_NONE
+        elif thing is True:
+            self.kind[row] = _KIND_TRUE
+        elif thing is False:
+            self.kind[row] = _KIND_FALSE
+        elif isinstance(thing, six.string_types):
+            self.kind[row] = _KIND_STRING
+            self.value[row] = self._string_id(thing)
+        elif isinstance(thing, list):
+            self.kind[row] = _KIND_LIST
+            return thing
+        elif isinstance(thing, tuple):
+            self.kind[row] = _KIND_TUPLE
+            return thing
+        elif type(thing) in _NODE_KINDS:
+            self.kind[row] = _NODE_KINDS[type(thing)]
+            if type(thing) in _LEAF_CLASSES:
+                self.value[row] = self._string_id(getattr(thing, thing._attr_names[0]))
+                return None
+            return [None if name == 'context' else getattr(thing, name)
+                    for name in thing._attr_names]
+        else:
+            raise TypeError('Cannot store object of type {}'
+                            .format(type(thing).__name__))
+        return None
+
+
+    def _string_id(self, text):
+        index = self._string_ids.get(text)
+        if index is None:
+            index = self._string_ids[text] = len(self.strings)
+            self.strings.append(text)
+        return index
+
+
+    def _rows_of_kind(self, kind):
+        if numpy is not None:
+            return numpy.flatnonzero(self._column('kind') == kind).tolist()
+        return [row for row, k in enumerate(self.kind) if k == kind]
+
+
+    def _find_numpy(self, kind, offset, matching):
+        rows = numpy.flatnonzero(self._column('kind') == kind)
+        if offset is not None:
+            names = self._column('first')[rows] + offset
+            rows = rows[self._column('kind')[names] == _NODE_KINDS[Identifier]]
+            names = self._column('first')[rows] + offset
+        else:
+            names = rows
+        matching = numpy.array(matching + [False], dtype=bool)
+        # String ids of -1 select the extra False at the end.
+        return rows[matching[self._column('value')[names]]].tolist()
+
+
+    def _column(self, name):
+        column = getattr(self, name)
+        return numpy.frombuffer(column, dtype=column.typecode)
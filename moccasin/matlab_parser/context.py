@@ -21,39 +21,79 @@
 # ------------------------------------------------------------------------- -->
 
 from __future__ import print_function
-import collections
 from pyparsing import ParseResults
 
+try:
+    from symbols import KINDS, SymbolTable
+    from callgraph import CallGraph
+except:
+    from .symbols import KINDS, SymbolTable
+    from .callgraph import CallGraph
+
 
 # The ContextDict class makes it easier to create dictionary-like properties
 # on MatlabContext objects.  The reason it's necessary is that Python
 # properties are designed around the idea that you do "obj.prop = value",
 # whereas for some properties in MatlabContext, we want the ability to do
-# "obj.prop[key] = value".  This means that obj.prop has to be a custom class
-# that supports the operations.
-#
-# This next class def is based on http://stackoverflow.com/a/7760938/743730
+# "obj.prop[key] = value".  It is a plain dict, except that the
+# dictionaries of assignments and types tell the SymbolTable of their
+# context (see symbols.py) when they change, so that it can keep its flat
+# dictionaries of bindings up to date.
 
-class ContextDict(collections.MutableMapping, dict):
+class ContextDict(dict):
     """Class used to implement MatlabContext properties that are dictionaries."""
 
-    def __getitem__(self, key):
-        return dict.__getitem__(self, key)
+    # Set for the dictionaries whose changes the SymbolTable must know
+    # about.  These are class attributes so that they are defined while a
+    # pickled ContextDict is being filled in, before its state is restored.
+    _owner = None
+    _kind  = None
+
+    def __init__(self, owner=None, kind=None):
+        dict.__init__(self)
+        if kind in KINDS:
+            self._owner = owner
+            self._kind  = kind
 
     def __setitem__(self, key, value):
         dict.__setitem__(self, key, value)
+        self._changed(key)
 
     def __delitem__(self, key):
         dict.__delitem__(self, key)
+        self._changed(key)
+
+    def pop(self, key, *default):
+        present = key in self
+        value = dict.pop(self, key, *default)
+        if present:
+            self._changed(key)
+        return value
 
-    def __iter__(self):
-        return dict.__iter__(self)
+    def popitem(self):
+        (key, value) = dict.popitem(self)
+        self._changed(key)
+        return (key, value)
 
-    def __len__(self):
-        return dict.__len__(self)
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
 
-    def __contains__(self, x):
-        return dict.__contains__(self, x)
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self._changed(None)
+
+    def clear(self):
+        dict.clear(self)
+        self._changed(None)
+
+    def _changed(self, key):
+        if self._owner is not None:
+            table = self._owner._symbol_table()
+            if table is not None:
+                table.changed(self._owner, self._kind, key)
 
 
 class MatlabContext(object):
@@ -121,6 +161,16 @@ class MatlabContext(object):
       file:        If the contents of this context came from a file, the path
                    to the file.
 
+      symbols:     The SymbolTable of the tree of contexts this one belongs
+                   to, for looking up the assignments and types visible in
+                   a context without searching its parents.  It is made
+                   when first used and kept by the topmost context.
+
+      call_graph:  The CallGraph of the tree of contexts this one belongs
+                   to, for finding the calls to a function, or the calls
+                   given a handle to it, without searching every context.
+                   Like 'symbols', it is kept by the topmost context.
+
     Users can access via the normal x.propname approach.
 
     To make a copy of a Context object, use the Python 'copy' module.
@@ -138,10 +188,18 @@ class MatlabContext(object):
         self.nodes          = nodes      # The list of MatlabNode objects.
         self.parse_results  = pr         # The corresponding ParseResults obj.
         self.file           = file       # The path to the file, if any.
-        self._functions     = ContextDict()
-        self._assignments   = ContextDict()
-        self._calls         = ContextDict()
-        self._types         = ContextDict()
+        self._functions     = ContextDict(self, 'functions')
+        self._assignments   = ContextDict(self, 'assignments')
+        self._calls         = ContextDict(self, 'calls')
+        self._types         = ContextDict(self, 'types')
+
+
+    def __getstate__(self):
+        # The symbol table and call graph are made again when needed.
+        state = self.__dict__.copy()
+        state.pop('_symbols', None)
+        state.pop('_call_graph', None)
+        return state
 
 
     def __repr__(self):
@@ -224,6 +282,48 @@ class MatlabContext(object):
         return self._types
 
 
+    @property
+    def symbols(self):
+        """The SymbolTable of the tree of contexts this context belongs to."""
+        root = self._root()
+        table = root.__dict__.get('_symbols')
+        if table is None:
+            table = root.__dict__['_symbols'] = SymbolTable()
+        return table
+
+
+    @property
+    def call_graph(self):
+        """The CallGraph of the tree of contexts this context belongs to."""
+        root = self._root()
+        graph = root.__dict__.get('_call_graph')
+        if graph is None:
+            graph = root.__dict__['_call_graph'] = CallGraph(root)
+        return graph
+
+
+    def _symbol_table(self):
+        # Like 'symbols', but doesn't make the table if there is none yet.
+        # This is used while contexts are being filled in, so it only looks
+        # at attributes that are already set (see serialize.py).
+        context = self
+        while True:
+            table = context.__dict__.get('_symbols')
+            if (table is not None or context.__dict__.get('topmost')
+                    or context.parent is None):
+                return table
+            context = context.parent
+
+
+    def _root(self):
+        # The topmost context of a file is the root of its tree, even if
+        # the parser has given it a parent.
+        context = self
+        while context.parent is not None and not context.topmost:
+            context = context.parent
+        return context
+
+
 
 # Quick testing interface.
 
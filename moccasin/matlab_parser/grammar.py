@@ -28,7 +28,9 @@
 # class `MatlabGrammar` for debugging and other tasks, but the basic goal of
 # `MatlabGrammar` is to provide the two main entry points.  Both of those
 # functions return a data structure that a caller can examine to determine
-# what was found in a given MATLAB input string or file.
+# what was found in a given MATLAB input string or file.  For very large
+# files, `MatlabGrammar.iter_parse()` yields the top-level `MatlabNode`
+# objects one statement at a time instead.
 #
 # The data structure returned by the parsing functions is an object of class
 # `MatlabContext`.  This object contains a number of fields designed for
@@ -359,38 +361,109 @@ from __future__ import print_function
 import codecs
 import copy
 import pdb
+import re
 import six
 import sys
+import threading
 import traceback
 import pyparsing                        # Need this for version check, so ...
 from pyparsing import *                 # ... DON'T merge this & previous stmt!
-from distutils.version import LooseVersion
-from collections import defaultdict
+from collections import defaultdict, deque
 try:
     from grammar_utils import *
     from context import *
     from matlab import *
     from functions import *
+    from cache import ParseCache
+    from rd_parser import MatlabRDParser, preprocess as rd_preprocess
+    from statement_reader import StatementReader
 except:
     from .grammar_utils import *
     from .context import *
     from .matlab import *
     from .functions import *
+    from .cache import ParseCache
+    from .rd_parser import MatlabRDParser, preprocess as rd_preprocess
+    from .statement_reader import StatementReader
 
-# Check minimum version of PyParsing.
+# Check minimum version of PyParsing.  (This used to use distutils' version
+# comparison, but importing distutils takes longer than the rest of this
+# module put together.)
 
-if LooseVersion(pyparsing.__version__) < LooseVersion('2.0.3'):
+def _version_tuple(version):
+    return tuple(int(n) for n in re.findall(r'\d+', version)[:3])
+
+if _version_tuple(pyparsing.__version__) < (2, 0, 3):
     raise Exception('MatlabGrammar requires PyParsing version 2.0.3 or higher')
 
 # Necessary optimization.  Without this, the PyParsing grammar defined below
-# never finishes parsing anything.
+# never finishes parsing anything.  Note that MatlabGrammar replaces the
+# cache that this creates with its own PackratCache during each parse; see
+# _do_parse() and the 'packrat_cache_size' argument to MatlabGrammar().
 
 ParserElement.enablePackrat()
 
-# The inefficient nature of this parser leads to easily exceeding the default
-# recursion stack limit.  Let's increase it:
-
-sys.setrecursionlimit(5000)
+# The name of the class variable in which PyParsing looks up its packrat
+# cache.  Versions before 2.1.6 use a plain dict called _exprArgCache;
+# later versions use a cache object called packrat_cache.  PackratCache
+# works as either.
+
+if hasattr(ParserElement, 'packrat_cache'):
+    _PACKRAT_CACHE_ATTR = 'packrat_cache'
+else:
+    _PACKRAT_CACHE_ATTR = '_exprArgCache'
+
+# Default maximum number of entries in the packrat cache of a MatlabGrammar
+# object.  PyParsing's own default is 128, which is far too small for our
+# grammar: parsing a line of MATLAB creates some 2000 entries, so nearly
+# every lookup missed.  With this size, parsing the syntax and converter
+# test cases takes a third of the time it did with 128 entries, the same
+# as with an unbounded cache; entries take roughly 1 KB each.
+
+_DEFAULT_PACKRAT_CACHE_SIZE = 65536
+
+# Both parsers recurse many times for every level of nesting of constructs
+# in the input, such as parentheses inside parentheses, and the default
+# recursion limit allows only some 30 levels.  The limit is raised to the
+# following value while parsing, and put back afterwards.  Nothing else in
+# this module depends on it: the conversion of the parse results into
+# MatlabNode objects and the passes over the nodes use explicit stacks for
+# operator expressions, which are the things that get very long.
+#
+# The recursion limit applies to the whole process, so when several threads
+# parse at once, it is raised by the first one to start and put back by the
+# last one to finish.
+
+_PARSE_RECURSION_LIMIT = 5000
+
+_recursion_limit_lock  = threading.Lock()
+_recursion_limit_users = 0
+_saved_recursion_limit = None
+
+def _call_with_parse_recursion_limit(func, *args, **kwargs):
+    global _recursion_limit_users, _saved_recursion_limit
+    with _recursion_limit_lock:
+        if _recursion_limit_users == 0:
+            _saved_recursion_limit = sys.getrecursionlimit()
+            if _saved_recursion_limit < _PARSE_RECURSION_LIMIT:
+                sys.setrecursionlimit(_PARSE_RECURSION_LIMIT)
+        _recursion_limit_users += 1
+    try:
+        return func(*args, **kwargs)
+    finally:
+        with _recursion_limit_lock:
+            _recursion_limit_users -= 1
+            if (_recursion_limit_users == 0
+                and _saved_recursion_limit < _PARSE_RECURSION_LIMIT):
+                sys.setrecursionlimit(_saved_recursion_limit)
+
+# PyParsing keeps the packrat cache in a class variable (see above), and the
+# grammar objects it matches are shared by all MatlabGrammar objects, so
+# only one thread at a time may run the PyParsing grammar.  The recursive-
+# descent backend keeps all of its state in the parser object, and parses
+# with it are not serialized.
+
+_pyparsing_lock = threading.Lock()
 
 
 
@@ -441,23 +514,7 @@ class ParseResultsTransformer:
         length = len(pr)
         if length > 1 and empty_dict(pr):
             # It's an expression.  We deconstruct the infix notation.
-            if pr[1].get('transpose'):
-                # Process the first part and revisit the rest, in case we
-                # have more than one operator applied to the lead item.
-                return self.visit_transpose(pr)
-            elif len(pr) == 2 and 'unary operator' in pr[0].keys():
-                return self.visit_unary_operator(pr)
-            elif len(pr) == 3:
-                if 'binary operator' in pr[1].keys():
-                    return self.visit_binary_operator(pr)
-                elif 'colon operator' in pr[1].keys():
-                    return self.visit_colon_operator(pr)
-            elif len(pr) == 5 and 'colon operator' in pr[1].keys():
-                return self.visit_colon_operator(pr)
-            else:
-                # This should not happen, but maybe someday it will.
-                msg = 'Unexpected expression form encountered in ParseResults.'
-                raise MatlabInternalException(msg)
+            return self._visit_expression(pr)
 
         elif length == 1 and pr[0] == '':
             # An empty string.  This special case handling shoudn't be
@@ -480,76 +537,115 @@ class ParseResultsTransformer:
             return meth(pr)
 
 
-    def visit_identifier(self, pr):
-        return Identifier(name=pr['identifier'])
-
-
-    def visit_number(self, pr):
-        return Number(value=pr['number'])
-
-
-    def visit_string(self, pr):
-        return String(value=pr['string'])
-
-
-    def visit_tilde(self, pr):
-        return Special(value='~')
-
-
-    def visit_colon(self, pr):
-        return Special(value=':')
-
-
-    def visit_end_operator(self, pr):
-        return Special(value='end')
-
-
-    def visit_unary_operator(self, pr):
+    # Operator expressions are converted without recursion (see "Deeply
+    # nested operator expressions" in matlab.py): we keep our own stack of
+    # the expressions whose operands are still being converted.  Operands
+    # that are not operator expressions (numbers, identifiers, array
+    # references, etc.) go through visit() as usual; their nesting depth is
+    # bounded by how deeply constructs are nested in the input, not by its
+    # length.
+
+    def _visit_expression(self, pr):
+        combine, operands = self._expression_form(pr)
+        stack = [(pr, combine, operands, [])]
+        while True:
+            expr, combine, operands, values = stack[-1]
+            if len(values) < len(operands):
+                operand = operands[len(values)]
+                if (isinstance(operand, ParseResults) and len(operand) > 1
+                    and empty_dict(operand)):
+                    combine, operands = self._expression_form(operand)
+                    stack.append((operand, combine, operands, []))
+                else:
+                    values.append(self.visit(operand))
+                continue
+            stack.pop()
+            node = combine(expr, *values)
+            if not stack:
+                return node
+            stack[-1][3].append(node)
+
+
+    def _expression_form(self, pr):
+        # Returns the function that builds the node for expression pr, and
+        # the list of operands that need to be converted first.
+        if pr[1].get('transpose'):
+            return self._transpose, [pr[0]]
+        elif len(pr) == 2 and 'unary operator' in pr[0].keys():
+            return self._unary_operator, [pr[1]]
+        elif len(pr) == 3:
+            if 'binary operator' in pr[1].keys():
+                return self._binary_operator, [pr[0], pr[2]]
+            elif 'colon operator' in pr[1].keys():
+                return self._colon_operator, [pr[0], pr[2]]
+        elif len(pr) == 5 and 'colon operator' in pr[1].keys():
+            return self._colon_operator, [pr[0], pr[2], pr[4]]
+        # This should not happen, but maybe someday it will.
+        msg = 'Unexpected expression form encountered in ParseResults.'
+        raise MatlabInternalException(msg)
+
+
+    def _unary_operator(self, pr, operand):
         op_key = first_key(pr[0])
         op = pr[0][op_key]
-        operand = self.visit(pr[1])
         if op == '-' and isinstance(operand, Number):
             # Replace [UnaryOp(op='-'), Number(value='x')] with Number(value='-x')
             # But watch out if it's already a negative number.
             if operand.value.startswith('-'):
-                return Number(value=operand.value[1:])
+                return self._parser._leaves.number(operand.value[1:])
             else:
-                return Number(value=op + operand.value)
+                return self._parser._leaves.number(op + operand.value)
         elif op == '+' and isinstance(operand, Number):
             # Doesn't seem worth preserving the '+'.
             # Replace [UnaryOp(op='+'), Number(value='x')] with Number(value='x')
-            return Number(operand.value)
+            return self._parser._leaves.number(operand.value)
         else:
             # This is probably negation, "~".
             return UnaryOp(op=op, operand=operand)
 
 
-    def visit_binary_operator(self, pr):
+    def _binary_operator(self, pr, left, right):
         op_key = first_key(pr[1])
         op = pr[1][op_key]
-        left = self.visit(pr[0])
-        right = self.visit(pr[2])
         return BinaryOp(op=op, left=left, right=right)
 
 
-    def visit_colon_operator(self, pr):
-        if len(pr) == 3:
-            left=self.visit(pr[0])
-            middle=None
-            right=self.visit(pr[2])
-        elif len(pr) == 5:
-            left=self.visit(pr[0])
-            middle=self.visit(pr[2])
-            right=self.visit(pr[4])
-        return ColonOp(left=left, middle=middle, right=right)
+    def _colon_operator(self, pr, left, *rest):
+        if len(rest) == 1:
+            return ColonOp(left=left, middle=None, right=rest[0])
+        else:
+            return ColonOp(left=left, middle=rest[0], right=rest[1])
 
 
-    def visit_transpose(self, pr):
-        operand=self.visit(pr[0])
+    def _transpose(self, pr, operand):
         op = pr[1]['transpose']
         return Transpose(op=op, operand=operand)
 
 
+    def visit_identifier(self, pr):
+        return self._parser._leaves.identifier(pr['identifier'])
+
+
+    def visit_number(self, pr):
+        return self._parser._leaves.number(pr['number'])
+
+
+    def visit_string(self, pr):
+        return String(value=pr['string'])
+
+
+    def visit_tilde(self, pr):
+        return Special(value='~')
+
+
+    def visit_colon(self, pr):
+        return Special(value=':')
+
+
+    def visit_end_operator(self, pr):
+        return Special(value='end')
+
+
     def visit_standalone_expression(self, pr):
         content = pr['standalone expression']
         return self.visit(content)
@@ -673,7 +769,7 @@ class ParseResultsTransformer:
     def visit_ambiguous_id(self, pr):
         content = pr['ambiguous id']
         name = content[0]
-        return Ambiguous(name=Identifier(name=name), args=None)
+        return Ambiguous(name=self._parser._leaves.identifier(name), args=None)
 
 
     def visit_struct(self, pr):
@@ -835,11 +931,57 @@ class ParseResultsTransformer:
 #     things like convert ambiguous cases, like something that could be
 #     either a function call or an array reference, to more specific classes
 #     of objects if we have figured out what those objects should be.
+#
+# Things learned late in the walk can settle questions that came up earlier
+# in it.  For example, the types of a function's parameters may only become
+# known from a call to the function further down in the file, and after
+# that, uses of the parameters in the body of the function can be resolved.
+# Rather than walking the whole tree again (which would still leave longer
+# chains of such inferences unresolved), the walk records what each open
+# question is waiting for, and transform() revisits just those questions
+# whose answers may have changed, until nothing more can be learned:
+#
+#  - An Ambiguous node left unresolved waits for the type of its name.
+#
+#  - The types inferred for the parameters of a function wait for more
+#    calls to the function (directly or through a function handle), for
+#    the types of the arguments in the calls, and for changes to them.
+#
+#  - The type of the variable assigned in an assignment, and the
+#    resolution of an Ambiguous node, wait for changes to their parts.
+#
+# Only types becoming known for the first time in a context are treated as
+# news.  Since that can only happen once for a given object and context,
+# and calls and changes to Ambiguous nodes are likewise finite, the
+# worklist always comes to an end.
 
 class NodeTransformer(MatlabNodeVisitor):
     def __init__(self, parser):
         super(NodeTransformer, self).__init__()
         self._parser = parser
+        # Entries waiting for the type of an object to become known and for
+        # calls to a function, keyed by object and function name.  Entries
+        # are tuples (kind, node, context); see _revisit().
+        self._awaiting_type = defaultdict(list)
+        self._awaiting_call = defaultdict(list)
+        # Names of the functions argument lists were passed to, by id().
+        self._callees = defaultdict(list)
+        self._worklist = deque()
+        self._queued = set()
+        # Where Ambiguous nodes are in the tree, by id(); see _locate().
+        self._slots = None
+
+
+    def transform(self, nodes):
+        """Visits the given nodes, then revisits the parts of them that
+        depend on things learned later in the visit, until no more can be
+        learned.  Returns the new nodes."""
+        nodes = self.visit(nodes)
+        while self._worklist:
+            entry = self._worklist.popleft()
+            self._queued.discard((entry[0], id(entry[1])))
+            self._revisit(nodes, *entry)
+        return nodes
 
 
     def visit_FunCall(self, node):
@@ -847,7 +989,7 @@ class NodeTransformer(MatlabNodeVisitor):
         node.name = self.visit(node.name)
         node.args = self.visit(node.args)
         # Save the call.
-        self._parser._save_function_call(node)
+        self._save_function_call(node)
         return node
 
 
@@ -856,62 +998,11 @@ class NodeTransformer(MatlabNodeVisitor):
         # Since we know this to be a function, we record its type as such.
         # Make sure to record it in the parent's context -- that's why this
         # is done before a context is pushed in the next step below.
-        parser._save_type(node.name, 'function')
+        self._save_type(node.name, 'function')
         # Push the new function context.  Note that FunDef is unusual in having
         # a node.context property -- other MatlabNodes don't.
         parser._push_context(node.context)
-        # Record inferred type info about the input and output parameters.
-        # The type info applies *inside* the function.
-        for var in filter(lambda x: isinstance(x, Identifier), (node.output or [])):
-            # Output parameters are vars inside the context of a function def.
-            parser._save_type(var, 'variable')
-        if node.parameters:
-            # Look at the rest of the file, to see if we can find a call to
-            # this function and correlate the arguments with the parameters,
-            # to figure out what type they are based on their usage patterns.
-            num_param = len(node.parameters)
-            context = parser._context
-            # Case 1: direct calls to this function.
-            calls = parser._get_direct_calls(node.name, context.parent, anywhere=True)
-            for arglist in (calls or []):
-                if len(arglist) != num_param:
-                    continue
-                for i in range(0, num_param):
-                    arg = arglist[i]
-                    param = node.parameters[i]
-                    if not isinstance(param, Identifier):
-                        continue
-                    if isinstance(arg, FuncHandle):
-                        parser._save_type(param, 'function')
-
-                    elif (isinstance(arg, Identifier)
-                          and parser._get_type(arg, context) == 'function'):
-                        parser._save_type(param, 'function')
-
-                    elif (isinstance(arg, FunCall)
-                          and isinstance(arg.name, Identifier)
-                          and parser._get_type(arg.name, context) == 'function'):
-                        parser._save_type(param, 'variable')
-
-                    elif (isinstance(arg, Primitive) or isinstance(arg, Array)
-                          or isinstance(arg, Operator)):
-                        parser._save_type(param, 'variable')
-
-                    elif (isinstance(arg, Identifier) and
-                          parser._get_type(arg, context) == 'variable'):
-                        parser._save_type(param, 'variable')
-
-            # Case 2: passing a handle to this funtion as an argument to another.
-            calls = parser._get_indirect_calls(node.name, context.parent, anywhere=True)
-            # FIXME: this currently only looks for calls involving odeNN
-            # functions, but there are probably others we could inspect.
-            if any(func.name.startswith('ode') for func in calls.keys()):
-                # This function gets passed as a function handle to a MATLAB
-                # odeNN function.  This means that the arguments to the current
-                # function are variables, and not other functions.
-                for param in node.parameters:
-                    if isinstance(param, Identifier):
-                        parser._save_type(param, 'variable')
+        self._infer_parameter_types(node)
         # Make sure to process the body of this function.
         if node.body:
             node.body = self.visit(node.body)
@@ -920,11 +1011,81 @@ class NodeTransformer(MatlabNodeVisitor):
         return node
 
 
+    def _infer_parameter_types(self, node):
+        # Record inferred type info about the input and output parameters.
+        # The type info applies *inside* the function, so this is called
+        # with the function's context being the current context.
+        parser = self._parser
+        context = parser._context
+        for var in filter(lambda x: isinstance(x, Identifier), (node.output or [])):
+            # Output parameters are vars inside the context of a function def.
+            self._save_type(var, 'variable')
+        if not node.parameters:
+            return
+        # Whatever we find here may change with more calls to the function.
+        self._await(self._awaiting_call, node.name, 'parameters', node)
+
+        # Look at the rest of the file, to see if we can find a call to
+        # this function and correlate the arguments with the parameters,
+        # to figure out what type they are based on their usage patterns.
+        num_param = len(node.parameters)
+        # Case 1: direct calls to this function.
+        graph = context.call_graph
+        for arglist in graph.calls_to(node.name, context.parent):
+            if len(arglist) != num_param:
+                continue
+            for i in range(0, num_param):
+                arg = arglist[i]
+                param = node.parameters[i]
+                if not isinstance(param, Identifier):
+                    continue
+                if isinstance(arg, Identifier):
+                    self._await(self._awaiting_type, arg, 'parameters', node)
+                elif isinstance(arg, FunCall) and isinstance(arg.name, Identifier):
+                    self._await(self._awaiting_type, arg.name, 'parameters', node)
+
+                if isinstance(arg, FuncHandle):
+                    self._save_type(param, 'function')
+
+                elif (isinstance(arg, Identifier)
+                      and parser._get_type(arg, context) == 'function'):
+                    self._save_type(param, 'function')
+
+                elif (isinstance(arg, FunCall)
+                      and isinstance(arg.name, Identifier)
+                      and parser._get_type(arg.name, context) == 'function'):
+                    self._save_type(param, 'variable')
+
+                elif (isinstance(arg, Primitive) or isinstance(arg, Array)
+                      or isinstance(arg, Operator)):
+                    self._save_type(param, 'variable')
+
+                elif (isinstance(arg, Identifier) and
+                      parser._get_type(arg, context) == 'variable'):
+                    self._save_type(param, 'variable')
+
+        # Case 2: passing a handle to this funtion as an argument to another.
+        calls = graph.handle_calls(node.name, context.parent)
+        # FIXME: this currently only looks for calls involving odeNN
+        # functions, but there are probably others we could inspect.
+        if any(func.name.startswith('ode') for func in calls.keys()):
+            # This function gets passed as a function handle to a MATLAB
+            # odeNN function.  This means that the arguments to the current
+            # function are variables, and not other functions.
+            for param in node.parameters:
+                if isinstance(param, Identifier):
+                    self._save_type(param, 'variable')
+
+
     def visit_Assignment(self, node):
         # First visit the lhs and rhs.
         node.lhs = self.visit(node.lhs)
         node.rhs = self.visit(node.rhs)
+        self._infer_assignment_types(node)
+        return node
+
 
+    def _infer_assignment_types(self, node):
         # Save this assignment.
         parser = self._parser
         parser._save_assignment(node)
@@ -936,39 +1097,39 @@ class NodeTransformer(MatlabNodeVisitor):
             if (isinstance(rhs, Array) or isinstance(rhs, Primitive)
                   or isinstance(rhs, Operator)):
                 # In these cases, the LHS is clearly a variable.
-                parser._save_type(lhs, 'variable')
+                self._save_type(lhs, 'variable')
             elif isinstance(rhs, Handle) or isinstance(rhs, AnonFun):
                 # Confusing case: RHS is a function, but *this* is a
                 # variable.  If this is instead labeled as a function, then
                 # it will lead to erroneous results when the variable is used
                 # as an argument to a function call elsewhere.
-                parser._save_type(lhs, 'variable')
+                self._save_type(lhs, 'variable')
             elif (isinstance(rhs, FunCall) and isinstance(rhs.name, Identifier)
                 and rhs.name.name == 'str2func'):
                 # Special case: a function is being created using Matlab's
                 # str2func(), so in fact, the thing we're assigning to should
                 # be considered a function.
-                parser._save_type(lhs, 'function')
+                self._save_type(lhs, 'function')
             elif (isinstance(rhs, FunCall) or isinstance(rhs, ArrayRef)
                   or isinstance(rhs, ArrayRef) or isinstance(rhs, StructRef)):
                 # FIXME: this is an assumption.
-                parser._save_type(lhs, 'variable')
+                self._save_type(lhs, 'variable')
         elif isinstance(lhs, ArrayRef):
             # A function call can't appear on the LHS of an assignment, so
             # we know that what we have here is a variable, not a function.
-            parser._save_type(lhs.name, 'variable')
+            self._save_type(lhs.name, 'variable')
         elif isinstance(lhs, StructRef) and not lhs.dynamic:
             if (isinstance(rhs, FunCall) and isinstance(rhs.name, Identifier)
                 and rhs.name.name == 'str2func'):
                 # Special case: a function is being created using Matlab's
                 # str2func(), so in fact, the thing we're assigning to should
                 # be considered a function.
-                parser._save_type(lhs, 'function')
+                self._save_type(lhs, 'function')
             else:
-                parser._save_type(lhs, 'variable')
+                self._save_type(lhs, 'variable')
             if isinstance(lhs.name, Identifier):
                 # It's a simple x.y struct reference => x is a variable.
-                parser._save_type(lhs.name, 'variable')
+                self._save_type(lhs.name, 'variable')
         elif isinstance(lhs, Array):
             # A bare array on the LHS.  If symbols appear as subscripts, they
             # cannot be functions.  They could be array references, but it is
@@ -976,15 +1137,22 @@ class NodeTransformer(MatlabNodeVisitor):
             # be one row of subscripts in an array used on the LHS.
             for item in lhs.rows[0]:
                 if isinstance(item, Ambiguous) and item.args == None:
-                    parser._save_type(item.name, 'variable')
-
-        return node
+                    self._save_type(item.name, 'variable')
 
 
     def visit_Ambiguous(self, node):
         # Visit the pieces first.
         node.name = self.visit(node.name)
         node.args = self.visit(node.args)
+        return self._resolve_ambiguous(node, revisit=False)
+
+
+    def _resolve_ambiguous(self, node, revisit):
+        # When revisiting a node, its arguments have already been visited
+        # and are being looked after separately, so we leave them alone.
+        def visited(args):
+            return args if revisit else self.visit(args)
+
         # Now analyze the pieces.
         if isinstance(node.name, Identifier) or isinstance(node.name, StructRef):
             thing = node.name
@@ -1003,10 +1171,10 @@ class NodeTransformer(MatlabNodeVisitor):
                     # It's an identifier followed by arguments.  We know it's
                     # not an array or we wouldn't be here, so we're looking at
                     # a function call.
-                    the_args = self.visit(node.args)
+                    the_args = visited(node.args)
                     node = FunCall(name=thing, args=the_args)
                     # Save the call in the present context.
-                    parser._save_function_call(node)
+                    self._save_function_call(node)
                 else:
                     # There were no arguments at all (e.g., it was "a" rather
                     # than "a()".  We treat it as a variable.  We can
@@ -1027,32 +1195,34 @@ class NodeTransformer(MatlabNodeVisitor):
                     # been put in the list of function calls.  Remove it.
                     if thing in context.calls:
                         context.calls.pop(thing)
-                    the_args = self.visit(node.args)
+                    the_args = visited(node.args)
                     node = ArrayRef(name=node.name, args=the_args, is_cell=False)
         elif parser._get_type(thing, context) == 'function':
             # This is a known function or command.  We can convert this
             # to a FunCall.  At this time, we also process the arguments,
             # being careful not to change "None" to [].
-            the_args = self.visit(node.args) if node.args else node.args
+            the_args = visited(node.args) if node.args else node.args
             node = FunCall(name=thing, args=the_args)
             # Save the call in the present context.
-            parser._save_function_call(node)
+            self._save_function_call(node)
         elif (isinstance(thing, StructRef) and node.args == []):
             # It's something of the form a.b().  This could be an array
             # reference, but in practice, few people put "()" when referring
             # to an array.  So, it's probably a function call.  FIXME: this
             # is an assumption, not a certainty.  We also process the
             # arguments, being careful not to change "None" to [].
-            the_args = self.visit(node.args) if node.args else node.args
+            the_args = visited(node.args) if node.args else node.args
             node = FunCall(name=thing, args=the_args)
             # Save the call in the present context.
-            parser._save_function_call(node)
+            self._save_function_call(node)
         else:
             # Although we didn't change the type of this Ambiguous,
             # we may still be able to change some of its arguments.
             # However, be careful not to change "None" to [].
             if node.args:
-                node.args = self.visit(node.args)
+                node.args = visited(node.args)
+            # We may be able to tell what it is once we know more about it.
+            self._await(self._awaiting_type, thing, 'ambiguous', node)
 
         return node
 
@@ -1067,7 +1237,7 @@ class NodeTransformer(MatlabNodeVisitor):
         # If we've decided we have an array reference, then the identifier is
         # a variable.  This is useful when we have not seen an assignment and
         # the variable might have come from, e.g., loading a file.
-        self._parser._save_type(node.name, 'variable')
+        self._save_type(node.name, 'variable')
         node.args = self.visit(node.args)
         return node
 
@@ -1080,11 +1250,127 @@ class NodeTransformer(MatlabNodeVisitor):
         # If we have a structure reference where the name is a simple id,
         # we can tag the id as a variable.
         if isinstance(node.name, Identifier):
-            self._parser._save_type(node.name, 'variable')
+            self._save_type(node.name, 'variable')
         return node
 
 
-
+    # The worklist.
+    # .........................................................................
+
+    def _save_type(self, thing, type):
+        known = thing in self._parser._context.types
+        self._parser._save_type(thing, type)
+        if not known:
+            self._wake(self._awaiting_type.pop(thing, []))
+
+
+    def _save_function_call(self, node):
+        self._parser._save_function_call(node)
+        # Calls matter to the function called, and to functions whose
+        # handles are passed as arguments (see CallGraph.handle_calls()).
+        names = [node.name]
+        names += [arg.name for arg in (node.args or []) if isinstance(arg, FuncHandle)]
+        if isinstance(node.args, list):
+            self._callees[id(node.args)] += names
+        for name in names:
+            self._wake(self._awaiting_call.pop(name, []))
+
+
+    def _await(self, table, key, kind, node):
+        table[key].append((kind, node, self._parser._context))
+
+
+    def _wake(self, entries):
+        for kind, node, context in entries:
+            if (kind, id(node)) not in self._queued:
+                self._queued.add((kind, id(node)))
+                self._worklist.append((kind, node, context))
+
+
+    def _revisit(self, nodes, kind, node, context):
+        parser = self._parser
+        current = parser._context
+        parser._context = context
+        try:
+            if kind == 'parameters':
+                self._infer_parameter_types(node)
+            elif kind == 'assignment':
+                self._infer_assignment_types(node)
+            else:
+                new = self._resolve_ambiguous(node, revisit=True)
+                if new is not node:
+                    self._replace(nodes, node, new)
+        finally:
+            parser._context = current
+
+
+    def _replace(self, nodes, old, new):
+        if self._slots is None:
+            self._slots = _locate_ambiguous(nodes)
+        container, key = self._slots.get(id(old), (None, None))
+        if container is None or _slot_value(container, key) is not old:
+            return
+        _set_slot_value(container, key, new)
+        # Whatever holds the node may depend on what it turned out to be.
+        context = self._parser._context
+        if isinstance(container, Assignment):
+            self._wake([('assignment', container, context)])
+        elif isinstance(container, Ambiguous):
+            self._wake([('ambiguous', container, context)])
+        elif isinstance(container, list):
+            for name in self._callees.get(id(container), []):
+                self._wake(self._awaiting_call.pop(name, []))
+
+
+# Helpers for NodeTransformer.  A slot is a (container, key) pair, where the
+# container is a list or a MatlabNode and the key is an index or attribute
+# name, or a pair (key, index) for an element of a tuple in the container.
+
+def _locate_ambiguous(nodes):
+    # Returns a dict mapping id()'s of Ambiguous objects to their slots.
+    slots = {}
+    stack = [nodes]
+    while stack:
+        container = stack.pop()
+        if isinstance(container, list):
+            items = enumerate(container)
+        else:
+            items = [(a, getattr(container, a, None))
+                     for a in type(container)._visitable_attr]
+        for key, value in items:
+            if isinstance(value, tuple):
+                parts = [((key, i), part) for i, part in enumerate(value)]
+            else:
+                parts = [(key, value)]
+            for slot_key, part in parts:
+                if isinstance(part, Ambiguous):
+                    slots[id(part)] = (container, slot_key)
+                if isinstance(part, list) or isinstance(part, MatlabNode):
+                    stack.append(part)
+    return slots
+
+
+def _slot_value(container, key):
+    if isinstance(key, tuple):
+        return _slot_value(container, key[0])[key[1]]
+    elif isinstance(container, list):
+        return container[key]
+    else:
+        return getattr(container, key)
+
+
+def _set_slot_value(container, key, value):
+    if isinstance(key, tuple):
+        parts = list(_slot_value(container, key[0]))
+        parts[key[1]] = value
+        _set_slot_value(container, key[0], tuple(parts))
+    elif isinstance(container, list):
+        container[key] = value
+    else:
+        setattr(container, key, value)
+
+
+
 # Disambiguator
 #
 # Helper class to traverse a node structure and convert cases of Ambiguous
@@ -1113,769 +1399,71 @@ class Disambiguator(MatlabNodeVisitor):
 
 
 
-# MatlabGrammar.
-# .............................................................................
-# The definition of our MATLAB grammar, in PyParsing.
+# FunctionContextBuilder
 #
-# Note: the grammar is written in reverse order, from smallest elements to
-# the highest level parsing object, simply because Python interprets the file
-# in this order and needs each item defined before it encounters it later.
-# However, for readabily, it's probably easiest to start at the last
-# definition (which is _matlab_syntax) and read up.
+# Helper class used with the recursive-descent backend (see rd_parser.py).
+# That parser produces MatlabNode objects directly, but leaves the work
+# that ParseResultsTransformer does on the side -- creating contexts for
+# function definitions, and disambiguating loop and catch variables -- to
+# this class.  The order of visits is the same as in ParseResultsTransformer.
 
-class MatlabGrammar:
+class FunctionContextBuilder(MatlabNodeVisitor):
+    def __init__(self, parser):
+        super(FunctionContextBuilder, self).__init__()
+        self._parser = parser
 
-    # First, the lowest-level terminal tokens.
-    # .........................................................................
 
-    _EOL        = LineEnd().suppress()
-    _SOL        = LineStart().suppress()
-    _WHITE      = White(ws=' \t').suppress()
-
-    # Note: For MATLAB, we often need to control where line breaks are
-    # allowed.  In PyParsing, the whitespace property is attached to term
-    # definitions and not to definitions that only combine the terms; i.e.,
-    # when using the "^" or "|" operators to combine terms, it doesn't matter
-    # if you precede that with setDefaultWhitespaceChars settings.  You have
-    # to set the value for the individual term expressions.  That's why some
-    # of the following primitives are wrapped with setDefaultWhitespaceChars.
-
-    ParserElement.setDefaultWhitespaceChars(' \t')
-
-    _SEMI       = Literal(';').suppress()
-    _COMMA      = Literal(',').suppress()
-    _LPAR       = Literal("(").suppress()
-    _RPAR       = Literal(")").suppress()
-    _LBRACKET   = Literal('[').suppress()
-    _RBRACKET   = Literal(']').suppress()
-    _LBRACE     = Literal('{').suppress()
-    _RBRACE     = Literal('}').suppress()
-    _EQUALS     = Literal('=').suppress()
-    _DOT        = Literal('.').suppress()
-    _ELLIPSIS   = Literal('...')
-
-    ParserElement.setDefaultWhitespaceChars(' \t\n\r')
-
-    # This definition of numbers knowingly ignores imaginary numbers because
-    # they're not used in our domain.
-
-    _INTEGER    = Word(nums)
-    _EXPONENT   = Combine(oneOf('E e D d') + Optional(oneOf('+ -')) + Word(nums))
-    _FLOAT      = (Combine(Word(nums) + Optional('.' + Word(nums)) + _EXPONENT)
-                   | Combine(Word(nums) + '.' + _EXPONENT)
-                   | Combine(Word(nums) + '.' + Word(nums))
-                   | Combine('.' + Word(nums) + _EXPONENT)
-                   | Combine('.' + Word(nums))
-                   | Combine(Word(nums) + '.'))
-
-    # Next come definitions of terminal elements.  The funky syntax with the
-    # second parenthesized argument on each line is something PyParsing allows;
-    # it's a short form, equivalent to calling .setResultsName(...).
-
-    _NUMBER     = (_FLOAT | _INTEGER)                 ('number')
-    _STRING     = QuotedString("'", escQuote="''")    ('string')
-
-    _TILDE      = Literal('~')                        ('tilde')
-
-    ParserElement.setDefaultWhitespaceChars(' \t')
-
-    _UMINUS     = Literal('-')                        ('unary operator')
-    _UPLUS      = Literal('+')                        ('unary operator')
-    _UNOT       = Literal('~')                        ('unary operator')
-    _TIMES      = Literal('*')                        ('binary operator')
-    _ELTIMES    = Literal('.*')                       ('binary operator')
-    _MRDIVIDE   = Literal('/')                        ('binary operator')
-    _MLDIVIDE   = Literal('\\')                       ('binary operator')
-    _RDIVIDE    = Literal('./')                       ('binary operator')
-    _LDIVIDE    = Literal('.\\')                      ('binary operator')
-    _MPOWER     = Literal('^')                        ('binary operator')
-    _ELPOWER    = Literal('.^')                       ('binary operator')
-    _PLUS       = Literal('+')                        ('binary operator')
-    _MINUS      = Literal('-')                        ('binary operator')
-    _LT         = Literal('<')                        ('binary operator')
-    _LE         = Literal('<=')                       ('binary operator')
-    _GT         = Literal('>')                        ('binary operator')
-    _GE         = Literal('>=')                       ('binary operator')
-    _EQ         = Literal('==')                       ('binary operator')
-    _NE         = Literal('~=')                       ('binary operator')
-    _AND        = Literal('&')                        ('binary operator')
-    _OR         = Literal('|')                        ('binary operator')
-    _SHORT_AND  = Literal('&&')                       ('binary operator')
-    _SHORT_OR   = Literal('||')                       ('binary operator')
-
-    # Operators that have special-case handling.
-
-    _COLON      = Literal(':')
-    _NC_TRANSP  = Literal(".'")                       ('transpose')
-    _CC_TRANSP  = Literal("'")                        ('transpose')
-
-    ParserElement.setDefaultWhitespaceChars(' \t\n\r')
-
-    # Keywords.  This list is based on what the command 'iskeyword' returns
-    # in MATLAB 2014b.  Note that 'end' as an operator is defined again below.
-
-    _BREAK      = Keyword('break')
-    _CASE       = Keyword('case')
-    _CATCH      = Keyword('catch')
-    _CLASSDEF   = Keyword('classdef')
-    _CONTINUE   = Keyword('continue')
-    _ELSE       = Keyword('else')
-    _ELSEIF     = Keyword('elseif')
-    _END        = Keyword('end')
-    _FOR        = Keyword('for')
-    _FUNCTION   = Keyword('function')
-    _GLOBAL     = Keyword('global')
-    _IF         = Keyword('if')
-    _OTHERWISE  = Keyword('otherwise')
-    _PARFOR     = Keyword('parfor')
-    _PERSISTENT = Keyword('persistent')
-    _RETURN     = Keyword('return')
-    _SPMD       = Keyword('spmd')
-    _SWITCH     = Keyword('switch')
-    _TRY        = Keyword('try')
-    _WHILE      = Keyword('while')
-
-    # Identifiers.
-    #
-    # _id defines identifiers that can be used in user programs.  They can't
-    # be the same as known MATLAB language keywords.  _name defines a labeled
-    # version of _id that we use in most grammar expressions below to avoid
-    # writing "Group(_id)('name')".
+    def visit_FunDef(self, node):
+        node.context = self._parser._save_function_definition(node)
+        self._parser._push_context(node.context)
+        node.body = self.visit(node.body)
+        self._parser._pop_context()
+        return node
 
-    _reserved   = _BREAK | _CASE | _CATCH | _CLASSDEF | _CONTINUE \
-                  | _ELSE | _ELSEIF | _END | _FOR | _FUNCTION \
-                  | _GLOBAL | _IF | _OTHERWISE | _PARFOR | _PERSISTENT \
-                  | _RETURN | _SPMD | _SWITCH | _TRY | _WHILE
 
-    _identifier = Word(alphas, alphanums + '_')
-    _id         = NotAny(_reserved) + _identifier('identifier')
-    _name       = Group(_id)('name')
+    def visit_For(self, node):
+        node.body = self.visit(node.body)
+        node.body = Disambiguator(self, vars=[node.var]).visit(node.body)
+        return node
 
-    # Grammar for expressions.
-    #
-    # Some up-front notes:
-    #
-    # 1) Calling PyParsing's setResultsName() function or its equivalent
-    # yields A COPY of the thing affected -- it does not return the original
-    # thing.  This means that if you have a grammar element of the form
-    #             _foo = Group(_bar('bar') | _biff('biff'))
-    # then _bar and _biff never actually get invoked when _foo is invoked;
-    # what get invoked are copies of _bar and _biff, because that's what gets
-    # stored in _foo.  This has implications for using parse actions and also
-    # debug tracing.  Right now, we no longer use parse actions, but beware
-    # that if parse actions are ever attached to _bar & _biff, they are not
-    # actually called when _foo is invoked because _foo uses copies of _bar
-    # and _biff.  This leads to subtle and frustrating rounds of bug-chasing.
-    #
-    # 2) The grammar below is sometimes designed with the assumption that the
-    # input is valid Matlab.  This fits our purpose, which is to parse valid
-    # Matlab, so we can afford to produce something simpler here and assume
-    # that the input won't do some things that the Matlab parser would
-    # reject.  The basic rule is: accept everything that's valid Matlab, but
-    # don't worry about deliberately excluding what isn't valid Matlab.
-    # .........................................................................
 
-    _expr          = Forward()
-    _expr_in_array = Forward()
-
-    # The possible statement separators/delimiters in Matlab are:
-    #   - EOL
-    #   - line comment (because they eat the EOL at the end)
-    #   - block comments
-    #   - semicolon
-    #   - comma
-    # We handle EOL implicitly in most cases by leaving PyParsing's default
-    # whitespace definition as-is, which marks EOL as an ignored whitespace
-    # character. However, sometimes Matlab syntax requires special care with
-    # EOL, so in those cases, EOL is handled explicitly.
-
-    _line_c_start  = Literal('%').suppress()
-    _block_c_start = Literal('%{').suppress()
-    _block_c_end   = Literal('%}').suppress()
-    _line_comment  = Group(_line_c_start + restOfLine + _EOL)
-    _block_comment = Group(_block_c_start + SkipTo(_block_c_end, include=True))
-    _comment       = Group(_block_comment('comment') | _line_comment('comment'))
-
-    _delimiter     = _COMMA | _SEMI
-    _noncontent    = _delimiter | _comment | _EOL
-
-    # Comma-separated arguments to matrix/array/cell arrays can have ':'
-    # in arguments, but arguments to function calls can't.  Parameter lists in
-    # some other situations (like function return values) can have '~', but
-    # the other elements can only be identifiers, not expressions.  The
-    # following are the different versions used in different places later on.
-    #
-    # For array parsing to work, the next bunch of grammar objects have to be
-    # constructed with different whitespace-handling rules: they must not eat
-    # line breaks, because we need to match EOL explicitly, or else we can't
-    # properly parse a matrix like the following as consisting of 2 rows:
-    #    a = [1 2
-    #         3 4]
-    # That's the reason for the next call to setDefaultWhitespaceChars().
-    # This is turned off again further below.
-    #
-    # Also, the definitions of the array contents grammars below explicitly
-    # include references to _WHITE, which normally would not be necessary and
-    # considered redundant, *except* that in order to deal with some other
-    # problems with array parsing, the definition of expressions used as
-    # array contents explicitly turn off the regular whitespace rules.  This
-    # is why whitespace appears in the next several terms.  So, if you find
-    # yourself looking at these and thinking that the business involving
-    # Optional(_WHITE) is useless and can be removed: no, they have to stay
-    # in order to work properly inside other definitions later.
-    #
-    # Important note about _one_sub: handling MATLAB whitespace behavior
-    # inside and outside of arrays is extremely challenging in this parsing
-    # framework.  Here are examples of cases to be dealt with.  Suppose that
-    # "a" is an array of one item:
-    #
-    #    a(1)        => one item, the value inside the array "a" at location 1
-    #    a (1)       => one item, the value inside the array "a" at location 1
-    #    [a (1)]     => an array of TWO items, the value of a and 1
-    #    [(a (1))]   => an array of ONE item, a(1)
-    #
-    # Notice how in the 3rd example, the handling of whitespace changes inside
-    # the array context, yet wrapping the same expression in parentheses once
-    # again reverts the behavior of whitespace handling to how it is outside
-    # the array context.  (Aside: WTF, MATLAB!?)  The solution implemented here
-    # is rooted in the definition of _one_sub below, which references two
-    # different expression grammar terms.  The first one, _expr_in_array,
-    # handles the third example above.  The definition of _expr_in_array is a
-    # variant of _expr that changes whitespace behavior such that whitespace
-    # is not ignored.  This lets us handle the case where "a (1)" is
-    # interpreted as two subscript items in the array context.  But, this
-    # then screws up interpretation of the fourth example above, in which we
-    # now want to revert handling of whitespace to what it is outside of an
-    # array context.  That's the reason for the introduction of the separate
-    # reference to _LPAR + _expr + _RPAR in the definition of _one_sub: it
-    # lets us use the normal _expr to handle whitespace inside parenthesized
-    # expressions as if they were outside the array context.
-
-    ParserElement.setDefaultWhitespaceChars(' \t')
-
-    _one_sub       = Group(_COLON('colon')) | _expr_in_array | _LPAR + _expr + _RPAR
-    _comma_subs    = Optional(_one_sub) \
-                     + ZeroOrMore(Optional(_WHITE) + _COMMA + Optional(_WHITE) + Optional(_one_sub))
-    _space_subs    = _one_sub + ZeroOrMore(OneOrMore(_WHITE) + _one_sub)
-
-    _call_args     = delimitedList(_expr)
-
-    _opt_arglist   = Optional(_call_args('argument list'))
-
-    _one_param     = Group(_TILDE) | Group(_id)
-    _paramlist     = delimitedList(_one_param)
-    _opt_paramlist = Optional(_paramlist('parameter list'))
-
-    # Bare matrices.  This is a cheat because it doesn't check that all the
-    # element contents have the same data type.  But again, since we expect our
-    # input to be valid Matlab, we don't expect to have to verify that property.
-
-    _row_sep       = Optional(_WHITE) + _SEMI + Optional(_WHITE) + Optional(_comment) \
-                     | Optional(_WHITE) + _comment | _EOL
-    _one_row       = _comma_subs('subscript list') ^ _space_subs('subscript list')
-    _rows          = Optional(_WHITE) + Optional(Group(_one_row.leaveWhitespace())) \
-                     + ZeroOrMore(_row_sep + Optional(Group(_one_row))) + Optional(_WHITE)
-    _bare_array    = Group(_LBRACKET + _rows('row list') + _RBRACKET)('array')
-
-    ParserElement.setDefaultWhitespaceChars(' \t\n\r')
-
-    # Cell arrays.  You can write {} by itself, but a reference has to have at
-    # least one subscript: "somearray{}" is not valid.  Newlines don't
-    # seem to be allowed in args to references, but a bare ':' is allowed.
-    # Some tricky parts:
-    # - The following parses as a cell reference:        a{1}
-    # - The following parses as a function call:         a {1}
-    # - The following parses as an array of 3 elements:  [a {1} a]
-    # - Cell array references can be nested: a{2}{3}
-
-    _bare_cell     = Group(_LBRACE + Optional(_WHITE) + _rows('row list')
-                           + Optional(_WHITE) + _RBRACE)('cell array')
-    _cell_args     = Optional(_WHITE) + Group(_comma_subs)('subscript list') + Optional(_WHITE)
-    _cell_base     = Group(_name + _LBRACE + _cell_args + _RBRACE)('cell array')
-    _cell_nested   = Group(Group(_cell_base)('cell array')
-                           + _LBRACE + _cell_args + _RBRACE)('cell array')
-    _cell_access   = _cell_nested | _cell_base
-    _cell_array    = _cell_access | _bare_cell
-
-    # Named array references.  Note: this interacts with the definition of
-    # function calls later below.  (See _funcall_or_array.)
-
-    _array_args    = Group(_comma_subs)
-    _array_base    = Group(_cell_access | _name)('array base')
-    _array_access  = Group(_array_base
-                           + _LPAR + _array_args('subscript list') + _RPAR
-                          ).setResultsName('array')  # noqa
-
-    # Function handles.
-    #
-    # See http://mathworks.com/help/matlab/ref/function_handle.html
-    # In all function arguments, you can use a bare tilde to indicate a value
-    # that can be ignored.  This is not obvious from the functional
-    # documentation, but it seems to be the case when I try it.  (It's the
-    # case for function defs and function return values too.)
-
-    _named_handle  = Group('@' + _name)
-    _anon_handle   = Group('@' + _LPAR + _opt_paramlist + _RPAR
-                           + _expr('function definition'))  # noqa
-    _fun_handle    = (_named_handle | _anon_handle).setResultsName('function handle')
-
-    # Struct array references.  This is incomplete: in Matlab, the LHS can
-    # actually be a full expression that yields a struct.  Here, to avoid an
-    # infinitely recursive grammar, we only allow a specific set of objects
-    # and exclude a full expr.  (Doing the obvious thing, expr + "." + _id,
-    # results in an infinitely-recursive grammar.)  Also note _bare_array is
-    # deliberately not part of the following because [1].foo is not legal.
-    #
-    # Dynamic field access means that 'str' in
-    #    a.(str)
-    # needs to be interpreted as something to be evaluated, not a static
-    # identifier.  Thus, we can't return Identifier(name='str') alone, or
-    # the caller will not be able to distinguish that from a static access,
-    #    a.str
-    # The solution here is to detect the use of ".()" and explicitly label
-    # the type of field found (as either 'static field' or 'dynamic field').
-    #
-    # Note: BE VERY CAREFUL about the ordering of the terms in _struct_base.
-    # A change to the order can lead to infinite recursion on some inputs.
-    # The current order was determined by trial and error to work on our
-    # various test cases.  (And no, I'm not proud of the hackiness.)
-
-    _funcall_or_array   = Forward()
-    _struct_field       = _id('static field') | _LPAR + _expr('dynamic field') + _RPAR
-    _simple_struct_base = Group(_array_access | _id)
-    _simple_struct      = Group(_simple_struct_base('struct base')
-                                + Optional(_WHITE) + _DOT + Optional(_WHITE) 
-                                + _struct_field)('struct')
-    _struct_base        = Group(_simple_struct + Optional(_WHITE) + FollowedBy(_DOT)
-                                ^ _fun_handle
-                                ^ _funcall_or_array
-                                ^ _cell_access
-                                ^ _array_access
-                                ^ _id)
-    _struct_access      = Group(_struct_base('struct base')
-                                + Optional(_WHITE) + _DOT + Optional(_WHITE)
-                                + _struct_field)('struct')
-
-    # "Function syntax" function calls.
-    #
-    # Unfortunately, the function call forms using parentheses look identical
-    # to matrix/array accesses, and in fact in MATLAB there's no way to tell
-    # them apart except by determining whether the first name is a function
-    # or command.  This means it's ultimately run-time dependent, and depends
-    # on the functions and scripts that the user has defined.
-    #
-    # We don't have access to the user's MATLAB environment, so we are left
-    # to resort to various heuristics to try to guess what we have.  For
-    # instance, if something comes through in "command syntax", we can assume
-    # it's a function call.  (Handled by _funcall_cmd_style below.)  Another
-    # one is that in arrays, you can use bare ':' in the argument list.  This
-    # means that if a ':' is found, it's an array reference for sure.  (This
-    # case is handled in the definition of _opt_arglist) Beyond that, we call
-    # all cases we can't resolve syntactically as "array or function", and
-    # then in post-processing, attempt to apply other heuristics to figure
-    # out which ones are in fact functions.
-    #
-    # There are complications.  You can put function names or arrays inside a
-    # cell array or struct, reference into that to get the function, and hand
-    # it arguments.  E.g.:
-    #    x = somearray{1}(x, 3)
-    # or even
-    #    somestruct(2).somefieldname = str2func('functionname')
-    #    somestruct(2).somefieldname(42)
-    #
-    # The following definition is incomplete w.r.t. what MATLAB allows, since
-    # MATLAB would probably let you use the full range of expressions as the
-    # base for the function.
-
-    _fun_access         = Group(_cell_access('cell array')) \
-                          ^ Group(_simple_struct) \
-                          ^ Group(_id)
-    _funcall_or_array <<= Group(_fun_access('name')
-                                + _LPAR + _opt_arglist + _RPAR
-                               ).setResultsName('array or function')  # noqa
-
-    # "Command syntax" function calls and array references.
-    #
-    # Matlab functions can be called with arguments either surrounded with
-    # parentheses or not.  This is called "command vs. function syntax".
-    # Here are examples of command syntax:
-    #    clear x y z
-    #    format long
-    #    print -dpng magicsquare.png
-    #    save /tmp/foo
-    #    save relative/path.m
-    # etc.  As the MATLAB docs say, the following are equivalent:
-    #    load durer.mat        % Command syntax
-    #    load('durer.mat')     % Function syntax
-    # Note the way that the first form treats the arguments as (unquoted)
-    # strings.  Also note that spaces are allowed in the second form but
-    # do not turn the result into command-style syntax.  I.e.,
-    #    load ('durer.mat')
-    # is not the same as
-    #    load '(\'durer.mat\')'
-    #
-    # The syntactic rules are explained in the following MATLAB document:
-    # http://mathworks.com/help/matlab/matlab_prog/command-vs-function-syntax.html
-    # The grammar below for command-style syntax is not fully compliant.  One
-    # known failure: it requires an argument.  We deal with command-syntax
-    # function calls *without* arguments separately in post-processing.
-
-    ParserElement.setDefaultWhitespaceChars(' \t')
-
-    _most_ops          = Group(_PLUS ^ _MINUS ^ _TIMES ^ _ELTIMES ^ _MRDIVIDE
-                               ^ _MLDIVIDE ^ _RDIVIDE ^ _LDIVIDE ^ _MPOWER
-                               ^ _ELPOWER ^ _LT ^ _LE ^ _GT ^ _GE ^ _EQ ^ _NE
-                               ^ _AND ^ _OR ^ _SHORT_AND ^ _SHORT_OR ^ _COLON
-                               ^ _NC_TRANSP)
-    _noncmd_arg_start  = _EQUALS | _LPAR | _most_ops + _WHITE | _delimiter | _comment
-    _dash_term         = Combine(Literal('-') + Word(alphas, alphanums + '_'))
-    _fun_cmd_arg       = _STRING | _dash_term | CharsNotIn(" ,;\t\n\r")
-    _fun_cmd_arglist   = _fun_cmd_arg + ZeroOrMore(NotAny(_noncontent)
-                                                   + Optional(_WHITE)
-                                                   + _fun_cmd_arg)
-    _funcall_cmd_style = Group(_name + NotAny(_EOL)
-                               + _WHITE + NotAny(_noncmd_arg_start)
-                               + _fun_cmd_arglist('arguments')
-                              )('command statement')
-
-    ParserElement.setDefaultWhitespaceChars(' \t\n\r')
-
-    # Function calls without parentheses.
-    #
-    # A final bit of nastiness in MATLAB is the ability to invoke a function
-    # without using parenthese, such as this example:
-    #
-    #   if (rand > 0.50)
-    #       A=1;
-    #   end;
-    #
-    # Currently, we only recognize this case if the function involved is a
-    # known MATLAB function or a function defined somewhere in the file.
-    # This is done in post processing, but we tag the possible cases during
-    # the initial parse by looking for _ambiguous_id instead of a plain _id.
-    # This is why the following seemingly-pointless definition exists, and is
-    # used instead of using _id directly in _operand and other similar places
-    # later.
-
-    _ambiguous_id = Group(NotAny(_reserved) + _identifier)('ambiguous id')
-
-    # And now, general expressions and operators outside of arrays.
-
-    _operand = Group(_funcall_or_array \
-                     | _struct_access  \
-                     | _array_access   \
-                     | _cell_array     \
-                     | _bare_array     \
-                     | _fun_handle     \
-                     | _ambiguous_id   \
-                     | _NUMBER         \
-                     | _STRING)
-
-    _transp_op     = NotAny(_WHITE) + _NC_TRANSP ^ NotAny(_WHITE) + _CC_TRANSP
-    _uplusminusneg = _UPLUS ^ _UMINUS ^ _UNOT
-    _plusminus     = _PLUS ^ _MINUS
-    _timesdiv      = _TIMES ^ _ELTIMES ^ _MRDIVIDE ^ _MLDIVIDE ^ _RDIVIDE ^ _LDIVIDE
-    _power         = _MPOWER ^ _ELPOWER
-    _logical_op    = _LE ^ _GE ^ _NE ^ _LT ^ _GT ^ _EQ
-    _colon_op      = _COLON('colon operator')
-
-    # In MATLAB, power and transpose have higher precedence than the unary
-    # operators.  The next hack solves a problem in correctly matching
-    # expressions in which a unary operator comes immediately after another
-    # operator, particularly the _power operators.  The problem occurs
-    # because of how infixNotation() constructs the matching expression
-    # left-to-right as it goes down the list of arguments in the order given.
-    # To get the right behavior, we have to set up _power to have higher
-    # precendence than unary operators, which seems easy at first but it
-    # turns out it interacts with the right-associative nature of unary
-    # operators (_uplusminusneg).  For reasons that are not 100% clear, if
-    # the first few terms are in the following (more intuitive, natural) order,
-    #
-    #   _expr <<= infixNotation(_operand, [
-    #        (Group(_transp_op),     1, opAssoc.LEFT, makeLRlike(1)),
-    #        (Group(_power),         2, opAssoc.LEFT, makeLRlike(2)),
-    #        (Group(_uplusminusneg), 1, opAssoc.RIGHT),
-    #       ...
-    #
-    # then an expression such as 2^-3 does not match.  The following hack
-    # provides a second expression (_uplusminusneg_after) for matching the
-    # unary operators if and only if they appear in the second operand of a
-    # binary operator.
-    #
-    # The operator precedence rules in MATLAB are listed here:
-    # http://www.mathworks.com/help/matlab/matlab_prog/operator-precedence.html
-
-    _not_unary = _transp_op ^ _plusminus ^ _timesdiv ^ _power ^ _logical_op ^ _COLON
-    _uplusminusneg_after = FollowedBy(_not_unary) + _UPLUS \
-                           ^ FollowedBy(_not_unary) + _UMINUS \
-                           ^ FollowedBy(_not_unary) + _UNOT
-
-    _expr        <<= infixNotation(_operand, [
-        (Group(_transp_op),                    1, opAssoc.LEFT, makeLRlike(1)),
-        (Group(_uplusminusneg_after),          1, opAssoc.RIGHT),
-        (Group(_power),                        2, opAssoc.LEFT, makeLRlike(2)),
-        (Group(_uplusminusneg),                1, opAssoc.RIGHT),
-        (Group(_timesdiv),                     2, opAssoc.LEFT, makeLRlike(2)),
-        (Group(_plusminus),                    2, opAssoc.LEFT, makeLRlike(2)),
-        ((Group(_colon_op), Group(_colon_op)), 3, opAssoc.LEFT, makeLRlike(3)),
-        (Group(_colon_op),                     2, opAssoc.LEFT, makeLRlike(2)),
-        (Group(_logical_op),                   2, opAssoc.LEFT, makeLRlike(2)),
-        (Group(_AND),                          2, opAssoc.LEFT, makeLRlike(2)),
-        (Group(_OR),                           2, opAssoc.LEFT, makeLRlike(2)),
-        (Group(_SHORT_AND),                    2, opAssoc.LEFT, makeLRlike(2)),
-        (Group(_SHORT_OR),                     2, opAssoc.LEFT, makeLRlike(2)),
-    ])
-
-    # The 'end' keyword is special because of its many meanings.  One applies
-    # when indexing arrays.  This next definition is so we can detect that.
-
-    _end_op        = Keyword('end')('end operator')
-
-    # MATLAB does something evil: the parsing behavior changes inside array
-    # expressions.  This can be seen by typing the following expressions into
-    # the MATLAB interpreter:
-    #
-    # 1 -1          result: 0
-    # [1 -1]        result: array of 2 elements, [1, -1]
-    # [1 - 1]       result: array of 1 element, [0]
-    # [1 -1 - 1]    result: array of 2 elements, [1, -2]
-    # 1 - 1         result: 0
-    # 1-1           result: 0
-    # [1- 1]        result: array of 1 element, [0]
-    # [1 2 -3 + 4]  result: array of 3 elements, [1, 2, 1]
-    # [1 2 -3 +4]   result: array of 4 elements, [1, 2, -3, 4]
-    #
-    # Another example was mentioned earlier in this file, involving the
-    # definition of _one_sub.  Suppose that "a" is an array of one item:
-    #
-    #    a(1)        => one item, the value inside the array "a" at location 1
-    #    a (1)       => one item, the value inside the array "a" at location 1
-    #    [a (1)]     => an array of TWO items, the value of a and 1
-    #    [(a (1))]   => an array of ONE item, a(1)
-    #
-    # The only solution I have found is to define the expression grammar
-    # differently for the case of array contents.  This is the reason for
-    # _expr_in_array, _funcall_or_array_in_array, and _operand_in_array
-    # below; these versions change the interpretation of whitespace to make
-    # it significant, to cause matching to prefer different interpretations
-    # when used inside arrays.  Along with this, the definitions of arrays
-    # and their subscripts earlier in this file also have explicit uses of
-    # _WHITE in them, which wouldn't be necessary except for the fact that
-    # _operand_in_array below uses leaveWhitespace() to cause whitespace to
-    # be significant.
-    #
-    # Look, I know it's ugly.
-
-    _plusminus_array = (OneOrMore(_WHITE) + (_PLUS ^ _MINUS).leaveWhitespace() + OneOrMore(_WHITE)) \
-                       | (NotAny(_WHITE) + (_PLUS ^ _MINUS).leaveWhitespace())
-
-    _funcall_or_array_in_array = Group(_fun_access('name')
-                                       + _LPAR.copy().leaveWhitespace() + _opt_arglist + _RPAR
-                                      ).setResultsName('array or function')  # noqa
-
-    _operand_in_array = Group(_end_op
-                              | _TILDE
-                              | _funcall_or_array_in_array
-                              | _struct_access
-                              | _array_access
-                              | _cell_array
-                              | _bare_array
-                              | _fun_handle
-                              | _ambiguous_id
-                              | _NUMBER
-                              | _STRING
-                             ).leaveWhitespace()
-
-    _expr_in_array <<= infixNotation(_operand_in_array, [
-        (Group(_transp_op),                    1, opAssoc.LEFT, makeLRlike(1)),
-        (Group(_uplusminusneg_after),          1, opAssoc.RIGHT),
-        (Group(_power),                        2, opAssoc.LEFT, makeLRlike(2)),
-        (Group(_uplusminusneg),                1, opAssoc.RIGHT),
-        (Group(_timesdiv),                     2, opAssoc.LEFT, makeLRlike(2)),
-        (Group(_plusminus_array),              2, opAssoc.LEFT, makeLRlike(2)),
-        ((Group(_colon_op), Group(_colon_op)), 3, opAssoc.LEFT, makeLRlike(3)),
-        (Group(_colon_op),                     2, opAssoc.LEFT, makeLRlike(2)),
-        (Group(_logical_op),                   2, opAssoc.LEFT, makeLRlike(2)),
-        (Group(_AND),                          2, opAssoc.LEFT, makeLRlike(2)),
-        (Group(_OR),                           2, opAssoc.LEFT, makeLRlike(2)),
-        (Group(_SHORT_AND),                    2, opAssoc.LEFT, makeLRlike(2)),
-        (Group(_SHORT_OR),                     2, opAssoc.LEFT, makeLRlike(2)),
-    ])
-
-    # Assignments.
-    #
-    # We tag the LHS with 'lhs' whether it's a single variable or an array,
-    # because we can distinguish the cases by examining the parsed object.
+    def visit_Try(self, node):
+        node.body = self.visit(node.body)
+        node.catch_body = self.visit(node.catch_body)
+        if node.catch_var:
+            node.catch_body = Disambiguator(self, vars=[node.catch_var]).visit(node.catch_body)
+        return node
 
-    _lhs_var        = Group(_id)
-    _simple_assign  = Group(_lhs_var('lhs') + _EQUALS + _expr('rhs'))
-    _lhs_array      = Group(_struct_access | _array_access | _cell_access | _bare_array)
-    _other_assign   = Group(_lhs_array('lhs') + _EQUALS + _expr('rhs'))
-    _assignment     = (_other_assign | _simple_assign).setResultsName('assignment')
 
-    # Commands.
-    #
-    # Shell commands don't respect ellipses or delimiters, so we use EOL
-    # explicitly here and match _shell_cmd at the _matlab_syntax level.
-
-    _shell_cmd_cmd  = Group(restOfLine)('command')
-    _shell_cmd      = Group(Group('!' + _shell_cmd_cmd + _EOL)('shell command'))
-
-    # Control-flow statements.
-
-    _control_stmt   = Forward()
-    _stmt_list      = Forward()
-
-    _single_expr    = _expr('expression') + Optional(FollowedBy(_noncontent))
-    _test_expr      = _single_expr
-    _body           = Group(_stmt_list)                    ('body')
-    _break_stmt     = _BREAK                               ('break statement')
-    _return_stmt    = _RETURN                              ('return statement')
-    _continue_stmt  = _CONTINUE                            ('continue statement')
-
-    _while_stmt     = Group(_WHILE + _test_expr
-                            + _body
-                            + _END)                        ('while statement')
-
-    _loop_var       = Group(_id)                           ('loop variable')
-    _for_version1   = _FOR + _loop_var + _EQUALS + _test_expr \
-                      + _body \
-                      + _END
-    _for_version2   = _FOR + _LPAR + _loop_var + _EQUALS + _expr('expression') + _RPAR \
-                      + _body \
-                      + _END
-    _for_stmt       = Group(_for_version2 | _for_version1) ('for statement')
-
-    _catch_var      = Group(_id)                           ('catch variable')
-    ParserElement.setDefaultWhitespaceChars(' \t')
-    _catch_term     = _CATCH + Optional(NotAny(_noncontent) + _catch_var) + _noncontent
-    ParserElement.setDefaultWhitespaceChars(' \t\n\r')
-    _catch_body     = Group(_stmt_list)                    ('catch body')
-    _try_stmt       = Group(_TRY
-                            + _body
-                            + Optional(_catch_term)
-                            + _catch_body
-                            + _END)                        ('try statement')
-
-    _else_stmt      = Group(_ELSE + _body)                 ('else statement')
-    _elseif_stmt    = Group(_ELSEIF + _test_expr + _body)
-    _if_stmt        = Group(_IF + _test_expr
-                            + _body
-                            + ZeroOrMore(_elseif_stmt)     ('elseif statements')
-                            + Optional(_else_stmt)
-                            + _END).setResultsName         ('if statement')
-
-    _case_stmt      = Group(_CASE + _test_expr + _body)
-    _switch_other   = Group(_OTHERWISE + _body)            ('otherwise statement')
-    _switch_stmt    = Group(_SWITCH + _test_expr
-                            + ZeroOrMore(_case_stmt)       ('case statements')
-                            + Optional(_switch_other)
-                            + _END)                        ('switch statement')
-
-    _control_stmt  <<= Group(_while_stmt
-                             | _if_stmt
-                             | _switch_stmt
-                             | _for_stmt
-                             | _try_stmt
-                             | _continue_stmt
-                             | _break_stmt
-                             | _return_stmt
-                            ).setResultsName('control statement')  # noqa
-
-    # Global and persistent declarations.
-
-    _scope_type     = Group(_PERSISTENT | _GLOBAL)         ('type')
-    ParserElement.setDefaultWhitespaceChars(' \t')
-    _scope_var_list = Group(_id) + ZeroOrMore(_WHITE + Group(_id)).leaveWhitespace()
-    _scope_args     = _scope_var_list                      ('variables list')
-    ParserElement.setDefaultWhitespaceChars(' \t\n\r')
-    _scope_stmt     = Group(_scope_type + _scope_args)     ('scope declaration')
-
-    # Standalone expressions.
-    #
-    # If an expression is written on a line outside of another construct,
-    # it needs to be separated from other expressions by commas or newlines.
+    def visit_Expression(self, node):
+        # Function definitions and loops can't appear inside expressions.
+        return node
 
-    ParserElement.setDefaultWhitespaceChars(' \t')
-    _standalone_expr = _expr('standalone expression') + FollowedBy(_noncontent)
-    ParserElement.setDefaultWhitespaceChars(' \t\n\r')
 
-    # Statements and statement lists.
-    #
-    # Statement lists are almost the full _matlab_syntax, except that
-    # they don't include function definitions.
 
-    _stmt           = Group(_control_stmt
-                            | _scope_stmt
-                            | _assignment
-                            | _funcall_cmd_style
-                            | _standalone_expr)
-    _stmt_list    <<= ZeroOrMore(_stmt ^ _shell_cmd ^ _noncontent)
+# MatlabGrammar.
+# .............................................................................
+# The parser.  The PyParsing definition of our MATLAB grammar is the class
+# MatlabSyntax in pyparsing_grammar.py.  Building it takes a noticeable
+# fraction of a second, so it is only done when it is first needed, by the
+# following function.
 
-    # Function definitions.
-    #
-    # When a function returns multiple values and the LHS is an array
-    # expression in square brackets, a bare tilde can be put in place of an
-    # argument value to indicate that the value is to be ignored.
-
-    _fun_body       = Forward()
-
-    _single_value   = Group(_id) | Group(_TILDE)
-    _comma_values   = delimitedList(_single_value)
-    _space_values   = OneOrMore(_single_value)
-    _multi_values   = _LBRACKET + Optional(_comma_values ^ _space_values) + _RBRACKET
-    _fun_outputs    = Group(_multi_values) | Group(_single_value)
-    _fun_paramslist = _LPAR + _opt_paramlist + _RPAR
-
-    # The 'end' in a function definition is optional in some cases and not in
-    # others.  The use of 'end' is required for nested function definitions,
-    # which means that we need two variants of function bodies too.  This
-    # leads to our final grammatical indiginity: two expressions for function
-    # definitions, which are used in the overall definition of _matlab_file
-    # such that _matlab_file tries first one variant and then the other.
-    # In the following two definitions, note that both the use of 'end' and
-    # the definition of the body are different.
-
-    _fun_without_end = Group(_FUNCTION
-                             + Optional(_fun_outputs('output list') + _EQUALS())
-                             + Optional(_WHITE) + _name
-                             + Optional(_fun_paramslist)
-                             + Group(_stmt_list)('body')
-                            ).setResultsName('function definition')
-
-    _fun_with_end   = Group(_FUNCTION
-                            + Optional(_fun_outputs('output list') + _EQUALS())
-                            + Optional(_WHITE) + _name
-                            + Optional(_fun_paramslist)
-                            + Group(_fun_body)('body')
-                            + _END
-                           ).setResultsName('function definition')
-
-    # The next two definitions are only used to make the grouping level the
-    # same as other statements in the overall grammar.
-
-    _fun_def_shallow = Group(_fun_without_end)
-    _fun_def_deep    = Group(_fun_with_end)
-
-    # And now, the function body for function definitions that permit nesting.
-    # (Bodies that don't allow function nesting simply use _stmt_list.)
-
-    _fun_body <<= ZeroOrMore(_fun_def_deep ^ _stmt ^ _shell_cmd ^ _noncontent)
-
-    # The complete MATLAB file syntax.
-    #
-    # Since a file cannot mix the style of function definitions that use ends
-    # (either they all have to have 'end', or none do), we have two forms of
-    # MATLAB files.
+def _syntax():
+    """Returns the class holding the PyParsing grammar, building it first
+    if this is the first call."""
+    try:
+        from pyparsing_grammar import MatlabSyntax
+    except:
+        from .pyparsing_grammar import MatlabSyntax
+    return MatlabSyntax
 
-    _matlab_file = (ZeroOrMore(_fun_def_shallow ^ _stmt ^ _shell_cmd ^ _noncontent)
-                    ^ ZeroOrMore(_fun_def_deep ^ _stmt ^ _shell_cmd ^ _noncontent))
 
+class MatlabGrammar:
 
     # Preprocessor.
     # .........................................................................
     # This is used to process the input before it is handed to the actual
-    # parser defined by the grammar above.  We do this to overcome
+    # parser defined by the grammar.  We do this to overcome
     # limitations in our PyParsing-based grammar.
     #
     # Notes about continuation processing.  Continuations in MATLAB can
@@ -1912,17 +1500,15 @@ class MatlabGrammar:
     # continuation replacements, (3) go back and replace the markers with the
     # stored strings and shell commands.
 
-    _continuation  = Combine(_ELLIPSIS.leaveWhitespace()
-                             + Optional(CharsNotIn('\n\r\f')('comment'))
-                             + _EOL + _SOL)
-
-    _continuation.setParseAction(lambda t: ' ')
 
     def _preprocess(self, input):
+        if self._backend == 'rd':
+            return rd_preprocess(input)
         # Remove DOS-style carriage returns from the input.
         input = input.replace('\r\n', '\n')
-        # Remove continuations.
-        return self._continuation.transformString(input)
+        # Remove continuations.  This uses the PyParsing engine too.
+        with _pyparsing_lock:
+            return _syntax()._continuation.transformString(input)
 
 
     # Generator for final MatlabNode-based output representation.
@@ -1938,12 +1524,41 @@ class MatlabGrammar:
         # 1st pass: visit ParseResults items, translate them to MatlabNodes,
         # and create contexts for function definitions encountered.
         nodes = [ParseResultsTransformer(self).visit(item) for item in pr]
+        return self._finish_nodes_and_contexts(nodes)
 
-        # 2nd & 3rd passes: infer the types of objects where possible, and
+
+    def _generate_nodes_and_contexts_rd(self, input):
+        # Same as _generate_nodes_and_contexts(), but for the recursive-
+        # descent backend, which produces MatlabNodes directly.  Parse before
+        # pushing the context, so that a parse error leaves things unchanged.
+        parser = MatlabRDParser(input, self._leaves)
+        nodes = _call_with_parse_recursion_limit(parser.parse)
+        self._push_context(MatlabContext(topmost=True))
+        nodes = FunctionContextBuilder(self).visit(nodes)
+        return self._finish_nodes_and_contexts(nodes)
+
+
+    def _generate_nodes(self, input):
+        # Used by iter_parse() for each piece of a file: the same passes as
+        # above, but on preprocessed input holding complete top-level
+        # statements, in the current (topmost) context and without making
+        # the nodes the context's own.
+        if self._backend == 'rd':
+            parser = MatlabRDParser(input, self._leaves)
+            nodes = _call_with_parse_recursion_limit(parser.parse)
+            nodes = FunctionContextBuilder(self).visit(nodes)
+        else:
+            pr = self._parse_with_packrat_cache(input)
+            nodes = [ParseResultsTransformer(self).visit(item) for item in pr]
+        return NodeTransformer(self).transform(nodes)
+
+
+    def _finish_nodes_and_contexts(self, nodes):
+        # 2nd pass: infer the types of objects where possible, and
         # transform some classes into others to overcome limitations in our
-        # initial parse.  Must be done twice to propagate inferences.
-        nodes = NodeTransformer(self).visit(nodes)
-        nodes = NodeTransformer(self).visit(nodes)
+        # initial parse.  Inferences are propagated by revisiting only what
+        # depends on them; see NodeTransformer.
+        nodes = NodeTransformer(self).transform(nodes)
 
         # Final step: if the first construct in this file (after possible
         # comments) is a function definition, this whole file is a function.
@@ -2005,11 +1620,15 @@ class MatlabGrammar:
 
     def _save_function_call(self, node):
         # Save each call as a list of the arguments to the call.
-        # This will thus be a list of lists.
+        # This will thus be a list of lists.  The call graph is fetched
+        # first, since if it doesn't exist yet, it is made from the calls
+        # already in the contexts.
+        graph = self._context.call_graph
         if node.name not in self._context.calls:
             self._context.calls[node.name] = [node.args]
         else:
             self._context.calls[node.name].append(node.args)
+        graph.add(self._context, node.name, node.args)
 
 
     def _save_assignment(self, node):
@@ -2017,17 +1636,7 @@ class MatlabGrammar:
 
 
     def _get_assignment(self, node, context, recursive=False):
-        if node in self._context.assignments:
-            value = self._context.assignments[node]
-            if isinstance(value, Identifier) and recursive:
-                ultimate_value = self._get_assignment(value, context, True)
-                return ultimate_value or value
-            else:
-                return value
-        elif hasattr(context, 'parent') and context.parent:
-            return self._get_assignment(self, node, context.parent)
-        else:
-            return None
+        return context.symbols.assignment(node, context, recursive)
 
 
     def _save_type(self, thing, type):
@@ -2035,10 +1644,9 @@ class MatlabGrammar:
 
 
     def _get_type(self, thing, context):
-        if thing in context.types:
-            return context.types[thing]
-        elif hasattr(context, 'parent') and context.parent:
-            return self._get_type(thing, context.parent)
+        type = context.symbols.type(thing, context)
+        if type is not None:
+            return type
         elif isinstance(thing, Ambiguous) or isinstance(thing, FunCall):
             if isinstance(thing.name, Identifier):
                 name = thing.name.name
@@ -2050,37 +1658,6 @@ class MatlabGrammar:
         return None
 
 
-    def _get_direct_calls(self, name, context, anywhere=False, recursive=False):
-        calls = []
-        if context.calls and name in context.calls:
-            calls += context.calls[name]
-        if anywhere and context.functions:
-            for fun_name, fun_context in context.functions.items():
-                if name == fun_name:
-                    continue
-                calls += self._get_direct_calls(name, fun_context, False, False)
-        if recursive and hasattr(context, 'parent') and context.parent:
-            calls += self._get_direct_calls(name, context.parent, anywhere, True)
-        return [x for x in calls if x]
-
-
-    def _get_indirect_calls(self, name, context, anywhere=False, recursive=False):
-        # Search function calls, looking for cases where the named function is
-        # passed in as a function handle.
-        calls = defaultdict(list)
-        for fun_name in (context.calls or []):
-            for arglist in context.calls[fun_name]:
-                for arg in (arglist or []):
-                    if isinstance(arg, FuncHandle) and name == arg.name:
-                        calls[fun_name].append(arglist)
-        if anywhere and context.functions:
-            for fun_name, fun_context in context.functions.items():
-                calls.update(self._get_indirect_calls(name, fun_context, False, False))
-        if recursive and hasattr(context, 'parent') and context.parent:
-            calls.update(self._get_indirect_calls(name, context.parent, anywhere, True))
-        return calls
-
-
     def _find_first_function(self, nodes):
         for node in nodes:
             if isinstance(node, Comment):
@@ -2096,92 +1673,76 @@ class MatlabGrammar:
     # .........................................................................
 
     def _do_parse(self, input):
+        self._packrat_cache.reset_stats()
         preprocessed = self._preprocess(input)
-        pr = self._matlab_file.parseString(preprocessed, parseAll=True)
-        return self._generate_nodes_and_contexts(pr)
+        if self._cache:
+            cached = self._cache.get(preprocessed, self._backend)
+            if cached:
+                self._context = cached
+                return cached
+        if self._backend == 'rd':
+            top_context = self._generate_nodes_and_contexts_rd(preprocessed)
+        else:
+            pr = self._parse_with_packrat_cache(preprocessed)
+            top_context = self._generate_nodes_and_contexts(pr)
+        if self._cache:
+            self._cache.put(preprocessed, top_context, self._backend)
+        return top_context
+
+
+    def _parse_with_packrat_cache(self, preprocessed):
+        # PyParsing looks up its packrat cache in a class variable, so we
+        # put ours there for the duration of the parse.  The entries hold
+        # on to pieces of the input and to ParseResults, so the cache is
+        # emptied as soon as the parse is done, whatever the outcome.
+        with _pyparsing_lock:
+            previous = getattr(ParserElement, _PACKRAT_CACHE_ATTR)
+            setattr(ParserElement, _PACKRAT_CACHE_ATTR, self._packrat_cache)
+            try:
+                return _call_with_parse_recursion_limit(
+                    _syntax()._matlab_file.parseString, preprocessed, parseAll=True)
+            finally:
+                setattr(ParserElement, _PACKRAT_CACHE_ATTR, previous)
+                self._packrat_cache.clear()
 
 
     # Debugging.
     # .........................................................................
-
-    # Name each grammar object after itself, so that when PyParsing prints
-    # debugging output, it uses the name rather than a generic regexp term.
-
-    _to_name = [ _AND, _CC_TRANSP, _COLON, _COMMA, _DOT, _ELLIPSIS, _ELPOWER,
-                 _ELTIMES, _END, _EOL, _EQ, _EQUALS, _EXPONENT, _FLOAT,
-                 _FUNCTION, _GE, _GT, _INTEGER, _LBRACE, _LBRACKET, _LDIVIDE,
-                 _LE, _LPAR, _LT, _MINUS, _MLDIVIDE, _MPOWER, _MRDIVIDE,
-                 _NC_TRANSP, _NE, _NUMBER, _OR, _PLUS, _RBRACE, _RBRACKET,
-                 _RDIVIDE, _RPAR, _SEMI, _SHORT_AND, _SHORT_OR, _SOL,
-                 _STRING, _TILDE, _TIMES, _UMINUS, _UNOT, _UPLUS, _WHITE,
-                 _ambiguous_id, _anon_handle, _array_access, _array_args,
-                 _array_base, _assignment, _bare_array, _bare_cell,
-                 _block_c_end, _block_c_start, _block_comment, _body,
-                 _break_stmt, _call_args, _case_stmt, _catch_body,
-                 _catch_term, _catch_var, _cell_access, _cell_args,
-                 _cell_array, _cell_base, _cell_nested, _colon_op,
-                 _comma_subs, _comma_values, _comment, _continue_stmt,
-                 _control_stmt, _control_stmt, _dash_term, _delimiter,
-                 _else_stmt, _elseif_stmt, _end_op, _expr, _expr_in_array,
-                 _expr_in_array, _for_stmt, _for_version1, _for_version2,
-                 _fun_access, _fun_body, _fun_cmd_arg, _fun_cmd_arglist,
-                 _fun_def_deep, _fun_def_shallow, _fun_handle, _fun_outputs,
-                 _fun_paramslist, _fun_with_end, _fun_without_end,
-                 _funcall_cmd_style, _funcall_or_array, _id , _identifier,
-                 _if_stmt, _lhs_array, _lhs_var, _line_c_start,
-                 _line_comment, _logical_op, _loop_var, _matlab_file,
-                 _most_ops, _multi_values, _name, _named_handle,
-                 _noncmd_arg_start, _noncontent, _not_unary, _one_param,
-                 _one_row, _one_sub, _operand, _operand_in_array,
-                 _opt_arglist, _opt_paramlist, _other_assign, _paramlist,
-                 _plusminus, _plusminus_array, _power, _reserved,
-                 _return_stmt, _row_sep, _rows, _scope_args, _scope_stmt,
-                 _scope_type, _scope_var_list, _shell_cmd, _shell_cmd_cmd,
-                 _simple_assign, _simple_struct, _simple_struct_base,
-                 _single_expr, _single_value, _space_subs, _space_values,
-                 _standalone_expr, _stmt, _stmt_list, _stmt_list,
-                 _struct_access, _struct_base, _struct_field, _switch_other,
-                 _switch_stmt, _test_expr, _timesdiv, _transp_op, _try_stmt,
-                 _uplusminusneg, _uplusminusneg_after, _while_stmt]
-
-    def _object_name(self, obj):
-        """Returns the name of a given object."""
-        try:
-            values = MatlabGrammar.__dict__.iteritems()  # Python 2
-        except:
-            values = MatlabGrammar.__dict__.items()      # Python 3
-        for name, thing in values:
-            if thing is obj:
-                return name
-
-
-    _init_grammar_names_done = []
-
-    def _init_grammar_names(self):
-        if 'done' not in self._init_grammar_names_done:
-            for obj in self._to_name:
-                obj.setName(self._object_name(obj))
-            self._init_grammar_names_done.append('done')
-
-
-    # The next variable and function are for printing low-level PyParsing
-    # matches.  You can reduce the amount of output by changing the value
-    # (which is _to_name by default) to a list of specific objects.  E.g.:
-    #    _to_print_debug = [_cell_access, _cell_array, _bare_cell, _expr]
-
-    _to_print_debug = _to_name # [_fun_body, _fun_def_deep, _fun_def_shallow, _stmt, _matlab_file]
+    # The grammar objects to print debugging output for are listed in
+    # MatlabSyntax._to_print_debug, in pyparsing_grammar.py.
 
     def _print_debug(self, print_debug=False):
         if print_debug:
-            for obj in self._to_print_debug:
+            for obj in _syntax()._to_print_debug:
                 obj.setDebug(True)
 
 
     # Instance initialization.
     # .........................................................................
 
-    def __init__(self):
-        self._init_grammar_names()
+    _backends = ['pyparsing', 'rd']
+
+    def __init__(self, cache=None, backend='pyparsing',
+                 packrat_cache_size=_DEFAULT_PACKRAT_CACHE_SIZE):
+        """Creates a new parser.
+
+        :param cache: an optional ParseCache object.  If given, parse results
+        are looked up in (and saved to) the cache, so that parsing the same
+        input again can skip the expensive grammar-matching steps.
+        :param backend: the parsing engine to use: 'pyparsing' (the default)
+        for the PyParsing grammar defined in this class, or 'rd' for the much
+        faster hand-written recursive-descent parser in rd_parser.py.  Both
+        produce the same MatlabContext and MatlabNode structures.
+        :param packrat_cache_size: the maximum number of entries in the
+        packrat cache used by the 'pyparsing' backend, or None for no limit.
+        The cache is emptied after every parse.  Use packrat_stats() to see
+        how well a given size works.
+        """
+        if backend not in self._backends:
+            raise ValueError('Unknown parser backend: {}'.format(backend))
+        self._cache = cache
+        self._backend = backend
+        self._packrat_cache = PackratCache(packrat_cache_size)
         # self._init_parse_actions()
         self._print_debug(False)
         self._reset()
@@ -2201,6 +1762,7 @@ class MatlabGrammar:
 
     def _reset(self):
         self._context = None
+        self._leaves = LeafTable()
         self._push_context(MatlabContext(topmost=True))
 
 
@@ -2269,6 +1831,70 @@ class MatlabGrammar:
                 raise MatlabParsingException(msg)
 
 
+    def iter_parse(self, path, fail_soft=False):
+        """Parses the MATLAB contained in `path` one top-level statement or
+        function definition at a time, and yields the MatlabNode objects
+        for them as they are parsed.  Unlike parse_file(), this never holds
+        more than one piece of the input and its nodes in memory, so it can
+        be used on very large scripts.
+
+        The MatlabContext for the file is available in the property
+        `context`, and is brought up to date with the functions,
+        assignments, calls and types found in each piece before the nodes
+        for that piece are yielded.  Its `nodes` list is left empty.  Since
+        the input is read in order, types inferred from later parts of the
+        file do not change the nodes already yielded, and so some nodes may
+        be left Ambiguous that parse_file() would have resolved.
+
+        :param fail_soft: don't raise an exception if parsing fails; print
+        the error and stop instead.
+        """
+        self._reset()
+        self._packrat_cache.reset_stats()
+        self._context.file = path
+        self._context.nodes = []
+        seen_statement = False
+        line = 1
+        with codecs.open(path) as file:
+            for piece in StatementReader(file):
+                try:
+                    nodes = self._generate_nodes(self._preprocess(piece))
+                except ParseException as err:
+                    msg = "Error: {0} (in the statement starting on line {1})"
+                    if fail_soft:
+                        print(msg.format(err, line))
+                        return
+                    else:
+                        msg = 'Failed to parse MATLAB input'
+                        raise MatlabParsingException(msg)
+                line += piece.count('\n')
+                if not seen_statement:
+                    (is_function_file, function_name) = self._find_first_function(nodes)
+                    if is_function_file:
+                        self._context.name = function_name
+                    seen_statement = any(not isinstance(node, Comment) for node in nodes)
+                for node in nodes:
+                    yield node
+
+
+    @property
+    def context(self):
+        """The topmost MatlabContext of the most recent parse.  While
+        iter_parse() is running, it holds what has been parsed so far."""
+        return self._context
+
+
+    def packrat_stats(self):
+        """Returns a dictionary of statistics about the use of the packrat
+        cache in the most recent call to parse_string() or parse_file():
+        the number of 'hits', 'misses' and 'evictions', the largest number
+        of entries held at once ('peak entries'), the number of entries
+        currently held ('entries', normally 0 because the cache is emptied
+        after each parse) and the maximum size of the cache ('size').
+        """
+        return self._packrat_cache.stats()
+
+
     def print_parse_results(self, results, print_raw=False):
         """Prints a representation of the parsed output given in `results`.
         This is intended for debugging purposes.  If `print_raw` is True,
@@ -2316,7 +1942,37 @@ class MatlabGrammar:
             return front + left + sep.join(list) + right
 
         recurse = MatlabGrammar.make_formula
-        if isinstance(thing, str):
+        if isinstance(thing, Operator):
+            # Operator expressions are flattened using our own stack (see
+            # "Deeply nested operator expressions" in matlab.py).  The stack holds strings,
+            # which are copied to the output, and nodes still to be expanded.
+            sep = ' ' if spaces else ''
+            text = []
+            stack = [thing]
+            while stack:
+                item = stack.pop()
+                if isinstance(item, str):
+                    text.append(item)
+                elif isinstance(item, UnaryOp):
+                    stack.extend([')', item.operand, sep, item.op, '('])
+                elif isinstance(item, BinaryOp):
+                    stack.extend([')', item.right, sep, item.op, sep, item.left, '('])
+                elif isinstance(item, ColonOp):
+                    # FIXME: we don't have a sensible equivalent in SBML.
+                    if item.middle:
+                        stack.extend([item.right, ':', item.middle, ':', item.left])
+                    else:
+                        stack.extend([item.right, ':', item.left])
+                elif isinstance(item, Transpose):
+                    # FIXME: we don't have a sensible equivalent in SBML.
+                    stack.extend([item.op, item.operand])
+                elif isinstance(item, Operator):
+                    # Some operator we don't know about.
+                    return None
+                else:
+                    text.append(recurse(item, spaces, parens, atrans))
+            return ''.join(text)
+        elif isinstance(thing, str):
             return thing
         elif isinstance(thing, Primitive):
             return MatlabNode.as_string(thing.value)
@@ -2336,27 +1992,6 @@ class MatlabGrammar:
               or isinstance(thing, AnonFun)):
             # FIXME: we don't have a sensible equivalent in SBML.
             return MatlabNode.as_string(thing)
-        elif isinstance(thing, Operator):
-            if isinstance(thing, UnaryOp):
-                operand = recurse(thing.operand, spaces, parens, atrans)
-                return compose(None, [thing.op, operand], '()')
-            elif isinstance(thing, BinaryOp):
-                left = recurse(thing.left, spaces, parens, atrans)
-                right = recurse(thing.right, spaces, parens, atrans)
-                return compose(None, [left, thing.op, right], '()')
-            elif isinstance(thing, ColonOp):
-                # FIXME: we don't have a sensible equivalent in SBML.
-                left = recurse(thing.left, spaces, parens, atrans)
-                right = recurse(thing.right, spaces, parens, atrans)
-                if thing.middle:
-                    middle = recurse(thing.middle, spaces, parens, atrans)
-                    return left + ':' + middle + ':' + right
-                else:
-                    return left + ':' + right
-            elif isinstance(thing, Transpose):
-                # FIXME: we don't have a sensible equivalent in SBML.
-                return recurse(thing.operand, spaces, parens, atrans) + thing.op
-
         elif isinstance(thing, Array):
             # FIXME: we don't have arrays in core SBML.
             return compose(None, thing.rows, '[]')
@@ -20,11 +20,15 @@
 # available online at https://github.com/sbmlteam/moccasin/.
 # ------------------------------------------------------------------------- -->
 
+import collections
 import functools
 import inspect
 import sys
 import six
-from pyparsing import ParseResults
+from pyparsing import ParseResults, ParseException, ParserElement, Suppress, \
+    opAssoc, Literal, CaselessLiteral, Keyword, And, Or, MatchFirst, NotAny, \
+    FollowedBy, Empty, White, Optional, OneOrMore, ZeroOrMore, \
+    ParseElementEnhance, Word, QuotedString, LineEnd, StringEnd
 
 #
 # Parsing helpers.
@@ -56,6 +60,635 @@ def makeLRlike(numterms):
     return pa
 
 
+# PrecedenceClimber -- replacement for PyParsing's infixNotation().
+#
+# infixNotation() builds one PyParsing element per precedence level, and
+# each of those begins with a lookahead that parses its operand expression
+# (the next level down), followed by a repeat of the same parse for real,
+# followed, if no operator of that level comes next, by a third attempt at
+# the operand expression as the fallback alternative.  Packrat caching keeps
+# this from being exponential, but with the 13 levels of the MATLAB operator
+# table, every operand still goes through dozens of element invocations and
+# cache lookups before anything is known about the operator after it.  That
+# is where most of the time spent parsing MATLAB files goes.
+#
+# PrecedenceClimber takes the same arguments as infixNotation() and accepts
+# exactly the same inputs, producing the same tokens, but works in a single
+# pass: it parses an operand once, then climbs the table level by level,
+# trying at each level only the operator itself (and skipping even that when
+# the next character cannot start the operator).  To get identical results,
+# it reproduces the whitespace handling of the elements infixNotation()
+# would have created: in particular, the first operator in a chain must be
+# matched by the operator element itself, whereas later operators are
+# preceded by skipping the operator's whitespace characters (which, in our
+# grammar, includes line breaks), exactly as PyParsing's OneOrMore does.
+#
+# Only the forms used in our grammar are supported: left-associative
+# operators of 1, 2 or 3 terms, and right-associative unary operators.
+# Parse actions are called with the arguments (s, loc, toks).
+
+_NO_STARTS = None
+
+class PrecedenceClimber(ParserElement):
+    def __init__(self, baseExpr, opList, lpar=Suppress('('), rpar=Suppress(')')):
+        super(PrecedenceClimber, self).__init__()
+        self.baseExpr = baseExpr
+        self.lpar = lpar
+        self.rpar = rpar
+        self.levels = []
+        for operDef in opList:
+            opExpr, arity, assoc, pa = (operDef + (None,))[:4]
+            if arity == 3:
+                if opExpr is None or len(opExpr) != 2:
+                    raise ValueError('if numterms=3, opExpr must be a tuple or list of two expressions')
+                ops = tuple(opExpr)
+            else:
+                ops = (opExpr,)
+            if assoc == opAssoc.RIGHT:
+                if arity != 1:
+                    raise ValueError('only unary right-associative operators are supported')
+                if isinstance(opExpr, Optional):
+                    ops = (opExpr.expr,)
+            elif assoc != opAssoc.LEFT:
+                raise ValueError('operator must indicate right or left associativity')
+            elif arity not in (1, 2, 3):
+                raise ValueError('operator must be unary (1), binary (2), or ternary (3)')
+            starts = _operator_starts(ops[0])
+            self.levels.append((arity, assoc, ops, pa, starts))
+        self.mayIndexError = True
+        self.mayReturnEmpty = False
+        self.setName('expression')
+
+
+    def __str__(self):
+        return self.name
+
+
+    def streamline(self):
+        if not self.streamlined:
+            super(PrecedenceClimber, self).streamline()
+            for expr in self._subexpressions():
+                expr.streamline()
+        return self
+
+
+    def _subexpressions(self):
+        exprs = [self.baseExpr, self.lpar, self.rpar]
+        for arity, assoc, ops, pa, starts in self.levels:
+            exprs.extend(ops)
+        return exprs
+
+
+    def parseImpl(self, instring, loc, doActions=True):
+        return self._level(len(self.levels) - 1, instring, loc, doActions)
+
+
+    def _skip(self, instring, loc):
+        if self.skipWhitespace:
+            white = self.whiteChars
+            end = len(instring)
+            while loc < end and instring[loc] in white:
+                loc += 1
+        return loc
+
+
+    def _level(self, index, instring, loc, doActions):
+        """Parses an expression at level 'index' of the operator table
+        (-1 being the operands) starting at 'loc'."""
+        loc = self._skip(instring, loc)
+        if index < 0:
+            return self._operand(instring, loc, doActions)
+        arity, assoc, ops, pa, starts = self.levels[index]
+        if assoc == opAssoc.RIGHT:
+            tokens = self._prefix(index, ops[0], starts, instring, loc, doActions)
+            if tokens is None:
+                return self._level(index - 1, instring, loc, doActions)
+        else:
+            left = self._level(index - 1, instring, loc, doActions)
+            if arity == 1:
+                tokens = self._postfix(ops[0], starts, left, instring, doActions)
+            elif arity == 2:
+                tokens = self._infix(index, ops[0], starts, left, instring, doActions)
+            else:
+                tokens = self._ternary(index, ops, starts, left, instring, doActions)
+            if tokens is None:
+                return left
+        end, content = tokens
+        tokens = ParseResults([content])
+        if pa and doActions:
+            result = pa(instring, loc, tokens)
+            if result is not None:
+                tokens = ParseResults(result)
+        return end, tokens
+
+
+    def _operand(self, instring, loc, doActions):
+        try:
+            return self.baseExpr._parse(instring, loc, doActions)
+        except (ParseException, IndexError):
+            pass
+        try:
+            loc = _skip_for(self.lpar, instring, loc)
+            loc, tokens = self.lpar._parse(instring, loc, doActions, callPreParse=False)
+            loc, inner = self._parse(instring, loc, doActions)
+            tokens += inner
+            loc, closing = self.rpar._parse(instring, loc, doActions)
+            tokens += closing
+            return loc, tokens
+        except (ParseException, IndexError):
+            raise ParseException(instring, loc, self.errmsg, self)
+
+
+    def _postfix(self, op, starts, left, instring, doActions):
+        loc, content = left
+        content = content.copy()
+        found = False
+        while _could_start(starts, instring, loc):
+            try:
+                loc, tokens = op._parse(instring, loc, doActions)
+            except (ParseException, IndexError):
+                break
+            content += tokens
+            found = True
+        return (loc, content) if found else None
+
+
+    def _infix(self, index, op, starts, left, instring, doActions):
+        loc, content = left
+        if not _could_start(starts, instring, loc):
+            return None
+        # Operators after the first are preceded by skipping whitespace the
+        # way PyParsing's OneOrMore(op + operand) does.  The first one also
+        # has to be matched by the operator element itself, as is done by
+        # the lookahead in infixNotation(); this only makes a difference if
+        # the operator element does not skip whitespace on its own.
+        lookahead = not op.callPreparse
+        start = _skip_for(op, instring, loc)
+        try:
+            if lookahead and start != loc:
+                ahead, _ = op._parse(instring, loc, doActions)
+            after, tokens = op._parse(instring, start, doActions, callPreParse=False)
+            if lookahead and start != loc \
+               and self._skip(instring, ahead) != self._skip(instring, after):
+                self._level(index - 1, instring, ahead, doActions)
+            loc, right = self._level(index - 1, instring, after, doActions)
+        except (ParseException, IndexError):
+            return None
+        content = content.copy()
+        while True:
+            tokens += right
+            content += tokens
+            start = _skip_for(op, instring, loc)
+            if not _could_start(starts, instring, start):
+                break
+            try:
+                after, tokens = op._parse(instring, start, doActions, callPreParse=False)
+                end, right = self._level(index - 1, instring, after, doActions)
+            except (ParseException, IndexError):
+                break
+            loc = end
+        return loc, content
+
+
+    def _ternary(self, index, ops, starts, left, instring, doActions):
+        loc, content = left
+        if not _could_start(starts, instring, loc):
+            return None
+        content = content.copy()
+        try:
+            for op in ops:
+                loc, tokens = op._parse(instring, loc, doActions)
+                content += tokens
+                loc, tokens = self._level(index - 1, instring, loc, doActions)
+                content += tokens
+        except (ParseException, IndexError):
+            return None
+        return loc, content
+
+
+    def _prefix(self, index, op, starts, instring, loc, doActions):
+        loc = _skip_for(op, instring, loc)
+        if not _could_start(starts, instring, loc):
+            return None
+        try:
+            loc, content = op._parse(instring, loc, doActions, callPreParse=False)
+            loc, tokens = self._level(index, instring, loc, doActions)
+        except (ParseException, IndexError):
+            return None
+        content += tokens
+        return loc, content
+
+
+def _skip_for(expr, instring, loc):
+    """Skips whitespace the way an And starting with 'expr' would."""
+    if expr.skipWhitespace:
+        white = expr.whiteChars
+        end = len(instring)
+        while loc < end and instring[loc] in white:
+            loc += 1
+    return loc
+
+
+def _could_start(starts, instring, loc):
+    """Returns False if the text after 'loc' and any whitespace cannot begin
+    with any of the characters in 'starts' (None meaning unknown)."""
+    if starts is _NO_STARTS:
+        return True
+    end = len(instring)
+    while loc < end and instring[loc] in ' \t\n\r':
+        loc += 1
+    return loc < end and instring[loc] in starts
+
+
+def _operator_starts(expr):
+    """Returns the set of characters with which a match of 'expr' must begin
+    (after whitespace), or None if that cannot be determined."""
+    if isinstance(expr, CaselessLiteral) \
+       or (isinstance(expr, Keyword) and expr.caseless):
+        return _NO_STARTS
+    elif isinstance(expr, (Literal, Keyword)):
+        return frozenset(expr.match[:1]) if expr.match else _NO_STARTS
+    elif isinstance(expr, (Or, MatchFirst)):
+        starts = frozenset()
+        for alternative in expr.exprs:
+            more = _operator_starts(alternative)
+            if more is _NO_STARTS:
+                return _NO_STARTS
+            starts |= more
+        return starts
+    elif isinstance(expr, And):
+        for element in expr.exprs:
+            if isinstance(element, (NotAny, FollowedBy, Empty)):
+                continue
+            if _is_white(element):
+                continue
+            return _operator_starts(element)
+        return _NO_STARTS
+    elif isinstance(expr, ParseElementEnhance) and not isinstance(
+            expr, (Optional, ZeroOrMore, NotAny, FollowedBy)):
+        return _operator_starts(expr.expr) if expr.expr is not None else _NO_STARTS
+    return _NO_STARTS
+
+
+def _is_white(expr):
+    if isinstance(expr, (OneOrMore, ZeroOrMore, Optional)):
+        expr = expr.expr
+    return isinstance(expr, White) and not set(expr.matchWhite) - set(' \t\n\r')
+
+
+# PredictiveOr and PredictiveMatchFirst -- replacements for Or and MatchFirst.
+#
+# PyParsing's Or ('^') tries every one of its alternatives at every position
+# (without parse actions), keeps the longest match, and then parses the
+# winner a second time for real.  MatchFirst ('|') stops at the first
+# alternative that matches, but still has to try every alternative ahead of
+# it.  In our grammar, the statement lists are Or's of 3-4 alternatives and
+# the statements themselves are a MatchFirst of 12 kinds of statements, so
+# every line of a MATLAB file was attempted many times over before the one
+# alternative that could possibly match it was found.
+#
+# The two classes below behave exactly like Or and MatchFirst, except that
+# before trying anything, they look at the next token in the input and
+# set aside the alternatives that cannot begin with it.  To do that, the
+# first time each one is used, it works out what each alternative can start
+# with: a set of characters (e.g., anything accepted by the initial
+# characters of a Word), possibly with exceptions (e.g., identifiers that
+# are not reserved words, from the NotAny(_reserved) in _id), or a keyword
+# (e.g., 'function' or 'while').  Alternatives whose first token cannot be
+# determined (because they can match an empty string, or because they start
+# with something like a Regex) are always tried.  An Or that is left with
+# only one alternative parses it directly, without the extra trial parse.
+#
+# The remaining alternatives are tried in their original order, so ties in
+# longest-match behave the same as before.  The lookahead skips every
+# character that any element at the start of any alternative treats as
+# whitespace, and tries alternatives that can start at any of the
+# positions it passes; this errs on the side of trying an alternative that
+# then fails, but never skips one that would succeed.
+
+class _Predictions(object):
+    """Table of the alternatives of an Or or MatchFirst that can start at a
+    given character, computed from the results of _first_tokens()."""
+
+    def __init__(self, exprs):
+        self.exprs = exprs
+        self.count = len(exprs)
+        self.always = set()
+        self.table = {}
+        whites = set()
+        for index, expr in enumerate(self.exprs):
+            tokens = _first_tokens(expr, whites, set())
+            if tokens is _NO_STARTS:
+                self.always.add(index)
+                continue
+            for chars, keyword, excluded in tokens:
+                if keyword is not None:
+                    test = (keyword.match, keyword.identChars, ())
+                    self.table.setdefault(keyword.match[:1], []).append((index, test))
+                    continue
+                for char in chars:
+                    relevant = tuple((k.match, k.identChars) for k in excluded
+                                     if k.match[:1] == char)
+                    test = (None, None, relevant) if relevant else None
+                    self.table.setdefault(char, []).append((index, test))
+        self.white = set().union(*whites)
+
+
+    def candidates(self, instring, loc):
+        """Returns the alternatives that could match at 'loc' in 'instring'."""
+        found = set(self.always)
+        end = len(instring)
+        while True:
+            char = instring[loc:loc + 1]
+            for index, test in self.table.get(char, ()):
+                if index not in found and _passes(test, instring, loc):
+                    found.add(index)
+            if loc >= end or char not in self.white:
+                break
+            loc += 1
+        if len(found) == len(self.exprs):
+            return self.exprs
+        return [self.exprs[index] for index in sorted(found)]
+
+
+def _passes(test, instring, loc):
+    if test is None:
+        return True
+    word, identChars, excluded = test
+    if word is not None:
+        return _keyword_at(word, identChars, instring, loc)
+    return not any(_keyword_at(w, chars, instring, loc) for w, chars in excluded)
+
+
+def _keyword_at(word, identChars, instring, loc):
+    """Returns True if a Keyword for 'word' would match at 'loc'."""
+    if not instring.startswith(word, loc):
+        return False
+    after = loc + len(word)
+    return (after >= len(instring) or instring[after] not in identChars) \
+        and (loc == 0 or instring[loc - 1] not in identChars)
+
+
+def _first_tokens(expr, whites, active):
+    """Returns a list of the ways in which a non-empty match of 'expr' can
+    begin, or None if that cannot be determined or 'expr' can match an empty
+    string.  Each item is a tuple (chars, keyword, excluded): either a set of
+    characters that the match can start with, except where the text there
+    is one of the Keywords in the tuple 'excluded', or else a Keyword it can
+    start with.  The end of the input is represented by the character ''.
+    The sets of characters skipped as whitespace before the match are added
+    to the set 'whites'.  'active' guards against recursion."""
+    if id(expr) in active or expr.ignoreExprs:
+        return _NO_STARTS
+    if expr.skipWhitespace:
+        whites.add(frozenset(expr.whiteChars))
+    active = active | set([id(expr)])
+    if isinstance(expr, Keyword):
+        if expr.caseless:
+            first = expr.match[:1]
+            return [(frozenset([first.lower(), first.upper()]), None, ())]
+        return [(None, expr, ())]
+    elif isinstance(expr, CaselessLiteral):
+        first = expr.match[:1]
+        return [(frozenset([first.lower(), first.upper()]), None, ())]
+    elif isinstance(expr, Literal):
+        return [(frozenset(expr.match[:1]), None, ())] if expr.match else _NO_STARTS
+    elif isinstance(expr, Word):
+        return [(frozenset(expr.initChars), None, ())]
+    elif isinstance(expr, QuotedString):
+        return [(frozenset(expr.quoteChar[:1]), None, ())]
+    elif isinstance(expr, White):
+        return [(frozenset(expr.matchWhite), None, ())]
+    elif isinstance(expr, LineEnd):
+        return [(frozenset(['\n', '']), None, ())]
+    elif isinstance(expr, StringEnd):
+        return [(frozenset(['']), None, ())]
+    elif isinstance(expr, (Or, MatchFirst)):
+        return _union([_first_tokens(e, whites, active) for e in expr.exprs])
+    elif isinstance(expr, And):
+        return _sequence_tokens(expr.exprs, whites, active)
+    elif isinstance(expr, PrecedenceClimber):
+        starts = [expr.baseExpr, expr.lpar]
+        starts += [ops[0] for arity, assoc, ops, pa, _ in expr.levels
+                   if assoc == opAssoc.RIGHT]
+        return _union([_first_tokens(e, whites, active) for e in starts])
+    elif isinstance(expr, ParseElementEnhance) and not isinstance(
+            expr, (Optional, ZeroOrMore, NotAny, FollowedBy)):
+        if expr.expr is None:
+            return _NO_STARTS
+        return _first_tokens(expr.expr, whites, active)
+    return _NO_STARTS
+
+
+def _sequence_tokens(exprs, whites, active):
+    """Like _first_tokens(), for the elements of an And."""
+    tokens = []
+    excluded = ()
+    for element in exprs:
+        if isinstance(element, NotAny):
+            # A NotAny of keywords excludes them from the start of the next
+            # element, provided both skip whitespace the same way.
+            keyword_whites = set()
+            keywords = _first_tokens(element.expr, keyword_whites, active)
+            whites.update(keyword_whites)
+            if keywords is not _NO_STARTS and all(k for _, k, _ in keywords):
+                excluded = tuple(k for _, k, _ in keywords)
+                excluded_whites = keyword_whites
+            continue
+        if isinstance(element, (FollowedBy, Empty)):
+            continue
+        optional = isinstance(element, (Optional, ZeroOrMore))
+        element_whites = set()
+        if optional and element.skipWhitespace:
+            element_whites.add(frozenset(element.whiteChars))
+        more = _first_tokens(element.expr if optional else element,
+                             element_whites, active)
+        whites.update(element_whites)
+        if more is _NO_STARTS:
+            return _NO_STARTS
+        if excluded and not optional and len(element_whites) <= 1 \
+           and element_whites == excluded_whites:
+            more = [(chars, keyword, ()) if keyword else (chars, None, excluded)
+                    for chars, keyword, _ in more]
+        tokens += more
+        if not optional:
+            return tokens
+        excluded = ()
+    return _NO_STARTS
+
+
+def _union(alternatives):
+    tokens = []
+    for more in alternatives:
+        if more is _NO_STARTS:
+            return _NO_STARTS
+        tokens += more
+    return tokens
+
+
+class _Predictive(object):
+    predictions = None
+
+    def candidates(self, instring, loc):
+        """Returns the alternatives that could match at 'loc' in 'instring'."""
+        # The table is made the first time it's needed, when the grammar is
+        # complete, and again if the list of alternatives is ever changed.
+        predictions = self.predictions
+        if predictions is None or predictions.exprs is not self.exprs \
+           or predictions.count != len(self.exprs):
+            predictions = self.predictions = _Predictions(self.exprs)
+        return predictions.candidates(instring, loc)
+
+
+class PredictiveOr(_Predictive, Or):
+    def parseImpl(self, instring, loc, doActions=True):
+        exprs = self.candidates(instring, loc)
+        if len(exprs) == 1:
+            # There is no need to look for the longest match first.
+            try:
+                return exprs[0]._parse(instring, loc, doActions)
+            except ParseException as err:
+                err.msg = self.errmsg
+                raise
+            except IndexError:
+                raise ParseException(instring, len(instring), self.errmsg, self)
+        maxExcLoc = -1
+        maxException = None
+        matches = []
+        for e in exprs:
+            try:
+                loc2 = e.tryParse(instring, loc)
+            except ParseException as err:
+                if err.loc > maxExcLoc:
+                    maxException = err
+                    maxExcLoc = err.loc
+            except IndexError:
+                if len(instring) > maxExcLoc:
+                    maxException = ParseException(instring, len(instring), e.errmsg, self)
+                    maxExcLoc = len(instring)
+            else:
+                matches.append((loc2, e))
+        # Same as Or: retry the matches from longest to shortest.
+        matches.sort(key=lambda x: -x[0])
+        for _, e in matches:
+            try:
+                return e._parse(instring, loc, doActions)
+            except ParseException as err:
+                if err.loc > maxExcLoc:
+                    maxException = err
+                    maxExcLoc = err.loc
+        if maxException is None:
+            maxException = ParseException(instring, loc, self.errmsg, self)
+        maxException.msg = self.errmsg
+        raise maxException
+
+
+class PredictiveMatchFirst(_Predictive, MatchFirst):
+    def parseImpl(self, instring, loc, doActions=True):
+        maxExcLoc = -1
+        maxException = None
+        for e in self.candidates(instring, loc):
+            try:
+                return e._parse(instring, loc, doActions)
+            except ParseException as err:
+                if err.loc > maxExcLoc:
+                    maxException = err
+                    maxExcLoc = err.loc
+            except IndexError:
+                if len(instring) > maxExcLoc:
+                    maxException = ParseException(instring, len(instring), e.errmsg, self)
+                    maxExcLoc = len(instring)
+        if maxException is None:
+            maxException = ParseException(instring, loc, self.errmsg, self)
+        maxException.msg = self.errmsg
+        raise maxException
+
+
+# PackratCache -- replacement for PyParsing's packrat cache.
+#
+# PyParsing keeps a single packrat cache for all parsers, created by
+# ParserElement.enablePackrat() with a fixed size, and holds on to the
+# entries until the next parse.  PackratCache provides the same interface
+# (get/set/clear and the not_in_cache marker, or, for versions of PyParsing
+# before 2.1.6, that of a dict) so that MatlabGrammar can put
+# its own cache in place of PyParsing's for the duration of a parse, with a
+# size chosen per MatlabGrammar object.  When full, the least-recently used
+# entry is dropped.  It also keeps counts of hits, misses and evictions and
+# the largest number of entries held at once, to help in choosing the size.
+
+class PackratCache(object):
+    def __init__(self, size=None):
+        """Creates a cache holding at most 'size' entries, or an unbounded
+        number of entries if 'size' is None.  A size of 0 disables caching.
+        """
+        if size is not None and (not isinstance(size, six.integer_types)
+                                 or size < 0):
+            raise ValueError('Packrat cache size must be None or an integer >= 0')
+        self.size = size
+        self.not_in_cache = object()
+        self._cache = collections.OrderedDict()
+        self.reset_stats()
+
+
+    def get(self, key):
+        value = self._cache.pop(key, self.not_in_cache)
+        if value is self.not_in_cache:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._cache[key] = value
+        return value
+
+
+    def set(self, key, value):
+        if self.size == 0:
+            return
+        cache = self._cache
+        cache[key] = value
+        if self.size is not None and len(cache) > self.size:
+            cache.popitem(last=False)
+            self.evictions += 1
+        elif len(cache) > self.peak:
+            self.peak = len(cache)
+
+
+    def clear(self):
+        self._cache.clear()
+
+
+    # Older versions of PyParsing use the cache as a dict: they test for a
+    # key with 'in' and then fetch the value.  The test does the counting.
+
+    def __contains__(self, key):
+        return self.get(key) is not self.not_in_cache
+
+
+    def __getitem__(self, key):
+        return self._cache[key]
+
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.peak = 0
+
+
+    def stats(self):
+        """Returns a dictionary of counters and the current cache size."""
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'peak entries': self.peak,
+                'entries': len(self._cache), 'size': self.size}
+
+
+    def __len__(self):
+        return len(self._cache)
+
+
 # From http://pyparsing.wikispaces.com/share/view/41237655
 
 def setVar(varname, varvalue):
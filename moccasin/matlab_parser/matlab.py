@@ -24,7 +24,9 @@ from __future__ import print_function
 import inspect
 import sys
 import pdb
+import string
 import collections
+import six
 from collections import defaultdict
 
 
@@ -78,10 +80,41 @@ from collections import defaultdict
 # +--ShellCommand
 # |
 # `- Comment
-
+#
+# Parse trees of large files can have millions of nodes, so nodes don't have
+# a __dict__: the metaclass below gives every node class a __slots__ made
+# from the names in its _attr_names (less the ones its parent classes
+# already have slots for).  Node classes therefore must not set attributes
+# other than those named in _attr_names.
+#
+# Nodes are used as dictionary keys in MatlabContext (for assignments,
+# types and calls), and their hash is computed from the text form produced
+# by MatlabNode.as_string(), which walks the whole node.  Each node keeps
+# its hash once computed, in the slot _hash, and drops it when one of its
+# attributes is set.  Changes made further down (to a child node, or to a
+# list in place) are not seen, but those must not change the text form of
+# a node in use as a key anyway, since the dictionary would then no longer
+# find it.
+
+class _MatlabNodeMeta(type):
+    def __new__(meta, name, bases, namespace):
+        if '__slots__' not in namespace:
+            inherited = set()
+            for base in bases:
+                for klass in base.__mro__:
+                    inherited.update(klass.__dict__.get('__slots__', ()))
+            namespace['__slots__'] = tuple(
+                attr for attr in namespace.get('_attr_names') or []
+                if attr not in inherited)
+        return super(_MatlabNodeMeta, meta).__new__(meta, name, bases, namespace)
+
+
+@six.add_metaclass(_MatlabNodeMeta)
 class MatlabNode(object):
     '''Base class of nodes used to represent MATLAB statements as an AST.'''
 
+    __slots__ = ('_hash',)
+
     _attr_names = None                 # Default set of node attributes.
     _visitable_attr = []               # Default list of visitable attributes.
     _location   = (0, 0)               # Location in file (tuple: line, col).
@@ -97,11 +130,11 @@ class MatlabNode(object):
 
         # Set all of the positional arguments:
         for name, value in zip(self._attr_names, args):
-            setattr(self, name, value)
+            object.__setattr__(self, name, value)
 
         # Set the remaining keyword arguments:
         for name in self._attr_names[len(args):]:
-            setattr(self, name, kwargs.pop(name))
+            object.__setattr__(self, name, kwargs.pop(name))
 
         # Check for any remaining unknown arguments:
         if kwargs:
@@ -116,15 +149,38 @@ class MatlabNode(object):
         return '{MatlabNode}'
 
 
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        object.__setattr__(self, '_hash', None)
+
+
     def __eq__(self, other):
-        return (isinstance(other, self.__class__)
-                and self.__dict__ == other.__dict__)
+        return self is other or (isinstance(other, self.__class__)
+                                 and self.__getstate__() == other.__getstate__())
 
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
 
+    # Objects with __slots__ and no __dict__ need these to be pickled with
+    # the older pickle protocols.  The state is a dict, as it would be for an
+    # object with a __dict__, so that pickles made before nodes had slots can
+    # still be loaded.
+
+    def __getstate__(self):
+        state = {}
+        for name in self._attr_names or []:
+            if hasattr(self, name):
+                state[name] = getattr(self, name)
+        return state
+
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
+
     def __gt__(self, other):
         return not __le__(self, other)
 
@@ -164,21 +220,52 @@ class MatlabNode(object):
 
 
     def __hash__(self):
-        return hash(MatlabNode.as_string(self))
+        value = getattr(self, '_hash', None)
+        if value is None:
+            value = hash(MatlabNode.as_string(self))
+            object.__setattr__(self, '_hash', value)
+        return value
 
 
     @staticmethod
     def as_string(thing):
         """Turns a node structure into a canonical text string form.
-        This is a recursive function, and is meant to be used to convert simple
-        node structures (such as array accesses) into dictionary hash keys.
-        It is unlikely to yield useful results for more complicated node trees.
+        This is meant to be used to convert simple node structures (such as
+        array accesses) into dictionary hash keys.  It is unlikely to yield
+        useful results for more complicated node trees.
         """
         def row_to_string(row):
             list = [MatlabNode.as_string(item) for item in row]
             return ','.join(list)
 
-        if isinstance(thing, str):
+        if isinstance(thing, Operator):
+            # Operator expressions are flattened using our own stack (see
+            # "Deeply nested operator expressions" in this file).  The stack holds strings,
+            # which are copied to the output, and nodes still to be expanded.
+            text = []
+            stack = [thing]
+            while stack:
+                item = stack.pop()
+                if isinstance(item, str):
+                    text.append(item)
+                elif isinstance(item, UnaryOp):
+                    stack.extend([item.operand, item.op])
+                elif isinstance(item, BinaryOp):
+                    stack.extend([item.right, item.op, item.left])
+                elif isinstance(item, ColonOp):
+                    if item.middle:
+                        stack.extend([item.right, ':', item.middle, ':', item.left])
+                    else:
+                        stack.extend([item.right, ':', item.left])
+                elif isinstance(item, Transpose):
+                    stack.extend([item.op, item.operand])
+                elif isinstance(item, Operator):
+                    # Some operator we don't know about.
+                    return None
+                else:
+                    text.append(MatlabNode.as_string(item))
+            return ''.join(text)
+        elif isinstance(thing, str):
             return thing
         elif isinstance(thing, Primitive):
             return str(thing.value)
@@ -205,23 +292,6 @@ class MatlabNode(object):
         elif isinstance(thing, Array):
             rowlist = [row_to_string(row) for row in thing.rows]
             return '[' + ';'.join(rowlist) + ']'
-        elif isinstance(thing, Operator):
-            if isinstance(thing, UnaryOp):
-                return thing.op + MatlabNode.as_string(thing.operand)
-            elif isinstance(thing, BinaryOp):
-                left = MatlabNode.as_string(thing.left)
-                right = MatlabNode.as_string(thing.right)
-                return left + thing.op + right
-            elif isinstance(thing, ColonOp):
-                left = MatlabNode.as_string(thing.left)
-                right = MatlabNode.as_string(thing.right)
-                if thing.middle:
-                    middle = MatlabNode.as_string(thing.middle)
-                    return left + ':' + middle + ':' + right
-                else:
-                    return left + ':' + right
-            elif isinstance(thing, Transpose):
-                return MatlabNode.as_string(thing.operand) + thing.op
         elif isinstance(thing, FuncHandle):
             return str(thing)
         elif isinstance(thing, AnonFun):
@@ -511,10 +581,36 @@ class Ambiguous(Reference):
 
 # Operators
 # .........................................................................
+#
+# Deeply nested operator expressions
+#
+# Operator expressions can be nested very deeply: a sum of N terms is N-1
+# BinaryOps nested inside each other, and models with hundreds or thousands
+# of terms in a row are not unusual.  Code that walks these trees by
+# recursion needs a Python stack frame per term and fails on such inputs,
+# so the code that walks operator expressions (the default visit, the text
+# forms, make_formula, the converter's passes, etc.) keeps its own stack or
+# follows chains of operands with a loop instead.  The same holds for other
+# trees made from these, such as libSBML ASTNodes.
 
 class Operator(Expression):
     """Parent class for operators in expressions."""
-    pass
+
+    # The text forms of operator expressions are produced by filling in
+    # templates, rather than by having __str__() and __repr__() call str()
+    # and repr() on the operands, which would need a Python stack frame per
+    # term (see "Deeply nested operator expressions" above).  See
+    # _format_operator() below.  Fields in the templates that name visitable
+    # attributes are the operands.
+
+    _str_template  = '{{MatlabNode}}'
+    _repr_template = 'MatlabNode()'
+
+    def __repr__(self):
+        return _format_operator(self, '_repr_template', repr)
+
+    def __str__(self):
+        return _format_operator(self, '_str_template', _str_format)
 
 
 class UnaryOp(Operator):
@@ -522,56 +618,32 @@ class UnaryOp(Operator):
 
     _attr_names = ['op', 'operand']
     _visitable_attr = ['operand']
-
-    def __repr__(self):
-        return 'UnaryOp(op=\'{}\', operand={})'.format(
-            self.op, repr(self.operand))
-
-    def __str__(self):
-        return '{{unary op expression {} operand {}}}'.format(
-            self.op, _str_format(self.operand))
+    _repr_template = 'UnaryOp(op=\'{op}\', operand={operand})'
+    _str_template = '{{unary op expression {op} operand {operand}}}'
 
 
 class BinaryOp(Operator):
     '''Binary operator.'''
     _attr_names = ['op', 'left', 'right']
     _visitable_attr = ['left', 'right']
-
-    def __repr__(self):
-        return 'BinaryOp(op=\'{}\', left={}, right={})'.format(
-            self.op, repr(self.left), repr(self.right))
-
-    def __str__(self):
-        return '{{binary op expression {} left {} right {}}}'.format(
-            self.op, _str_format(self.left), _str_format(self.right))
+    _repr_template = 'BinaryOp(op=\'{op}\', left={left}, right={right})'
+    _str_template = '{{binary op expression {op} left {left} right {right}}}'
 
 
 class ColonOp(Operator):
     '''MATLAB "colon" operator, of the form x:y or x:y:z.'''
     _attr_names = ['left', 'middle', 'right']
     _visitable_attr = ['left', 'middle', 'right']
-
-    def __repr__(self):
-        return 'ColonOp(left={}, middle={}, right={})'.format(
-            repr(self.left), repr(self.middle), repr(self.right))
-
-    def __str__(self):
-        return '{{colon op expression: left={}, middle={}, right={}}}'.format(
-            _str_format(self.left), _str_format(self.middle), _str_format(self.right))
+    _repr_template = 'ColonOp(left={left}, middle={middle}, right={right})'
+    _str_template = '{{colon op expression: left={left}, middle={middle}, right={right}}}'
 
 
 class Transpose(Operator):
     '''MATLAB transpose operator.'''
     _attr_names = ['op', 'operand']
     _visitable_attr = ['operand']
-
-    def __repr__(self):
-        return 'Transpose(op=\'{}\', operand={})'.format(
-            self.op, repr(self.operand))
-
-    def __str__(self):
-        return '{{transpose expression: {} operator {} }}'.format(
-            _str_format(self.operand), self.op)
+    _repr_template = 'Transpose(op=\'{op}\', operand={operand})'
+    _str_template = '{{transpose expression: {operand} operator {op} }}'
 
 
 # Definitions: assignments, function definitions, scripts.
@@ -765,6 +837,37 @@ class Comment(MatlabNode):
         return '{{comment: {}}}'.format(self.content)
 
 
+# Shared leaf nodes.
+# .........................................................................
+# The parsers create Identifier and Number nodes through a LeafTable, which
+# hands out the same node every time for the same name or value in one
+# parse.  This saves memory, and makes comparing nodes and looking them up
+# in dictionaries mostly a matter of comparing object identities.  The
+# nodes are shared, so code must not change their attributes unless the
+# change is meant to apply to every occurrence.
+
+class LeafTable(object):
+    '''Identifier and Number nodes for one parse, by name or value.'''
+
+    def __init__(self):
+        self._identifiers = {}
+        self._numbers = {}
+
+
+    def identifier(self, name):
+        node = self._identifiers.get(name)
+        if node is None:
+            node = self._identifiers[name] = Identifier(name=name)
+        return node
+
+
+    def number(self, value):
+        node = self._numbers.get(value)
+        if node is None:
+            node = self._numbers[value] = Number(value=value)
+        return node
+
+
 # Visitor.
 # .........................................................................
 # This is a visitor class with special powers:
@@ -777,6 +880,11 @@ class Comment(MatlabNode):
 # For instance, if a visit_Identifier() is not defined, then upon
 # encountering a node of class Identifier, visit() will still check for
 # a visit_Reference(), visit_Entity(), and visit_Expression(), in that order.
+# The method found for each class of node is remembered in a table that
+# belongs to the visitor class (created along with the class by the
+# metaclass _VisitorMeta), so that visit() normally only has to do one
+# dictionary lookup.  This means the visit_CLASS() methods must be defined
+# in the class, not set on visitor objects.
 #
 # Subclasses must (A) make sure to call the __init__() functions in their
 # subclass __init__() functions, and (B) always make sure visit_CLASS()
@@ -804,59 +912,92 @@ class Comment(MatlabNode):
 # Note that no visit_MatlabNode() will ever get called, because there is no
 # point: the method visit() is effectively visit_MatlabNode().
 
+class _VisitorMeta(type):
+    def __new__(meta, name, bases, namespace):
+        # The dispatch table: class of node => the function to call for it,
+        # or None if there is no visit_CLASS() method for it or its parent
+        # classes.  Filled in by _handler() as classes are encountered.
+        namespace['_handlers'] = {}
+        return super(_VisitorMeta, meta).__new__(meta, name, bases, namespace)
+
+
+@six.add_metaclass(_VisitorMeta)
 class MatlabNodeVisitor(object):
     def __init__(self):
-        def catalog(this_class, classes):
-            # Note it doesn't help to put MatlabNode in the path because it
-            # bloats the list and complicates processing later, so we skip it.
-            for subclass in this_class.__subclasses__():
-                if this_class in classes:
-                    classes[subclass] = [this_class] + classes[this_class]
-                elif this_class is not MatlabNode:
-                    classes[subclass] = [this_class]
-                catalog(subclass, classes)
-
-        # Cache the superclass path for every subclass, so that we don't have
-        # to keep walking up the class hierarchy at every call to visit().
-        self._parent_classes = defaultdict(list)
-        catalog(MatlabNode, self._parent_classes)
+        pass
 
 
     def visit(self, node):
         if not node:
             return node
-        elif isinstance(node, list):
-            meth = getattr(self, 'visit_list', None)
-            if meth is None:
-                meth = self.default_visit_list
-            return meth(node)
-        elif isinstance(node, tuple):
-            return (self.visit(node[0]), self.visit(node[1]))
+        try:
+            handler = self._handlers[type(node)]
+        except KeyError:
+            handler = self._handler(type(node))
+        if handler is None:
+            # We got 'nothin.  We do the default walk.
+            return self.default_visit(node)
+        return handler(self, node)
+
+
+    @classmethod
+    def _handler(cls, node_class):
+        # If the user has defined a method for this class of object, return
+        # that; else, look for a method for a superclass, and failing all
+        # that, return None.  Note it doesn't help to look for a method for
+        # MatlabNode, so we skip it.  Lists and tuples have handlers too.
+        if issubclass(node_class, list):
+            handler = getattr(cls, 'visit_list', cls.default_visit_list)
+        elif issubclass(node_class, tuple):
+            handler = cls._visit_tuple
         else:
-            # If the user has defined a method for this class of object, call
-            # that; else, look for a method for a superclass, and failing all
-            # that, default to walking the visitable attributes.
-            methname = 'visit_' + type(node).__name__
-            meth = getattr(self, methname, None)
-            if meth:
-                return meth(node)
-            else:
-                for superclass in self._parent_classes[node.__class__]:
-                    methname = 'visit_' + superclass.__name__
-                    meth = getattr(self, methname, None)
-                    if meth:
-                        return meth(node)
-                # We got 'nothin.  We do the default walk.
-                meth = self.default_visit
-                return meth(node)
+            handler = None
+            for superclass in node_class.__mro__:
+                if superclass is MatlabNode or superclass is object:
+                    break
+                handler = getattr(cls, 'visit_' + superclass.__name__, None)
+                if handler:
+                    break
+        cls._handlers[node_class] = handler
+        return handler
+
+
+    def _visit_tuple(self, node):
+        return (self.visit(node[0]), self.visit(node[1]))
 
 
     def default_visit(self, node):
         """Default visitor.  Users can redefine this if desired."""
-        for a in type(node)._visitable_attr:
-            value = getattr(node, a, None)
-            if value:
-                setattr(node, a, self.visit(value))
+        # Nodes that also get the default walk (typically operator
+        # expressions, which can be nested very deeply) are walked using our
+        # own stack instead of by calling visit() on them, so that the depth
+        # of recursion doesn't grow with the length of an expression.  The
+        # order of visits is the same as if visit() had been called.  This
+        # only applies if this method has not been redefined by a subclass.
+        ours = (getattr(self.default_visit, '__func__', None)
+                is MatlabNodeVisitor.__dict__['default_visit'])
+        stack = [(node, iter(type(node)._visitable_attr))]
+        while stack:
+            parent, attrs = stack[-1]
+            for a in attrs:
+                value = getattr(parent, a, None)
+                if not value:
+                    continue
+                if ours and isinstance(value, MatlabNode):
+                    try:
+                        handler = self._handlers[type(value)]
+                    except KeyError:
+                        handler = self._handler(type(value))
+                    if handler is None:
+                        # The default walk returns the node itself, so
+                        # there's no need to set the attribute afterwards.
+                        stack.append((value, iter(type(value)._visitable_attr)))
+                        break
+                    setattr(parent, a, handler(self, value))
+                else:
+                    setattr(parent, a, self.visit(value))
+            else:
+                stack.pop()
         return node
 
 
@@ -898,3 +1039,40 @@ def _str_format_rowlist(rows):
             text += '; '
         i += 1
     return text
+
+
+_template_parts = {}
+
+def _format_operator(node, template, format):
+    # Fills in the named template of operator node, formatting the operands
+    # with function format.  Operands that are themselves operators are
+    # expanded in place using our own stack, so that deeply nested operator
+    # expressions don't need deeply nested calls.  Entries on the stack are
+    # pairs (is_text, value).
+    text = []
+    stack = [(False, node)]
+    while stack:
+        is_text, item = stack.pop()
+        if is_text:
+            text.append(item)
+        elif isinstance(item, Operator):
+            parts = _template_parts.get(getattr(item, template))
+            if parts is None:
+                parts = list(string.Formatter().parse(getattr(item, template)))
+                _template_parts[getattr(item, template)] = parts
+            expanded = []
+            for literal, field, _, _ in parts:
+                if literal:
+                    expanded.append((True, literal))
+                if field is None:
+                    continue
+                value = getattr(item, field)
+                if field in item._visitable_attr:
+                    expanded.append((False, value))
+                else:
+                    expanded.append((True, str(value)))
+            expanded.reverse()
+            stack.extend(expanded)
+        else:
+            text.append(format(item))
+    return ''.join(text)
@@ -0,0 +1,885 @@
+#!/usr/bin/env python
+#
+# @file    pyparsing_grammar.py
+# @brief   The MATLAB grammar, defined using PyParsing
+# @author  Michael Hucka
+#
+# <!---------------------------------------------------------------------------
+# This software is part of MOCCASIN, the Model ODE Converter for Creating
+# Automated SBML INteroperability. Visit https://github.com/sbmlteam/moccasin/.
+#
+# Copyright (C) 2014-2016 jointly by the following organizations:
+#  1. California Institute of Technology, Pasadena, CA, USA
+#  2. Icahn School of Medicine at Mount Sinai, New York, NY, USA
+#  3. Boston University, Boston, MA, USA
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation.  A copy of the license agreement is provided in the
+# file named "COPYING.txt" included with this software distribution and also
+# available online at https://github.com/sbmlteam/moccasin/.
+# ------------------------------------------------------------------------- -->
+
+# This file contains the PyParsing grammar used by the class MatlabGrammar
+# in grammar.py, whose comments describe how the grammar works and what it
+# produces.  Constructing the grammar means creating several thousand
+# PyParsing objects, so it is kept separate: grammar.py imports this module
+# only when the grammar is first needed (i.e., on the first parse using the
+# 'pyparsing' backend), not when grammar.py itself is imported.  That way,
+# programs that import MOCCASIN but do not parse anything, and programs that
+# use the 'rd' backend, don't have to pay for it.
+
+from pyparsing import *
+try:
+    from grammar_utils import *
+except:
+    from .grammar_utils import *
+
+
+# MatlabSyntax.
+# .............................................................................
+# The definition of our MATLAB grammar, in PyParsing.
+#
+# Note: the grammar is written in reverse order, from smallest elements to
+# the highest level parsing object, simply because Python interprets the file
+# in this order and needs each item defined before it encounters it later.
+# However, for readabily, it's probably easiest to start at the last
+# definition (which is _matlab_file) and read up.
+
+class MatlabSyntax:
+
+    # First, the lowest-level terminal tokens.
+    # .........................................................................
+
+    _EOL        = LineEnd().suppress()
+    _SOL        = LineStart().suppress()
+    _WHITE      = White(ws=' \t').suppress()
+
+    # Note: For MATLAB, we often need to control where line breaks are
+    # allowed.  In PyParsing, the whitespace property is attached to term
+    # definitions and not to definitions that only combine the terms; i.e.,
+    # when using the "^" or "|" operators to combine terms, it doesn't matter
+    # if you precede that with setDefaultWhitespaceChars settings.  You have
+    # to set the value for the individual term expressions.  That's why some
+    # of the following primitives are wrapped with setDefaultWhitespaceChars.
+
+    ParserElement.setDefaultWhitespaceChars(' \t')
+
+    _SEMI       = Literal(';').suppress()
+    _COMMA      = Literal(',').suppress()
+    _LPAR       = Literal("(").suppress()
+    _RPAR       = Literal(")").suppress()
+    _LBRACKET   = Literal('[').suppress()
+    _RBRACKET   = Literal(']').suppress()
+    _LBRACE     = Literal('{').suppress()
+    _RBRACE     = Literal('}').suppress()
+    _EQUALS     = Literal('=').suppress()
+    _DOT        = Literal('.').suppress()
+    _ELLIPSIS   = Literal('...')
+
+    ParserElement.setDefaultWhitespaceChars(' \t\n\r')
+
+    # This definition of numbers knowingly ignores imaginary numbers because
+    # they're not used in our domain.
+
+    _INTEGER    = Word(nums)
+    _EXPONENT   = Combine(oneOf('E e D d') + Optional(oneOf('+ -')) + Word(nums))
+    _FLOAT      = (Combine(Word(nums) + Optional('.' + Word(nums)) + _EXPONENT)
+                   | Combine(Word(nums) + '.' + _EXPONENT)
+                   | Combine(Word(nums) + '.' + Word(nums))
+                   | Combine('.' + Word(nums) + _EXPONENT)
+                   | Combine('.' + Word(nums))
+                   | Combine(Word(nums) + '.'))
+
+    # Next come definitions of terminal elements.  The funky syntax with the
+    # second parenthesized argument on each line is something PyParsing allows;
+    # it's a short form, equivalent to calling .setResultsName(...).
+
+    _NUMBER     = (_FLOAT | _INTEGER)                 ('number')
+    _STRING     = QuotedString("'", escQuote="''")    ('string')
+
+    _TILDE      = Literal('~')                        ('tilde')
+
+    ParserElement.setDefaultWhitespaceChars(' \t')
+
+    _UMINUS     = Literal('-')                        ('unary operator')
+    _UPLUS      = Literal('+')                        ('unary operator')
+    _UNOT       = Literal('~')                        ('unary operator')
+    _TIMES      = Literal('*')                        ('binary operator')
+    _ELTIMES    = Literal('.*')                       ('binary operator')
+    _MRDIVIDE   = Literal('/')                        ('binary operator')
+    _MLDIVIDE   = Literal('\\')                       ('binary operator')
+    _RDIVIDE    = Literal('./')                       ('binary operator')
+    _LDIVIDE    = Literal('.\\')                      ('binary operator')
+    _MPOWER     = Literal('^')                        ('binary operator')
+    _ELPOWER    = Literal('.^')                       ('binary operator')
+    _PLUS       = Literal('+')                        ('binary operator')
+    _MINUS      = Literal('-')                        ('binary operator')
+    _LT         = Literal('<')                        ('binary operator')
+    _LE         = Literal('<=')                       ('binary operator')
+    _GT         = Literal('>')                        ('binary operator')
+    _GE         = Literal('>=')                       ('binary operator')
+    _EQ         = Literal('==')                       ('binary operator')
+    _NE         = Literal('~=')                       ('binary operator')
+    _AND        = Literal('&')                        ('binary operator')
+    _OR         = Literal('|')                        ('binary operator')
+    _SHORT_AND  = Literal('&&')                       ('binary operator')
+    _SHORT_OR   = Literal('||')                       ('binary operator')
+
+    # Operators that have special-case handling.
+
+    _COLON      = Literal(':')
+    _NC_TRANSP  = Literal(".'")                       ('transpose')
+    _CC_TRANSP  = Literal("'")                        ('transpose')
+
+    ParserElement.setDefaultWhitespaceChars(' \t\n\r')
+
+    # Keywords.  This list is based on what the command 'iskeyword' returns
+    # in MATLAB 2014b.  Note that 'end' as an operator is defined again below.
+
+    _BREAK      = Keyword('break')
+    _CASE       = Keyword('case')
+    _CATCH      = Keyword('catch')
+    _CLASSDEF   = Keyword('classdef')
+    _CONTINUE   = Keyword('continue')
+    _ELSE       = Keyword('else')
+    _ELSEIF     = Keyword('elseif')
+    _END        = Keyword('end')
+    _FOR        = Keyword('for')
+    _FUNCTION   = Keyword('function')
+    _GLOBAL     = Keyword('global')
+    _IF         = Keyword('if')
+    _OTHERWISE  = Keyword('otherwise')
+    _PARFOR     = Keyword('parfor')
+    _PERSISTENT = Keyword('persistent')
+    _RETURN     = Keyword('return')
+    _SPMD       = Keyword('spmd')
+    _SWITCH     = Keyword('switch')
+    _TRY        = Keyword('try')
+    _WHILE      = Keyword('while')
+
+    # Identifiers.
+    #
+    # _id defines identifiers that can be used in user programs.  They can't
+    # be the same as known MATLAB language keywords.  _name defines a labeled
+    # version of _id that we use in most grammar expressions below to avoid
+    # writing "Group(_id)('name')".
+
+    _reserved   = PredictiveMatchFirst([_BREAK, _CASE, _CATCH, _CLASSDEF,
+                                        _CONTINUE, _ELSE, _ELSEIF, _END,
+                                        _FOR, _FUNCTION, _GLOBAL, _IF,
+                                        _OTHERWISE, _PARFOR, _PERSISTENT,
+                                        _RETURN, _SPMD, _SWITCH, _TRY, _WHILE])
+
+    _identifier = Word(alphas, alphanums + '_')
+    _id         = NotAny(_reserved) + _identifier('identifier')
+    _name       = Group(_id)('name')
+
+    # Grammar for expressions.
+    #
+    # Some up-front notes:
+    #
+    # 1) Calling PyParsing's setResultsName() function or its equivalent
+    # yields A COPY of the thing affected -- it does not return the original
+    # thing.  This means that if you have a grammar element of the form
+    #             _foo = Group(_bar('bar') | _biff('biff'))
+    # then _bar and _biff never actually get invoked when _foo is invoked;
+    # what get invoked are copies of _bar and _biff, because that's what gets
+    # stored in _foo.  This has implications for using parse actions and also
+    # debug tracing.  Right now, we no longer use parse actions, but beware
+    # that if parse actions are ever attached to _bar & _biff, they are not
+    # actually called when _foo is invoked because _foo uses copies of _bar
+    # and _biff.  This leads to subtle and frustrating rounds of bug-chasing.
+    #
+    # 2) The grammar below is sometimes designed with the assumption that the
+    # input is valid Matlab.  This fits our purpose, which is to parse valid
+    # Matlab, so we can afford to produce something simpler here and assume
+    # that the input won't do some things that the Matlab parser would
+    # reject.  The basic rule is: accept everything that's valid Matlab, but
+    # don't worry about deliberately excluding what isn't valid Matlab.
+    # .........................................................................
+
+    _expr          = Forward()
+    _expr_in_array = Forward()
+
+    # The possible statement separators/delimiters in Matlab are:
+    #   - EOL
+    #   - line comment (because they eat the EOL at the end)
+    #   - block comments
+    #   - semicolon
+    #   - comma
+    # We handle EOL implicitly in most cases by leaving PyParsing's default
+    # whitespace definition as-is, which marks EOL as an ignored whitespace
+    # character. However, sometimes Matlab syntax requires special care with
+    # EOL, so in those cases, EOL is handled explicitly.
+
+    _line_c_start  = Literal('%').suppress()
+    _block_c_start = Literal('%{').suppress()
+    _block_c_end   = Literal('%}').suppress()
+    _line_comment  = Group(_line_c_start + restOfLine + _EOL)
+    _block_comment = Group(_block_c_start + SkipTo(_block_c_end, include=True))
+    _comment       = Group(_block_comment('comment') | _line_comment('comment'))
+
+    _delimiter     = _COMMA | _SEMI
+    _noncontent    = _delimiter | _comment | _EOL
+
+    # Comma-separated arguments to matrix/array/cell arrays can have ':'
+    # in arguments, but arguments to function calls can't.  Parameter lists in
+    # some other situations (like function return values) can have '~', but
+    # the other elements can only be identifiers, not expressions.  The
+    # following are the different versions used in different places later on.
+    #
+    # For array parsing to work, the next bunch of grammar objects have to be
+    # constructed with different whitespace-handling rules: they must not eat
+    # line breaks, because we need to match EOL explicitly, or else we can't
+    # properly parse a matrix like the following as consisting of 2 rows:
+    #    a = [1 2
+    #         3 4]
+    # That's the reason for the next call to setDefaultWhitespaceChars().
+    # This is turned off again further below.
+    #
+    # Also, the definitions of the array contents grammars below explicitly
+    # include references to _WHITE, which normally would not be necessary and
+    # considered redundant, *except* that in order to deal with some other
+    # problems with array parsing, the definition of expressions used as
+    # array contents explicitly turn off the regular whitespace rules.  This
+    # is why whitespace appears in the next several terms.  So, if you find
+    # yourself looking at these and thinking that the business involving
+    # Optional(_WHITE) is useless and can be removed: no, they have to stay
+    # in order to work properly inside other definitions later.
+    #
+    # Important note about _one_sub: handling MATLAB whitespace behavior
+    # inside and outside of arrays is extremely challenging in this parsing
+    # framework.  Here are examples of cases to be dealt with.  Suppose that
+    # "a" is an array of one item:
+    #
+    #    a(1)        => one item, the value inside the array "a" at location 1
+    #    a (1)       => one item, the value inside the array "a" at location 1
+    #    [a (1)]     => an array of TWO items, the value of a and 1
+    #    [(a (1))]   => an array of ONE item, a(1)
+    #
+    # Notice how in the 3rd example, the handling of whitespace changes inside
+    # the array context, yet wrapping the same expression in parentheses once
+    # again reverts the behavior of whitespace handling to how it is outside
+    # the array context.  (Aside: WTF, MATLAB!?)  The solution implemented here
+    # is rooted in the definition of _one_sub below, which references two
+    # different expression grammar terms.  The first one, _expr_in_array,
+    # handles the third example above.  The definition of _expr_in_array is a
+    # variant of _expr that changes whitespace behavior such that whitespace
+    # is not ignored.  This lets us handle the case where "a (1)" is
+    # interpreted as two subscript items in the array context.  But, this
+    # then screws up interpretation of the fourth example above, in which we
+    # now want to revert handling of whitespace to what it is outside of an
+    # array context.  That's the reason for the introduction of the separate
+    # reference to _LPAR + _expr + _RPAR in the definition of _one_sub: it
+    # lets us use the normal _expr to handle whitespace inside parenthesized
+    # expressions as if they were outside the array context.
+
+    ParserElement.setDefaultWhitespaceChars(' \t')
+
+    _one_sub       = Group(_COLON('colon')) | _expr_in_array | _LPAR + _expr + _RPAR
+    _comma_subs    = Optional(_one_sub) \
+                     + ZeroOrMore(Optional(_WHITE) + _COMMA + Optional(_WHITE) + Optional(_one_sub))
+    _space_subs    = _one_sub + ZeroOrMore(OneOrMore(_WHITE) + _one_sub)
+
+    _call_args     = delimitedList(_expr)
+
+    _opt_arglist   = Optional(_call_args('argument list'))
+
+    _one_param     = Group(_TILDE) | Group(_id)
+    _paramlist     = delimitedList(_one_param)
+    _opt_paramlist = Optional(_paramlist('parameter list'))
+
+    # Bare matrices.  This is a cheat because it doesn't check that all the
+    # element contents have the same data type.  But again, since we expect our
+    # input to be valid Matlab, we don't expect to have to verify that property.
+
+    _row_sep       = Optional(_WHITE) + _SEMI + Optional(_WHITE) + Optional(_comment) \
+                     | Optional(_WHITE) + _comment | _EOL
+    _one_row       = _comma_subs('subscript list') ^ _space_subs('subscript list')
+    _rows          = Optional(_WHITE) + Optional(Group(_one_row.leaveWhitespace())) \
+                     + ZeroOrMore(_row_sep + Optional(Group(_one_row))) + Optional(_WHITE)
+    _bare_array    = Group(_LBRACKET + _rows('row list') + _RBRACKET)('array')
+
+    ParserElement.setDefaultWhitespaceChars(' \t\n\r')
+
+    # Cell arrays.  You can write {} by itself, but a reference has to have at
+    # least one subscript: "somearray{}" is not valid.  Newlines don't
+    # seem to be allowed in args to references, but a bare ':' is allowed.
+    # Some tricky parts:
+    # - The following parses as a cell reference:        a{1}
+    # - The following parses as a function call:         a {1}
+    # - The following parses as an array of 3 elements:  [a {1} a]
+    # - Cell array references can be nested: a{2}{3}
+
+    _bare_cell     = Group(_LBRACE + Optional(_WHITE) + _rows('row list')
+                           + Optional(_WHITE) + _RBRACE)('cell array')
+    _cell_args     = Optional(_WHITE) + Group(_comma_subs)('subscript list') + Optional(_WHITE)
+    _cell_base     = Group(_name + _LBRACE + _cell_args + _RBRACE)('cell array')
+    _cell_nested   = Group(Group(_cell_base)('cell array')
+                           + _LBRACE + _cell_args + _RBRACE)('cell array')
+    _cell_access   = _cell_nested | _cell_base
+    _cell_array    = _cell_access | _bare_cell
+
+    # Named array references.  Note: this interacts with the definition of
+    # function calls later below.  (See _funcall_or_array.)
+
+    _array_args    = Group(_comma_subs)
+    _array_base    = Group(_cell_access | _name)('array base')
+    _array_access  = Group(_array_base
+                           + _LPAR + _array_args('subscript list') + _RPAR
+                          ).setResultsName('array')  # noqa
+
+    # Function handles.
+    #
+    # See http://mathworks.com/help/matlab/ref/function_handle.html
+    # In all function arguments, you can use a bare tilde to indicate a value
+    # that can be ignored.  This is not obvious from the functional
+    # documentation, but it seems to be the case when I try it.  (It's the
+    # case for function defs and function return values too.)
+
+    _named_handle  = Group('@' + _name)
+    _anon_handle   = Group('@' + _LPAR + _opt_paramlist + _RPAR
+                           + _expr('function definition'))  # noqa
+    _fun_handle    = (_named_handle | _anon_handle).setResultsName('function handle')
+
+    # Struct array references.  This is incomplete: in Matlab, the LHS can
+    # actually be a full expression that yields a struct.  Here, to avoid an
+    # infinitely recursive grammar, we only allow a specific set of objects
+    # and exclude a full expr.  (Doing the obvious thing, expr + "." + _id,
+    # results in an infinitely-recursive grammar.)  Also note _bare_array is
+    # deliberately not part of the following because [1].foo is not legal.
+    #
+    # Dynamic field access means that 'str' in
+    #    a.(str)
+    # needs to be interpreted as something to be evaluated, not a static
+    # identifier.  Thus, we can't return Identifier(name='str') alone, or
+    # the caller will not be able to distinguish that from a static access,
+    #    a.str
+    # The solution here is to detect the use of ".()" and explicitly label
+    # the type of field found (as either 'static field' or 'dynamic field').
+    #
+    # Note: BE VERY CAREFUL about the ordering of the terms in _struct_base.
+    # A change to the order can lead to infinite recursion on some inputs.
+    # The current order was determined by trial and error to work on our
+    # various test cases.  (And no, I'm not proud of the hackiness.)
+
+    _funcall_or_array   = Forward()
+    _struct_field       = _id('static field') | _LPAR + _expr('dynamic field') + _RPAR
+    _simple_struct_base = Group(_array_access | _id)
+    _simple_struct      = Group(_simple_struct_base('struct base')
+                                + Optional(_WHITE) + _DOT + Optional(_WHITE) 
+                                + _struct_field)('struct')
+    _struct_base        = Group(_simple_struct + Optional(_WHITE) + FollowedBy(_DOT)
+                                ^ _fun_handle
+                                ^ _funcall_or_array
+                                ^ _cell_access
+                                ^ _array_access
+                                ^ _id)
+    _struct_access      = Group(_struct_base('struct base')
+                                + Optional(_WHITE) + _DOT + Optional(_WHITE)
+                                + _struct_field)('struct')
+
+    # "Function syntax" function calls.
+    #
+    # Unfortunately, the function call forms using parentheses look identical
+    # to matrix/array accesses, and in fact in MATLAB there's no way to tell
+    # them apart except by determining whether the first name is a function
+    # or command.  This means it's ultimately run-time dependent, and depends
+    # on the functions and scripts that the user has defined.
+    #
+    # We don't have access to the user's MATLAB environment, so we are left
+    # to resort to various heuristics to try to guess what we have.  For
+    # instance, if something comes through in "command syntax", we can assume
+    # it's a function call.  (Handled by _funcall_cmd_style below.)  Another
+    # one is that in arrays, you can use bare ':' in the argument list.  This
+    # means that if a ':' is found, it's an array reference for sure.  (This
+    # case is handled in the definition of _opt_arglist) Beyond that, we call
+    # all cases we can't resolve syntactically as "array or function", and
+    # then in post-processing, attempt to apply other heuristics to figure
+    # out which ones are in fact functions.
+    #
+    # There are complications.  You can put function names or arrays inside a
+    # cell array or struct, reference into that to get the function, and hand
+    # it arguments.  E.g.:
+    #    x = somearray{1}(x, 3)
+    # or even
+    #    somestruct(2).somefieldname = str2func('functionname')
+    #    somestruct(2).somefieldname(42)
+    #
+    # The following definition is incomplete w.r.t. what MATLAB allows, since
+    # MATLAB would probably let you use the full range of expressions as the
+    # base for the function.
+
+    _fun_access         = Group(_cell_access('cell array')) \
+                          ^ Group(_simple_struct) \
+                          ^ Group(_id)
+    _funcall_or_array <<= Group(_fun_access('name')
+                                + _LPAR + _opt_arglist + _RPAR
+                               ).setResultsName('array or function')  # noqa
+
+    # "Command syntax" function calls and array references.
+    #
+    # Matlab functions can be called with arguments either surrounded with
+    # parentheses or not.  This is called "command vs. function syntax".
+    # Here are examples of command syntax:
+    #    clear x y z
+    #    format long
+    #    print -dpng magicsquare.png
+    #    save /tmp/foo
+    #    save relative/path.m
+    # etc.  As the MATLAB docs say, the following are equivalent:
+    #    load durer.mat        % Command syntax
+    #    load('durer.mat')     % Function syntax
+    # Note the way that the first form treats the arguments as (unquoted)
+    # strings.  Also note that spaces are allowed in the second form but
+    # do not turn the result into command-style syntax.  I.e.,
+    #    load ('durer.mat')
+    # is not the same as
+    #    load '(\'durer.mat\')'
+    #
+    # The syntactic rules are explained in the following MATLAB document:
+    # http://mathworks.com/help/matlab/matlab_prog/command-vs-function-syntax.html
+    # The grammar below for command-style syntax is not fully compliant.  One
+    # known failure: it requires an argument.  We deal with command-syntax
+    # function calls *without* arguments separately in post-processing.
+
+    ParserElement.setDefaultWhitespaceChars(' \t')
+
+    _most_ops          = Group(_PLUS ^ _MINUS ^ _TIMES ^ _ELTIMES ^ _MRDIVIDE
+                               ^ _MLDIVIDE ^ _RDIVIDE ^ _LDIVIDE ^ _MPOWER
+                               ^ _ELPOWER ^ _LT ^ _LE ^ _GT ^ _GE ^ _EQ ^ _NE
+                               ^ _AND ^ _OR ^ _SHORT_AND ^ _SHORT_OR ^ _COLON
+                               ^ _NC_TRANSP)
+    _noncmd_arg_start  = _EQUALS | _LPAR | _most_ops + _WHITE | _delimiter | _comment
+    _dash_term         = Combine(Literal('-') + Word(alphas, alphanums + '_'))
+    _fun_cmd_arg       = _STRING | _dash_term | CharsNotIn(" ,;\t\n\r")
+    _fun_cmd_arglist   = _fun_cmd_arg + ZeroOrMore(NotAny(_noncontent)
+                                                   + Optional(_WHITE)
+                                                   + _fun_cmd_arg)
+    _funcall_cmd_style = Group(_name + NotAny(_EOL)
+                               + _WHITE + NotAny(_noncmd_arg_start)
+                               + _fun_cmd_arglist('arguments')
+                              )('command statement')
+
+    ParserElement.setDefaultWhitespaceChars(' \t\n\r')
+
+    # Function calls without parentheses.
+    #
+    # A final bit of nastiness in MATLAB is the ability to invoke a function
+    # without using parenthese, such as this example:
+    #
+    #   if (rand > 0.50)
+    #       A=1;
+    #   end;
+    #
+    # Currently, we only recognize this case if the function involved is a
+    # known MATLAB function or a function defined somewhere in the file.
+    # This is done in post processing, but we tag the possible cases during
+    # the initial parse by looking for _ambiguous_id instead of a plain _id.
+    # This is why the following seemingly-pointless definition exists, and is
+    # used instead of using _id directly in _operand and other similar places
+    # later.
+
+    _ambiguous_id = Group(NotAny(_reserved) + _identifier)('ambiguous id')
+
+    # And now, general expressions and operators outside of arrays.
+
+    _operand = Group(_funcall_or_array \
+                     | _struct_access  \
+                     | _array_access   \
+                     | _cell_array     \
+                     | _bare_array     \
+                     | _fun_handle     \
+                     | _ambiguous_id   \
+                     | _NUMBER         \
+                     | _STRING)
+
+    _transp_op     = NotAny(_WHITE) + _NC_TRANSP ^ NotAny(_WHITE) + _CC_TRANSP
+    _uplusminusneg = _UPLUS ^ _UMINUS ^ _UNOT
+    _plusminus     = _PLUS ^ _MINUS
+    _timesdiv      = _TIMES ^ _ELTIMES ^ _MRDIVIDE ^ _MLDIVIDE ^ _RDIVIDE ^ _LDIVIDE
+    _power         = _MPOWER ^ _ELPOWER
+    _logical_op    = _LE ^ _GE ^ _NE ^ _LT ^ _GT ^ _EQ
+    _colon_op      = _COLON('colon operator')
+
+    # In MATLAB, power and transpose have higher precedence than the unary
+    # operators.  The next hack solves a problem in correctly matching
+    # expressions in which a unary operator comes immediately after another
+    # operator, particularly the _power operators.  The problem occurs
+    # because of how infixNotation() constructs the matching expression
+    # left-to-right as it goes down the list of arguments in the order given.
+    # To get the right behavior, we have to set up _power to have higher
+    # precendence than unary operators, which seems easy at first but it
+    # turns out it interacts with the right-associative nature of unary
+    # operators (_uplusminusneg).  For reasons that are not 100% clear, if
+    # the first few terms are in the following (more intuitive, natural) order,
+    #
+    #   _expr <<= infixNotation(_operand, [
+    #        (Group(_transp_op),     1, opAssoc.LEFT, makeLRlike(1)),
+    #        (Group(_power),         2, opAssoc.LEFT, makeLRlike(2)),
+    #        (Group(_uplusminusneg), 1, opAssoc.RIGHT),
+    #       ...
+    #
+    # then an expression such as 2^-3 does not match.  The following hack
+    # provides a second expression (_uplusminusneg_after) for matching the
+    # unary operators if and only if they appear in the second operand of a
+    # binary operator.
+    #
+    # The operator precedence rules in MATLAB are listed here:
+    # http://www.mathworks.com/help/matlab/matlab_prog/operator-precedence.html
+
+    #
+    # The operator table is handed to PrecedenceClimber (in grammar_utils.py),
+    # which accepts the same arguments as PyParsing's infixNotation() and
+    # produces exactly the same results, but parses each operand only once
+    # instead of once or more per precedence level.
+
+    _not_unary = _transp_op ^ _plusminus ^ _timesdiv ^ _power ^ _logical_op ^ _COLON
+    _uplusminusneg_after = FollowedBy(_not_unary) + _UPLUS \
+                           ^ FollowedBy(_not_unary) + _UMINUS \
+                           ^ FollowedBy(_not_unary) + _UNOT
+
+    _expr        <<= PrecedenceClimber(_operand, [
+        (Group(_transp_op),                    1, opAssoc.LEFT, makeLRlike(1)),
+        (Group(_uplusminusneg_after),          1, opAssoc.RIGHT),
+        (Group(_power),                        2, opAssoc.LEFT, makeLRlike(2)),
+        (Group(_uplusminusneg),                1, opAssoc.RIGHT),
+        (Group(_timesdiv),                     2, opAssoc.LEFT, makeLRlike(2)),
+        (Group(_plusminus),                    2, opAssoc.LEFT, makeLRlike(2)),
+        ((Group(_colon_op), Group(_colon_op)), 3, opAssoc.LEFT, makeLRlike(3)),
+        (Group(_colon_op),                     2, opAssoc.LEFT, makeLRlike(2)),
+        (Group(_logical_op),                   2, opAssoc.LEFT, makeLRlike(2)),
+        (Group(_AND),                          2, opAssoc.LEFT, makeLRlike(2)),
+        (Group(_OR),                           2, opAssoc.LEFT, makeLRlike(2)),
+        (Group(_SHORT_AND),                    2, opAssoc.LEFT, makeLRlike(2)),
+        (Group(_SHORT_OR),                     2, opAssoc.LEFT, makeLRlike(2)),
+    ])
+
+    # The 'end' keyword is special because of its many meanings.  One applies
+    # when indexing arrays.  This next definition is so we can detect that.
+
+    _end_op        = Keyword('end')('end operator')
+
+    # MATLAB does something evil: the parsing behavior changes inside array
+    # expressions.  This can be seen by typing the following expressions into
+    # the MATLAB interpreter:
+    #
+    # 1 -1          result: 0
+    # [1 -1]        result: array of 2 elements, [1, -1]
+    # [1 - 1]       result: array of 1 element, [0]
+    # [1 -1 - 1]    result: array of 2 elements, [1, -2]
+    # 1 - 1         result: 0
+    # 1-1           result: 0
+    # [1- 1]        result: array of 1 element, [0]
+    # [1 2 -3 + 4]  result: array of 3 elements, [1, 2, 1]
+    # [1 2 -3 +4]   result: array of 4 elements, [1, 2, -3, 4]
+    #
+    # Another example was mentioned earlier in this file, involving the
+    # definition of _one_sub.  Suppose that "a" is an array of one item:
+    #
+    #    a(1)        => one item, the value inside the array "a" at location 1
+    #    a (1)       => one item, the value inside the array "a" at location 1
+    #    [a (1)]     => an array of TWO items, the value of a and 1
+    #    [(a (1))]   => an array of ONE item, a(1)
+    #
+    # The only solution I have found is to define the expression grammar
+    # differently for the case of array contents.  This is the reason for
+    # _expr_in_array, _funcall_or_array_in_array, and _operand_in_array
+    # below; these versions change the interpretation of whitespace to make
+    # it significant, to cause matching to prefer different interpretations
+    # when used inside arrays.  Along with this, the definitions of arrays
+    # and their subscripts earlier in this file also have explicit uses of
+    # _WHITE in them, which wouldn't be necessary except for the fact that
+    # _operand_in_array below uses leaveWhitespace() to cause whitespace to
+    # be significant.
+    #
+    # Look, I know it's ugly.
+
+    _plusminus_array = (OneOrMore(_WHITE) + (_PLUS ^ _MINUS).leaveWhitespace() + OneOrMore(_WHITE)) \
+                       | (NotAny(_WHITE) + (_PLUS ^ _MINUS).leaveWhitespace())
+
+    _funcall_or_array_in_array = Group(_fun_access('name')
+                                       + _LPAR.copy().leaveWhitespace() + _opt_arglist + _RPAR
+                                      ).setResultsName('array or function')  # noqa
+
+    _operand_in_array = Group(_end_op
+                              | _TILDE
+                              | _funcall_or_array_in_array
+                              | _struct_access
+                              | _array_access
+                              | _cell_array
+                              | _bare_array
+                              | _fun_handle
+                              | _ambiguous_id
+                              | _NUMBER
+                              | _STRING
+                             ).leaveWhitespace()
+
+    _expr_in_array <<= PrecedenceClimber(_operand_in_array, [
+        (Group(_transp_op),                    1, opAssoc.LEFT, makeLRlike(1)),
+        (Group(_uplusminusneg_after),          1, opAssoc.RIGHT),
+        (Group(_power),                        2, opAssoc.LEFT, makeLRlike(2)),
+        (Group(_uplusminusneg),                1, opAssoc.RIGHT),
+        (Group(_timesdiv),                     2, opAssoc.LEFT, makeLRlike(2)),
+        (Group(_plusminus_array),              2, opAssoc.LEFT, makeLRlike(2)),
+        ((Group(_colon_op), Group(_colon_op)), 3, opAssoc.LEFT, makeLRlike(3)),
+        (Group(_colon_op),                     2, opAssoc.LEFT, makeLRlike(2)),
+        (Group(_logical_op),                   2, opAssoc.LEFT, makeLRlike(2)),
+        (Group(_AND),                          2, opAssoc.LEFT, makeLRlike(2)),
+        (Group(_OR),                           2, opAssoc.LEFT, makeLRlike(2)),
+        (Group(_SHORT_AND),                    2, opAssoc.LEFT, makeLRlike(2)),
+        (Group(_SHORT_OR),                     2, opAssoc.LEFT, makeLRlike(2)),
+    ])
+
+    # Assignments.
+    #
+    # We tag the LHS with 'lhs' whether it's a single variable or an array,
+    # because we can distinguish the cases by examining the parsed object.
+
+    _lhs_var        = Group(_id)
+    _simple_assign  = Group(_lhs_var('lhs') + _EQUALS + _expr('rhs'))
+    _lhs_array      = Group(_struct_access | _array_access | _cell_access | _bare_array)
+    _other_assign   = Group(_lhs_array('lhs') + _EQUALS + _expr('rhs'))
+    _assignment     = (_other_assign | _simple_assign).setResultsName('assignment')
+
+    # Commands.
+    #
+    # Shell commands don't respect ellipses or delimiters, so we use EOL
+    # explicitly here and match _shell_cmd at the _matlab_syntax level.
+
+    _shell_cmd_cmd  = Group(restOfLine)('command')
+    _shell_cmd      = Group(Group('!' + _shell_cmd_cmd + _EOL)('shell command'))
+
+    # Control-flow statements.
+
+    _control_stmt   = Forward()
+    _stmt_list      = Forward()
+
+    _single_expr    = _expr('expression') + Optional(FollowedBy(_noncontent))
+    _test_expr      = _single_expr
+    _body           = Group(_stmt_list)                    ('body')
+    _break_stmt     = _BREAK                               ('break statement')
+    _return_stmt    = _RETURN                              ('return statement')
+    _continue_stmt  = _CONTINUE                            ('continue statement')
+
+    _while_stmt     = Group(_WHILE + _test_expr
+                            + _body
+                            + _END)                        ('while statement')
+
+    _loop_var       = Group(_id)                           ('loop variable')
+    _for_version1   = _FOR + _loop_var + _EQUALS + _test_expr \
+                      + _body \
+                      + _END
+    _for_version2   = _FOR + _LPAR + _loop_var + _EQUALS + _expr('expression') + _RPAR \
+                      + _body \
+                      + _END
+    _for_stmt       = Group(_for_version2 | _for_version1) ('for statement')
+
+    _catch_var      = Group(_id)                           ('catch variable')
+    ParserElement.setDefaultWhitespaceChars(' \t')
+    _catch_term     = _CATCH + Optional(NotAny(_noncontent) + _catch_var) + _noncontent
+    ParserElement.setDefaultWhitespaceChars(' \t\n\r')
+    _catch_body     = Group(_stmt_list)                    ('catch body')
+    _try_stmt       = Group(_TRY
+                            + _body
+                            + Optional(_catch_term)
+                            + _catch_body
+                            + _END)                        ('try statement')
+
+    _else_stmt      = Group(_ELSE + _body)                 ('else statement')
+    _elseif_stmt    = Group(_ELSEIF + _test_expr + _body)
+    _if_stmt        = Group(_IF + _test_expr
+                            + _body
+                            + ZeroOrMore(_elseif_stmt)     ('elseif statements')
+                            + Optional(_else_stmt)
+                            + _END).setResultsName         ('if statement')
+
+    _case_stmt      = Group(_CASE + _test_expr + _body)
+    _switch_other   = Group(_OTHERWISE + _body)            ('otherwise statement')
+    _switch_stmt    = Group(_SWITCH + _test_expr
+                            + ZeroOrMore(_case_stmt)       ('case statements')
+                            + Optional(_switch_other)
+                            + _END)                        ('switch statement')
+
+    _control_stmt  <<= Group(PredictiveMatchFirst([_while_stmt,
+                                                   _if_stmt,
+                                                   _switch_stmt,
+                                                   _for_stmt,
+                                                   _try_stmt,
+                                                   _continue_stmt,
+                                                   _break_stmt,
+                                                   _return_stmt])
+                            ).setResultsName('control statement')  # noqa
+
+    # Global and persistent declarations.
+
+    _scope_type     = Group(_PERSISTENT | _GLOBAL)         ('type')
+    ParserElement.setDefaultWhitespaceChars(' \t')
+    _scope_var_list = Group(_id) + ZeroOrMore(_WHITE + Group(_id)).leaveWhitespace()
+    _scope_args     = _scope_var_list                      ('variables list')
+    ParserElement.setDefaultWhitespaceChars(' \t\n\r')
+    _scope_stmt     = Group(_scope_type + _scope_args)     ('scope declaration')
+
+    # Standalone expressions.
+    #
+    # If an expression is written on a line outside of another construct,
+    # it needs to be separated from other expressions by commas or newlines.
+
+    ParserElement.setDefaultWhitespaceChars(' \t')
+    _standalone_expr = _expr('standalone expression') + FollowedBy(_noncontent)
+    ParserElement.setDefaultWhitespaceChars(' \t\n\r')
+
+    # Statements and statement lists.
+    #
+    # Statement lists are almost the full _matlab_syntax, except that
+    # they don't include function definitions.
+    #
+    # PredictiveMatchFirst and PredictiveOr (in grammar_utils.py) are used
+    # here and in the definitions that follow in place of "|" and "^".  They
+    # behave the same way, but look at the next token in the input first,
+    # and only try the alternatives that can start with it.  So for example,
+    # a line beginning with '%' only gets tried as a comment, and a line
+    # beginning with 'while' only as a while statement, instead of each line
+    # being tried as every kind of statement in turn.
+
+    _stmt           = Group(PredictiveMatchFirst([_control_stmt,
+                                                  _scope_stmt,
+                                                  _assignment,
+                                                  _funcall_cmd_style,
+                                                  _standalone_expr]))
+    _stmt_list    <<= ZeroOrMore(PredictiveOr([_stmt, _shell_cmd, _noncontent]))
+
+    # Function definitions.
+    #
+    # When a function returns multiple values and the LHS is an array
+    # expression in square brackets, a bare tilde can be put in place of an
+    # argument value to indicate that the value is to be ignored.
+
+    _fun_body       = Forward()
+
+    _single_value   = Group(_id) | Group(_TILDE)
+    _comma_values   = delimitedList(_single_value)
+    _space_values   = OneOrMore(_single_value)
+    _multi_values   = _LBRACKET + Optional(_comma_values ^ _space_values) + _RBRACKET
+    _fun_outputs    = Group(_multi_values) | Group(_single_value)
+    _fun_paramslist = _LPAR + _opt_paramlist + _RPAR
+
+    # The 'end' in a function definition is optional in some cases and not in
+    # others.  The use of 'end' is required for nested function definitions,
+    # which means that we need two variants of function bodies too.  This
+    # leads to our final grammatical indiginity: two expressions for function
+    # definitions, which are used in the overall definition of _matlab_file
+    # such that _matlab_file tries first one variant and then the other.
+    # In the following two definitions, note that both the use of 'end' and
+    # the definition of the body are different.
+
+    _fun_without_end = Group(_FUNCTION
+                             + Optional(_fun_outputs('output list') + _EQUALS())
+                             + Optional(_WHITE) + _name
+                             + Optional(_fun_paramslist)
+                             + Group(_stmt_list)('body')
+                            ).setResultsName('function definition')
+
+    _fun_with_end   = Group(_FUNCTION
+                            + Optional(_fun_outputs('output list') + _EQUALS())
+                            + Optional(_WHITE) + _name
+                            + Optional(_fun_paramslist)
+                            + Group(_fun_body)('body')
+                            + _END
+                           ).setResultsName('function definition')
+
+    # The next two definitions are only used to make the grouping level the
+    # same as other statements in the overall grammar.
+
+    _fun_def_shallow = Group(_fun_without_end)
+    _fun_def_deep    = Group(_fun_with_end)
+
+    # And now, the function body for function definitions that permit nesting.
+    # (Bodies that don't allow function nesting simply use _stmt_list.)
+
+    _fun_body <<= ZeroOrMore(PredictiveOr([_fun_def_deep, _stmt, _shell_cmd,
+                                           _noncontent]))
+
+    # The complete MATLAB file syntax.
+    #
+    # Since a file cannot mix the style of function definitions that use ends
+    # (either they all have to have 'end', or none do), we have two forms of
+    # MATLAB files.
+
+    _matlab_file = (ZeroOrMore(PredictiveOr([_fun_def_shallow, _stmt,
+                                             _shell_cmd, _noncontent]))
+                    ^ ZeroOrMore(PredictiveOr([_fun_def_deep, _stmt,
+                                               _shell_cmd, _noncontent])))
+
+    # Continuations.  This is used by MatlabGrammar._preprocess(); see the
+    # explanations there.
+
+    _continuation  = Combine(_ELLIPSIS.leaveWhitespace()
+                             + Optional(CharsNotIn('\n\r\f')('comment'))
+                             + _EOL + _SOL)
+
+    _continuation.setParseAction(lambda t: ' ')
+
+    # Debugging.
+    # .........................................................................
+
+    # Name each grammar object after itself, so that when PyParsing prints
+    # debugging output, it uses the name rather than a generic regexp term.
+
+    _to_name = [ _AND, _CC_TRANSP, _COLON, _COMMA, _DOT, _ELLIPSIS, _ELPOWER,
+                 _ELTIMES, _END, _EOL, _EQ, _EQUALS, _EXPONENT, _FLOAT,
+                 _FUNCTION, _GE, _GT, _INTEGER, _LBRACE, _LBRACKET, _LDIVIDE,
+                 _LE, _LPAR, _LT, _MINUS, _MLDIVIDE, _MPOWER, _MRDIVIDE,
+                 _NC_TRANSP, _NE, _NUMBER, _OR, _PLUS, _RBRACE, _RBRACKET,
+                 _RDIVIDE, _RPAR, _SEMI, _SHORT_AND, _SHORT_OR, _SOL,
+                 _STRING, _TILDE, _TIMES, _UMINUS, _UNOT, _UPLUS, _WHITE,
+                 _ambiguous_id, _anon_handle, _array_access, _array_args,
+                 _array_base, _assignment, _bare_array, _bare_cell,
+                 _block_c_end, _block_c_start, _block_comment, _body,
+                 _break_stmt, _call_args, _case_stmt, _catch_body,
+                 _catch_term, _catch_var, _cell_access, _cell_args,
+                 _cell_array, _cell_base, _cell_nested, _colon_op,
+                 _comma_subs, _comma_values, _comment, _continue_stmt,
+                 _control_stmt, _control_stmt, _dash_term, _delimiter,
+                 _else_stmt, _elseif_stmt, _end_op, _expr, _expr_in_array,
+                 _expr_in_array, _for_stmt, _for_version1, _for_version2,
+                 _fun_access, _fun_body, _fun_cmd_arg, _fun_cmd_arglist,
+                 _fun_def_deep, _fun_def_shallow, _fun_handle, _fun_outputs,
+                 _fun_paramslist, _fun_with_end, _fun_without_end,
+                 _funcall_cmd_style, _funcall_or_array, _id , _identifier,
+                 _if_stmt, _lhs_array, _lhs_var, _line_c_start,
+                 _line_comment, _logical_op, _loop_var, _matlab_file,
+                 _most_ops, _multi_values, _name, _named_handle,
+                 _noncmd_arg_start, _noncontent, _not_unary, _one_param,
+                 _one_row, _one_sub, _operand, _operand_in_array,
+                 _opt_arglist, _opt_paramlist, _other_assign, _paramlist,
+                 _plusminus, _plusminus_array, _power, _reserved,
+                 _return_stmt, _row_sep, _rows, _scope_args, _scope_stmt,
+                 _scope_type, _scope_var_list, _shell_cmd, _shell_cmd_cmd,
+                 _simple_assign, _simple_struct, _simple_struct_base,
+                 _single_expr, _single_value, _space_subs, _space_values,
+                 _standalone_expr, _stmt, _stmt_list, _stmt_list,
+                 _struct_access, _struct_base, _struct_field, _switch_other,
+                 _switch_stmt, _test_expr, _timesdiv, _transp_op, _try_stmt,
+                 _uplusminusneg, _uplusminusneg_after, _while_stmt]
+
+    # The next variable and function are for printing low-level PyParsing
+    # matches.  You can reduce the amount of output by changing the value
+    # (which is _to_name by default) to a list of specific objects.  E.g.:
+    #    _to_print_debug = [_cell_access, _cell_array, _bare_cell, _expr]
+
+    _to_print_debug = _to_name # [_fun_body, _fun_def_deep, _fun_def_shallow, _stmt, _matlab_file]
+
+
+# Name each grammar object in _to_name after the attribute of MatlabSyntax
+# that holds it.  _object_names maps each object (by id) to the first
+# attribute name under which it appears in the class definition.
+
+_object_names = {}
+for name, thing in vars(MatlabSyntax).items():
+    if isinstance(thing, ParserElement):
+        _object_names.setdefault(id(thing), name)
+
+for obj in MatlabSyntax._to_name:
+    obj.setName(_object_names[id(obj)])
@@ -0,0 +1,1126 @@
+#!/usr/bin/env python
+#
+# @file    rd_parser.py
+# @brief   Hand-written lexer and recursive-descent parser for MATLAB
+# @author  Michael Hucka
+#
+# <!---------------------------------------------------------------------------
+# This software is part of MOCCASIN, the Model ODE Converter for Creating
+# Automated SBML INteroperability. Visit https://github.com/sbmlteam/moccasin/.
+#
+# Copyright (C) 2014-2016 jointly by the following organizations:
+#  1. California Institute of Technology, Pasadena, CA, USA
+#  2. Icahn School of Medicine at Mount Sinai, New York, NY, USA
+#  3. Boston University, Boston, MA, USA
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation.  A copy of the license agreement is provided in the
+# file named "COPYING.txt" included with this software distribution and also
+# available online at https://github.com/sbmlteam/moccasin/.
+# ------------------------------------------------------------------------- -->
+
+# Basic principles of the recursive-descent parser
+# ------------------------------------------------
+#
+# This module is an alternative to the PyParsing grammar in
+# pyparsing_grammar.py.  It is selected by creating the parser as
+# MatlabGrammar(backend="rd"), and it produces exactly the same MatlabNode
+# objects that ParseResultsTransformer produces from the PyParsing results,
+# so that everything downstream of the first pass (type inference, the
+# converter, etc.) is unaffected by the choice of backend.  The reason it
+# exists is speed: the PyParsing grammar relies on packrat memoization and a
+# great deal of backtracking, and for larger models it can take minutes to
+# parse a file that this parser handles in a fraction of a second.
+#
+# The lexer is not a separate pass that produces a token stream.  MATLAB's
+# lexical structure depends on the syntactic context: a single quote can
+# start a string or be a transpose operator, whitespace separates elements
+# inside square brackets but not outside, "command syntax" turns the rest
+# of a line into unquoted string arguments, and so on.  So instead, the
+# lexer is a set of small recognizers (compiled regular expressions and
+# the _match_*() and _skip_*() methods below) that the parser calls at the
+# point where it knows which interpretation applies.
+#
+# The parser follows the structure of the PyParsing grammar closely, and
+# where the PyParsing grammar makes a choice between alternatives, this
+# parser makes the same choice.  The main points are:
+#
+#  1) A file is parsed first assuming that function definitions do not use
+#     'end' (and hence cannot be nested).  If that fails to consume the
+#     whole input, the file is parsed again assuming that they do.
+#
+#  2) Statements are tried in the order control statement, scope
+#     declaration, assignment, command-syntax function call, and standalone
+#     expression.  Backtracking only happens between these alternatives.
+#
+#  3) Expressions are parsed by precedence climbing, in two modes: the
+#     normal mode, and the mode used for elements of square-bracket and
+#     cell arrays, where whitespace is significant.  (See the comments
+#     about _expr_in_array in pyparsing_grammar.py for the gory details.)
+#
+#  4) Whether "a(...)" is an Ambiguous function-call-or-array-reference or
+#     a definite ArrayRef is decided on the same basis as in grammar.py:
+#     bare ':', bare '~' and 'end' can only be array subscripts.
+#
+# Errors are reported by raising PyParsing's ParseException, so that
+# callers of MatlabGrammar see the same behavior regardless of backend.
+# This parser accepts some inputs that the PyParsing grammar rejects, but
+# it never interprets valid input differently.
+
+from __future__ import print_function
+import re
+from pyparsing import ParseException
+try:
+    from matlab import *
+except:
+    from .matlab import *
+
+
+# Lexical elements.
+# .............................................................................
+
+_RESERVED = frozenset(['break', 'case', 'catch', 'classdef', 'continue',
+                       'else', 'elseif', 'end', 'for', 'function', 'global',
+                       'if', 'otherwise', 'parfor', 'persistent', 'return',
+                       'spmd', 'switch', 'try', 'while'])
+
+# Characters that may not appear next to a keyword (same as PyParsing's
+# default for Keyword objects).
+
+_KEYWORD_CHARS = frozenset('abcdefghijklmnopqrstuvwxyz'
+                           'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_$')
+
+_DIGITS = frozenset('0123456789')
+
+_identifier_re   = re.compile(r'[A-Za-z][A-Za-z0-9_]*')
+_number_re       = re.compile(r'(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[EeDd][+-]?[0-9]+)?')
+_string_re       = re.compile(r"'(?:[^'\n\r]|'')*'")
+_dash_term_re    = re.compile(r'-[A-Za-z][A-Za-z0-9_]*')
+_cmd_word_re     = re.compile(r'[^ ,;\t\n\r]+')
+_white_re        = re.compile(r'[\n\r]*[ \t]+')
+_continuation_re = re.compile(r'\.\.\.[^\n\r\f]*\n')
+
+# Binary operators, longest first so that a simple scan finds the longest
+# match.  The sets that follow are the operators at each precedence level.
+
+_BINARY_OPS   = ['||', '&&', '<=', '>=', '==', '~=', '.*', './', '.\\', '.^',
+                 '|', '&', '<', '>', '+', '-', '*', '/', '\\', '^', ':']
+
+# Operators that, when followed by whitespace, prevent a statement from
+# being interpreted as a command-syntax function call.
+
+_MOST_OPS     = ['||', '&&', '<=', '>=', '==', '~=', '.*', './', '.\\', '.^',
+                 ".'", '|', '&', '<', '>', '+', '-', '*', '/', '\\', '^', ':']
+
+_LOGICAL_OPS  = frozenset(['<', '<=', '>', '>=', '==', '~='])
+_PLUSMINUS    = frozenset(['+', '-'])
+_TIMESDIV     = frozenset(['*', '.*', '/', '\\', './', '.\\'])
+_POWER        = frozenset(['^', '.^'])
+_COLON        = frozenset([':'])
+_AND_OR       = [frozenset(['||']), frozenset(['&&']), frozenset(['|']),
+                 frozenset(['&'])]
+
+# Keywords that begin control statements.
+
+_CONTROL_WORDS = frozenset(['while', 'if', 'switch', 'for', 'try',
+                            'continue', 'break', 'return'])
+
+
+def preprocess(text):
+    """Performs the same preprocessing as MatlabGrammar._preprocess():
+    DOS line endings are normalized and continuation lines are joined.
+    """
+    text = text.replace('\r\n', '\n')
+    return _continuation_re.sub(' ', text)
+
+
+def unquote(text):
+    """Returns the contents of a quoted MATLAB string literal, processed the
+    same way as PyParsing's QuotedString processes them.  Only doubled
+    quotes are unescaped; backslash sequences such as \\n are left for
+    MATLAB functions like sprintf() to interpret, as they are in MATLAB.
+    """
+    return text[1:-1].replace("''", "'")
+
+
+class _NoMatch(Exception):
+    """Internal exception used to backtrack out of a failed alternative."""
+    pass
+
+
+# Parser.
+# .............................................................................
+
+class MatlabRDParser(object):
+    """Recursive-descent parser for MATLAB input.
+
+    The input must already have been preprocessed (see preprocess()).  The
+    result of parse() is a list of MatlabNode objects, identical to what the
+    first pass over the PyParsing results produces, except that function
+    definitions do not yet have contexts; those are created by MatlabGrammar.
+    Identifier and Number nodes are taken from the LeafTable `leaves`, or
+    from a new one if none is given.
+    """
+
+    def __init__(self, text, leaves=None):
+        self._leaves     = leaves if leaves is not None else LeafTable()
+        self._text       = text.expandtabs()
+        self._len        = len(self._text)
+        self._pos        = 0
+        self._in_array   = False
+        self._subscripts = []
+        self._furthest   = 0
+
+
+    def parse(self):
+        # Files with function definitions without 'end' are tried first.
+        # Same as with the grammar's _matlab_file, we only use the deep form
+        # if the shallow one does not get to the end of the input.
+        nodes = self._parse_file(deep=False)
+        if self._pos < self._len:
+            nodes = self._parse_file(deep=True)
+        if self._pos < self._len:
+            loc = max(self._pos, self._furthest)
+            raise ParseException(self._text, loc, 'Expected end of text')
+        return nodes
+
+
+    def _parse_file(self, deep):
+        self._pos = 0
+        nodes = self._parse_stmt_list('deep' if deep else 'shallow')
+        self._skip_wsnl()
+        return nodes
+
+
+    # Low-level scanning.
+    # .........................................................................
+
+    def _fail(self):
+        if self._pos > self._furthest:
+            self._furthest = self._pos
+        raise _NoMatch()
+
+
+    def _peek(self, offset=0):
+        loc = self._pos + offset
+        return self._text[loc] if loc < self._len else ''
+
+
+    def _skip_spaces(self):
+        text = self._text
+        while self._pos < self._len and text[self._pos] in ' \t':
+            self._pos += 1
+
+
+    def _skip_wsnl(self):
+        text = self._text
+        while self._pos < self._len and text[self._pos] in ' \t\n\r':
+            self._pos += 1
+
+
+    def _skip_operand_space(self):
+        # Operands may be preceded by line breaks, except at the start of
+        # elements inside arrays, where line breaks separate rows.  (Operands
+        # that follow an operator may always be preceded by line breaks.)
+        if self._in_array:
+            self._skip_spaces()
+        else:
+            self._skip_wsnl()
+
+
+    def _keyword_at(self, loc):
+        """Returns the reserved word at 'loc', or None."""
+        match = _identifier_re.match(self._text, loc)
+        if not match or match.group() not in _RESERVED:
+            return None
+        end = match.end()
+        if end < self._len and self._text[end] in _KEYWORD_CHARS:
+            return None
+        if loc > 0 and self._text[loc - 1] in _KEYWORD_CHARS:
+            return None
+        return match.group()
+
+
+    def _match_keyword(self, word):
+        self._skip_wsnl()
+        if self._keyword_at(self._pos) != word:
+            self._fail()
+        self._pos += len(word)
+
+
+    def _match_identifier(self):
+        """Matches an identifier that is not a reserved word."""
+        match = _identifier_re.match(self._text, self._pos)
+        if not match or self._keyword_at(self._pos):
+            self._fail()
+        self._pos = match.end()
+        return match.group()
+
+
+    def _match_char(self, char):
+        self._skip_spaces()
+        if self._peek() != char:
+            self._fail()
+        self._pos += 1
+
+
+    def _match_white(self, loc):
+        """Returns the end of a run of whitespace as matched by the grammar's
+        _WHITE (optional line breaks followed by spaces), or None."""
+        match = _white_re.match(self._text, loc)
+        return match.end() if match else None
+
+
+    def _match_white_run(self, loc):
+        """Returns the end of any number of consecutive _WHITE matches."""
+        end = self._match_white(loc)
+        while end is not None:
+            loc = end
+            end = self._match_white(loc)
+        return loc
+
+
+    def _binary_op_at(self, loc):
+        for op in _BINARY_OPS:
+            if self._text.startswith(op, loc):
+                return op
+        return None
+
+
+    def _at_eol(self, loc):
+        text = self._text
+        while loc < self._len and text[loc] in ' \t\r':
+            loc += 1
+        return loc >= self._len or text[loc] == '\n'
+
+
+    def _at_noncontent(self, loc):
+        """True if a delimiter, comment, or end of line follows 'loc'."""
+        text = self._text
+        while loc < self._len and text[loc] in ' \t':
+            loc += 1
+        if loc < self._len and text[loc] in ',;':
+            return True
+        if self._at_eol(loc):
+            return True
+        while loc < self._len and text[loc] in ' \t\n\r':
+            loc += 1
+        return loc < self._len and text[loc] == '%'
+
+
+    def _try(self, method, *args):
+        """Calls method(*args), restoring the position if it fails."""
+        start = self._pos
+        try:
+            return method(*args)
+        except _NoMatch:
+            self._pos = start
+            return None
+
+
+    # Comments, delimiters and shell commands.
+    # .........................................................................
+
+    def _comment(self):
+        text = self._text
+        start = self._pos
+        if text.startswith('%{', start):
+            end = text.find('%}', start + 2)
+            if end >= 0:
+                # Leading whitespace is not part of the content.
+                self._pos = start + 2
+                self._skip_wsnl()
+                content = text[min(self._pos, end):end]
+                self._pos = end + 2
+                return Comment(content=content)
+        end = text.find('\n', start)
+        if end < 0:
+            end = self._len
+        self._pos = end + 1
+        return Comment(content=text[start + 1:end])
+
+
+    def _shell_command(self):
+        end = self._text.find('\n', self._pos)
+        if end < 0:
+            end = self._len
+        cmd = self._text[self._pos + 1:end]
+        self._pos = end + 1
+        backgrounded = cmd.strip().endswith('&')
+        if backgrounded:
+            cmd = cmd[:cmd.rfind('&') - 1]
+        return ShellCommand(command=cmd, background=backgrounded)
+
+
+    def _skip_noncontent(self):
+        """Skips a delimiter, comment or end of line; fails if none."""
+        if not self._at_noncontent(self._pos):
+            self._fail()
+        self._skip_spaces()
+        if self._peek() in (',', ';'):
+            self._pos += 1
+            return
+        start = self._pos
+        self._skip_wsnl()
+        if self._peek() == '%':
+            self._comment()
+        else:
+            end = self._text.find('\n', start)
+            self._pos = self._len if end < 0 else end + 1
+
+
+    # Statement lists and function definitions.
+    # .........................................................................
+
+    def _parse_stmt_list(self, fundefs=None):
+        """Parses statements until something that is not a statement.  The
+        value of 'fundefs' is None if function definitions are not allowed,
+        otherwise 'shallow' or 'deep' (meaning with 'end')."""
+        nodes = []
+        text = self._text
+        while True:
+            self._skip_wsnl()
+            if self._pos >= self._len:
+                break
+            char = text[self._pos]
+            if char in ',;':
+                self._pos += 1
+            elif char == '%':
+                nodes.append(self._comment())
+            elif char == '!':
+                nodes.append(self._shell_command())
+            else:
+                if fundefs and self._keyword_at(self._pos) == 'function':
+                    node = self._try(self._function_definition, fundefs == 'deep')
+                else:
+                    node = self._try(self._statement)
+                if node is None:
+                    break
+                nodes.append(node)
+        return nodes
+
+
+    def _function_definition(self, deep):
+        self._match_keyword('function')
+        output = self._try(self._function_outputs)
+        self._skip_wsnl()
+        name = self._leaves.identifier(self._match_identifier())
+        params = self._try(self._function_parameters)
+        if deep:
+            body = self._parse_stmt_list('deep')
+            self._match_keyword('end')
+        else:
+            body = self._parse_stmt_list()
+        return FunDef(name=name, parameters=params, output=output, body=body,
+                      context=None)
+
+
+    def _function_outputs(self):
+        self._skip_wsnl()
+        if self._peek() == '[':
+            self._pos += 1
+            output = []
+            while True:
+                self._skip_wsnl()
+                if self._peek() == ']':
+                    self._pos += 1
+                    break
+                if output and self._peek() == ',':
+                    self._pos += 1
+                    self._skip_wsnl()
+                output.append(self._single_value())
+        else:
+            output = [self._single_value()]
+        self._match_char('=')
+        return output
+
+
+    def _single_value(self):
+        if self._peek() == '~':
+            self._pos += 1
+            return Special(value='~')
+        return self._leaves.identifier(self._match_identifier())
+
+
+    def _function_parameters(self):
+        self._match_char('(')
+        params = []
+        while True:
+            self._skip_wsnl()
+            if self._peek() == ')':
+                self._pos += 1
+                break
+            if params:
+                self._match_char(',')
+                self._skip_wsnl()
+            params.append(self._single_value())
+        return params or None
+
+
+    # Statements.
+    # .........................................................................
+
+    def _statement(self):
+        keyword = self._keyword_at(self._pos)
+        if keyword:
+            if keyword in _CONTROL_WORDS:
+                return self._control_statement(keyword)
+            elif keyword in ('global', 'persistent'):
+                return self._scope_declaration(keyword)
+            self._fail()
+        node = self._try(self._assignment)
+        if node is not None:
+            return node
+        if _identifier_re.match(self._text, self._pos):
+            node = self._try(self._command_statement)
+            if node is not None:
+                return node
+        return self._standalone_expression()
+
+
+    def _assignment(self):
+        if self._peek() == '[':
+            lhs = self._array(']')
+        else:
+            lhs = self._reference(lhs=True)
+        self._skip_spaces()
+        if self._peek() != '=' or self._peek(1) == '=':
+            self._fail()
+        self._pos += 1
+        rhs = self._expression()
+        return Assignment(lhs=lhs, rhs=rhs)
+
+
+    def _command_statement(self):
+        name = self._leaves.identifier(self._match_identifier())
+        text = self._text
+        if self._at_eol(self._pos) or self._peek() not in ' \t':
+            self._fail()
+        self._skip_spaces()
+        loc = self._pos
+        if self._peek() in ('=', '(', ',', ';', '%'):
+            self._fail()
+        for op in _MOST_OPS:
+            if text.startswith(op, loc):
+                if self._match_white(loc + len(op)) is not None:
+                    self._fail()
+                break
+        args = [self._command_argument(self._pos)]
+        while not self._at_noncontent(self._pos):
+            loc = self._match_white(self._pos) or self._pos
+            arg = self._try(self._command_argument, loc)
+            if arg is None:
+                break
+            args.append(arg)
+        return FunCall(name=name, args=args)
+
+
+    def _command_argument(self, loc):
+        text = self._text
+        start = loc
+        while start < self._len and text[start] in ' \t\n\r':
+            start += 1
+        match = _string_re.match(text, start)
+        if match:
+            self._pos = match.end()
+            return String(value=unquote(match.group()))
+        start = loc
+        while start < self._len and text[start] in ' \t':
+            start += 1
+        match = _dash_term_re.match(text, start) or _cmd_word_re.match(text, loc)
+        if not match:
+            self._fail()
+        self._pos = match.end()
+        return String(value=match.group())
+
+
+    def _standalone_expression(self):
+        node = self._expression()
+        if not self._at_noncontent(self._pos):
+            self._fail()
+        return node
+
+
+    def _scope_declaration(self, keyword):
+        self._pos += len(keyword)
+        self._skip_spaces()
+        variables = [self._leaves.identifier(self._match_identifier())]
+        while self._peek() in (' ', '\t'):
+            loc = self._pos
+            while self._text[loc:loc + 1] in (' ', '\t'):
+                loc += 1
+            match = _identifier_re.match(self._text, loc)
+            if not match or self._keyword_at(loc):
+                break
+            variables.append(self._leaves.identifier(match.group()))
+            self._pos = match.end()
+        return ScopeDecl(type=keyword, variables=variables)
+
+
+    # Control statements.
+    # .........................................................................
+
+    def _control_statement(self, keyword):
+        if keyword == 'while':
+            return self._while_statement()
+        elif keyword == 'if':
+            return self._if_statement()
+        elif keyword == 'switch':
+            return self._switch_statement()
+        elif keyword == 'for':
+            return self._for_statement()
+        elif keyword == 'try':
+            return self._try_statement()
+        else:
+            self._pos += len(keyword)
+            return Branch(kind=keyword)
+
+
+    def _while_statement(self):
+        self._match_keyword('while')
+        cond = self._expression()
+        body = self._parse_stmt_list()
+        self._match_keyword('end')
+        return While(cond=cond, body=body)
+
+
+    def _if_statement(self):
+        self._match_keyword('if')
+        cond = self._expression()
+        body = self._parse_stmt_list()
+        elseifs = []
+        else_body = None
+        while True:
+            self._skip_wsnl()
+            keyword = self._keyword_at(self._pos)
+            if keyword == 'elseif':
+                self._pos += len(keyword)
+                elseif_cond = self._expression()
+                elseifs.append((elseif_cond, self._parse_stmt_list()))
+            elif keyword == 'else':
+                self._pos += len(keyword)
+                else_body = self._parse_stmt_list()
+                break
+            else:
+                break
+        self._match_keyword('end')
+        return If(cond=cond, body=body, elseif_tuples=elseifs,
+                  else_body=else_body)
+
+
+    def _switch_statement(self):
+        self._match_keyword('switch')
+        cond = self._expression()
+        cases = []
+        otherwise = None
+        while True:
+            self._skip_wsnl()
+            char = self._peek()
+            if char in (',', ';'):
+                self._pos += 1
+                continue
+            elif char == '%':
+                self._comment()
+                continue
+            keyword = self._keyword_at(self._pos)
+            if keyword == 'case':
+                self._pos += len(keyword)
+                case_cond = self._expression()
+                cases.append((case_cond, self._parse_stmt_list()))
+            elif keyword == 'otherwise':
+                self._pos += len(keyword)
+                otherwise = self._parse_stmt_list()
+                break
+            else:
+                break
+        self._match_keyword('end')
+        return Switch(cond=cond, case_tuples=cases, otherwise=otherwise)
+
+
+    def _for_statement(self):
+        self._match_keyword('for')
+        start = self._pos
+        try:
+            self._match_char('(')
+            var, expr = self._for_header()
+            self._match_char(')')
+        except _NoMatch:
+            self._pos = start
+            var, expr = self._for_header()
+        body = self._parse_stmt_list()
+        self._match_keyword('end')
+        return For(var=var, expr=expr, body=body)
+
+
+    def _for_header(self):
+        self._skip_wsnl()
+        var = self._leaves.identifier(self._match_identifier())
+        self._match_char('=')
+        return (var, self._expression())
+
+
+    def _try_statement(self):
+        self._match_keyword('try')
+        body = self._parse_stmt_list()
+        var = None
+        self._skip_wsnl()
+        if self._keyword_at(self._pos) == 'catch':
+            self._pos += len('catch')
+            if not self._at_noncontent(self._pos):
+                self._skip_spaces()
+                var = self._leaves.identifier(self._match_identifier())
+            self._skip_noncontent()
+        catch_body = self._parse_stmt_list()
+        self._match_keyword('end')
+        return Try(body=body, catch_var=var, catch_body=catch_body)
+
+
+    # Expressions.
+    # .........................................................................
+    # Precedence, from lowest to highest: ||, &&, |, &, comparisons, the
+    # 2-term colon operator, the 3-term colon operator, + and -, * and
+    # division, unary operators, power, and finally transpose.  All binary
+    # operators are left-associative.
+
+    def _expression(self):
+        saved = self._in_array
+        self._in_array = False
+        try:
+            return self._binary_level(0)
+        finally:
+            self._in_array = saved
+
+
+    _LEVELS = _AND_OR + [_LOGICAL_OPS]
+
+
+    def _binary_level(self, level):
+        if level == len(self._LEVELS):
+            return self._range()
+        return self._left_assoc(self._LEVELS[level], self._binary_level,
+                                level + 1)
+
+
+    def _left_assoc(self, ops, method, *args):
+        """Parses a left-associative sequence of operands produced by
+        'method', separated by binary operators in the set 'ops'."""
+        left = method(*args)
+        follow = False
+        while True:
+            start = self._pos
+            op = self._binary_op(ops, follow)
+            if op is None:
+                return left
+            try:
+                self._skip_wsnl()
+                right = method(*args)
+            except _NoMatch:
+                # Not an operator after all; leave it for the caller.
+                self._pos = start
+                return left
+            if op == ':':
+                left = ColonOp(left=left, middle=None, right=right)
+            else:
+                left = BinaryOp(op=op, left=left, right=right)
+            follow = True
+
+
+    def _binary_op(self, ops, follow=False):
+        """Matches one of the operators in 'ops'.  Returns the operator, or
+        None (without moving) if the next thing is not one of them.  If
+        'follow' is true, this is not the first operator of a chain."""
+        # The PyParsing grammar only insists that the first operator of a
+        # chain be on the same line as its left operand; once a chain has
+        # started, later operators at the same level may follow line breaks
+        # (except for the and/or operators) and are never taken for the sign
+        # of a new array element.  Colons may always follow line breaks.  We
+        # reproduce all of this so that both backends agree.
+        start = self._pos
+        if (follow and ops not in _AND_OR) or ops is _COLON:
+            self._skip_wsnl()
+        elif self._in_array and ops is _PLUSMINUS:
+            self._pos = self._match_white_run(start)
+        else:
+            self._skip_spaces()
+        loc = self._pos
+        op = self._binary_op_at(loc)
+        if op not in ops:
+            self._pos = start
+            return None
+        if self._in_array and op in _PLUSMINUS and loc > start and not follow:
+            # Inside arrays, "a -b" is two elements but "a - b" is one.
+            if self._match_white_run(loc + 1) == loc + 1:
+                self._pos = start
+                return None
+        self._pos = loc + len(op)
+        return op
+
+
+    def _range(self):
+        return self._left_assoc(_COLON, self._colon3)
+
+
+    def _colon3(self):
+        left = self._additive()
+        start = self._pos
+        if self._binary_op(_COLON) is None:
+            return left
+        try:
+            self._skip_wsnl()
+            middle = self._additive()
+            if self._binary_op(_COLON) is not None:
+                self._skip_wsnl()
+                right = self._additive()
+                return ColonOp(left=left, middle=middle, right=right)
+        except _NoMatch:
+            pass
+        self._pos = start
+        return left
+
+
+    def _additive(self):
+        return self._left_assoc(_PLUSMINUS, self._multiplicative)
+
+
+    def _multiplicative(self):
+        return self._left_assoc(_TIMESDIV, self._unary)
+
+
+    def _unary(self):
+        self._skip_operand_space()
+        char = self._peek()
+        if char in ('+', '-') or (char == '~' and self._peek(1) != '='):
+            start = self._pos
+            self._pos += 1
+            try:
+                self._skip_wsnl()
+                return self._make_unary(char, self._unary())
+            except _NoMatch:
+                if char == '~' and self._subscripts:
+                    # A bare tilde, as in "[~, x] = f(y)".
+                    self._pos = start + 1
+                    self._note_subscript_only()
+                    return Special(value='~')
+                raise
+        return self._power()
+
+
+    def _make_unary(self, op, operand):
+        if op == '-' and isinstance(operand, Number):
+            if operand.value.startswith('-'):
+                return self._leaves.number(operand.value[1:])
+            else:
+                return self._leaves.number(op + operand.value)
+        elif op == '+' and isinstance(operand, Number):
+            return self._leaves.number(operand.value)
+        else:
+            return UnaryOp(op=op, operand=operand)
+
+
+    def _power(self):
+        left = self._postfix()
+        follow = False
+        while True:
+            start = self._pos
+            op = self._binary_op(_POWER, follow)
+            if op is None:
+                return left
+            try:
+                self._skip_wsnl()
+                right = self._power_operand()
+            except _NoMatch:
+                self._pos = start
+                return left
+            left = BinaryOp(op=op, left=left, right=right)
+            follow = True
+
+
+    def _power_operand(self):
+        # Unary operators bind more tightly than power when they appear in
+        # the exponent: 2^-2^2 means (2^-2)^2.
+        self._skip_operand_space()
+        char = self._peek()
+        if char in ('+', '-'):
+            self._pos += 1
+            self._skip_wsnl()
+            return self._make_unary(char, self._power_operand())
+        return self._postfix()
+
+
+    def _postfix(self):
+        self._skip_operand_space()
+        node = self._primary()
+        text = self._text
+        while True:
+            if text.startswith(".'", self._pos):
+                self._pos += 2
+                node = Transpose(op=".'", operand=node)
+            elif self._peek() == "'":
+                self._pos += 1
+                node = Transpose(op="'", operand=node)
+            else:
+                return node
+
+
+    def _primary(self):
+        char = self._peek()
+        if char in _DIGITS or (char == '.' and self._peek(1) in _DIGITS):
+            match = _number_re.match(self._text, self._pos)
+            self._pos = match.end()
+            return self._leaves.number(match.group())
+        elif char == "'":
+            match = _string_re.match(self._text, self._pos)
+            if not match:
+                self._fail()
+            self._pos = match.end()
+            return String(value=unquote(match.group()))
+        elif char == '[':
+            return self._array(']')
+        elif char == '{':
+            return self._array('}')
+        elif char == '(':
+            self._pos += 1
+            saved = self._in_array
+            self._in_array = False
+            try:
+                node = self._binary_level(0)
+            finally:
+                self._in_array = saved
+            self._skip_wsnl()
+            if self._peek() != ')':
+                self._fail()
+            self._pos += 1
+            return node
+        elif char == '@':
+            return self._function_handle()
+        elif _identifier_re.match(self._text, self._pos):
+            if self._keyword_at(self._pos) == 'end' and self._subscripts:
+                self._pos += 3
+                self._note_subscript_only()
+                return Special(value='end')
+            return self._reference(lhs=False)
+        self._fail()
+
+
+    def _function_handle(self):
+        self._pos += 1
+        self._skip_wsnl()
+        if self._peek() != '(':
+            return FuncHandle(name=self._leaves.identifier(self._match_identifier()))
+        self._pos += 1
+        args = []
+        while True:
+            self._skip_wsnl()
+            if self._peek() == ')':
+                self._pos += 1
+                break
+            if args:
+                self._match_char(',')
+                self._skip_wsnl()
+            args.append(self._single_value())
+        body = self._expression()
+        return AnonFun(args=args, body=body)
+
+
+    # References: identifiers, struct fields, array and cell subscripts.
+    # .........................................................................
+
+    def _reference(self, lhs):
+        """Parses an identifier followed by any number of parenthesized
+        arguments, braced subscripts and struct fields.  If 'lhs' is true,
+        this is the left-hand side of an assignment."""
+        name = self._leaves.identifier(self._match_identifier())
+        node = name
+        while True:
+            start = self._pos
+            if not self._in_array:
+                self._skip_spaces()
+            char = self._peek()
+            if char == '(':
+                self._pos += 1
+                args, plain = self._subscript_list(')')
+                # Only the last suffix can be a function call.
+                if lhs or self._field_follows() or self._suffix_follows():
+                    plain = False
+                if plain:
+                    node = Ambiguous(name=node, args=args)
+                else:
+                    node = ArrayRef(name=node, args=args, is_cell=False)
+            elif char == '{':
+                self._pos += 1
+                args, plain = self._subscript_list('}')
+                node = ArrayRef(name=node, args=args, is_cell=True)
+            else:
+                self._pos = start
+                field = self._try(self._struct_field)
+                if field is None:
+                    break
+                node = field(node)
+        if node is name and not lhs:
+            return Ambiguous(name=name, args=None)
+        return node
+
+
+    def _field_follows(self):
+        start = self._pos
+        result = self._try(self._struct_field) is not None
+        self._pos = start
+        return result
+
+
+    def _suffix_follows(self):
+        loc = self._pos
+        if not self._in_array:
+            while loc < self._len and self._text[loc] in ' \t':
+                loc += 1
+        return self._text[loc:loc + 1] in ('(', '{')
+
+
+    def _struct_field(self):
+        if self._in_array:
+            self._skip_spaces()
+        else:
+            self._skip_wsnl()
+        if self._peek() != '.':
+            self._fail()
+        self._pos += 1
+        self._skip_wsnl()
+        if self._peek() == '(':
+            self._pos += 1
+            field = self._expression()
+            self._skip_wsnl()
+            if self._peek() != ')':
+                self._fail()
+            self._pos += 1
+            return lambda base: StructRef(name=base, field=field, dynamic=True)
+        field = self._leaves.identifier(self._match_identifier())
+        return lambda base: StructRef(name=base, field=field, dynamic=False)
+
+
+    def _subscript_list(self, closer):
+        """Parses comma-separated arguments up to 'closer'.  Returns a tuple
+        of the list of arguments, and a flag that is False if anything only
+        allowed in array subscripts (':', '~', 'end') was used."""
+        saved = self._in_array
+        self._in_array = False
+        flags = {'plain': True}
+        self._subscripts.append(flags)
+        try:
+            args = []
+            comma = False
+            while True:
+                self._skip_wsnl()
+                char = self._peek()
+                if char == closer:
+                    if comma:
+                        # An empty argument, as in "f(a, )".
+                        flags['plain'] = False
+                    self._pos += 1
+                    break
+                elif char == ',':
+                    if comma or not args:
+                        flags['plain'] = False
+                    self._pos += 1
+                    comma = True
+                    continue
+                comma = False
+                args.append(self._subscript())
+                loc = self._pos
+                self._skip_wsnl()
+                if self._peek() not in (',', closer):
+                    self._fail()
+                if '\n' in self._text[loc:self._pos]:
+                    # PyParsing only takes "f(a\n)" as an array reference.
+                    flags['plain'] = False
+            return (args, flags['plain'])
+        finally:
+            self._subscripts.pop()
+            self._in_array = saved
+
+
+    def _subscript(self):
+        if self._peek() == ':':
+            loc = self._pos + 1
+            while loc < self._len and self._text[loc] in ' \t\n\r':
+                loc += 1
+            if self._text[loc:loc + 1] in (',', ')', '}', ']', ';', '\n', ''):
+                self._pos += 1
+                self._note_subscript_only()
+                return Special(value=':')
+        return self._binary_level(0)
+
+
+    def _note_subscript_only(self):
+        flags = self._subscripts[-1]
+        if flags is not None:
+            flags['plain'] = False
+
+
+    # Square-bracket and cell arrays.
+    # .........................................................................
+
+    def _join_row_lines(self, closer):
+        """Called after an element followed by a space in a row without
+        commas.  The PyParsing grammar lets the whitespace between such
+        elements include line breaks, so "[1 2 \n 3 4]" is a single row,
+        whereas "[1 2\n 3 4]" has two; we mimic this."""
+        loc = self._pos
+        text = self._text
+        while loc < self._len and text[loc] in ' \t':
+            loc += 1
+        if loc >= self._len or text[loc] not in '\n\r':
+            return
+        while loc < self._len and text[loc] in ' \t\n\r':
+            loc += 1
+        if loc < self._len and text[loc] not in (closer, '%', ';', ','):
+            self._pos = loc
+
+
+    def _array(self, closer):
+        self._pos += 1
+        saved = self._in_array
+        self._in_array = True
+        self._subscripts.append(None)
+        try:
+            rows = []
+            row = []
+            separated = False
+            text = self._text
+            while True:
+                self._skip_spaces()
+                if self._pos >= self._len:
+                    self._fail()
+                char = text[self._pos]
+                if char == closer:
+                    self._pos += 1
+                    break
+                elif char in ';\n\r':
+                    self._pos += 1
+                    if row:
+                        rows.append(row)
+                    row = []
+                    separated = False
+                elif char == '%':
+                    self._comment()
+                    if row:
+                        rows.append(row)
+                    row = []
+                    separated = False
+                elif char == ',':
+                    self._pos += 1
+                    self._skip_wsnl()
+                    separated = True
+                else:
+                    row.append(self._subscript())
+                    char = self._peek()
+                    if char not in (' ', '\t', ',', ';', '\n', '\r', '%', closer):
+                        self._fail()
+                    if char in ' \t' and not separated:
+                        self._join_row_lines(closer)
+            if row:
+                rows.append(row)
+            return Array(rows=rows, is_cell=(closer == '}'))
+        finally:
+            self._subscripts.pop()
+            self._in_array = saved
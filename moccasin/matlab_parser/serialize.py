@@ -0,0 +1,517 @@
+#!/usr/bin/env python
+#
+# @file    serialize.py
+# @brief   Compact binary encoding of MatlabContext and MatlabNode trees
+# @author  Michael Hucka
+#
+# <!---------------------------------------------------------------------------
+# This software is part of MOCCASIN, the Model ODE Converter for Creating
+# Automated SBML INteroperability. Visit https://github.com/sbmlteam/moccasin/.
+#
+# Copyright (C) 2014-2016 jointly by the following organizations:
+#  1. California Institute of Technology, Pasadena, CA, USA
+#  2. Icahn School of Medicine at Mount Sinai, New York, NY, USA
+#  3. Boston University, Boston, MA, USA
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation.  A copy of the license agreement is provided in the
+# file named "COPYING.txt" included with this software distribution and also
+# available online at https://github.com/sbmlteam/moccasin/.
+# ------------------------------------------------------------------------- -->
+
+# dump_context() turns a MatlabContext, with everything reachable from it,
+# into a string of bytes, and load_context() turns such a string back into
+# a MatlabContext.  This is meant for storing parse results and passing
+# them between processes: unlike pickling, it leaves out the ParseResults,
+# it doesn't need the Python recursion limit raised for deeply nested
+# expressions, and it can decode the contexts of functions only when they
+# are used.
+#
+# Format
+# ------
+#
+# All unsigned integers are written as varints (7 bits per byte, least
+# significant group first, high bit set on all but the last byte), and
+# signed integers as zigzag-encoded varints.  The data consists of
+#
+#   header:    the 4 bytes _MAGIC, and FORMAT_VERSION as a 2-byte unsigned
+#              big-endian integer;
+#   strings:   the number of strings, then each string as its length and
+#              its UTF-8 bytes.  Every string in the data is written once,
+#              here, and elsewhere referred to by its index;
+#   sections:  the number of sections, then for each one the index of the
+#              section of its parent context plus 1 (0 for none), and the
+#              offset and length of its data relative to the start of the
+#              section data;
+#   section data.
+#
+# Each MatlabContext is stored in its own section.  Section 0 is the one
+# passed to dump_context().  The data of a section is a sequence of values
+# (see below) for the context's `topmost`, `name`, `file`, `comments`,
+# `parameters`, `returns` and `nodes`, followed by its `functions`,
+# `assignments`, `calls` and `types`, each as a count of entries followed
+# by the key and the value of each entry.
+#
+# A value starts with a one-byte tag (the _TAG_ constants below), and for
+# MatlabNode objects the tag is _TAG_NODE plus the position of the node's
+# class in _NODE_CLASSES.  What follows the tag depends on it: nothing for
+# None and booleans, an integer, a string index, a count followed by that
+# many values for lists and tuples, a section index for contexts, or the
+# values of the node's attributes in the order of its _attr_names.
+# Identifier and Number nodes are written as _TAG_IDENTIFIER/_TAG_NUMBER
+# and the index of their name or value.  Within a section, each list and
+# each node other than those is numbered in the order written, and a list
+# or node written before is written again as _TAG_REF and its number, so
+# that objects shared in the tree are shared in the decoded tree too.
+#
+# Normally the body, parameters and output of a FunDef are the nodes,
+# parameters and returns of the context of the function.  In that case
+# they are written as _TAG_SAME, and are only decoded with the context.
+#
+# Lazy decoding
+# -------------
+#
+# load_context() only decodes the header and the strings.  Contexts are
+# represented by placeholder objects that decode their section the first
+# time one of their attributes is used (other than `parent`), and FunDef
+# nodes whose body is written as _TAG_SAME decode the context of the
+# function the first time their body, parameters or output is used.  Once
+# decoded, these objects turn into ordinary MatlabContext and FunDef
+# objects.  So, for example, looking up one function with
+# context.functions[name] does not decode the other functions.
+#
+# Change FORMAT_VERSION whenever the format changes, including when node
+# classes or their attributes change.  New node classes must be added at
+# the end of _NODE_CLASSES.
+
+from __future__ import print_function
+import struct
+import threading
+import six
+
+try:
+    from context import MatlabContext
+    from matlab import *
+except:
+    from .context import MatlabContext
+    from .matlab import *
+
+
+FORMAT_VERSION = 1
+
+_MAGIC = b'MCTX'
+
+_TAG_NONE       = 0
+_TAG_TRUE       = 1
+_TAG_FALSE      = 2
+_TAG_INT        = 3
+_TAG_STRING     = 4
+_TAG_LIST       = 5
+_TAG_TUPLE      = 6
+_TAG_REF        = 7
+_TAG_CONTEXT    = 8
+_TAG_SAME       = 9
+_TAG_IDENTIFIER = 10
+_TAG_NUMBER     = 11
+_TAG_NODE       = 16
+
+_NODE_CLASSES = [Number, String, Special, Array, FuncHandle, AnonFun,
+                 Identifier, FunCall, ArrayRef, StructRef, Ambiguous,
+                 UnaryOp, BinaryOp, ColonOp, Transpose, ScopeDecl,
+                 Assignment, FunDef, Try, Switch, If, While, For, Branch,
+                 ShellCommand, Comment]
+
+_NODE_TAGS = dict((cls, _TAG_NODE + i) for i, cls in enumerate(_NODE_CLASSES))
+
+# The attributes of a FunDef that may be written as _TAG_SAME, and the
+# attributes of its context that they are the same as.
+
+_FUNDEF_SHARED = {'body': 'nodes', 'parameters': 'parameters',
+                  'output': 'returns'}
+
+_CONTEXT_DICTS = ['_functions', '_assignments', '_calls', '_types']
+
+
+def dump_context(context):
+    """Returns a string of bytes encoding the MatlabContext `context`, the
+    contexts of the functions in it and their nodes.  The ParseResults in
+    the contexts, if any, are left out."""
+    return _Encoder().encode(context)
+
+
+def load_context(data):
+    """Returns the MatlabContext encoded in the string of bytes `data` by
+    dump_context().  The contexts of functions are decoded the first time
+    they are used."""
+    return _Decoder(data).context(0)
+
+
+# Encoding.
+# .........................................................................
+
+def _write_uint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+class _Encoder(object):
+    def __init__(self):
+        self._strings = {}             # String => index.
+        self._sections = []            # Contexts, by section index.
+        self._section_of = {}          # id() of context => section index.
+
+
+    def encode(self, context):
+        self._section_index(context)
+        datas = []
+        # Encoding a section can add more sections to the list.
+        i = 0
+        while i < len(self._sections):
+            datas.append(self._encode_section(self._sections[i]))
+            i += 1
+
+        out = bytearray(_MAGIC)
+        out += struct.pack('>H', FORMAT_VERSION)
+        strings = sorted(self._strings, key=self._strings.get)
+        _write_uint(out, len(strings))
+        for text in strings:
+            data = text.encode('utf-8')
+            _write_uint(out, len(data))
+            out += data
+        _write_uint(out, len(self._sections))
+        offset = 0
+        for section, data in zip(self._sections, datas):
+            parent = section.parent
+            _write_uint(out, self._section_index(parent) + 1 if parent else 0)
+            _write_uint(out, offset)
+            _write_uint(out, len(data))
+            offset += len(data)
+        for data in datas:
+            out += data
+        return bytes(out)
+
+
+    def _string_index(self, text):
+        if not isinstance(text, six.text_type):
+            text = text.decode('utf-8')
+        index = self._strings.get(text)
+        if index is None:
+            index = self._strings[text] = len(self._strings)
+        return index
+
+
+    def _section_index(self, context):
+        index = self._section_of.get(id(context))
+        if index is None:
+            index = self._section_of[id(context)] = len(self._sections)
+            self._sections.append(context)
+            # The parent needs a section too, for the section table.
+            if context.parent:
+                self._section_index(context.parent)
+        return index
+
+
+    def _encode_section(self, context):
+        out = bytearray()
+        memo = {}
+        for value in [context.topmost, context.name, context.file,
+                      context.comments, context.parameters, context.returns,
+                      context.nodes]:
+            self._write_value(out, memo, value)
+        for attr in _CONTEXT_DICTS:
+            entries = getattr(context, attr)
+            _write_uint(out, len(entries))
+            for key, value in entries.items():
+                self._write_value(out, memo, key)
+                self._write_value(out, memo, value)
+        return out
+
+
+    def _write_value(self, out, memo, value):
+        # Written using our own stack, rather than by recursion, because
+        # operator expressions can be nested very deeply.  Objects are
+        # numbered in 'memo' in the order they are written.
+        stack = [value]
+        while stack:
+            value = stack.pop()
+            if value is _same:
+                out.append(_TAG_SAME)
+            elif value is None:
+                out.append(_TAG_NONE)
+            elif value is True:
+                out.append(_TAG_TRUE)
+            elif value is False:
+                out.append(_TAG_FALSE)
+            elif isinstance(value, six.integer_types):
+                out.append(_TAG_INT)
+                _write_uint(out, (value << 1) if value >= 0 else ((-value << 1) - 1))
+            elif isinstance(value, six.string_types):
+                out.append(_TAG_STRING)
+                _write_uint(out, self._string_index(value))
+            elif isinstance(value, MatlabContext):
+                out.append(_TAG_CONTEXT)
+                _write_uint(out, self._section_index(value))
+            elif id(value) in memo:
+                out.append(_TAG_REF)
+                _write_uint(out, memo[id(value)])
+            elif isinstance(value, list):
+                memo[id(value)] = len(memo)
+                out.append(_TAG_LIST)
+                _write_uint(out, len(value))
+                stack.extend(reversed(value))
+            elif isinstance(value, tuple):
+                out.append(_TAG_TUPLE)
+                _write_uint(out, len(value))
+                stack.extend(reversed(value))
+            elif type(value) is Identifier \
+                 and isinstance(value.name, six.string_types):
+                out.append(_TAG_IDENTIFIER)
+                _write_uint(out, self._string_index(value.name))
+            elif type(value) is Number \
+                 and isinstance(value.value, six.string_types):
+                out.append(_TAG_NUMBER)
+                _write_uint(out, self._string_index(value.value))
+            elif type(value) in _NODE_TAGS:
+                memo[id(value)] = len(memo)
+                out.append(_NODE_TAGS[type(value)])
+                stack.extend(reversed(self._node_values(value)))
+            else:
+                raise TypeError('Cannot serialize object of type {}'
+                                .format(type(value).__name__))
+
+
+    def _node_values(self, node):
+        values = [getattr(node, name) for name in node._attr_names]
+        if isinstance(node, FunDef) and node.context is not None:
+            for i, name in enumerate(node._attr_names):
+                shared = _FUNDEF_SHARED.get(name)
+                if shared and values[i] is getattr(node.context, shared):
+                    values[i] = _same
+        return values
+
+
+# Marks a FunDef attribute to be written as _TAG_SAME.
+
+_same = object()
+
+
+# Decoding.
+# .........................................................................
+
+class _Decoder(object):
+    def __init__(self, data):
+        self._data = bytearray(data)
+        if self._data[:4] != bytearray(_MAGIC):
+            raise ValueError('Not a serialized MatlabContext')
+        (version,) = struct.unpack('>H', bytes(self._data[4:6]))
+        if version != FORMAT_VERSION:
+            raise ValueError('Unsupported serialization format version {}'
+                             .format(version))
+        self._pos = 6
+        self._strings = []
+        for i in range(self._read_uint()):
+            length = self._read_uint()
+            text = self._data[self._pos:self._pos + length].decode('utf-8')
+            self._strings.append(str(text) if six.PY2 else text)
+            self._pos += length
+        self._sections = []
+        for i in range(self._read_uint()):
+            parent = self._read_uint() - 1
+            offset = self._read_uint()
+            length = self._read_uint()
+            self._sections.append((parent, offset, length))
+        self._start = self._pos
+        self._contexts = {}            # Section index => context.
+        self._leaves = LeafTable()
+        self._lock = threading.Lock()
+
+
+    def context(self, index):
+        context = self._contexts.get(index)
+        if context is None:
+            context = _LazyContext.__new__(_LazyContext)
+            context.__dict__['_decoder'] = self
+            context.__dict__['_section'] = index
+            self._contexts[index] = context
+            parent = self._sections[index][0]
+            context.__dict__['parent'] = self.context(parent) if parent >= 0 else None
+        return context
+
+
+    def decode_section(self, context):
+        # Another thread may have decoded it while this one waited.
+        with self._lock:
+            if '_section' in context.__dict__:
+                self._decode_section(context)
+
+
+    def _decode_section(self, context):
+        (_, offset, length) = self._sections[context.__dict__['_section']]
+        self._pos = self._start + offset
+        memo = []
+        (topmost, name, file, comments, parameters, returns, nodes) \
+            = [self._read_value(memo) for i in range(7)]
+        entries = []
+        for attr in _CONTEXT_DICTS:
+            pairs = []
+            for i in range(self._read_uint()):
+                key = self._read_value(memo)
+                pairs.append((key, self._read_value(memo)))
+            entries.append(pairs)
+        if self._pos != self._start + offset + length:
+            raise ValueError('Corrupted data in section {}'
+                             .format(context.__dict__['_section']))
+
+        # The attributes are made apart and added all at once, so that other
+        # threads never see the context partly filled in.  No symbol table
+        # can have a scope for the context before it is decoded, so the
+        # dictionaries are filled without telling one.
+        decoded = MatlabContext.__new__(MatlabContext)
+        MatlabContext.__init__(decoded, name=name, parent=context.parent,
+                               nodes=nodes, parameters=parameters,
+                               returns=returns, file=file, topmost=topmost)
+        decoded.comments = comments
+        for attr, pairs in zip(_CONTEXT_DICTS, entries):
+            table = getattr(decoded, attr)
+            if table._owner is not None:
+                table._owner = context
+            dict.update(table, pairs)
+        state = context.__dict__
+        state.update(decoded.__dict__)
+        del state['_decoder']
+        del state['_section']
+        context.__class__ = MatlabContext
+
+
+    def _read_uint(self):
+        data = self._data
+        result = shift = 0
+        while True:
+            byte = data[self._pos]
+            self._pos += 1
+            result |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+
+    def _read_value(self, memo):
+        # The counterpart of _Encoder._write_value().  Lists, tuples and
+        # nodes being filled in are kept on a stack of entries [object,
+        # number of values still to come, values so far].  Nodes are
+        # created before their attributes are read so that they are
+        # numbered in the same order as by the encoder.
+        stack = []
+        while True:
+            tag = self._data[self._pos]
+            self._pos += 1
+            if tag == _TAG_NONE:
+                value = None
+            elif tag == _TAG_TRUE:
+                value = True
+            elif tag == _TAG_FALSE:
+                value = False
+            elif tag == _TAG_INT:
+                n = self._read_uint()
+                value = -((n + 1) >> 1) if n & 1 else n >> 1
+            elif tag == _TAG_STRING:
+                value = self._strings[self._read_uint()]
+            elif tag == _TAG_IDENTIFIER:
+                value = self._leaves.identifier(self._strings[self._read_uint()])
+            elif tag == _TAG_NUMBER:
+                value = self._leaves.number(self._strings[self._read_uint()])
+            elif tag == _TAG_CONTEXT:
+                value = self.context(self._read_uint())
+            elif tag == _TAG_REF:
+                value = memo[self._read_uint()]
+            elif tag == _TAG_SAME:
+                value = _same
+            elif tag == _TAG_LIST or tag == _TAG_TUPLE:
+                value = [] if tag == _TAG_LIST else ()
+                if tag == _TAG_LIST:
+                    memo.append(value)
+                count = self._read_uint()
+                if count:
+                    stack.append([value, count, []])
+                    continue
+            elif _TAG_NODE <= tag < _TAG_NODE + len(_NODE_CLASSES):
+                cls = _NODE_CLASSES[tag - _TAG_NODE]
+                value = cls.__new__(cls)
+                memo.append(value)
+                stack.append([value, len(cls._attr_names), []])
+                continue
+            else:
+                raise ValueError('Corrupted data: unknown tag {}'.format(tag))
+
+            # Hand the value to the objects waiting for it, finishing each
+            # one that is now complete.
+            while stack:
+                entry = stack[-1]
+                entry[2].append(value)
+                entry[1] -= 1
+                if entry[1]:
+                    break
+                stack.pop()
+                value = self._finish(*entry)
+            else:
+                return value
+
+
+    def _finish(self, obj, count, values):
+        if isinstance(obj, list):
+            obj.extend(values)
+        elif isinstance(obj, tuple):
+            obj = tuple(values)
+        else:
+            lazy = False
+            for name, value in zip(obj._attr_names, values):
+                if value is _same:
+                    lazy = True
+                else:
+                    object.__setattr__(obj, name, value)
+            if lazy:
+                obj.__class__ = _LazyFunDef
+        return obj
+
+
+class _LazyContext(MatlabContext):
+    # A MatlabContext whose section has not been decoded yet.  The only
+    # attributes it has are 'parent' and the ones used to decode it; using
+    # any other decodes it and makes it a plain MatlabContext.
+
+    def __getattr__(self, name):
+        decoder = self.__dict__.get('_decoder')
+        if decoder is not None:
+            decoder.decode_section(self)
+        # It is decoded now, by this thread or another.
+        return object.__getattribute__(self, name)
+
+
+    def __reduce_ex__(self, protocol):
+        self.topmost                    # Decode it.
+        return self.__reduce_ex__(protocol)
+
+
+class _LazyFunDef(FunDef):
+    # A FunDef whose body, parameters and output are those of its context,
+    # which has not been decoded yet.
+
+    def __getattr__(self, name):
+        if name not in _FUNDEF_SHARED:
+            raise AttributeError(name)
+        context = self.context
+        for attr, shared in _FUNDEF_SHARED.items():
+            try:
+                object.__getattribute__(self, attr)
+            except AttributeError:
+                object.__setattr__(self, attr, getattr(context, shared))
+        self.__class__ = FunDef
+        return getattr(self, name)
+
+
+    def __reduce_ex__(self, protocol):
+        self.body                       # Decode it.
+        return self.__reduce_ex__(protocol)
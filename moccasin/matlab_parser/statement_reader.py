@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+#
+# @file    statement_reader.py
+# @brief   Split MATLAB input into top-level statements, reading line by line
+# @author  Michael Hucka
+#
+# <!---------------------------------------------------------------------------
+# This software is part of MOCCASIN, the Model ODE Converter for Creating
+# Automated SBML INteroperability. Visit https://github.com/sbmlteam/moccasin/.
+#
+# Copyright (C) 2014-2016 jointly by the following organizations:
+#  1. California Institute of Technology, Pasadena, CA, USA
+#  2. Icahn School of Medicine at Mount Sinai, New York, NY, USA
+#  3. Boston University, Boston, MA, USA
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation.  A copy of the license agreement is provided in the
+# file named "COPYING.txt" included with this software distribution and also
+# available online at https://github.com/sbmlteam/moccasin/.
+# ------------------------------------------------------------------------- -->
+
+# StatementReader is used by MatlabGrammar.iter_parse() to read a file one
+# piece at a time, where each piece is one or more complete top-level
+# statements (or a complete top-level function definition) that can be
+# handed to the parser on its own.  It only has to find where pieces end,
+# not to parse them, so it does a light lexical scan of each line, keeping
+# track of:
+#
+#  - open brackets, parentheses and braces, since rows of an array and
+#    arguments can span lines;
+#  - continuation lines ("...", which MatlabGrammar's preprocessing joins
+#    wherever they appear, even in comments and strings);
+#  - block comments ("%{" ... "%}");
+#  - strings, so that brackets and keywords in them are not counted;
+#  - keywords that open blocks ('if', 'for', 'function', etc.) and the
+#    'end' that closes them, outside of brackets and of the arguments of
+#    command-syntax function calls such as "hold on".
+#
+# A piece ends at the end of a line where none of these is open.  Function
+# definitions that are closed by 'end' are therefore returned one at a
+# time.  Function definitions that are not closed by 'end' cannot be told
+# apart from nested ones until the end of the file, so a file that uses
+# them is returned as one piece from the first function definition on.
+
+import re
+
+_BLOCK_OPENERS = frozenset(['if', 'for', 'parfor', 'while', 'switch', 'try',
+                            'function', 'spmd'])
+
+# Keywords that may be directly followed by a statement.
+
+_STATEMENT_PREFIXES = frozenset(['else', 'otherwise', 'try'])
+
+_OPEN_BRACKETS  = '([{'
+_CLOSE_BRACKETS = ')]}'
+
+# A single quote is a transpose operator if it directly follows one of
+# these characters; otherwise it starts a string.
+
+_TRANSPOSABLE = frozenset('abcdefghijklmnopqrstuvwxyz'
+                          'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_.)]}\'')
+
+_word_re = re.compile(r'[A-Za-z][A-Za-z0-9_]*|[0-9]+')
+
+# What follows the name in a command-syntax function call, as decided by
+# MatlabRDParser._command_statement(): whitespace, and then something
+# other than a delimiter, a comment, '=', '(', or an operator followed by
+# whitespace.
+
+_command_re = re.compile(r'[ \t]+(?![=(,;%\n\r]|(?:\|\||&&|<=|>=|==|~=|\.\*|\./'
+                         r'|\.\\|\.\^|\.\'|[|&<>+\-*/\\^:])[ \t\n\r])(?=\S)')
+
+_command_args_re = re.compile(r'[^,;%\n\r]*')
+
+
+class StatementReader(object):
+    """Iterates over pieces of MATLAB text read from 'lines', an iterable of
+    lines such as a file object.  Each piece is a string consisting of whole
+    lines and holding one or more complete top-level statements."""
+
+    def __init__(self, lines):
+        self._lines = lines
+
+
+    def __iter__(self):
+        self._depth            = 0     # Open blocks.
+        self._brackets         = 0     # Open brackets, parens and braces.
+        self._in_block_comment = False
+        self._continued        = False # Previous line ended with "...".
+        piece = []
+        for line in self._lines:
+            piece.append(line)
+            if self._scan(line):
+                yield ''.join(piece)
+                piece = []
+        if piece:
+            yield ''.join(piece)
+
+
+    def _scan(self, line):
+        """Updates the state with the contents of 'line'.  Returns True if
+        the line ends a piece."""
+        pos = 0
+        end = line.find('...')
+        continued = end >= 0
+        if not continued:
+            end = len(line)
+        # Whether a statement may start at 'pos'.
+        start = self._brackets == 0 and not self._continued
+        self._continued = continued
+        if self._in_block_comment:
+            close = line.find('%}')
+            if close < 0:
+                return False
+            self._in_block_comment = False
+            pos = close + 2
+        elif start and line.lstrip().startswith('!'):
+            # Shell commands extend to the end of the line.
+            return not continued and self._complete()
+        while pos < end:
+            char = line[pos]
+            if char == '%':
+                if line.startswith('%{', pos):
+                    close = line.find('%}', pos + 2)
+                    if close < 0:
+                        self._in_block_comment = True
+                        return False
+                    pos = close + 2
+                    continue
+                break
+            elif char == "'" and (pos == 0 or line[pos - 1] not in _TRANSPOSABLE):
+                pos = self._skip_string(line, pos + 1)
+                start = False
+                continue
+            elif char in _OPEN_BRACKETS:
+                self._brackets += 1
+            elif char in _CLOSE_BRACKETS:
+                self._brackets = max(0, self._brackets - 1)
+            elif char in ',;' and self._brackets == 0:
+                start = True
+                pos += 1
+                continue
+            else:
+                match = _word_re.match(line, pos)
+                if match:
+                    word = match.group()
+                    pos = match.end()
+                    if self._brackets > 0 or (match.start() > 0
+                                              and line[match.start() - 1] == '.'):
+                        pass
+                    elif word in _BLOCK_OPENERS or word == 'end':
+                        self._keyword(word)
+                    elif start and _command_re.match(line, pos):
+                        # The rest of the statement is command arguments.
+                        pos = _command_args_re.match(line, pos).end()
+                    start = word in _STATEMENT_PREFIXES
+                    continue
+            if char not in ' \t':
+                start = False
+            pos += 1
+        return not continued and self._complete()
+
+
+    def _skip_string(self, line, pos):
+        # Returns the position after the string that starts at 'pos', or
+        # the end of the line if the string is not closed.
+        while True:
+            close = line.find("'", pos)
+            if close < 0:
+                return len(line)
+            if line.startswith("''", close):
+                pos = close + 2
+            else:
+                return close + 1
+
+
+    def _keyword(self, word):
+        if word in _BLOCK_OPENERS:
+            self._depth += 1
+        elif word == 'end' and self._depth > 0:
+            self._depth -= 1
+
+
+    def _complete(self):
+        return (self._depth == 0 and self._brackets == 0
+                and not self._in_block_comment)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+#
+# @file    symbols.py
+# @brief   Table of the names bound in each scope of a MATLAB file
+# @author  Michael Hucka
+#
+# <!---------------------------------------------------------------------------
+# This software is part of MOCCASIN, the Model ODE Converter for Creating
+# Automated SBML INteroperability. Visit https://github.com/sbmlteam/moccasin/.
+#
+# Copyright (C) 2014-2016 jointly by the following organizations:
+#  1. California Institute of Technology, Pasadena, CA, USA
+#  2. Icahn School of Medicine at Mount Sinai, New York, NY, USA
+#  3. Boston University, Boston, MA, USA
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation.  A copy of the license agreement is provided in the
+# file named "COPYING.txt" included with this software distribution and also
+# available online at https://github.com/sbmlteam/moccasin/.
+# ------------------------------------------------------------------------- -->
+
+# A SymbolTable answers the question "what is the assignment (or type) of
+# this thing, as seen from this context?"  The answer is the binding in the
+# context itself if there is one, otherwise the one in its parent, and so
+# on up to the topmost context.  Rather than walking up the contexts for
+# every question, the table keeps, for each context that has been asked
+# about, a flat dictionary of every binding visible in it: the bindings of
+# its parent's flat dictionary, overridden by its own.  The flat dictionary
+# of the topmost context is simply its own dictionary.
+#
+# There is one table per tree of contexts, kept by the topmost context (see
+# MatlabContext.symbols).  The dictionaries of a MatlabContext tell the
+# table when they change, and the table updates the flat dictionaries of
+# the context and of the contexts below it that don't have a binding of
+# their own for the same key.  Flat dictionaries are only made when they
+# are first needed, so changes made before then cost nothing.
+
+try:
+    from matlab import Identifier
+except:
+    from .matlab import Identifier
+
+KINDS = ('assignments', 'types')
+
+
+class _Scope(object):
+    # What the table knows about one context.
+    __slots__ = ('context', 'parent', 'children', 'flat')
+
+    def __init__(self, context):
+        self.context  = context
+        self.parent   = _parent(context)   # As it was when the scope was made.
+        self.children = []
+        self.flat     = {}                 # Kind -> flat dictionary.
+
+
+class SymbolTable(object):
+    """Resolved bindings of the 'assignments' and 'types' dictionaries of a
+    tree of MatlabContext objects.  Get the table of a context using its
+    'symbols' property."""
+
+    def __init__(self):
+        self._scopes = {}
+
+
+    def bindings(self, kind, context):
+        """Returns a dictionary of all the bindings of 'kind' ('assignments'
+        or 'types') that are visible in 'context'.  It must not be
+        modified."""
+        scope = self._scope(context)
+        flat = scope.flat.get(kind)
+        if flat is None:
+            own = getattr(context, kind)
+            if scope.parent is None:
+                flat = own
+            else:
+                flat = dict(self.bindings(kind, scope.parent))
+                flat.update(own)
+            scope.flat[kind] = flat
+        return flat
+
+
+    def lookup(self, kind, thing, context):
+        """Returns the value that 'thing' is bound to in the dictionaries of
+        'kind' ('assignments' or 'types') as seen from 'context', or None."""
+        return self.bindings(kind, context).get(thing)
+
+
+    def type(self, thing, context):
+        """Returns the type of 'thing' as seen from 'context', or None."""
+        return self.bindings('types', context).get(thing)
+
+
+    def assignment(self, thing, context, recursive=False):
+        """Returns the value assigned to 'thing' as seen from 'context', or
+        None.  If the value is an Identifier and 'recursive' is True, looks
+        up the Identifier's value in turn, until getting something that's
+        not an Identifier or that has no value, and returns that."""
+        assignments = self.bindings('assignments', context)
+        value = assignments.get(thing)
+        if recursive:
+            seen = set([thing])
+            while (isinstance(value, Identifier) and value in assignments
+                   and value not in seen):
+                seen.add(value)
+                value = assignments[value]
+        return value
+
+
+    def changed(self, context, kind, key=None):
+        """Called by the dictionaries of 'context' when the binding of 'key'
+        in the dictionary of 'kind' has changed.  If 'key' is None, any
+        number of keys may have changed."""
+        scope = self._scopes.get(context)
+        if scope is None or kind not in scope.flat:
+            return
+        if key is None:
+            self._forget(scope, kind)
+        else:
+            self._update(scope, kind, key, getattr(context, kind))
+
+
+    def _scope(self, context):
+        scope = self._scopes.get(context)
+        if scope is not None and scope.parent is not _parent(context):
+            # The context has been moved since we last saw it.
+            self._remove(scope)
+            scope = None
+        if scope is None:
+            scope = self._scopes[context] = _Scope(context)
+            if scope.parent is not None:
+                self._scope(scope.parent).children.append(scope)
+        return scope
+
+
+    def _update(self, scope, kind, key, own):
+        # Written with our own stack, like the rest of the parser.
+        stack = [(scope, own)]
+        while stack:
+            scope, own = stack.pop()
+            flat = scope.flat.get(kind)
+            if flat is None:
+                continue
+            if flat is not own:
+                if key in own:
+                    flat[key] = own[key]
+                else:
+                    parent = self._scopes[scope.parent].flat[kind]
+                    if key in parent:
+                        flat[key] = parent[key]
+                    else:
+                        flat.pop(key, None)
+            for child in scope.children:
+                own = getattr(child.context, kind)
+                if key not in own:
+                    stack.append((child, own))
+
+
+    def _forget(self, scope, kind):
+        # Drops the flat dictionaries of 'kind' in the scope and the scopes
+        # below it, to be made again when next needed.
+        stack = [scope]
+        while stack:
+            scope = stack.pop()
+            scope.flat.pop(kind, None)
+            stack.extend(scope.children)
+
+
+    def _remove(self, scope):
+        parent = self._scopes.get(scope.parent)
+        if parent is not None and scope in parent.children:
+            parent.children.remove(scope)
+        stack = [scope]
+        while stack:
+            scope = stack.pop()
+            self._scopes.pop(scope.context, None)
+            stack.extend(scope.children)
+
+
+def _parent(context):
+    # The topmost context of a file is the root of its tree of scopes.
+    return None if context.topmost else context.parent
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import glob
+import math
+import os
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+import libsbml
+from matlab_parser import *
+
+# Helpers shared by the tests that check that a converted model computes
+# the same rates of change as the plain equation-based one: the folded
+# (test_folderModule.py), shared-term (test_eliminatorModule.py) and
+# reaction-based (test_reactionsModule.py) models.
+
+def parse(text):
+    with MatlabGrammar(backend='rd') as parser:
+        return parser.parse_string(text)
+
+def read(path):
+    with open(path) as file:
+        return file.read()
+
+def cases_dir(name):
+    if os.path.isdir('tests'):
+        path = ['tests', 'converter_test', name]
+    elif os.path.isdir('converter_test'):
+        path = ['converter_test', name]
+    else:
+        path = [name]
+    return os.path.join(*path)
+
+def case_files():
+    return sorted(glob.glob(os.path.join(cases_dir('converter-test-cases'),
+                                         'valid*.m')))
+
+def model(sbml):
+    # The model, with the species set to made-up values.
+    document = libsbml.readSBMLFromString(sbml)
+    document.expandInitialAssignments()
+    model = document.getModel()
+    for i, species in enumerate(model.getListOfSpecies()):
+        species.setInitialConcentration(1 + i/10.0)
+    model.document = document           # The document owns the model.
+    return model
+
+def value(ast, model):
+    return libsbml.SBMLTransforms.evaluateASTNode(ast, model)
+
+def rule_rates(model):
+    # The value of each rate rule.
+    return dict((rule.getVariable(), value(rule.getMath(), model))
+                for rule in model.getListOfRules() if rule.isRate())
+
+def reaction_rates(model):
+    # The rate of change of each variable, from its rate rule or from the
+    # reactions it takes part in.
+    rates = rule_rates(model)
+    for reaction in model.getListOfReactions():
+        rate = value(reaction.getKineticLaw().getMath(), model)
+        for ref in reaction.getListOfReactants():
+            species = ref.getSpecies()
+            rates[species] = rates.get(species, 0) - ref.getStoichiometry() * rate
+        for ref in reaction.getListOfProducts():
+            species = ref.getSpecies()
+            rates[species] = rates.get(species, 0) + ref.getStoichiometry() * rate
+    return rates
+
+def same_rates(expected, actual, rel=1e-12, abs=None):
+    assert set(actual) == set(expected)
+    for var, rate in expected.items():
+        if math.isnan(rate):
+            assert math.isnan(actual[var])
+        else:
+            assert actual[var] == pytest.approx(rate, rel=rel, abs=abs)
@@ -0,0 +1,40 @@
+% The model of docs/presentations/slides-for-prime-meeting-2015/moccasin-demo/
+% antagonist.m, written as a script with the ODE function at the end, which
+% is the form the converter handles.  antagonist-biocham.xml is the output
+% BIOCHAM produced for it.
+%
+% ys(1)  [IFNb_mRNA]
+% ys(2)  [IFNb_env]
+% ys(3)  [STATP2n]
+% ys(4)  [IRF7m]
+
+x0=[0; 0; 0; 0];
+ts=0; te=10;
+
+% IFNb mRNA
+r0=3e-3; tao1=2.5;
+r1=r0; k1=log(2)/tao1;
+% IFNb protein (environment)
+C=5e5; vmax2=20 *3600; NA=6.02e23;
+r2= 1e9*C*vmax2/NA; KK2=2e-3;
+% STAT2Pn
+TJtot=1e-4;k5=3600; tao3=0.56;
+r3=TJtot*k5; k3=log(2)/tao3; KK3=4.3e-3;
+% IRF7 mRNA
+k11=3600e-7; tao6=1;
+r4=k11; k4=log(2)/tao6;
+
+[t,ys]=ode15s(@resi,linspace(ts,te,300),x0);
+
+function y=resi(t,x)
+y=zeros(4,1);
+b1=0.4;
+b4=0.2;
+myf=exp(-b1*t);
+myfs=exp(-b4*t);
+
+y(1)=  r1*myf- k1*x(1);
+y(2)=   r2*x(1)/(KK2+x(1));
+y(3)=    r3*x(2)/(KK3+x(2))- k3*x(3);
+y(4)=    r4*x(3)*myfs- k4*x(4);
+end
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/converter/')
+sys.path.append('../moccasin/converter/')
+sys.path.append('../../moccasin/converter/')
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+import libsbml
+from matlab_parser import *
+from converter import *
+from rate_helpers import parse, read, case_files, model, rule_rates, same_rates
+
+# SubexpressionEliminator finds the subexpressions that several rows of an
+# ODE function have in common, and create_raterule_model() uses it if asked
+# to.  The models it produces must compute the same rates as the others.
+
+text = '''x0 = [1; 2; 3];
+k1 = 2;
+K  = 0.5;
+k2 = 3;
+[t, x] = ode45(@f, [0 10], x0);
+function dx = f(t, x)
+  dx = [-k1*x(1)/(K + x(1)) + k2*x(3);
+        k1*x(1)/(K + x(1)) - k2*x(2)*(K + x(1));
+        k2*x(2)*(K + x(1)) - k2*x(3)];
+end
+'''
+
+def expressions(*texts):
+    # The variables are assigned first, so that they are parsed as such.
+    known = 'a = 0; b = 0; c = 0; x = [0 0]; '
+    lines = ['value = ' + text + ';' for text in texts]
+    nodes = parse(known + '\n'.join(lines)).nodes
+    return [node.rhs for node in nodes[-len(texts):]]
+
+def formulas(nodes):
+    return [MatlabGrammar.make_formula(node) for node in nodes]
+
+class TestClass:
+
+    def test_eliminate(self):
+        rows = expressions('a*x(1)/(b + x(1)) + c', 'c - a*x(1)/(b + x(1))',
+                           'exp(a*b) * (b + x(1))', 'exp(a*b)')
+        (rows, shared) = SubexpressionEliminator(2).eliminate(rows)
+        assert formulas(rows) == ['(cse001 + c)', '(c - cse001)',
+                                  '(cse002 * (b + x(1)))', 'cse002']
+        assert [name for name, _ in shared] == ['cse001', 'cse002']
+        assert formulas([expr for _, expr in shared]) == [
+            '((a * x(1)) / (b + x(1)))', 'exp((a * b))']
+
+    def test_minCost(self):
+        rows = expressions('a*x(1)/(b + x(1))', 'a*x(1)/(b + x(1))', 'b + x(1)')
+        (_, shared) = SubexpressionEliminator(4).eliminate(rows)
+        assert shared == []
+        (rows, shared) = SubexpressionEliminator(1).eliminate(rows)
+        assert formulas(rows) == ['cse002', 'cse002', 'cse001']
+        assert formulas([expr for _, expr in shared]) == [
+            '(b + x(1))', '((a * x(1)) / cse001)']
+
+    def test_notReordered(self):
+        rows = expressions('a*b + c', 'b*a + c', 'c + a*b')
+        (rows, shared) = SubexpressionEliminator(1).eliminate(rows)
+        assert formulas(rows) == ['(cse001 + c)', '((b * a) + c)', '(c + cse001)']
+
+    def test_unchanged(self):
+        rows = expressions('a*b + c', 'a + x(2)')
+        original = formulas(rows)
+        (new_rows, shared) = SubexpressionEliminator(1).eliminate(rows)
+        assert shared == []
+        assert new_rows[0] is rows[0] and new_rows[1] is rows[1]
+        assert formulas(rows) == original
+
+    def test_deepExpression(self):
+        total = ' + '.join('a*x({})'.format(i % 2 + 1) for i in range(2000))
+        rows = expressions(total + ' - b', total + ' - c')
+        (rows, shared) = SubexpressionEliminator(2).eliminate(rows)
+        assert formulas(rows) == ['(cse001 - b)', '(cse001 - c)']
+        assert len(shared) == 1
+
+    def test_model(self):
+        sbml = create_raterule_model(parse(text), add_comments=False,
+                                     common_subexpressions=True)[0]
+        model = libsbml.readSBMLFromString(sbml).getModel()
+        assert model.getNumRules() == 4
+        rule = model.getAssignmentRule('cse001')
+        assert libsbml.formulaToL3String(rule.getMath()) == 'k2 * x_2 * (K + x_1)'
+        rule = model.getRateRule('x_3')
+        assert libsbml.formulaToL3String(rule.getMath()) == 'cse001 - k2 * x_3'
+        xpp = create_raterule_model(parse(text), output_format='xpp',
+                                    add_comments=False,
+                                    common_subexpressions=True)[0]
+        assert '\ncse001=((k2 * x_2) * (K + x_1))\n' in xpp
+        assert 'dx_3/dt=(cse001 - (k2 * x_3))' in xpp
+
+    @pytest.mark.parametrize('path', case_files())
+    def test_sameRates(self, path):
+        contents = read(path)
+        plain = create_raterule_model(parse(contents), add_comments=False)[0]
+        shared = create_raterule_model(parse(contents), add_comments=False,
+                                       common_subexpressions=True,
+                                       min_subexpression_cost=1)[0]
+        same_rates(rule_rates(model(plain)), rule_rates(model(shared)))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/converter/')
+sys.path.append('../moccasin/converter/')
+sys.path.append('../../moccasin/converter/')
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import *
+from converter import *
+
+# MatlabFinder indexes the uses of variables in one walk of a context, and
+# clean_matlab() uses it to remove assignments to unused variables.
+
+text = '''a = 1;
+b = 2;
+c = a + 3;
+d = [c, 4];
+e = 5;
+if e > 0
+  z = 1;
+end
+unused = 6;
+[t, y] = ode45(@f, [0 1], d);
+function dy = f(t, y)
+  k = 2;
+  dy = -k*y;
+end
+'''
+
+def parse(text):
+    with MatlabGrammar(backend='rd') as parser:
+        return parser.parse_string(text)
+
+def ident(name):
+    return Identifier(name=name)
+
+class TestClass:
+
+    def test_findUse(self):
+        context = parse(text)
+        finder = MatlabFinder(context)
+        for name in ['a', 'c', 'd', 'e']:
+            assert finder.find_use(ident(name))
+        for name in ['b', 'z', 'unused']:
+            assert not finder.find_use(ident(name))
+
+    def test_uses(self):
+        context = parse(text)
+        finder = MatlabFinder(context)
+        (use,) = finder.uses(ident('a'))
+        assert isinstance(use, BinaryOp)
+        (use,) = finder.uses(ident('c'))
+        assert isinstance(use, Array)
+        assert finder.uses(ident('b')) == []
+
+    def test_functionContext(self):
+        context = parse(text)
+        finder = MatlabFinder(context.functions[ident('f')])
+        assert finder.find_use(ident('k'))
+        assert finder.find_use(ident('y'))
+        assert not finder.find_use(ident('a'))
+
+    def test_cleanMatlab(self):
+        context = parse(text)
+        clean_matlab(context, context)
+        remaining = set(context.assignments.keys())
+        for name in ['a', 'c', 'd', 'e']:
+            assert ident(name) in remaining
+        for name in ['b', 'unused']:
+            assert ident(name) not in remaining
+        assert ident('k') in context.functions[ident('f')].assignments
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+from decimal import Decimal
+import pytest
+import sys
+sys.path.append('moccasin/converter/')
+sys.path.append('../moccasin/converter/')
+sys.path.append('../../moccasin/converter/')
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+import libsbml
+from matlab_parser import *
+from converter import *
+from rate_helpers import parse, read, case_files, model, rule_rates, same_rates
+
+# MatlabConstantFolder replaces constant expressions by their values where
+# these are exact, and create_raterule_model() uses it if asked to.  The
+# models it produces must compute the same rates as the unfolded ones.
+
+text = '''tspan  = [0 300];
+xinit  = [0; 0];
+a      = 0.01 * 60;
+b      = 0.0058 * 60;
+c      = 0.006 * 60;
+d      = 0.000192 * 60;
+e      = a / 3;
+g      = -a * 2;
+[t, x] = ode45(@f, tspan, xinit);
+function dx = f(t, x)
+  dx = [a - b * x(1) + e; c * x(1) - d * x(2) + g * a * 2];
+end
+'''
+
+def expression(text):
+    # The variables are assigned first, so that they are parsed as such.
+    known = 'a = 0; b = 0; c = 0; e = 0; k = 0; x = 0; y = [1 2]; '
+    return parse(known + 'value = ' + text + ';').nodes[-1].rhs
+
+def formula(node):
+    return MatlabGrammar.make_formula(node)
+
+def folder():
+    context = parse('a = 0.01 * 60; b = a * 2; c = b / 3; k = 1 / 3;')
+    return MatlabConstantFolder(context.assignments)
+
+class TestClass:
+
+    def test_values(self):
+        f = folder()
+        assert f.variable_value('a') == Decimal('0.6')
+        assert f.variable_value('c') == Decimal('0.4')
+        assert f.variable_value('k') is None
+        assert f.variable_value('nothing') is None
+        assert f.value(expression('b - 1')) == Decimal('0.2')
+        assert f.value(expression('max(a, 2^3)')) == 8
+        assert f.value(expression('a * x')) is None
+
+    def test_inexact(self):
+        f = folder()
+        for text in ['1/3', 'exp(1)', 'sin(0.5)', '2 * pi', 'sqrt(2)', 'k']:
+            assert f.value(expression(text)) is None
+        assert f.value(expression('sqrt(2.25)')) == Decimal('1.5')
+
+    def test_fold(self):
+        f = folder()
+        assert formula(f.fold(expression('0.01 * 60 * x'))) == '(0.6 * x)'
+        assert formula(f.fold(expression('x * 0.01 * 60'))) == '((x * 0.01) * 60)'
+        assert formula(f.fold(expression('x + (0.2 - 1)'))) == '(x + (- 0.8))'
+        assert formula(f.fold(expression('x / 3 + k'))) == '((x / 3) + k)'
+        assert formula(f.fold(expression('y(0.4 * 5)'))) == 'y(2)'
+        # Variables not in 'inlined' are kept, even if their values are known.
+        assert formula(f.fold(expression('a * 2 * x'))) == '((a * 2) * x)'
+        assert formula(f.fold(expression('-a * x'))) == '((- a) * x)'
+        f.inlined = set(['a'])
+        assert formula(f.fold(expression('a * x + b'))) == '((0.6 * x) + b)'
+        assert formula(f.fold(expression('a * 2 * x'))) == '(1.2 * x)'
+        assert formula(f.fold(expression('a * b * x'))) == '((0.6 * b) * x)'
+
+    def test_deepExpression(self):
+        f = folder()
+        node = expression(' + '.join(['0.6'] * 2000 + ['x']))
+        assert formula(f.fold(node)) == '(1200 + x)'
+
+    def test_chooseInlined(self):
+        context = parse(text)
+        f = MatlabConstantFolder(context.assignments)
+        rows = [expression('a - b * x(1)'), expression('b * x(2) + e')]
+        assert f.choose_inlined(rows, []) == set(['a', 'e'])
+        assert f.choose_inlined(rows, [expression('[e, 1]')]) == set(['a'])
+
+    def test_foldedModel(self):
+        sbml = create_raterule_model(parse(text), add_comments=False,
+                                     fold_constants=True)[0]
+        model = libsbml.readSBMLFromString(sbml).getModel()
+        assert model.getNumInitialAssignments() == 0
+        assert model.getParameter('a').getValue() == 0.6
+        assert model.getParameter('g').getValue() == -1.2
+        formula = libsbml.formulaToL3String(model.getRateRule('x_2').getMath())
+        assert formula == '(c * x_1 - d * x_2) + g * a * 2'
+
+    def test_knownValuesKept(self):
+        # Without inlining, the rows still use the parameters.
+        model_text = """k = 0.5;
+y0 = [1; 2];
+[t, y] = ode45(@f, [0 10], y0);
+function dy = f(t, x)
+  dy = [-k*x(1); k*x(1) + 2*k*x(2)];
+end
+"""
+        xpp = create_raterule_model(parse(model_text), output_format='xpp',
+                                    add_comments=False, fold_constants=True)[0]
+        assert 'dy_1/dt=((- k) * y_1)' in xpp
+        assert 'dy_2/dt=((k * y_1) + ((2 * k) * y_2))' in xpp
+
+    def test_inlinedModel(self):
+        sbml = create_raterule_model(parse(text), add_comments=False,
+                                     inline_constants=True)[0]
+        model = libsbml.readSBMLFromString(sbml).getModel()
+        # 'a' is used twice, and the others once.
+        assert [p.getId() for p in model.getListOfParameters()] == ['a']
+        formula = libsbml.formulaToL3String(model.getRateRule('x_1').getMath())
+        assert formula == '(a - 0.348 * x_1) + 0.2'
+        formula = libsbml.formulaToL3String(model.getRateRule('x_2').getMath())
+        assert formula == '(0.36 * x_1 - 0.01152 * x_2) + -1.2 * a * 2'
+        xpp = create_raterule_model(parse(text), output_format='xpp',
+                                    add_comments=False, inline_constants=True)[0]
+        assert 'dx_1/dt=((a - (0.348 * x_1)) + 0.2)' in xpp
+
+    @pytest.mark.parametrize('path', case_files())
+    def test_sameRates(self, path):
+        contents = read(path)
+        plain = create_raterule_model(parse(contents), add_comments=False)[0]
+        folded = create_raterule_model(parse(contents), add_comments=False,
+                                       inline_constants=True)[0]
+        same_rates(rule_rates(model(plain)), rule_rates(model(folded)))
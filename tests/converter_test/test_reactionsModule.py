@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import pytest
+import sys
+sys.path.append('moccasin/converter/')
+sys.path.append('../moccasin/converter/')
+sys.path.append('../../moccasin/converter/')
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+import libsbml
+from matlab_parser import *
+from converter import *
+from rate_helpers import parse, read, cases_dir, case_files, model, value, \
+    rule_rates, reaction_rates, same_rates
+
+# ReactionInferrer replaces the rate rules of species by reactions, and
+# create_reaction_model() uses it.  Its reactions should be those BIOCHAM
+# produced for the same models, and should give the species the same rates
+# of change as the rate rules do.
+
+text = '''x0 = [1; 2; 3];
+k1 = 2;
+K  = 0.5;
+k2 = 3;
+[t, x] = ode45(@f, [0 10], x0);
+function dx = f(t, x)
+  v  = k1*x(1)/(K + x(1));
+  dx = [-v + 2*k2*x(3);
+        v - k2*x(2)*(x(1) + x(2))^2;
+        k2*x(2)*(x(1) + x(2))^2 - 2*k2*x(3)];
+end
+'''
+
+def side(refs):
+    return sorted((ref.getSpecies(), round(ref.getStoichiometry(), 12))
+                  for ref in refs)
+
+def reactions(model, rate_model=None):
+    # The reactions as (reactants, products, rate), with the rate given by
+    # its value in 'rate_model', since BIOCHAM writes the factors in other
+    # orders (and its models lack some parameters).
+    return sorted((side(r.getListOfReactants()), side(r.getListOfProducts()),
+                   value(r.getKineticLaw().getMath(), rate_model or model))
+                  for r in model.getListOfReactions())
+
+class TestClass:
+
+    @pytest.mark.parametrize('name, numeric', [('example', True),
+                                               ('antagonist', False)])
+    def test_biocham(self, name, numeric):
+        path = os.path.join(cases_dir('reaction-test-cases'), name)
+        sbml = create_reaction_model(parse(read(path + '.m')),
+                                     add_comments=False,
+                                     numeric_parameters=numeric)
+        ours = model(sbml)
+        assert not any(rule.isRate() for rule in ours.getListOfRules())
+        biocham = libsbml.readSBMLFromString(read(path + '-biocham.xml'))
+        expected = reactions(biocham.getModel(), ours)
+        actual = reactions(ours)
+        assert [r[:2] for r in actual] == [r[:2] for r in expected]
+        for (_, _, rate), (_, _, expected_rate) in zip(actual, expected):
+            assert rate == pytest.approx(expected_rate, rel=1e-12)
+
+    def test_example(self):
+        path = os.path.join(cases_dir('reaction-test-cases'), 'example.m')
+        sbml = create_reaction_model(parse(read(path)), add_comments=False)
+        ours = libsbml.readSBMLFromString(sbml).getModel()
+        laws = sorted(libsbml.formulaToL3String(r.getKineticLaw().getMath())
+                      for r in ours.getListOfReactions())
+        assert laws == ['a', 'b * x_1', 'c * x_1', 'd * x_2']
+        reaction = ours.getReaction('R_3')
+        assert libsbml.formulaToL3String(reaction.getKineticLaw().getMath()) == 'c * x_1'
+        assert side(reaction.getListOfReactants()) == [('x_1', 1)]
+        assert side(reaction.getListOfProducts()) == [('x_1', 1), ('x_2', 1)]
+        assert ours.getNumInitialAssignments() == 4
+
+    def test_model(self):
+        sbml = create_reaction_model(parse(text), add_comments=False)
+        ours = libsbml.readSBMLFromString(sbml).getModel()
+        found = dict((libsbml.formulaToL3String(r.getKineticLaw().getMath()),
+                      (side(r.getListOfReactants()), side(r.getListOfProducts())))
+                     for r in ours.getListOfReactions())
+        assert found == {
+            'v': ([('x_1', 1)], [('x_2', 1)]),
+            'k2 * x_3': ([('x_3', 2)], [('x_1', 2)]),
+            'k2 * x_2 * x_1^2': ([('x_1', 1), ('x_2', 1)], [('x_1', 1), ('x_3', 1)]),
+            'k2 * x_2^2 * x_1': ([('x_1', 1), ('x_2', 2)], [('x_1', 1), ('x_3', 2)]),
+            'k2 * x_2^3': ([('x_2', 1)], [('x_3', 1)]),
+        }
+        same_rates(rule_rates(model(create_raterule_model(parse(text))[0])),
+                   reaction_rates(model(sbml)), rel=1e-9, abs=1e-12)
+
+    def test_catalystThroughRule(self):
+        sbml = create_raterule_model(parse(text), add_comments=False,
+                                     common_subexpressions=True)[0]
+        document = libsbml.readSBMLFromString(sbml)
+        ReactionInferrer().infer(document)
+        found = dict((libsbml.formulaToL3String(r.getKineticLaw().getMath()),
+                      (side(r.getListOfReactants()), side(r.getListOfProducts())))
+                     for r in document.getModel().getListOfReactions())
+        # cse002 is k2*x_2*(x_1 + x_2)^2, defined by an assignment rule.
+        assert found['cse002'] == ([('x_1', 1), ('x_2', 1)],
+                                   [('x_1', 1), ('x_3', 1)])
+
+    def test_maxTerms(self):
+        cube = """x0 = [1; 2];
+[t, x] = ode45(@f, [0 10], x0);
+function dx = f(t, x)
+  dx = [-(x(1) + x(2))^3; (x(1) + x(2))^3];
+end
+"""
+        sbml = create_raterule_model(parse(cube), add_comments=False)[0]
+        for max_terms, count in [(1000, 4), (3, 1)]:
+            document = libsbml.readSBMLFromString(sbml)
+            added = ReactionInferrer(max_terms=max_terms).infer(document)
+            assert len(added) == count
+        formula = libsbml.formulaToL3String(added[0].getKineticLaw().getMath())
+        assert formula == '(x_1 + x_2)^3'
+
+    def test_manyTerms(self):
+        terms = ' + '.join('a*x(1)^{}'.format(i) for i in range(1, 1001))
+        model_text = ('x0 = [1; 1]; a = 2;\n[t, x] = ode45(@f, [0 1], x0);\n'
+                      'function dx = f(t, x)\n  dx = [-(' + terms + '); '
+                      + terms + ' + x(2)];\nend\n')
+        sbml = create_reaction_model(parse(model_text), add_comments=False)
+        ours = libsbml.readSBMLFromString(sbml).getModel()
+        assert ours.getNumReactions() == 1001
+
+    def test_parameters(self):
+        # Rate rules of parameters are left alone.
+        sbml = create_reaction_model(parse(text), use_species=False,
+                                     add_comments=False)
+        ours = libsbml.readSBMLFromString(sbml).getModel()
+        assert ours.getNumReactions() == 0
+        assert ours.getRateRule('x_1') is not None
+
+    @pytest.mark.parametrize('path', case_files())
+    @pytest.mark.parametrize('numeric', [False, True])
+    def test_sameRates(self, path, numeric):
+        contents = read(path)
+        plain = create_raterule_model(parse(contents), add_comments=False)[0]
+        inferred = create_reaction_model(parse(contents), add_comments=False,
+                                         numeric_parameters=numeric)
+        same_rates(rule_rates(model(plain)), reaction_rates(model(inferred)),
+                   rel=1e-9, abs=1e-12)
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/converter/')
+sys.path.append('../moccasin/converter/')
+sys.path.append('../../moccasin/converter/')
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import *
+from converter import *
+from rate_helpers import parse
+
+# MatlabRewriter writes numbers without scientific notation for XPP and
+# BIOCHAM.  The parsers share Number nodes, so it replaces them instead of
+# changing them, and the parameters made from the context's assignments must
+# get the replacements.
+
+text = '''k = 1.25e-7;
+c = 3e5;
+x0 = [1; 2];
+[t, x] = ode45(@f, [0 10], x0);
+function dx = f(t, x)
+  dx = [-k*x(1) + c; k*x(1) - 2.5e-3*x(2)];
+end
+'''
+
+class TestClass:
+
+    @pytest.mark.parametrize('output_format', ['xpp', 'biocham'])
+    def test_parameters(self, output_format):
+        xpp = create_raterule_model(parse(text), output_format=output_format,
+                                    add_comments=False)[0]
+        assert 'par k=0.000000125\n' in xpp
+        assert 'par c=300000\n' in xpp
+        assert '(0.0025 * x_2)' in xpp
+        assert 'e-7' not in xpp and 'e5' not in xpp
+
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pytest
+import sys
+import glob
+import os
+import threading
+sys.path.append('moccasin/converter/')
+sys.path.append('../moccasin/converter/')
+sys.path.append('../../moccasin/converter/')
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import *
+from converter import *
+
+# Conversions run in separate ConversionSessions must not affect each other:
+# converting the test cases in many threads at once must give exactly the
+# same output as converting them one after the other.
+
+def case_files():
+    if os.path.isdir('tests'):
+        path = ['tests', 'converter_test', 'converter-test-cases']
+    elif os.path.isdir('converter_test'):
+        path = ['converter_test', 'converter-test-cases']
+    else:
+        path = ['converter-test-cases']
+    return sorted(glob.glob(os.path.join(*(path + ['valid*.m']))))
+
+def convert(path, backend, output_format='sbml'):
+    session = ConversionSession(backend=backend)
+    with open(path) as file:
+        results = session.parse_string(file.read())
+    [output, _, _] = session.create_raterule_model(results,
+                                                   output_format=output_format,
+                                                   add_comments=False)
+    return output
+
+def convert_concurrently(jobs, num_threads):
+    outputs = [None]*len(jobs)
+    errors = []
+    def work(start):
+        try:
+            for i in range(start, len(jobs), num_threads):
+                outputs[i] = convert(*jobs[i])
+        except Exception as err:
+            errors.append(err)
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    return outputs
+
+class TestClass:
+
+    @pytest.mark.parametrize('backend', ['rd', 'pyparsing'])
+    def test_concurrentSameAsSerial(self, backend):
+        files = case_files()
+        if backend == 'pyparsing':
+            # PyParsing parses one at a time anyway; a few files will do.
+            files = files[:6]
+        jobs = [(path, backend, fmt) for fmt in ['sbml', 'xpp'] for path in files]
+        jobs = jobs * 2
+        serial = [convert(*job) for job in jobs]
+        assert convert_concurrently(jobs, 8) == serial
+
+    def test_namesPerSession(self):
+        # valid_55.m has an anonymous function that is turned into a new
+        # function, named by the session's NameGenerator.
+        path = [f for f in case_files() if f.endswith('valid_55.m')][0]
+        for i in range(2):
+            session = ConversionSession(backend='rd')
+            results = session.parse_file(path)
+            session.create_raterule_model(results)
+            assert 'anon001' in [f.name for f in results.nodes[0].context.functions]
+            assert session.names.name() == 'name002'
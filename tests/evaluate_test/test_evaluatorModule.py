@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import sys
+sys.path.append('moccasin/converter/')
+sys.path.append('../moccasin/converter/')
+sys.path.append('../../moccasin/converter/')
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+
+from decimal import Decimal
+import glob
+import os
+import pytest
+from matlab_parser import *
+from converter import *
+
+# MatlabEvaluator evaluates MatlabNode expressions directly.  The formulas of
+# the NumericStringParser test cases that are also MATLAB expressions should
+# give the same values.
+
+def case_files():
+    if os.path.isdir('tests'):
+        path = ['tests', 'evaluate_test', 'evaluate-test-cases']
+    elif os.path.isdir('evaluate_test'):
+        path = ['evaluate_test', 'evaluate-test-cases']
+    else:
+        path = ['evaluate-test-cases']
+    return sorted(glob.glob(os.path.join(*(path + ['valid_*.m']))))
+
+def expression(text):
+    with MatlabGrammar(backend='rd') as parser:
+        return parser.parse_string('value = ' + text + ';').nodes[0].rhs
+
+def read(path):
+    with open(path) as file:
+        return file.read().strip()
+
+class TestClass:
+
+    @pytest.mark.parametrize('path', case_files())
+    def test_evaluateCases(self, path):
+        formula = read(path)
+        expected = read(path[:-2] + '.txt')
+        try:
+            node = expression(formula)
+            value = MatlabEvaluator().evaluate(node)
+        except EvaluationError:
+            # Not every NumericStringParser formula is MATLAB (e.g., "ln").
+            pytest.skip('not a MATLAB expression: ' + formula)
+        assert value == pytest.approx(float(expected), rel=1e-9)
+
+    def test_exact(self):
+        evaluator = MatlabEvaluator(exact=True)
+        assert evaluator.evaluate(expression('0.1 + 0.2')) == Decimal('0.3')
+        assert evaluator.evaluate(expression('a * 60'), {'a': '0.01'}) == Decimal('0.6')
+        assert MatlabEvaluator().evaluate(expression('0.1 + 0.2')) != 0.3
+
+    def test_environment(self):
+        evaluator = MatlabEvaluator()
+        node = expression('k1*x(2)/(K + x(1)) - pi')
+        env = {'k1': 2, 'K': 0.5, 'x': [1, 3]}
+        assert evaluator.evaluate(node, env) == pytest.approx(4 - 3.141592653589793)
+        compiled = evaluator.compile(node)
+        assert compiled.names == set(['k1', 'K', 'x'])
+        assert compiled({'k1': 1, 'K': 0, 'x': [2, 2]}) == pytest.approx(1 - 3.141592653589793)
+        assert evaluator.compile(expression('k1*x(2)/(K + x(1)) - pi')) is compiled
+
+    def test_batch(self):
+        evaluator = MatlabEvaluator()
+        nodes = [expression(text) for text in ['a + b', 'a * b', 'max(a, b)']]
+        assert evaluator.evaluate_all(nodes, {'a': 2, 'b': 3}) == [5, 6, 3]
+        with pytest.raises(UnknownIdentifierError) as info:
+            evaluator.evaluate_all(nodes + [expression('c - d')], {'a': 2, 'b': 3})
+        assert info.value.names == ['c', 'd']
+
+    def test_unknownIdentifier(self):
+        with pytest.raises(UnknownIdentifierError) as info:
+            MatlabEvaluator().evaluate(expression('2 * q + mystery(3)'))
+        assert info.value.names == ['mystery', 'q']
+        with pytest.raises(EvaluationError):
+            MatlabEvaluator().evaluate(expression('1 / 0'))
+
+    def test_deepExpression(self):
+        terms = ['y{}'.format(i) for i in range(3000)]
+        node = expression(' + '.join(terms))
+        env = dict((name, 1) for name in terms)
+        assert MatlabEvaluator().evaluate(node, env) == 3000
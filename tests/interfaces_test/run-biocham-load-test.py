@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+#
+# @file    run-biocham-load-test.py
+# @brief   Measure build_reaction_model against a local mock of BIOCHAM.
+# @author  Harold Gomez
+#
+# <!---------------------------------------------------------------------------
+# This software is part of MOCCASIN, the Model ODE Converter for Creating
+# Automated SBML INteroperability. Visit https://github.com/sbmlteam/moccasin/.
+#
+# Copyright (C) 2014-2016 jointly by the following organizations:
+#  1. California Institute of Technology, Pasadena, CA, USA
+#  2. Icahn School of Medicine at Mount Sinai, New York, NY, USA
+#  3. Boston University, Boston, MA, USA
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation.  A copy of the license agreement is provided in the
+# file named "COPYING.txt" included with this software distribution and also
+# available online at https://github.com/sbmlteam/moccasin/.
+# ------------------------------------------------------------------------- -->
+
+from __future__ import print_function
+import getopt
+import os
+import sys
+import tempfile
+import threading
+import time
+sys.path.append('../../moccasin/interfaces/')
+sys.path.append('../../moccasin/')
+from controller import *
+from mock_biocham import *
+
+
+# Each of the 'concurrency' threads has its own Controller (since a
+# Controller holds the parse results of one file), but they all share one
+# BiochamClient, as the threads of the GUI or a batch would.  The threads
+# take calls from a common count until 'total' calls have been made, and
+# the time of each call to build_reaction_model is recorded.  Calls that
+# fail return None (build_reaction_model prints the error).
+
+def run(contents, client, concurrency, total):
+    remaining = [total]
+    lock = threading.Lock()
+    times = []
+    failures = [0]
+
+    def worker():
+        controller = Controller(client)
+        controller.parse_File(contents)
+        while True:
+            with lock:
+                if not remaining[0]:
+                    return
+                remaining[0] -= 1
+            start = time.time()
+            sbml = controller.build_reaction_model(use_species=True,
+                                                   name_after_param=False,
+                                                   add_comments=False)
+            elapsed = time.time() - start
+            with lock:
+                times.append(elapsed)
+                if not sbml:
+                    failures[0] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start, sorted(times), failures[0]
+
+
+def percentile(sorted_values, fraction):
+    index = int(round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def main(argv):
+    '''Usage: run-biocham-load-test.py [options]
+    Options:
+      -c N        Number of threads making calls (default: 4)
+      -n N        Number of calls in all (default: 100)
+      -f FILE     MATLAB file to convert (default: the example model)
+      -l SECONDS  Delay of the mock's answers, or LOW,HIGH (default: 0.05)
+      -e RATE     Fraction of the mock's answers that fail (default: 0)
+      -r N        Retries of each call by the client (default: 2)
+      -k          Keep BIOCHAM's answers in a cache (so most calls hit it)
+      -u URL      Call this service instead of starting the mock
+    '''
+    try:
+        options, _ = getopt.getopt(argv[1:], "c:n:f:l:e:r:ku:")
+    except getopt.GetoptError:
+        raise SystemExit(main.__doc__)
+
+    cases = os.path.join('..', 'converter_test', 'reaction-test-cases')
+    concurrency = 4
+    total = 100
+    path = os.path.join(cases, 'example.m')
+    latency = 0.05
+    error_rate = 0
+    retries = 2
+    cache_dir = None
+    url = None
+    for opt, value in options:
+        if opt == '-c':
+            concurrency = int(value)
+        elif opt == '-n':
+            total = int(value)
+        elif opt == '-f':
+            path = value
+        elif opt == '-l':
+            low_high = [float(v) for v in value.split(',')]
+            latency = tuple(low_high) if len(low_high) > 1 else low_high[0]
+        elif opt == '-e':
+            error_rate = float(value)
+        elif opt == '-r':
+            retries = int(value)
+        elif opt == '-k':
+            cache_dir = tempfile.mkdtemp()
+        elif opt == '-u':
+            url = value
+
+    with open(path) as file:
+        contents = file.read()
+    server = None
+    if not url:
+        with open(os.path.join(cases, 'example-biocham.xml'), 'rb') as file:
+            response = file.read()
+        server = MockBiocham(response=response, latency=latency,
+                             error_rate=error_rate, seed=0).start()
+        url = server.url
+    client = BiochamClient(url, retries=retries, backoff=0.01,
+                           pool_size=concurrency, cache_dir=cache_dir)
+    try:
+        elapsed, times, failures = run(contents, client, concurrency, total)
+    finally:
+        client.close()
+        if server:
+            server.stop()
+
+    print('{} calls, {} threads, {} failed'.format(total, concurrency, failures))
+    print('{:.1f} calls per second'.format(total / elapsed))
+    print('latency (ms): p50 {:.1f}  p90 {:.1f}  p99 {:.1f}  max {:.1f}'.format(
+        1000 * percentile(times, 0.5), 1000 * percentile(times, 0.9),
+        1000 * percentile(times, 0.99), 1000 * times[-1]))
+    if server:
+        print('mock service: {} uploads, {} connections, at most {} at once'.format(
+            len(server.uploads()), len(server.connections), server.most_active))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
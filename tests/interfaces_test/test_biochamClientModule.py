@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import hashlib
+import os
+import pytest
+import socket
+import sys
+import threading
+import time
+sys.path.append('moccasin/interfaces/')
+sys.path.append('../moccasin/interfaces/')
+sys.path.append('../../moccasin/interfaces/')
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from controller import *
+from mock_biocham import *
+
+# BiochamClient makes the calls to BIOCHAM for the Controller.  Here it
+# talks to a MockBiocham server, which records what it was sent.
+
+@pytest.fixture
+def server():
+    with MockBiocham(response=b'<sbml/>') as server:
+        yield server
+
+def client(server, **kwargs):
+    options = dict(retries=2, backoff=0.01, timeout=(1, 0.5))
+    options.update(kwargs)
+    return BiochamClient(server.url, **options)
+
+def unused_url():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return 'http://127.0.0.1:{}/rest/export'.format(port)
+
+def example_path(name):
+    if os.path.isdir('tests'):
+        path = ['tests', 'converter_test', 'reaction-test-cases', name]
+    elif os.path.isdir('converter_test'):
+        path = ['converter_test', 'reaction-test-cases', name]
+    else:
+        path = ['..', 'converter_test', 'reaction-test-cases', name]
+    return os.path.join(*path)
+
+def read(path, mode='r'):
+    with open(path, mode) as file:
+        return file.read()
+
+def example_inputs(count):
+    # Versions of example.m that differ in the value of 'a'.
+    text = read(example_path('example.m'))
+    return [text.replace('0.01 * 60', '0.0{} * 60'.format(i + 1))
+            for i in range(count)]
+
+def concurrent_calls(biocham, count):
+    # The results of 'count' calls made at once, or the errors they raised.
+    start = threading.Event()
+    outcomes = []
+    def call():
+        start.wait()
+        try:
+            outcomes.append(biocham.export_sbml('x=1\n'))
+        except BiochamError as err:
+            outcomes.append(err)
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    start.set()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+class TestClass:
+
+    def test_upload(self, server):
+        biocham = client(server)
+        assert biocham.export_sbml('dx/dt=-x\n') == b'<sbml/>'
+        (method, fields) = server.requests[0]
+        assert method == 'POST'
+        assert fields == {'exportTo': b'sbml', 'curate': b'true',
+                          'file': b'dx/dt=-x\n'}
+
+    def test_keepAlive(self, server):
+        biocham = client(server)
+        for _ in range(5):
+            biocham.export_sbml('x=1\n')
+        assert len(server.uploads()) == 5
+        assert len(server.connections) == 1
+
+    def test_retries(self, server):
+        server.script = [(503, b'', 0), (502, b'', 0), (200, b'<ok/>', 0)]
+        assert client(server).export_sbml('x=1\n') == b'<ok/>'
+        assert len(server.uploads()) == 3
+
+    def test_giveUp(self, server):
+        server.script = [(503, b'', 0)] * 3
+        with pytest.raises(BiochamError):
+            client(server).export_sbml('x=1\n')
+        assert len(server.uploads()) == 3
+
+    def test_notRetried(self, server):
+        server.script = [(400, b'bad', 0)]
+        with pytest.raises(BiochamError):
+            client(server).export_sbml('x=1\n')
+        assert len(server.uploads()) == 1
+
+    def test_timeout(self, server):
+        server.script = [(200, b'<late/>', 1), (200, b'<ok/>', 0)]
+        start = time.time()
+        assert client(server).export_sbml('x=1\n') == b'<ok/>'
+        assert time.time() - start < 1
+
+    def test_circuitBreaker(self, server):
+        biocham = client(server, retries=0, failure_threshold=2, reset_after=0.2)
+        server.script = [(500, b'', 0)] * 2
+        for _ in range(2):
+            with pytest.raises(BiochamError):
+                biocham.export_sbml('x=1\n')
+        with pytest.raises(BiochamUnavailableError):
+            biocham.export_sbml('x=1\n')
+        assert not biocham.is_reachable()
+        assert len(server.requests) == 2
+        time.sleep(0.25)
+        assert biocham.export_sbml('x=1\n') == b'<sbml/>'
+        assert len(server.requests) == 3
+
+    def test_halfOpen(self, server):
+        biocham = client(server, retries=0, failure_threshold=1, reset_after=0.2)
+        server.script = [(500, b'', 0)]
+        with pytest.raises(BiochamError):
+            biocham.export_sbml('x=1\n')
+        # Once 'reset_after' has passed, only one of the callers gets through.
+        for status, expected in [(500, BiochamError), (200, bytes)]:
+            time.sleep(0.25)
+            server.script = [(status, b'<sbml/>', 0.3)]
+            count = len(server.requests)
+            outcomes = concurrent_calls(biocham, 4)
+            assert len(server.requests) == count + 1
+            assert sorted(type(o).__name__ for o in outcomes) \
+                == sorted([expected.__name__] + ['BiochamUnavailableError'] * 3)
+        assert biocham.export_sbml('x=2\n') == b'<sbml/>'
+
+    def test_reachability(self, server):
+        biocham = client(server, reachability_ttl=0.2)
+        assert biocham.is_reachable()
+        assert biocham.is_reachable()
+        assert len(server.requests) == 1
+        time.sleep(0.25)
+        assert biocham.is_reachable()
+        assert len(server.requests) == 2
+        assert [method for method, _ in server.requests] == ['HEAD', 'HEAD']
+
+    def test_unreachable(self):
+        biocham = BiochamClient(unused_url(), retries=1, backoff=0.01)
+        assert not biocham.is_reachable()
+        with pytest.raises(BiochamError):
+            biocham.export_sbml('x=1\n')
+
+    def test_controller(self, server):
+        server.script = [(200, read(example_path('example-biocham.xml'), 'rb'), 0)]
+        contents = read(example_path('example.m'))
+        controller = Controller(client(server))
+        assert controller.check_network_connection()
+        controller.parse_File(contents)
+        sbml = controller.build_reaction_model(use_species=True,
+                                               name_after_param=False,
+                                               add_comments=False)
+        assert '<reaction id="R_1"' in sbml
+        assert '<parameter id="a"' in sbml
+        assert b'dx_1/dt' in server.uploads()[0]
+
+    def test_cache(self, server, tmp_path):
+        cache_dir = str(tmp_path / 'cache')
+        server.script = [(500, b'', 0)]
+        biocham = client(server, cache_dir=cache_dir)
+        assert biocham.export_sbml('x=1\n') == b'<sbml/>'
+        assert biocham.export_sbml('x=1\n') == b'<sbml/>'
+        assert biocham.export_sbml('x=2\n') == b'<sbml/>'
+        assert len(server.uploads()) == 3   # The 500 response was tried again.
+        assert sorted(os.listdir(cache_dir)) == sorted([
+            hashlib.sha256(b'x=1\n').hexdigest() + '.xml',
+            hashlib.sha256(b'x=2\n').hexdigest() + '.xml'])
+        assert biocham.cached_response('x=2\n') == b'<sbml/>'
+        assert biocham.cached_response('x=3\n') is None
+
+    def test_cacheNotWritable(self, server, tmp_path):
+        # The response is returned even if it can't be saved.
+        not_a_dir = tmp_path / 'file'
+        not_a_dir.write_bytes(b'')
+        biocham = client(server, cache_dir=str(not_a_dir))
+        assert biocham.export_sbml('x=1\n') == b'<sbml/>'
+        # Here the rename fails, since the entry's name is taken by a directory.
+        cache_dir = tmp_path / 'cache'
+        cache_dir.mkdir()
+        (cache_dir / (hashlib.sha256(b'x=1\n').hexdigest() + '.xml')).mkdir()
+        biocham = client(server, cache_dir=str(cache_dir))
+        assert biocham.export_sbml('x=1\n') == b'<sbml/>'
+        assert not [name for name in os.listdir(str(cache_dir))
+                    if name.endswith('.tmp')]
+
+    def test_offline(self, server, tmp_path):
+        cache_dir = str(tmp_path)
+        client(server, cache_dir=cache_dir).export_sbml('x=1\n')
+        count = len(server.requests)
+        biocham = BiochamClient(server.url, cache_dir=cache_dir, offline=True)
+        assert biocham.export_sbml('x=1\n') == b'<sbml/>'
+        with pytest.raises(BiochamError):
+            biocham.export_sbml('x=2\n')
+        assert not biocham.is_reachable()
+        assert len(server.requests) == count
+
+    def test_batch(self, server):
+        server.response = read(example_path('example-biocham.xml'), 'rb')
+        server.latency = 1             # Longer than parsing a model takes.
+        inputs = example_inputs(6)
+        inputs.insert(2, 'this is not a model')
+        controller = Controller(client(server, timeout=(1, 5)))
+        results = controller.build_reaction_models(inputs, True, False, False,
+                                                   max_workers=3)
+        assert 2 <= server.most_active <= 3
+        assert len(server.uploads()) == 6
+        assert isinstance(results[2], Exception)
+        del results[2]
+        for i, sbml in enumerate(results):
+            assert '<reaction id="R_1"' in sbml
+            assert '<cn> 0.0{} </cn>'.format(i + 1) in sbml
+
+    def test_batchReplay(self, server, tmp_path):
+        server.response = read(example_path('example-biocham.xml'), 'rb')
+        inputs = example_inputs(4)
+        cache_dir = str(tmp_path)
+        online = Controller(client(server, cache_dir=cache_dir))
+        expected = online.build_reaction_models(inputs, True, False, False)
+        assert len(server.uploads()) == 4
+        online.build_reaction_models(inputs, True, False, False)
+        assert len(server.uploads()) == 4
+        offline = Controller(BiochamClient(server.url, cache_dir=cache_dir,
+                                           offline=True))
+        assert offline.build_reaction_models(inputs, True, False, False) == expected
+        assert len(server.requests) == 4
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pytest
+import requests
+import sys
+import time
+sys.path.append('moccasin/interfaces/')
+sys.path.append('../moccasin/interfaces/')
+sys.path.append('../../moccasin/interfaces/')
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from mock_biocham import *
+
+# MockBiocham accepts the uploads that BIOCHAM accepts, and answers them as
+# it is told to.
+
+def upload(server, xpp=b'x=1\n', data=None):
+    data = data if data is not None else {'exportTo': 'sbml', 'curate': 'true'}
+    return requests.post(server.url, files={'file': ('model.ode', xpp)},
+                         data=data, timeout=5)
+
+class TestClass:
+
+    def test_contract(self):
+        with MockBiocham() as server:
+            response = upload(server)
+            assert response.status_code == 200
+            assert b'Model_generated_by_BIOCHAM' in response.content
+            assert upload(server, data={'exportTo': 'xpp'}).status_code == 400
+            assert requests.post(server.url, data={'exportTo': 'sbml'},
+                                 timeout=5).status_code == 400
+            assert requests.head(server.url, timeout=5).status_code == 405
+            assert server.uploads() == [b'x=1\n', b'x=1\n', None]
+
+    def test_response(self):
+        with MockBiocham(response=lambda xpp: b'<' + xpp.strip() + b'/>') as server:
+            assert upload(server, b'model').content == b'<model/>'
+
+    def test_errors(self):
+        with MockBiocham(error_rate=1, error_status=502) as server:
+            assert [upload(server).status_code for _ in range(3)] == [502] * 3
+        with MockBiocham(error_rate=0.5, seed=1) as server:
+            statuses = [upload(server).status_code for _ in range(40)]
+            assert 5 < statuses.count(503) < 35
+            assert statuses.count(200) + statuses.count(503) == 40
+
+    def test_latency(self):
+        with MockBiocham(latency=(0.1, 0.2)) as server:
+            start = time.time()
+            upload(server)
+            assert 0.1 <= time.time() - start < 1
+
+    def test_script(self):
+        with MockBiocham() as server:
+            server.script = [(504, b'', 0), (200, b'<first/>', 0)]
+            assert upload(server).status_code == 504
+            assert upload(server).content == b'<first/>'
+            assert upload(server).status_code == 200
+
+    def test_stop(self):
+        server = MockBiocham().start()
+        url = server.url
+        server.stop()
+        with pytest.raises(requests.ConnectionError):
+            requests.post(url, timeout=1)
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import glob
+import os
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabGrammar
+
+# Helpers shared by the syntax tests, which may be run from the top
+# directory, from tests/, or from tests/syntax_test/.
+
+def parse(text, backend='pyparsing'):
+    with MatlabGrammar(backend=backend) as parser:
+        return parser.parse_string(text)
+
+def cases_dir(suite='syntax-test-cases'):
+    # 'suite' is the name of a directory of test cases in syntax_test/ or
+    # converter_test/.
+    test_dir = 'converter_test' if suite.startswith('converter') else 'syntax_test'
+    if os.path.isdir('tests'):
+        path = ['tests', test_dir, suite]
+    elif os.path.isdir(test_dir):
+        path = [test_dir, suite]
+    elif os.path.isdir(suite):
+        path = [suite]
+    else:
+        path = ['..', test_dir, suite]
+    return os.path.join(*path)
+
+def case_files(pattern='valid_0[0-4]*.m', suite='syntax-test-cases'):
+    # A sample of the cases is usually enough; the whole of the syntax test
+    # suite is covered by test_syntaxModule.py.
+    return sorted(glob.glob(os.path.join(cases_dir(suite), pattern)))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# @file    run-dispatch-benchmark.py
+# @brief   Count PyParsing element attempts per line on the syntax tests.
+# @author  Michael Hucka
+#
+# <!---------------------------------------------------------------------------
+# This software is part of MOCCASIN, the Model ODE Converter for Creating
+# Automated SBML INteroperability. Visit https://github.com/sbmlteam/moccasin/.
+#
+# Copyright (C) 2014-2016 jointly by the following organizations:
+#  1. California Institute of Technology, Pasadena, CA, USA
+#  2. Icahn School of Medicine at Mount Sinai, New York, NY, USA
+#  3. Boston University, Boston, MA, USA
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation.  A copy of the license agreement is provided in the
+# file named "COPYING.txt" included with this software distribution and also
+# available online at https://github.com/sbmlteam/moccasin/.
+# ------------------------------------------------------------------------- -->
+
+from __future__ import print_function
+import glob
+import sys
+import time
+import getopt
+from pyparsing import ParserElement, Or, MatchFirst
+sys.path.append('../../moccasin/')
+from matlab_parser import *
+from matlab_parser.grammar_utils import PredictiveOr, PredictiveMatchFirst
+
+
+# Element attempts are counted by wrapping ParserElement._parse, which is
+# what every element calls to try every other element (with packrat parsing
+# on, each such call is a cache lookup, and a miss is followed by a call to
+# _parseNoCache, which we count separately).  The "before" run makes the
+# predictive alternatives in the grammar behave like plain Or and MatchFirst
+# by giving them back the original parseImpl methods.
+
+counts = {'attempts': 0, 'invocations': 0}
+
+def counting(method, key):
+    def wrapper(*args, **kwargs):
+        counts[key] += 1
+        return method(*args, **kwargs)
+    return wrapper
+
+
+def run(files, predictive):
+    if predictive:
+        PredictiveOr.parseImpl = predictive_or
+        PredictiveMatchFirst.parseImpl = predictive_match_first
+    else:
+        PredictiveOr.parseImpl = Or.parseImpl
+        PredictiveMatchFirst.parseImpl = MatchFirst.parseImpl
+    counts['attempts'] = counts['invocations'] = 0
+    lines = 0
+    start = time.time()
+    for f in files:
+        with open(f, 'r') as file:
+            contents = file.read()
+        lines += len(contents.splitlines()) or 1
+        ParserElement.resetCache()
+        with MatlabGrammar() as parser:
+            parser.parse_string(contents, fail_soft=True)
+    elapsed = time.time() - start
+    return lines, counts['attempts'], counts['invocations'], elapsed
+
+
+def main(argv):
+    '''Usage: run-dispatch-benchmark.py [-p pattern]
+    Arguments:
+      -p  (Optional) Glob pattern of the files to parse.  Default:
+          "syntax-test-cases/valid*.m".
+    '''
+
+    try:
+        options, path = getopt.getopt(argv[1:], "p:")
+    except:
+        raise SystemExit(main.__doc__)
+
+    pattern = "syntax-test-cases/valid*.m"
+    for opt, value in options:
+        if opt == '-p':
+            pattern = value
+    files = sorted(glob.glob(pattern))
+    if not files:
+        raise SystemExit('No files match ' + pattern)
+
+    ParserElement._parse = counting(ParserElement._parse, 'attempts')
+    ParserElement._parseNoCache = counting(ParserElement._parseNoCache, 'invocations')
+
+    print('{} files'.format(len(files)))
+    print('{:<12} {:>8} {:>12} {:>10} {:>12} {:>10} {:>9}'.format(
+        '', 'lines', 'attempts', 'per line', 'invocations', 'per line', 'seconds'))
+    for label, predictive in [('before', False), ('after', True)]:
+        lines, attempts, invocations, elapsed = run(files, predictive)
+        print('{:<12} {:>8} {:>12} {:>10.1f} {:>12} {:>10.1f} {:>9.2f}'.format(
+            label, lines, attempts, float(attempts)/lines, invocations,
+            float(invocations)/lines, elapsed))
+
+
+predictive_or = PredictiveOr.parseImpl
+predictive_match_first = PredictiveMatchFirst.parseImpl
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+# @file    run-memory-benchmark.py
+# @brief   Report the memory used per parse tree node on the syntax tests.
+# @author  Michael Hucka
+#
+# <!---------------------------------------------------------------------------
+# This software is part of MOCCASIN, the Model ODE Converter for Creating
+# Automated SBML INteroperability. Visit https://github.com/sbmlteam/moccasin/.
+#
+# Copyright (C) 2014-2016 jointly by the following organizations:
+#  1. California Institute of Technology, Pasadena, CA, USA
+#  2. Icahn School of Medicine at Mount Sinai, New York, NY, USA
+#  3. Boston University, Boston, MA, USA
+#
+# This is free software; you can redistribute it and/or modify it under the
+# terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation.  A copy of the license agreement is provided in the
+# file named "COPYING.txt" included with this software distribution and also
+# available online at https://github.com/sbmlteam/moccasin/.
+# ------------------------------------------------------------------------- -->
+
+from __future__ import print_function
+import glob
+import sys
+import getopt
+sys.path.append('../../moccasin/')
+from matlab_parser import *
+
+
+# Nodes have __slots__ rather than a __dict__.  The "before" figure is what
+# the same nodes cost when each holds its attributes in a __dict__, which
+# is measured by copying the attributes of every node onto an instance of a
+# plain class made for the node's class.  Only the nodes themselves are
+# counted, not the values of their attributes, since those are the same
+# either way.
+
+plain_classes = {}
+
+def plain_copy(node):
+    klass = type(node)
+    if klass not in plain_classes:
+        plain_classes[klass] = type('Plain' + klass.__name__, (object,), {})
+    copy = plain_classes[klass]()
+    for name, value in node.__getstate__().items():
+        setattr(copy, name, value)
+    return copy
+
+
+def nodes_in(thing):
+    stack = [thing]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, (list, tuple)):
+            stack.extend(item)
+        elif isinstance(item, MatlabNode):
+            yield item
+            for name in type(item)._visitable_attr:
+                stack.append(getattr(item, name))
+            if isinstance(item, FunDef) and item.context:
+                stack.append(item.context.nodes)
+
+
+def measure(files):
+    count = before = after = 0
+    for f in files:
+        with open(f, 'r') as file:
+            contents = file.read()
+        with MatlabGrammar() as parser:
+            context = parser.parse_string(contents, fail_soft=True)
+        for node in nodes_in(context.nodes):
+            copy = plain_copy(node)
+            count  += 1
+            before += sys.getsizeof(copy) + sys.getsizeof(copy.__dict__)
+            after  += sys.getsizeof(node)
+    return count, before, after
+
+
+def main(argv):
+    '''Usage: run-memory-benchmark.py [-p pattern]
+    Arguments:
+      -p  (Optional) Glob pattern of the files to parse.  Default:
+          "syntax-test-cases/valid*.m".
+    '''
+
+    try:
+        options, path = getopt.getopt(argv[1:], "p:")
+    except:
+        raise SystemExit(main.__doc__)
+
+    pattern = "syntax-test-cases/valid*.m"
+    for opt, value in options:
+        if opt == '-p':
+            pattern = value
+    files = sorted(glob.glob(pattern))
+    if not files:
+        raise SystemExit('No files match ' + pattern)
+
+    count, before, after = measure(files)
+    print('{} files, {} nodes'.format(len(files), count))
+    print('{:<12} {:>12} {:>14}'.format('', 'bytes', 'bytes per node'))
+    for label, total in [('before', before), ('after', after)]:
+        print('{:<12} {:>12} {:>14.1f}'.format(label, total, float(total)/count))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabGrammar
+from parse_helpers import case_files
+
+# Differential test of the PyParsing and recursive-descent parser backends:
+# both must produce the same nodes and the same contexts for every file in
+# the syntax and converter test suites.
+
+def describe(context, depth=0):
+    indent = '  '*depth
+    lines = ['{}context {!r} parameters={!r} returns={!r}'.format(
+        indent, context.name, context.parameters, context.returns)]
+    lines += [indent + repr(node) for node in context.nodes or []]
+    for label, table in [('assignments', context.assignments),
+                         ('calls', context.calls), ('types', context.types)]:
+        entries = sorted('{!r} => {!r}'.format(k, v) for k, v in table.items())
+        lines.append('{}{}: {}'.format(indent, label, entries))
+    for name in sorted(context.functions, key=repr):
+        lines += describe(context.functions[name], depth + 1)
+    return lines
+
+def parse_with(backend, path):
+    with MatlabGrammar(backend=backend) as parser:
+        return describe(parser.parse_file(path))
+
+class TestClass:
+
+    @pytest.mark.parametrize('model', case_files('*.m') +
+                             case_files('*.m', 'converter-test-cases'))
+    def test_backendsAgree(self, model):
+        assert parse_with('rd', model) == parse_with('pyparsing', model)
+
+    def test_unknownBackend(self):
+        with pytest.raises(ValueError):
+            MatlabGrammar(backend='nonesuch')
+
+    def test_parseError(self, capsys):
+        parser = MatlabGrammar(backend='rd')
+        assert parser.parse_string('x = (1 + ', fail_soft=True) is None
+        out, err = capsys.readouterr()
+        assert out.startswith('Error:')
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pytest
+import sys
+import os
+import codecs
+import threading
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabGrammar, ParseCache
+from parse_helpers import case_files
+
+# Parses the file twice through the same cache and returns the printed
+# results of each parse.  The second parse should be served from the cache.
+def parse_twice(path, cache, capsys):
+    outputs = []
+    for i in range(2):
+        with MatlabGrammar(cache=cache) as parser:
+            results = parser.parse_file(path, fail_soft=True)
+            parser.print_parse_results(results, print_raw=True)
+        out, err = capsys.readouterr()
+        outputs.append(out)
+    return outputs
+
+def read_parsed(path):
+    file = codecs.open(path, encoding='utf-8')
+    contents = file.read()
+    file.close()
+    return contents
+
+class TestClass:
+
+    @pytest.mark.parametrize('model', case_files('valid_0[0-2]*.m'))
+    def test_cachedParseIsIdentical(self, capsys, tmpdir, model):
+        cache = ParseCache(str(tmpdir))
+        first, second = parse_twice(model, cache, capsys)
+        assert cache.misses == 1 and cache.hits == 1
+        assert first == second
+        assert second == read_parsed(model.rsplit('.')[0] + '.txt')
+
+    def test_lruEviction(self, capsys, tmpdir):
+        cache = ParseCache(str(tmpdir), max_entries=2)
+        for model in case_files('valid_0[0-2]*.m')[:3]:
+            parse_twice(model, cache, capsys)
+        stats = cache.stats()
+        assert stats['entries'] == 2
+        assert stats['evictions'] == 1
+        assert stats['hits'] == 3 and stats['misses'] == 3
+
+    def test_corruptEntryIsMiss(self, capsys, tmpdir):
+        cache = ParseCache(str(tmpdir))
+        model = case_files('valid_0[0-2]*.m')[0]
+        parse_twice(model, cache, capsys)
+        for name in os.listdir(str(tmpdir)):
+            with open(os.path.join(str(tmpdir), name), 'wb') as f:
+                f.write(b'garbage')
+        first, _ = parse_twice(model, cache, capsys)
+        assert first == read_parsed(model.rsplit('.')[0] + '.txt')
+        assert cache.misses == 2
+
+    def test_backendsKeptApart(self, capsys, tmpdir):
+        cache = ParseCache(str(tmpdir))
+        model = case_files('valid_0[0-2]*.m')[0]
+        for backend in ['pyparsing', 'rd', 'pyparsing', 'rd']:
+            with MatlabGrammar(cache=cache, backend=backend) as parser:
+                parser.parse_file(model, fail_soft=True)
+        assert cache.misses == 2 and cache.hits == 2
+        assert len(os.listdir(str(tmpdir))) == 2
+
+    def test_countsFromThreads(self, tmpdir):
+        cache = ParseCache(str(tmpdir))
+        def lookups():
+            for i in range(200):
+                cache.get('nothing')
+        threads = [threading.Thread(target=lookups) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert cache.stats()['misses'] == 1600
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pickle
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import *
+from parse_helpers import parse
+
+# The CallGraph of a tree of contexts is built while parsing, and finds the
+# calls to a function and the calls given a handle to it.
+
+text = '''function main
+  [t, y] = ode45(@rhs, [0 10], [1 2]);
+  g(1, 2);
+  g(3, 4);
+end
+function dy = rhs(t, y)
+  dy = g(y, t);
+end
+function r = g(a, b)
+  r = a + b;
+end
+'''
+
+def ident(name):
+    return Identifier(name=name)
+
+class TestClass:
+
+    @pytest.mark.parametrize('backend', ['pyparsing', 'rd'])
+    def test_callsTo(self, backend):
+        top = parse(text, backend)
+        graph = top.call_graph
+        main = top.functions[ident('main')]
+        assert main.call_graph is graph
+        calls = graph.calls_to(ident('g'), top)
+        assert len(calls) == 3
+        assert calls[0] is main.calls[ident('g')][0]
+        assert len(graph.calls_to(ident('g'), main)) == 2
+        assert graph.calls_to(ident('rhs'), top) == []
+
+    @pytest.mark.parametrize('backend', ['pyparsing', 'rd'])
+    def test_handleCalls(self, backend):
+        top = parse(text, backend)
+        calls = top.call_graph.handle_calls(ident('rhs'), top)
+        assert list(calls.keys()) == [ident('ode45')]
+        assert len(calls[ident('ode45')]) == 1
+        assert top.call_graph.handle_calls(ident('g'), top) == {}
+
+    @pytest.mark.parametrize('backend', ['pyparsing', 'rd'])
+    def test_parameterTypes(self, backend):
+        top = parse(text, backend)
+        rhs = top.functions[ident('rhs')]
+        g = top.functions[ident('g')]
+        assert rhs.types[ident('y')] == 'variable'
+        assert g.types[ident('a')] == 'variable'
+
+    def test_allCalls(self):
+        top = parse(text)
+        main = top.functions[ident('main')]
+        calls = top.call_graph.all_calls(top)
+        assert set(calls) == set([ident('ode45'), ident('g')])
+        assert len(calls[ident('g')]) == 3
+        assert set(top.call_graph.all_calls(main)) == set(main.calls)
+
+    def test_removedCalls(self):
+        top = parse(text)
+        main = top.functions[ident('main')]
+        main.calls.pop(ident('g'))
+        assert len(top.call_graph.calls_to(ident('g'), top)) == 1
+        main.calls.pop(ident('ode45'))
+        assert top.call_graph.handle_calls(ident('rhs'), top) == {}
+
+    def test_rebuiltAfterPickling(self):
+        top = parse(text)
+        top.call_graph
+        copy = pickle.loads(pickle.dumps(top))
+        assert '_call_graph' not in copy.__dict__
+        assert len(copy.call_graph.calls_to(ident('g'), copy)) == 3
+        assert ident('ode45') in copy.call_graph.handle_calls(ident('rhs'), copy)
+
+    def test_loadedContext(self):
+        copy = load_context(dump_context(parse(text)))
+        main = copy.functions[ident('main')]
+        graph = main.call_graph
+        assert graph is copy.call_graph
+        assert len(graph.calls_to(ident('g'), copy)) == 3
+        assert main.symbols.type(ident('y'), main) == 'variable'
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import *
+import matlab_parser.columnar as columnar
+from matlab_parser.columnar import ColumnarTrees
+from parse_helpers import parse, case_files
+
+# ColumnarTrees must give back the nodes it was given, and find the same
+# nodes with and without NumPy.
+
+models = ['''function dy = f(t, y)
+  dy = [-y(1); y(1)*2];
+end
+''', '''[t, y] = ode45(@f, [0 10], [1 0]);
+plot(t, y);
+''', '''x = odeset('RelTol', 1e-4);
+[t, y] = ode15s(@(t, y) -y, [0, 1], 1, x);
+s.ode45 = 1;
+if x > 1, z = {1, 'a'}; elseif x, z = x'; else z = ~x; end
+''']
+
+def store():
+    trees = ColumnarTrees()
+    for i, text in enumerate(models):
+        trees.add(parse(text, 'rd').nodes, 'model{}'.format(i))
+    return trees
+
+@pytest.fixture(params=['numpy', 'python'])
+def which(request, monkeypatch):
+    if request.param == 'numpy':
+        if columnar.numpy is None:
+            pytest.skip('NumPy is not installed')
+    else:
+        monkeypatch.setattr(columnar, 'numpy', None)
+    return request.param
+
+class TestClass:
+
+    def test_roundTrip(self):
+        trees = ColumnarTrees()
+        for path in case_files():
+            with MatlabGrammar() as parser:
+                nodes = parser.parse_file(path).nodes
+            tree = trees.add(nodes, path)
+            assert trees.labels[tree] == path
+            assert repr(trees.nodes(tree)) == repr(nodes)
+
+    def test_findNamed(self, which):
+        trees = store()
+        rows = trees.find(FunCall, 'ode*')
+        found = [(trees.labels[trees.tree(row)], trees.node(row).name.name)
+                 for row in rows]
+        assert found == [('model1', 'ode45'), ('model2', 'odeset'),
+                         ('model2', 'ode15s')]
+        assert rows == sorted(rows)
+        call = trees.node(rows[0])
+        assert call == parse(models[1], 'rd').nodes[0].rhs
+        assert len(trees.find(Identifier, 'ode*')) == 4
+        assert len(trees.find(Identifier, 'y')) == 8
+
+    def test_findAll(self, which):
+        trees = store()
+        assert len(trees.find(FunDef)) == 1
+        assert len(trees.find(AnonFun)) == 1
+        assert [trees.node(row).field.name for row in trees.find(StructRef)] == ['ode45']
+        with pytest.raises(ValueError):
+            trees.find(BinaryOp, 'x')
+
+    def test_structure(self):
+        trees = store()
+        root = trees.root(2)
+        assert trees.parent[root] == -1
+        for row in range(root, len(trees)):
+            for child in trees.children(row):
+                assert trees.parent[child] == row
+        assert trees.node(trees.children(root)[0]) == parse(models[2], 'rd').nodes[0]
+
+    def test_deepExpression(self):
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(1000)
+        try:
+            nodes = parse('x = ' + '+'.join('a{}'.format(i) for i in range(5000)) + ';\n', 'rd').nodes
+            trees = ColumnarTrees()
+            trees.add(nodes)
+            assert MatlabNode.as_string(trees.nodes(0)[0].rhs) \
+                == MatlabNode.as_string(nodes[0].rhs)
+        finally:
+            sys.setrecursionlimit(limit)
+
+    def test_bytesPerNode(self):
+        trees = store()
+        count = sum(len(trees.find(cls)) for cls in columnar._NODE_CLASSES)
+        assert trees.nbytes() < 40 * count
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import *
+
+# Long expressions make deeply nested operator nodes (a sum of N terms is
+# N-1 nested BinaryOps).  Converting, printing and walking them must not
+# depend on the recursion limit, so the tests run with Python's default
+# limit -- some other test modules raise it -- and use many more terms than
+# that.  The PyParsing backend is much slower, so it gets fewer terms.
+
+def expression(terms):
+    return ' + '.join("-a{0}*b(2)' - ~c{0}".format(i) for i in range(terms))
+
+def first_terms(count):
+    return '+'.join("-a{0}*b(2)'-~c{0}".format(i) for i in range(count))
+
+@pytest.fixture
+def default_limit():
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(1000)
+    yield
+    sys.setrecursionlimit(limit)
+
+class Counter(MatlabNodeVisitor):
+    def __init__(self):
+        super(Counter, self).__init__()
+        self.count = 0
+
+    def visit_Identifier(self, node):
+        self.count += 1
+        return node
+
+class TestClass:
+
+    @pytest.mark.parametrize('backend, terms', [('rd', 20000), ('pyparsing', 300)])
+    def test_longExpression(self, default_limit, backend, terms):
+        parser = MatlabGrammar(backend=backend)
+        rhs = parser.parse_string('x = ' + expression(terms) + ';\n').nodes[0].rhs
+        assert sys.getrecursionlimit() == 1000
+        text = MatlabNode.as_string(rhs)
+        assert text.startswith(first_terms(3))
+        assert hash(rhs) == hash(text)
+        formula = MatlabGrammar.make_formula(rhs)
+        assert formula.startswith('('*(2*terms + 1) + "- a0()) * b(2)') - (~ c0()))")
+        assert formula.count('(') == formula.count(')')
+        assert str(rhs).count('{binary op expression') == 3*terms - 1
+        assert repr(rhs).count('Identifier(') == 3*terms
+        counter = Counter()
+        counter.visit(rhs)
+        assert counter.count == 3*terms
+
+    def test_shortExpression(self, default_limit):
+        parser = MatlabGrammar(backend='rd')
+        rhs = parser.parse_string('x = ' + expression(2) + ';\n').nodes[0].rhs
+        assert MatlabNode.as_string(rhs) == "-a0*b(2)'-~c0+-a1*b(2)'-~c1"
+        assert MatlabGrammar.make_formula(rhs) == \
+            "(((((- a0()) * b(2)') - (~ c0())) + ((- a1()) * b(2)')) - (~ c1()))"
+        assert str(rhs) == (
+            '{binary op expression - left {binary op expression + left '
+            '{binary op expression - left {binary op expression * left '
+            '{unary op expression - operand {function/array: {identifier: "a0"} None}} '
+            'right {transpose expression: {function/array: {identifier: "b"} '
+            '( {number: 2} )} operator \' }} right {unary op expression ~ operand '
+            '{function/array: {identifier: "c0"} None}}} right {binary op expression '
+            '* left {unary op expression - operand {function/array: {identifier: "a1"} '
+            'None}} right {transpose expression: {function/array: {identifier: "b"} '
+            '( {number: 2} )} operator \' }}} right {unary op expression ~ operand '
+            '{function/array: {identifier: "c1"} None}}}')
+        assert repr(rhs.right) == ("UnaryOp(op='~', operand=Ambiguous("
+                                   "name=Identifier(name='c1'), args=None))")
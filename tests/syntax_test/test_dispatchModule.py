@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from pyparsing import *
+from matlab_parser.grammar_utils import PredictiveOr, PredictiveMatchFirst
+
+# PredictiveOr and PredictiveMatchFirst must accept exactly what Or and
+# MatchFirst accept given the same alternatives, and produce the same
+# tokens.  The statements below mimic the shape of the ones in grammar.py:
+# keywords, identifiers that exclude keywords, and alternatives that start
+# with line breaks or can match the end of the input.
+
+def statements(alternatives, either):
+    ParserElement.setDefaultWhitespaceChars(' \t\n\r')
+    keyword = Keyword('if') | Keyword('end') | Keyword('else') | Keyword('elseif')
+    ident = NotAny(keyword) + Word(alphas, alphanums + '_')('identifier')
+    number = Word(nums)('number')
+    expr = Group(ident | number)
+    if_stmt = Group(Keyword('if') + expr + Optional(Keyword('else')) + Keyword('end'))
+    assign = Group(ident + Suppress('=') + expr)
+    call = Group(ident + Suppress('(') + Optional(expr) + Suppress(')'))
+    bare = Group(expr)
+    ParserElement.setDefaultWhitespaceChars(' \t')
+    comment = Group(Suppress('%') + restOfLine + LineEnd().suppress())
+    delimiter = Suppress(';') | LineEnd().suppress()
+    shell = Group('!' + restOfLine)
+    ParserElement.setDefaultWhitespaceChars(' \t\n\r')
+    stmt = alternatives([if_stmt, assign, call, bare])
+    return ZeroOrMore(either([stmt, comment, delimiter, shell])) + StringEnd()
+
+def grammars():
+    return (statements(MatchFirst, Or),
+            statements(PredictiveMatchFirst, PredictiveOr))
+
+def parse(grammar, text):
+    try:
+        return grammar.parseString(text).dump()
+    except ParseException as err:
+        return (err.loc, err.msg)
+
+cases = ['', 'a', '1', 'a = 1', 'a=b', 'f(1)', 'f()', 'if a end',
+         'if a else end', 'if 1\nend', 'ifa = 1', 'enda', 'end', 'else',
+         'elseif', 'a = end', '% comment\na', 'a % comment', '!ls -l\nb',
+         ';;a;\n\n b', '  \n  a = 1;  \n', 'a b', 'a = ', 'f(', '!']
+
+class TestClass:
+
+    @pytest.mark.parametrize('text', cases)
+    def test_sameAsOrAndMatchFirst(self, text):
+        reference, predictive = grammars()
+        assert parse(predictive, text) == parse(reference, text)
+
+    def test_tableUpdated(self):
+        alternatives = PredictiveMatchFirst([Keyword('if')])
+        assert alternatives.parseString('if').asList() == ['if']
+        alternatives.append(Word(nums))
+        assert alternatives.parseString('12').asList() == ['12']
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import *
+from parse_helpers import parse
+
+# Nodes keep their hash once computed, and the parsers share Identifier and
+# Number nodes for the same name or value within one parse.
+
+text = '''x = 1;
+y = x + 1;
+z(x) = y * 2;
+'''
+
+class TestClass:
+
+    @pytest.mark.parametrize('backend', ['pyparsing', 'rd'])
+    def test_sharedLeaves(self, backend):
+        nodes = parse(text, backend).nodes
+        x = nodes[0].lhs
+        assert nodes[1].rhs.left is x
+        assert nodes[2].lhs.args[0] is x
+        assert nodes[1].rhs.right is nodes[0].rhs
+
+    @pytest.mark.parametrize('backend', ['pyparsing', 'rd'])
+    def test_notSharedAcrossParses(self, backend):
+        first = parse(text, backend).nodes[0].lhs
+        second = parse(text, backend).nodes[0].lhs
+        assert first is not second
+        assert first == second
+
+    @pytest.mark.parametrize('backend', ['pyparsing', 'rd'])
+    def test_contextLookups(self, backend):
+        context = parse(text, backend)
+        lhs = ArrayRef(name=Identifier(name='z'), args=[Identifier(name='x')],
+                       is_cell=False)
+        assert context.assignments[Identifier(name='x')] == Number(value='1')
+        assert lhs in context.assignments
+
+    def test_hashCached(self):
+        node = BinaryOp(op='+', left=Identifier(name='a'), right=Number(value='1'))
+        assert hash(node) == hash(MatlabNode.as_string(node))
+        assert node._hash == hash('a+1')
+
+    def test_hashDroppedOnChange(self):
+        node = BinaryOp(op='+', left=Identifier(name='a'), right=Number(value='1'))
+        hash(node)
+        node.right = Number(value='2')
+        assert node._hash is None
+        assert hash(node) == hash('a+2')
+        table = {node: 'x'}
+        assert table[BinaryOp(op='+', left=Identifier(name='a'),
+                              right=Number(value='2'))] == 'x'
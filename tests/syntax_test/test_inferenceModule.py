@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabGrammar
+from matlab_parser.grammar import Ambiguous, ArrayRef, FunCall
+
+# Type inferences must propagate however long the chain of them is.  Here,
+# x1 is only known to be a variable once g is known to be a function, x2
+# once x1 is, and so on up the chain.
+
+text = '''function main()
+  y = x4(1);
+  x4 = x3(1);
+  x3 = x2(1);
+  x2 = x1(1);
+  x1 = g(1);
+end
+function r = g(a)
+  r = a;
+end
+'''
+
+class TestClass:
+
+    @pytest.mark.parametrize('backend', ['pyparsing', 'rd'])
+    def test_longChain(self, backend):
+        context = MatlabGrammar(backend=backend).parse_string(text)
+        body = context.nodes[0].body
+        assert not any(isinstance(stmt.rhs, Ambiguous) for stmt in body)
+        assert all(isinstance(stmt.rhs, ArrayRef) for stmt in body[:-1])
+        assert isinstance(body[-1].rhs, FunCall)
+        types = context.nodes[0].context.types
+        for name in ['x1', 'x2', 'x3', 'x4']:
+            assert [t for k, t in types.items() if k.name == name] == ['variable']
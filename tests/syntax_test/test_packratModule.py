@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from pyparsing import ParserElement
+from matlab_parser import MatlabGrammar
+from matlab_parser.grammar import _PACKRAT_CACHE_ATTR
+from matlab_parser.grammar_utils import PackratCache
+
+# The packrat cache size of a MatlabGrammar object must not change what is
+# parsed, and the cache must be emptied after every parse.
+
+text = '''function y = f(x)
+  a = [1 2; 3 4];
+  if x > 0
+    y = a(1,2) + x^2;
+  else
+    y = -x;
+  end
+'''
+
+def parse(size):
+    parser = MatlabGrammar(packrat_cache_size=size)
+    return [repr(node) for node in parser.parse_string(text).nodes], parser
+
+class TestClass:
+
+    @pytest.mark.parametrize('size', [0, 1, 100, None])
+    def test_sameResults(self, size):
+        assert parse(size)[0] == parse(MatlabGrammar().packrat_stats()['size'])[0]
+
+    def test_stats(self):
+        previous = getattr(ParserElement, _PACKRAT_CACHE_ATTR)
+        nodes, parser = parse(100)
+        stats = parser.packrat_stats()
+        assert stats['size'] == 100
+        assert stats['misses'] > 0 and stats['hits'] > 0
+        assert stats['peak entries'] == 100
+        assert stats['evictions'] > 0
+        assert stats['entries'] == 0
+        assert getattr(ParserElement, _PACKRAT_CACHE_ATTR) is previous
+
+    def test_statsReset(self):
+        nodes, parser = parse(None)
+        first = parser.packrat_stats()
+        parser.parse_string('x = 1;')
+        second = parser.packrat_stats()
+        assert second['misses'] < first['misses']
+        assert second['evictions'] == 0
+        assert second['peak entries'] < first['peak entries']
+
+    def test_clearedAfterError(self):
+        parser = MatlabGrammar(packrat_cache_size=None)
+        assert parser.parse_string('x = (1 + ', fail_soft=True) is None
+        assert parser.packrat_stats()['entries'] == 0
+        assert parser.packrat_stats()['peak entries'] > 0
+
+    def test_lruOrder(self):
+        cache = PackratCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1
+        cache.set('c', 3)
+        assert cache.get('b') is cache.not_in_cache
+        assert cache.get('a') == 1
+        assert cache.stats()['evictions'] == 1
+
+    def test_dictInterface(self):
+        cache = PackratCache(1)
+        cache['a'] = 1
+        assert 'a' in cache and cache['a'] == 1
+        cache['b'] = 2
+        assert 'a' not in cache
+        assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+    @pytest.mark.parametrize('size', [-1, 1.5, 'big'])
+    def test_badSize(self, size):
+        with pytest.raises(ValueError):
+            MatlabGrammar(packrat_cache_size=size)
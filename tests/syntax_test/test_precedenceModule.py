@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from pyparsing import *
+from matlab_parser.grammar_utils import PrecedenceClimber, makeLRlike
+
+# PrecedenceClimber must accept exactly what infixNotation() accepts given
+# the same operator table, and produce the same tokens.  The table below
+# mimics the shape of the one in grammar.py, including operators that do
+# and do not skip line breaks.
+
+def operator_table():
+    ParserElement.setDefaultWhitespaceChars(' \t')
+    plus   = Literal('+')('binary operator')
+    minus  = Literal('-')('binary operator')
+    times  = Literal('*')('binary operator')
+    power  = Literal('^')('binary operator')
+    uminus = Literal('-')('unary operator')
+    transp = Literal("'")('transpose')
+    colon  = Literal(':')
+    amp    = Literal('&')('binary operator')
+    ParserElement.setDefaultWhitespaceChars(' \t\n\r')
+    colon_op = colon('colon operator')
+    return [
+        (Group(NotAny(White(' \t')) + transp), 1, opAssoc.LEFT, makeLRlike(1)),
+        (Group(power),                         2, opAssoc.LEFT, makeLRlike(2)),
+        (Group(uminus),                        1, opAssoc.RIGHT),
+        (Group(times),                         2, opAssoc.LEFT, makeLRlike(2)),
+        (Group(plus ^ minus),                  2, opAssoc.LEFT, makeLRlike(2)),
+        ((Group(colon_op), Group(colon_op)),   3, opAssoc.LEFT, makeLRlike(3)),
+        (Group(colon_op),                      2, opAssoc.LEFT, makeLRlike(2)),
+        (Group(amp),                           2, opAssoc.LEFT, makeLRlike(2)),
+    ]
+
+def grammars():
+    operand = Group(Word(alphas)('identifier') | Word(nums)('number'))
+    table = operator_table()
+    return (infixNotation(operand, table) + StringEnd(),
+            PrecedenceClimber(operand, table) + StringEnd())
+
+def parse(grammar, text):
+    try:
+        return grammar.parseString(text).dump()
+    except ParseException:
+        return None
+
+cases = ['a', '1', 'a + b', 'a+b*c', 'a*b+c', 'a - b - c - d', 'a ^ b ^ c',
+         "a'", "a''", "a '", '-a', '--a', 'a^-b', '-a^b', 'a:b', 'a:b:c',
+         'a:b:c:d', '(a + b) * c', '((a))', 'a & b & c', 'a*(b + -c)^d',
+         'a - b\n- c', 'a\n- b', 'a*b\n*c', 'a*b\n-c', 'a & b\n& c', 'a\n:b',
+         'a:b\n:c', '(a\n+ b)', 'a +\nb', 'a + ', '(a', 'a b', '']
+
+class TestClass:
+
+    @pytest.mark.parametrize('text', cases)
+    def test_sameAsInfixNotation(self, text):
+        reference, climber = grammars()
+        assert parse(climber, text) == parse(reference, text)
+
+    def test_unsupportedOperator(self):
+        with pytest.raises(ValueError):
+            PrecedenceClimber(Word(nums), [(Literal('='), 2, opAssoc.RIGHT)])
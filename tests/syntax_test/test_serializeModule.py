@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pickle
+import pytest
+import sys
+import threading
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import *
+from matlab_parser.serialize import dump_context, load_context, FORMAT_VERSION
+from parse_helpers import parse, case_files
+
+# dump_context() and load_context() must give back the same contexts and
+# nodes, decoding the contexts of functions only when they are used.
+
+text = '''function y = f(x)
+  y = g(x) + h(x);
+end
+function z = g(x)
+  z = [x, 2; 3, x'];
+  if z(1) > 1
+    z = z';
+  end
+end
+function w = h(x)
+  w = @(t) t*x;
+end
+'''
+
+def printed(context, capsys):
+    MatlabGrammar().print_parse_results(context, print_raw=True)
+    out, err = capsys.readouterr()
+    return out
+
+def decoded(context):
+    return context.__class__ is MatlabContext
+
+class TestClass:
+
+    @pytest.mark.parametrize('path', case_files())
+    def test_roundTrip(self, path, capsys):
+        with MatlabGrammar() as parser:
+            context = parser.parse_file(path)
+        expected = printed(context, capsys)
+        assert printed(load_context(dump_context(context)), capsys) == expected
+
+    def test_lazyContexts(self):
+        context = load_context(dump_context(parse(text, 'rd')))
+        assert not decoded(context)
+        assert context.topmost
+        assert decoded(context)
+        functions = dict((k.name, v) for k, v in context.functions.items())
+        assert not any(decoded(c) for c in functions.values())
+        assert functions['g'].parent is context
+        assert functions['g'].name.name == 'g'
+        assert decoded(functions['g'])
+        assert not decoded(functions['f']) and not decoded(functions['h'])
+        fundef = context.nodes[2]
+        assert fundef.context is functions['h']
+        assert not decoded(functions['h'])
+        assert fundef.body is functions['h'].nodes
+        assert isinstance(fundef, FunDef) and type(fundef) is FunDef
+
+    def test_sharing(self):
+        context = load_context(dump_context(parse('a = 1;\nc = f(a, 1);\n', 'rd')))
+        first, second = context.nodes
+        assert second.rhs.args[0] is first.lhs
+        assert second.rhs.args[1] is first.rhs
+        assert context.assignments[first.lhs] is first.rhs
+        assert context.assignments[second.lhs] is second.rhs
+
+    def test_sameAsParse(self):
+        original = parse(text, 'rd')
+        context = load_context(dump_context(original))
+        assert MatlabNode.as_string(context.functions[Identifier(name='g')].nodes[0].rhs) \
+            == MatlabNode.as_string(original.functions[Identifier(name='g')].nodes[0].rhs)
+        assert set(context.types.items()) == set(original.types.items())
+
+    def test_deepExpression(self):
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(1000)
+        try:
+            context = parse('x = ' + '+'.join('a{}'.format(i) for i in range(5000)) + ';\n', 'rd')
+            data = dump_context(context)
+            copy = load_context(data)
+            assert MatlabNode.as_string(copy.nodes[0].rhs) \
+                == MatlabNode.as_string(context.nodes[0].rhs)
+        finally:
+            sys.setrecursionlimit(limit)
+
+    def test_pickleLazy(self):
+        context = load_context(dump_context(parse(text, 'rd')))
+        copy = pickle.loads(pickle.dumps(context, pickle.HIGHEST_PROTOCOL))
+        assert type(copy) is MatlabContext
+        assert len(copy.functions) == 3
+
+    def test_threads(self):
+        # Threads that use the same loaded contexts for the first time at
+        # once must each see them fully decoded.
+        functions = ''.join('function y = f{0}(x)\n  y = x + {0};\nend\n'
+                            .format(i) for i in range(20))
+        data = dump_context(parse(functions, 'rd'))
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)     # Switch threads often.
+        try:
+            self._read_in_threads(data)
+        finally:
+            sys.setswitchinterval(interval)
+
+    def _read_in_threads(self, data):
+        for trial in range(30):
+            context = load_context(data)
+            contexts = list(context.functions.values())
+            start = threading.Event()
+            found = []
+            def read():
+                start.wait()
+                try:
+                    found.append([len(c.assignments) for c in contexts])
+                except Exception as err:
+                    found.append(err)
+            threads = [threading.Thread(target=read) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            start.set()
+            for thread in threads:
+                thread.join()
+            assert found == [[1] * 20] * 8
+            assert all(decoded(c) for c in contexts)
+
+    def test_badData(self):
+        with pytest.raises(ValueError):
+            load_context(b'not a context')
+        data = dump_context(parse('a = 1;\n', 'rd'))
+        with pytest.raises(ValueError):
+            load_context(data[:4] + b'\xff\xff' + data[6:])
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pickle
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import *
+from parse_helpers import parse
+
+# Nodes have __slots__ instead of a __dict__, made from their _attr_names.
+# They must still compare, pickle and get walked by visitors as before.
+
+text = '''function y = f(x)
+  y = [x, 2; 3, x'] + g(x(1:end), 'a');
+end
+a = f(1);
+if a > 1
+  b.c = @(z) z*2;
+end
+'''
+
+# FunDef nodes hold a MatlabContext, which only compares equal to itself, so
+# the tests compare the nodes that follow the function definition.
+
+class TestClass:
+
+    def test_noDict(self):
+        for node in [Identifier(name='x'), Number(value='1'),
+                     BinaryOp(op='+', left=Number(value='1'),
+                              right=Identifier(name='x'))]:
+            assert not hasattr(node, '__dict__')
+            with pytest.raises(AttributeError):
+                node.unknown = 1
+
+    def test_slotsFromAttrNames(self):
+        assert Identifier(name='x').__getstate__() == {'name': 'x'}
+        assert ArrayRef.__slots__ == ('args', 'is_cell')
+        assert Identifier.__slots__ == ()
+        assert set(FunDef(name=None, parameters=[], output=[], body=[],
+                          context=None).__getstate__()) == set(FunDef._attr_names)
+
+    def test_equality(self):
+        assert Identifier(name='x') == Identifier(name='x')
+        assert Identifier(name='x') != Identifier(name='y')
+        assert Identifier(name='x') != Number(value='x')
+        assert parse(text).nodes[1:] == parse(text).nodes[1:]
+
+    @pytest.mark.parametrize('protocol', range(pickle.HIGHEST_PROTOCOL + 1))
+    def test_pickle(self, protocol):
+        nodes = parse(text).nodes
+        copy = pickle.loads(pickle.dumps(nodes, protocol))
+        assert copy[1:] == nodes[1:]
+        assert str(copy) == str(nodes)
+
+    def test_dictState(self):
+        # Pickles made when nodes had a __dict__ hold the __dict__ as state.
+        node = Identifier.__new__(Identifier)
+        node.__setstate__({'name': 'x'})
+        assert node == Identifier(name='x')
+
+    def test_visitor(self):
+        class Renamer(MatlabNodeVisitor):
+            def visit_Identifier(self, node):
+                return Identifier(name=node.name.upper())
+        nodes = parse('a = b + c(d);\n').nodes
+        visited = Renamer().visit(nodes)
+        assert MatlabNode.as_string(visited[0].rhs) == 'B+C(D)'
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pytest
+import os
+import subprocess
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser.grammar import _syntax
+
+# The PyParsing grammar must not be built until it is needed: importing the
+# parser, creating a MatlabGrammar and parsing with the 'rd' backend don't
+# need it.  This is checked in a separate Python process.
+
+check = '''
+import sys
+from matlab_parser import MatlabGrammar
+MatlabGrammar(backend='rd').parse_string('x = 1;')
+built = 'matlab_parser.pyparsing_grammar' in sys.modules
+MatlabGrammar().parse_string('x = 1;')
+sys.exit(0 if not built and 'matlab_parser.pyparsing_grammar' in sys.modules else 1)
+'''
+
+def package_dir():
+    for path in ['moccasin', '../moccasin', '../../moccasin']:
+        if os.path.isdir(os.path.join(path, 'matlab_parser')):
+            return os.path.abspath(path)
+
+class TestClass:
+
+    def test_lazyGrammar(self):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [package_dir()] + [p for p in [os.environ.get('PYTHONPATH')] if p])
+        assert subprocess.call([sys.executable, '-c', check], env=env) == 0
+
+    def test_grammarNames(self):
+        syntax = _syntax()
+        for name in ['_matlab_file', '_stmt', '_expr', '_reserved', '_EOL']:
+            assert getattr(syntax, name).name == name
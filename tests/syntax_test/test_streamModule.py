@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import MatlabGrammar
+from matlab_parser.grammar import MatlabParsingException
+from matlab_parser.statement_reader import StatementReader
+
+# MatlabGrammar.iter_parse() must produce the same nodes as parse_file() for
+# input in which nothing depends on what comes later, and must keep the
+# context up to date as it goes.
+
+script = '''% Parameters.
+k1 = 0.5;
+k2 = [1 2
+      3 4];
+k3 = k1 * ...
+     2;
+if k1 > 0
+  x = k2(1, 2);
+end
+%{
+a block comment with end in it
+%}
+disp end
+y = {'if', 'end'};
+'''
+
+def write(tmpdir, text):
+    path = tmpdir.join('input.m')
+    path.write(text)
+    return str(path)
+
+class TestClass:
+
+    @pytest.mark.parametrize('backend', ['pyparsing', 'rd'])
+    def test_sameNodes(self, backend, tmpdir):
+        path = write(tmpdir, script)
+        parser = MatlabGrammar(backend=backend)
+        expected = [repr(node) for node in parser.parse_file(path).nodes]
+        assert [repr(node) for node in parser.iter_parse(path)] == expected
+
+    def test_contextUpToDate(self, tmpdir):
+        path = write(tmpdir, script)
+        parser = MatlabGrammar(backend='rd')
+        assigned = []
+        for node in parser.iter_parse(path):
+            assigned.append(sorted(id.name for id in parser.context.assignments))
+        assert assigned[1] == ['k1']
+        assert assigned[2] == ['k1', 'k2']
+        assert parser.context.file == path
+        assert parser.context.nodes == []
+
+    def test_functionFile(self, tmpdir):
+        path = write(tmpdir, 'function y = f(x)\n  y = g(x);\nend\n'
+                             'function z = g(w)\n  z = w;\nend\n')
+        parser = MatlabGrammar(backend='rd')
+        nodes = list(parser.iter_parse(path))
+        assert len(nodes) == 2
+        assert parser.context.name.name == 'f'
+        assert len(parser.context.functions) == 2
+
+    def test_pieces(self):
+        lines = ['a = [1 2\n', '3 4];\n', 'for i = 1:3\n', "  s = 'end';\n",
+                 "end, b = a';\n", 'c = 1 ...\n', '+ 2;\n']
+        assert list(StatementReader(lines)) == ['a = [1 2\n3 4];\n',
+                                                "for i = 1:3\n  s = 'end';\nend, b = a';\n",
+                                                'c = 1 ...\n+ 2;\n']
+
+    def test_parseError(self, tmpdir, capsys):
+        path = write(tmpdir, 'a = 1;\nb = (2 + ;\nc = 3;\n')
+        parser = MatlabGrammar(backend='rd')
+        nodes = []
+        with pytest.raises(MatlabParsingException):
+            for node in parser.iter_parse(path):
+                nodes.append(node)
+        assert len(nodes) == 1
+        assert len(list(parser.iter_parse(path, fail_soft=True))) == 1
+        out, err = capsys.readouterr()
+        assert 'line 2' in out
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pickle
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import *
+from parse_helpers import parse
+
+# The SymbolTable of a tree of contexts resolves assignments and types the
+# way MATLAB scoping does, and follows changes made to the contexts.
+
+text = '''a = 1;
+i = a;
+function y = f(x)
+  b = 2;
+  a = 3;
+  y = x(i) + b;
+end
+'''
+
+def parse_f(text, backend='pyparsing'):
+    # The topmost context and that of the function f.
+    context = parse(text, backend)
+    return (context, context.functions[Identifier(name='f')])
+
+def ident(name):
+    return Identifier(name=name)
+
+class TestClass:
+
+    @pytest.mark.parametrize('backend', ['pyparsing', 'rd'])
+    def test_resolution(self, backend):
+        (top, f) = parse_f(text, backend)
+        symbols = top.symbols
+        assert f.symbols is symbols
+        assert symbols.assignment(ident('a'), top) == Number(value='1')
+        assert symbols.assignment(ident('a'), f) == Number(value='3')
+        assert symbols.assignment(ident('b'), f) == Number(value='2')
+        assert symbols.assignment(ident('b'), top) is None
+        assert symbols.assignment(ident('i'), f) == ident('a')
+        assert symbols.assignment(ident('i'), f, recursive=True) == Number(value='3')
+        assert symbols.type(ident('b'), f) == 'variable'
+        assert symbols.type(ident('b'), top) is None
+        assert symbols.type(ident('f'), f) == 'function'
+
+    def test_flatBindings(self):
+        (top, f) = parse_f(text)
+        root = MatlabContext(topmost=True)
+        assert root.symbols.bindings('assignments', root) is root.assignments
+        assert top.symbols.bindings('assignments', top) == top.assignments
+        flat = top.symbols.bindings('assignments', f)
+        assert set(flat) == set(top.assignments) | set(f.assignments)
+
+    def test_followsChanges(self):
+        (top, f) = parse_f(text)
+        symbols = top.symbols
+        assert symbols.assignment(ident('c'), f) is None
+        top.assignments[ident('c')] = Number(value='4')
+        assert symbols.assignment(ident('c'), f) == Number(value='4')
+        f.assignments[ident('c')] = Number(value='5')
+        top.assignments[ident('c')] = Number(value='6')
+        assert symbols.assignment(ident('c'), f) == Number(value='5')
+        f.assignments.pop(ident('c'))
+        assert symbols.assignment(ident('c'), f) == Number(value='6')
+        del top.assignments[ident('c')]
+        assert symbols.assignment(ident('c'), f) is None
+        f.assignments.update({ident('d'): Number(value='7')})
+        assert symbols.assignment(ident('d'), f) == Number(value='7')
+        top.assignments.clear()
+        assert symbols.assignment(ident('i'), f) is None
+        assert symbols.assignment(ident('a'), f) == Number(value='3')
+
+    def test_newContext(self):
+        (top, f) = parse_f(text)
+        g = MatlabContext(name=ident('g'), parent=f)
+        g.types[ident('z')] = 'variable'
+        assert g.symbols is top.symbols
+        assert top.symbols.type(ident('z'), g) == 'variable'
+        assert top.symbols.type(ident('b'), g) == 'variable'
+        assert top.symbols.assignment(ident('b'), g) == Number(value='2')
+
+    def test_movedContext(self):
+        (top, f) = parse_f(text)
+        other = MatlabContext(topmost=True)
+        other.assignments[ident('b')] = Number(value='8')
+        g = MatlabContext(name=ident('g'), parent=f)
+        assert g.symbols.assignment(ident('b'), g) == Number(value='2')
+        g.parent = other
+        assert g.symbols is other.symbols
+        assert g.symbols.assignment(ident('b'), g) == Number(value='8')
+
+    def test_cycle(self):
+        context = MatlabContext(topmost=True)
+        context.assignments[ident('p')] = ident('q')
+        context.assignments[ident('q')] = ident('p')
+        assert context.symbols.assignment(ident('p'), context, True) in [ident('p'), ident('q')]
+
+    def test_notPickled(self):
+        (top, f) = parse_f(text)
+        top.symbols.assignment(ident('a'), f)
+        copy = pickle.loads(pickle.dumps(top))
+        assert '_symbols' not in copy.__dict__
+        copy_f = copy.functions[ident('f')]
+        copy.assignments[ident('e')] = Number(value='9')
+        assert copy.symbols.assignment(ident('e'), copy_f) == Number(value='9')
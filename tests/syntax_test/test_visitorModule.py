@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import pytest
+import sys
+sys.path.append('moccasin/')
+sys.path.append('../moccasin')
+sys.path.append('../../moccasin')
+from matlab_parser import *
+from parse_helpers import parse
+
+# MatlabNodeVisitor finds the visit_CLASS() method for each class of node
+# once per visitor class, looking at parent classes of the node's class if
+# there is no method for the class itself.
+
+class Recorder(MatlabNodeVisitor):
+    def __init__(self):
+        super(Recorder, self).__init__()
+        self.seen = []
+
+    def visit_Identifier(self, node):
+        self.seen.append(('Identifier', node.name))
+        return node
+
+    def visit_Primitive(self, node):
+        self.seen.append(('Primitive', node.value))
+        return node
+
+class OperatorRecorder(Recorder):
+    def visit_Operator(self, node):
+        self.seen.append(('Operator', MatlabNode.as_string(node)))
+        return node
+
+class ListCounter(MatlabNodeVisitor):
+    def __init__(self):
+        super(ListCounter, self).__init__()
+        self.lists = 0
+
+    def visit_list(self, node):
+        self.lists += 1
+        return self.default_visit_list(node)
+
+class TestClass:
+
+    def test_parentClasses(self):
+        recorder = Recorder()
+        recorder.visit(parse("x = y + 2*'s';\n", 'rd').nodes)
+        assert recorder.seen == [('Identifier', 'x'), ('Identifier', 'y'),
+                                 ('Primitive', '2'), ('Primitive', 's')]
+
+    def test_tablePerClass(self):
+        nodes = parse('x = y + 2;\n', 'rd').nodes
+        recorder = OperatorRecorder()
+        recorder.visit(nodes)
+        assert recorder.seen == [('Identifier', 'x'), ('Operator', 'y+2')]
+        assert Recorder._handlers[BinaryOp] is None
+        assert OperatorRecorder._handlers[BinaryOp] is not None
+        recorder = Recorder()
+        recorder.visit(nodes)
+        assert recorder.seen == [('Identifier', 'x'), ('Identifier', 'y'),
+                                 ('Primitive', '2')]
+
+    def test_listsAndTuples(self):
+        counter = ListCounter()
+        counter.visit(parse('if a\n  b(1,2);\nelseif c\n  d;\nend\n', 'rd').nodes)
+        assert counter.lists == 5
+        recorder = Recorder()
+        assert recorder.visit((Identifier(name='a'), [Number(value='1')])) \
+            == (Identifier(name='a'), [Number(value='1')])
+        assert recorder.seen == [('Identifier', 'a'), ('Primitive', '1')]